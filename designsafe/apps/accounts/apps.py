@@ -3,4 +3,7 @@ from django.apps import AppConfig
 class DesignSafeAccountsConfig(AppConfig):
     name = 'designsafe.apps.accounts'
     label = 'designsafe_accounts'
-    verbose_name = 'DesignSafe Accounts'
\ No newline at end of file
+    verbose_name = 'DesignSafe Accounts'
+
+    def ready(self):
+        from designsafe.apps.accounts.receivers import index_user, unindex_user
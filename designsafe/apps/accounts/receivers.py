@@ -0,0 +1,48 @@
+"""
+.. module: designsafe.apps.accounts.receivers
+   :synopsis: Keep the users index in sync with user accounts.
+"""
+import logging
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from designsafe.apps.api.users import utils as users_utils
+
+#pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+#pylint: enable=invalid-name
+
+
+@receiver(post_save, sender=get_user_model(), dispatch_uid='index_user')
+def index_user(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Write a saved user to the users index.
+
+    Saves that only update ``last_login`` are skipped, they happen on
+    every login and change nothing that is indexed. Nothing is written
+    until the index is set up by ``./manage.py index_users``.
+    """
+    if raw or not getattr(settings, 'USERS_INDEX_SYNC', False):
+        return
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    try:
+        if not users_utils.users_index_ready():
+            return
+        users_utils.index_user(instance)
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning('Unable to index user %s: %s', instance.username, exc)
+
+
+@receiver(post_delete, sender=get_user_model(), dispatch_uid='unindex_user')
+def unindex_user(sender, instance, **kwargs):
+    """Remove a deleted user from the users index."""
+    if not getattr(settings, 'USERS_INDEX_SYNC', False):
+        return
+    try:
+        if not users_utils.users_index_ready():
+            return
+        users_utils.unindex_user(instance.username)
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning('Unable to remove user %s from the index: %s',
+                       instance.username, exc)
@@ -0,0 +1,133 @@
+"""
+.. module: designsafe.apps.accounts.tas
+   :synopsis: Cached TAS profile lookups.
+
+Author and collaborator rendering needs the TAS profile (institution,
+...) of every user involved. :func:`get_users` reads the profiles from the
+cache and fetches the missing ones concurrently through a shared
+``TASClient``. Profiles are cached for ``TAS_PROFILE_CACHE_TIMEOUT``
+seconds, users TAS does not know about are cached as missing for
+``TAS_PROFILE_NEGATIVE_CACHE_TIMEOUT`` seconds. Connection errors are not
+cached.
+
+Call :func:`warm_project` before a loop rendering the members of a project
+so the loop only reads the cache.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from pytas.http import TASClient
+from requests.exceptions import RequestException
+
+#pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+#pylint: enable=invalid-name
+
+CACHE_KEY = 'tas_profile:{username}'
+# Cached in place of the profile of users TAS does not know about.
+MISSING = False
+# Profiles fetched concurrently.
+MAX_WORKERS = 8
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def client():
+    """Return the ``TASClient`` shared by the profile lookups."""
+    global _client  # pylint: disable=global-statement
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TASClient()
+    return _client
+
+
+def cache_key(username):
+    """Cache key of the TAS profile of ``username``."""
+    return CACHE_KEY.format(username=username)
+
+
+def invalidate(*usernames):
+    """Drop the cached profiles of ``usernames``, e.g. after a profile edit."""
+    keys = [cache_key(username) for username in usernames if username]
+    if keys:
+        cache.delete_many(keys)
+
+
+def _fetch(username):
+    """Return the profile of ``username`` from TAS.
+
+    :returns: A tuple of the profile dict, or :data:`MISSING` if TAS does
+        not know the user, and the ``RequestException`` raised if TAS could
+        not be reached.
+    """
+    try:
+        return client().get_user(username=username), None
+    except RequestException as exc:
+        logger.warning('Unable to reach TAS for user %s: %s', username, exc)
+        return None, exc
+    except Exception as exc:  # pylint: disable=broad-except
+        # TASClient raises a bare Exception when TAS answers with an error.
+        logger.info('No TAS profile for user %s: %s', username, exc)
+        return MISSING, None
+
+
+def get_users(usernames, raise_errors=False):
+    """Return the TAS profiles of ``usernames``.
+
+    :param list usernames: Usernames, duplicates and empty values are ignored.
+    :param bool raise_errors: Raise the ``RequestException`` of a profile
+        that could not be fetched, instead of returning ``None`` for it.
+        Set it where a missing profile must not be written, e.g. when
+        publishing.
+    :returns: Dict of username to profile dict, or ``None`` for users
+        without a profile.
+    """
+    usernames = list(set(username for username in usernames if username))
+    timeout = getattr(settings, 'TAS_PROFILE_CACHE_TIMEOUT', 0)
+    cached = {}
+    if timeout:
+        keys = {cache_key(username): username for username in usernames}
+        cached = {keys[key]: profile
+                  for key, profile in cache.get_many(list(keys)).items()}
+
+    misses = [username for username in usernames if username not in cached]
+    results = []
+    if len(misses) == 1:
+        results = [_fetch(misses[0])]
+    elif misses:
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(misses))) as executor:
+            results = list(executor.map(_fetch, misses))
+    fetched = dict((username, profile) for username, (profile, _) in zip(misses, results))
+    errors = [exc for _, exc in results if exc is not None]
+
+    if timeout:
+        negative_timeout = getattr(settings, 'TAS_PROFILE_NEGATIVE_CACHE_TIMEOUT', 0)
+        found = {cache_key(username): profile
+                 for username, profile in fetched.items() if profile}
+        missing = {cache_key(username): MISSING
+                   for username, profile in fetched.items() if profile is MISSING}
+        if found:
+            cache.set_many(found, timeout)
+        if missing and negative_timeout:
+            cache.set_many(missing, negative_timeout)
+
+    if errors and raise_errors:
+        raise errors[0]
+    cached.update(fetched)
+    return {username: cached[username] or None for username in usernames}
+
+
+def get_user(username):
+    """Return the TAS profile of ``username``, or ``None``."""
+    if not username:
+        return None
+    return get_users([username])[username]
+
+
+def warm_project(project):
+    """Cache the TAS profiles of the PI, co-PIs and team of ``project``."""
+    get_users([project.pi] + list(project.co_pis) + list(project.team_members))
@@ -1,8 +1,11 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model, signals
 from django.contrib.auth.models import Permission
 from django.core.urlresolvers import reverse
 from unittest import skip
+from mock import MagicMock, patch
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from designsafe.apps.accounts import tas
 
 
 class AccountsTests(TestCase):
@@ -121,3 +124,72 @@ class AccountsTests(TestCase):
         assert 'NEW TEST BIO' in resp.content
         assert 'NEW_WEBSITE' in resp.content
         assert 'NEW_ORCID_ID' in resp.content
+
+
+@override_settings(TAS_PROFILE_CACHE_TIMEOUT=60, TAS_PROFILE_NEGATIVE_CACHE_TIMEOUT=10)
+class TasProfilesTests(TestCase):
+
+    def setUp(self):
+        self.patch_cache = patch('designsafe.apps.accounts.tas.cache')
+        self.patch_client = patch('designsafe.apps.accounts.tas.client')
+        self.mock_cache = self.patch_cache.start()
+        self.mock_client = self.patch_client.start()
+        self.addCleanup(self.patch_cache.stop)
+        self.addCleanup(self.patch_client.stop)
+
+        def get_user(username):
+            if username == 'missing':
+                raise Exception('User not found')
+            if username == 'offline':
+                raise RequestsConnectionError('TAS unavailable')
+            return {'username': username, 'institution': 'UT Austin'}
+        self.mock_client.return_value.get_user.side_effect = get_user
+
+    def test_get_users_fetches_misses(self):
+        self.mock_cache.get_many.return_value = {
+            'tas_profile:cached': {'username': 'cached', 'institution': 'TACC'},
+            'tas_profile:gone': False,
+        }
+
+        profiles = tas.get_users(['cached', 'gone', 'ds_user', 'missing',
+                                  'offline', 'ds_user', None])
+
+        self.assertEqual(profiles, {
+            'cached': {'username': 'cached', 'institution': 'TACC'},
+            'gone': None,
+            'ds_user': {'username': 'ds_user', 'institution': 'UT Austin'},
+            'missing': None,
+            'offline': None,
+        })
+        fetched = sorted(c[1]['username'] for c in
+                         self.mock_client.return_value.get_user.call_args_list)
+        self.assertEqual(fetched, ['ds_user', 'missing', 'offline'])
+        self.mock_cache.set_many.assert_any_call(
+            {'tas_profile:ds_user': profiles['ds_user']}, 60)
+        self.mock_cache.set_many.assert_any_call({'tas_profile:missing': False}, 10)
+        self.assertEqual(self.mock_cache.set_many.call_count, 2)
+
+    def test_get_users_raises_connection_errors(self):
+        self.mock_cache.get_many.return_value = {}
+
+        with self.assertRaises(RequestsConnectionError):
+            tas.get_users(['ds_user', 'missing', 'offline'], raise_errors=True)
+
+        # Profiles that were fetched are still cached.
+        self.mock_cache.set_many.assert_any_call(
+            {'tas_profile:ds_user': {'username': 'ds_user', 'institution': 'UT Austin'}}, 60)
+
+    @override_settings(TAS_PROFILE_CACHE_TIMEOUT=0)
+    def test_cache_disabled(self):
+        self.assertEqual(tas.get_user('ds_user')['institution'], 'UT Austin')
+        self.mock_cache.get_many.assert_not_called()
+        self.mock_cache.set_many.assert_not_called()
+
+    def test_warm_project(self):
+        self.mock_cache.get_many.return_value = {}
+        project = MagicMock(pi='ds_admin', co_pis=['ds_user'], team_members=['ds_user'])
+
+        tas.warm_project(project)
+
+        keys = self.mock_cache.set_many.call_args[0][0]
+        self.assertEqual(sorted(keys), ['tas_profile:ds_admin', 'tas_profile:ds_user'])
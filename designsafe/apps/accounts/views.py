@@ -9,6 +9,7 @@ from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import render_to_response
 from django.utils.translation import ugettext_lazy as _
 from designsafe.apps.accounts import forms, integrations
+from designsafe.apps.accounts import tas as tas_profiles
 from designsafe.apps.accounts.models import (NEESUser, DesignSafeProfile,
                                              NotificationPreferences)
 from designsafe.apps.auth.tasks import check_or_create_agave_home_dir
@@ -343,6 +344,7 @@ def profile_edit(request):
             data['source'] = tas_user['source']
 
             tas.save_user(tas_user['id'], data)
+            tas_profiles.invalidate(user.username)
             messages.success(request, 'Your profile has been updated!')
 
             try:
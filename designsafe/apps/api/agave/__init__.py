@@ -4,14 +4,20 @@
     we should create an agave.utils or agave.libs module for these to live in.
 """
 import logging
-import requests
-from agavepy.agave import Agave, load_resource
+from agavepy.agave import load_resource
 from django.conf import settings
+from designsafe.apps.api.agave.clients import (AgaveClientFactory, UserClientProvider,
+                                               connect_task_stats, connect_task_clients)
 
 logger = logging.getLogger(__name__)
 
 AGAVE_RESOURCES = load_resource(getattr(settings, 'AGAVE_TENANT_BASEURL'))
 
+client_factory = AgaveClientFactory(AGAVE_RESOURCES)
+connect_task_stats(client_factory)
+user_clients = UserClientProvider(client_factory)
+connect_task_clients(user_clients)
+
 def get_service_account_client():
     """Return service account agave client.
 
@@ -19,19 +25,18 @@ def get_service_account_client():
 
     ..note:: This service account is an admin account on the Agave tenant.
 
+    ..note:: Clients come from :data:`client_factory` and are shared by
+             the whole process.
+
     ..todo:: Should we, instead, use `ds_user`?
              There might be some issues because of permissionas,
              but it might be a bit safer."""
 
-    return Agave(api_server=settings.AGAVE_TENANT_BASEURL,
-                 token=settings.AGAVE_SUPER_TOKEN,
-                 resources=AGAVE_RESOURCES)
+    return client_factory.service_account()
 
 def get_sandbox_service_account_client():
     """Return sandbox service account"""
-    return Agave(api_server=settings.AGAVE_SANDBOX_TENANT_BASEURL,
-                 token=settings.AGAVE_SANDBOX_SUPER_TOKEN,
-                 resources=AGAVE_RESOURCES)
+    return client_factory.service_account(sandbox=True)
 
 def service_account():
     """Return prod or sandbox service client depending on setting.AGAVE_USE_SANDBOX"""
@@ -43,32 +48,12 @@ def service_account():
 def impersonate_service_account(username):
     """Return agave client as username.
 
+    The impersonation token is cached by :data:`client_factory` until
+    shortly before it expires.
+
     :param str username: Username to impersonate.
     """
-    url = '/'.join([settings.AGAVE_TENANT_BASEURL, 'token'])
-    cred = (settings.AGAVE_CLIENT_KEY, settings.AGAVE_CLIENT_SECRET)
-
-    if getattr(settings, 'AGAVE_USE_SANDBOX', False):
-        cred = (settings.AGAVE_SANDBOX_CLIENT_KEY, settings.AGAVE_SANDBOX_CLIENT_SECRET)
-
-    body = {
-        'grant_type': 'admin_password',
-        'username': settings.DS_ADMIN_USERNAME,
-        'password': settings.DS_ADMIN_PASSWORD,
-        'token_username': '/'.join([settings.AGAVE_USER_STORE_ID, username]),
-        'scope': 'PRODUCTION',
-    }
-    response = requests.post(url, data=body, auth=cred)
-    response.raise_for_status()
-    token_data = response.json()
-    return Agave(
-        api_server=settings.AGAVE_TENANT_BASEURL,
-        api_key=cred[0],
-        api_secret=cred[1],
-        token=token_data['access_token'],
-        resources=AGAVE_RESOURCES,
-        refresh_token=token_data['access_token']
-    )
+    return client_factory.impersonate(username)
 
 
 def to_camel_case(snake_str):
@@ -0,0 +1,500 @@
+"""
+.. module: designsafe.apps.api.agave.clients
+   :synopsis: Process-wide Agave client factory.
+
+Every ``Agave`` object builds its own ``requests`` session, so every new
+client pays for a fresh TCP/TLS handshake. :class:`AgaveClientFactory`
+keeps one pooled session per worker process, shares it between the clients
+it hands out and caches service account and impersonation clients until
+shortly before their tokens expire.
+
+:class:`UserClientProvider` hands out the clients of users logged in with
+OAuth, one per user per request or task, and makes sure only one process at
+a time refreshes a user's token.
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from agavepy.agave import Agave
+from celery.signals import task_prerun, task_postrun
+from django.conf import settings
+from django.core.cache import cache
+from designsafe.libs.common.instrumentation import record_call
+
+#pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+#pylint: enable=invalid-name
+
+
+class AgaveClientStats(object):
+    """Counters for client cache hits/misses and Agave request latency.
+
+    Totals are kept for the whole process. :meth:`scope` additionally
+    collects the counters of the current thread so a view or a task can
+    report how much Agave time it spent.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        """Reset process-wide counters."""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.requests = 0
+            self.request_time = 0.0
+
+    def _scopes(self):
+        if not hasattr(self._local, 'scopes'):
+            self._local.scopes = []
+        return self._local.scopes
+
+    def _add(self, key, value):
+        for counters in self._scopes():
+            counters[key] += value
+
+    def record_hit(self):
+        with self._lock:
+            self.hits += 1
+        self._add('hits', 1)
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+        self._add('misses', 1)
+
+    def record_request(self, elapsed):
+        with self._lock:
+            self.requests += 1
+            self.request_time += elapsed
+        self._add('requests', 1)
+        self._add('request_time', elapsed)
+
+    def snapshot(self):
+        """Return process-wide counters as a dict."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'requests': self.requests,
+                'request_time': self.request_time
+            }
+
+    def begin(self, name):
+        """Start collecting counters for the current thread.
+
+        :returns: Counters to pass to :meth:`end`.
+        """
+        counters = {'name': name, 'hits': 0, 'misses': 0, 'requests': 0,
+                    'request_time': 0.0}
+        self._scopes().append(counters)
+        return counters
+
+    def end(self, counters):
+        """Stop collecting ``counters`` and log them."""
+        scopes = self._scopes()
+        if counters in scopes:
+            scopes.remove(counters)
+        if counters['requests'] or counters['misses']:
+            logger.info('Agave usage for %s: %d requests in %.3fs, '
+                        'client cache %d hits/%d misses',
+                        counters['name'], counters['requests'],
+                        counters['request_time'], counters['hits'],
+                        counters['misses'])
+        return counters
+
+    @contextmanager
+    def scope(self, name):
+        """Collect counters for everything done in this thread inside the
+        ``with`` block and log them on exit.
+
+        :param str name: Label for the log line, e.g. a view or task name.
+        """
+        counters = self.begin(name)
+        try:
+            yield counters
+        finally:
+            self.end(counters)
+
+
+class PooledSession(requests.Session):
+    """``requests`` session with a bounded connection pool, retries on
+    idempotent requests, a default timeout and latency accounting."""
+
+    def __init__(self, stats, pool_size=10, retries=3, timeout=None):
+        super(PooledSession, self).__init__()
+        self.stats = stats
+        self.timeout = timeout
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size,
+                              max_retries=Retry(total=retries,
+                                                backoff_factor=0.5,
+                                                status_forcelist=(502, 503, 504)))
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        start = time.time()
+        try:
+            return super(PooledSession, self).send(request, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            self.stats.record_request(elapsed)
+            record_call('agave', elapsed)
+
+
+class AgaveClientFactory(object):
+    """Hand out ``Agave`` clients that share one pooled session per process.
+
+    Clients are cached by purpose. Impersonation tokens are reused until
+    ``token_expiry_margin`` seconds before they expire. A missing client is
+    created under a lock of its own key, so a slow token request only makes
+    the threads asking for the same client wait. The cache and the session
+    are rebuilt after a fork so prefork workers never share sockets.
+
+    :param dict resources: Agave resources, see
+        :func:`agavepy.agave.load_resource`.
+    """
+
+    def __init__(self, resources=None, pool_size=None, retries=None,
+                 timeout=None, token_expiry_margin=None):
+        self.resources = resources
+        self.pool_size = pool_size or getattr(settings, 'AGAVE_CLIENT_POOL_SIZE', 10)
+        self.retries = retries if retries is not None else \
+            getattr(settings, 'AGAVE_CLIENT_RETRIES', 3)
+        self.timeout = timeout or getattr(settings, 'AGAVE_CLIENT_TIMEOUT', (5, 120))
+        self.token_expiry_margin = token_expiry_margin or \
+            getattr(settings, 'AGAVE_TOKEN_EXPIRY_MARGIN', 300)
+        self.stats = AgaveClientStats()
+        self._lock = threading.RLock()
+        self._pid = None
+        self._session = None
+        self._clients = {}
+        self._key_locks = {}
+
+    def _check_pid(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            self._pid = pid
+            self._session = None
+            self._clients = {}
+            self._key_locks = {}
+
+    @property
+    def session(self):
+        """Pooled session for this process."""
+        with self._lock:
+            self._check_pid()
+            if self._session is None:
+                self._session = PooledSession(self.stats,
+                                              pool_size=self.pool_size,
+                                              retries=self.retries,
+                                              timeout=self.timeout)
+            return self._session
+
+    def pool(self, client):
+        """Make ``client`` send its requests through the pooled session."""
+        session = self.session
+        for resource in (client.all, client.clients_resource):
+            if resource is not None:
+                resource.http_client.session = session
+        return client
+
+    def _lookup(self, key):
+        """Return the cached client of ``key`` and the lock creating it."""
+        with self._lock:
+            self._check_pid()
+            client, expires_at = self._clients.get(key, (None, None))
+            if client is not None and \
+                    (expires_at is not None and time.time() >= expires_at):
+                client = None
+            return client, self._key_locks.setdefault(key, threading.Lock())
+
+    def _cached(self, key, create):
+        client, key_lock = self._lookup(key)
+        if client is not None:
+            self.stats.record_hit()
+            return client
+        with key_lock:
+            # Another thread may have created it while this one waited.
+            client, _ = self._lookup(key)
+            if client is not None:
+                self.stats.record_hit()
+                return client
+            self.stats.record_miss()
+            client, expires_at = create()
+            client = self.pool(client)
+            with self._lock:
+                self._clients[key] = (client, expires_at)
+            return client
+
+    def service_account(self, sandbox=False):
+        """Return the (sandbox) service account client."""
+        def _create():
+            if sandbox:
+                api_server = settings.AGAVE_SANDBOX_TENANT_BASEURL
+                token = settings.AGAVE_SANDBOX_SUPER_TOKEN
+            else:
+                api_server = settings.AGAVE_TENANT_BASEURL
+                token = settings.AGAVE_SUPER_TOKEN
+            return Agave(api_server=api_server, token=token,
+                         resources=self.resources), None
+
+        return self._cached(('service_account', sandbox), _create)
+
+    def impersonate(self, username):
+        """Return a client acting as ``username``.
+
+        The token is requested with the ``admin_password`` grant and reused
+        until shortly before it expires.
+
+        :param str username: Username to impersonate.
+        """
+        def _create():
+            url = '/'.join([settings.AGAVE_TENANT_BASEURL, 'token'])
+            cred = (settings.AGAVE_CLIENT_KEY, settings.AGAVE_CLIENT_SECRET)
+
+            if getattr(settings, 'AGAVE_USE_SANDBOX', False):
+                cred = (settings.AGAVE_SANDBOX_CLIENT_KEY,
+                        settings.AGAVE_SANDBOX_CLIENT_SECRET)
+
+            body = {
+                'grant_type': 'admin_password',
+                'username': settings.DS_ADMIN_USERNAME,
+                'password': settings.DS_ADMIN_PASSWORD,
+                'token_username': '/'.join([settings.AGAVE_USER_STORE_ID, username]),
+                'scope': 'PRODUCTION',
+            }
+            requested_at = time.time()
+            response = self.session.post(url, data=body, auth=cred)
+            response.raise_for_status()
+            token_data = response.json()
+            client = Agave(
+                api_server=settings.AGAVE_TENANT_BASEURL,
+                api_key=cred[0],
+                api_secret=cred[1],
+                token=token_data['access_token'],
+                resources=self.resources,
+                refresh_token=token_data['access_token']
+            )
+            expires_at = requested_at + \
+                int(token_data.get('expires_in', 0)) - self.token_expiry_margin
+            return client, expires_at
+
+        return self._cached(('impersonate', username), _create)
+
+    def clear(self):
+        """Drop every cached client."""
+        with self._lock:
+            self._clients = {}
+
+
+class UserClientProvider(object):
+    """Hand out ``Agave`` clients acting as users with an OAuth token.
+
+    Between :meth:`begin` and :meth:`end`, which the auth middleware and the
+    Celery task signals call, each thread gets one client per user, so reading
+    ``AgaveOAuthToken.client`` several times in a view or a task returns the
+    same client. Clients send their requests through the pooled session of
+    ``factory``.
+
+    Token refreshes are single-flight across processes. The process that
+    takes a user's cache lock refreshes the token and saves it. Other
+    processes wait up to ``lock_timeout`` seconds for the new token to be
+    saved and use it instead of spending the refresh token again.
+
+    :param factory: :class:`AgaveClientFactory` providing the session.
+    """
+    LOCK_KEY = 'agave_token_refresh:{user_id}'
+    COUNT_KEY = 'agave_token_refresh_count:{kind}'
+    # refreshed: this process refreshed the token.
+    # joined: another process refreshed it, its token was used.
+    # failed: the refresh request failed.
+    COUNT_KINDS = ('refreshed', 'joined', 'failed')
+    TOKEN_FIELDS = ('access_token', 'refresh_token', 'token_type', 'scope',
+                    'expires_in', 'created')
+
+    def __init__(self, factory, lock_timeout=None, poll_interval=0.1):
+        self.factory = factory
+        self.lock_timeout = lock_timeout or \
+            getattr(settings, 'AGAVE_TOKEN_REFRESH_LOCK_TIMEOUT', 10)
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(self.COUNT_KINDS, 0)
+
+    def begin(self):
+        """Start memoizing clients in the current thread."""
+        self._local.clients = {}
+
+    def end(self):
+        """Stop memoizing clients in the current thread and drop them."""
+        self._local.clients = None
+
+    @contextmanager
+    def scope(self):
+        """Memoize clients inside the ``with`` block."""
+        self.begin()
+        try:
+            yield
+        finally:
+            self.end()
+
+    def client(self, token):
+        """Return a client acting as the owner of ``token``.
+
+        :param token: :class:`designsafe.apps.auth.models.AgaveOAuthToken`.
+        """
+        clients = getattr(self._local, 'clients', None)
+        if clients is not None and token.user_id in clients:
+            self.factory.stats.record_hit()
+            return clients[token.user_id]
+        self.factory.stats.record_miss()
+        client = Agave(api_server=settings.AGAVE_TENANT_BASEURL,
+                       api_key=settings.AGAVE_CLIENT_KEY,
+                       api_secret=settings.AGAVE_CLIENT_SECRET,
+                       token=token.access_token,
+                       resources=self.factory.resources,
+                       refresh_token=token.refresh_token,
+                       token_callback=token.update)
+        # agavepy refreshes through client.token, also when a request fails
+        # with an expired token.
+        refresh = client.token.refresh
+        client.token.refresh = lambda: self.refresh(token, client, refresh)
+        self.factory.pool(client)
+        if clients is not None:
+            clients[token.user_id] = client
+        return client
+
+    def refresh(self, token, client, refresh):
+        """Refresh the token of ``client`` unless another process is already
+        doing it.
+
+        :param token: ``AgaveOAuthToken`` the client was created from.
+        :param client: ``Agave`` client.
+        :param refresh: agavepy's refresh of ``client.token``, which calls
+            ``token.update`` with the new token.
+        :returns: The new access token.
+        """
+        stale = client._token
+        key = self.LOCK_KEY.format(user_id=token.user_id)
+        if cache.add(key, os.getpid(), self.lock_timeout):
+            try:
+                saved = self._saved_token(token)
+                if saved and saved['access_token'] != stale:
+                    # Refreshed by another process since the client was created.
+                    self._adopt(token, client, saved)
+                else:
+                    self._refresh(refresh)
+            finally:
+                cache.delete(key)
+        else:
+            saved = self._wait(token, key, stale)
+            if saved is None:
+                logger.warning('Timed out waiting for the token of user %s to be '
+                               'refreshed, refreshing it here.', token.user_id)
+                self._refresh(refresh)
+            else:
+                self._adopt(token, client, saved)
+        # Refreshing rebuilds the client's resources and their sessions.
+        self.factory.pool(client)
+        return client._token
+
+    def _refresh(self, refresh):
+        try:
+            refresh()
+        except Exception:
+            self._count('failed')
+            raise
+        self._count('refreshed')
+
+    def _saved_token(self, token):
+        return type(token).objects.filter(pk=token.pk)\
+            .values(*self.TOKEN_FIELDS).first()
+
+    def _wait(self, token, key, stale):
+        """Wait for another process to save a token other than ``stale``.
+
+        :returns: The saved token fields, or ``None`` if none was saved.
+        """
+        deadline = time.time() + self.lock_timeout
+        while True:
+            saved = self._saved_token(token)
+            if saved and saved['access_token'] != stale:
+                return saved
+            if time.time() >= deadline or cache.get(key) is None:
+                return None
+            time.sleep(self.poll_interval)
+
+    def _adopt(self, token, client, saved):
+        """Switch ``token`` and ``client`` to a token saved by another process."""
+        for field, value in saved.items():
+            setattr(token, field, value)
+        client.token.token_info.update(access_token=saved['access_token'],
+                                       refresh_token=saved['refresh_token'])
+        client._token = saved['access_token']
+        client.refresh_token = saved['refresh_token']
+        client.refresh_aris()
+        self._count('joined')
+
+    def _count(self, kind):
+        with self._lock:
+            self.counts[kind] += 1
+        key = self.COUNT_KEY.format(kind=kind)
+        try:
+            cache.add(key, 0, None)
+            cache.incr(key)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.debug('Unable to count token refresh: %s', exc)
+
+    def refresh_counts(self):
+        """Return the token refreshes of every process by kind, see
+        :data:`COUNT_KINDS`. ``counts`` holds those of this process."""
+        keys = dict((self.COUNT_KEY.format(kind=kind), kind) for kind in self.COUNT_KINDS)
+        saved = cache.get_many(list(keys))
+        return dict((kind, saved.get(key, 0)) for key, kind in keys.items())
+
+
+def connect_task_stats(factory):
+    """Log Agave usage of every Celery task run in this process.
+
+    :param factory: :class:`AgaveClientFactory` whose stats are reported.
+    """
+    scopes = {}
+
+    def _prerun(task_id=None, task=None, **kwargs):
+        scopes[task_id] = factory.stats.begin(task.name)
+
+    def _postrun(task_id=None, **kwargs):
+        counters = scopes.pop(task_id, None)
+        if counters is not None:
+            factory.stats.end(counters)
+
+    task_prerun.connect(_prerun, weak=False)
+    task_postrun.connect(_postrun, weak=False)
+
+
+def connect_task_clients(provider):
+    """Memoize user clients for the duration of every Celery task run in
+    this process.
+
+    :param provider: :class:`UserClientProvider`.
+    """
+    def _prerun(**kwargs):
+        provider.begin()
+
+    def _postrun(**kwargs):
+        provider.end()
+
+    task_prerun.connect(_prerun, weak=False)
+    task_postrun.connect(_postrun, weak=False)
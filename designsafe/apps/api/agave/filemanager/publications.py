@@ -8,7 +8,8 @@
 import logging
 import datetime
 from django.conf import settings
-from elasticsearch_dsl import Q, Search, Index
+from designsafe.libs.elasticsearch.aliases import index_names as es_index_names
+from elasticsearch_dsl import Q, Search
 from designsafe.libs.elasticsearch.docs.publications import BaseESPublication
 from designsafe.libs.elasticsearch.docs.publication_legacy import BaseESPublicationLegacy
 from designsafe.apps.api.agave.filemanager.agave import AgaveFileManager
@@ -30,8 +31,9 @@ class PublicationsManager(AgaveFileManager):
 
     def construct_query(self, **kwargs):  # pylint: disable=no-self-use
         """Construct ES query."""
-        published_index_name = list(Index(settings.ES_INDEX_PREFIX.format('publications')).get_alias().keys())[0]
-        legacy_index_name = list(Index(settings.ES_INDEX_PREFIX.format('publications-legacy')).get_alias().keys())[0]
+        index_names = es_index_names('publications', 'publications-legacy')
+        published_index_name = index_names['publications']
+        legacy_index_name = index_names['publications-legacy']
 
         filter_queries = []
         if kwargs.get('type_filters'):
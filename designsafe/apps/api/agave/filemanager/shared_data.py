@@ -17,6 +17,7 @@ from elasticsearch_dsl.query import Q
 from elasticsearch_dsl import Search, Document
 from elasticsearch_dsl.connections import connections
 from designsafe.apps.data.models.elasticsearch import IndexedFile
+from designsafe.libs.elasticsearch.utils import paginate, next_cursor
 logger = logging.getLogger(__name__)
 
 class SharedDataFileManager(AgaveFileManager):
@@ -32,7 +33,14 @@ class SharedDataFileManager(AgaveFileManager):
         return True
 
     @staticmethod
-    def listing(system, file_path, user_context=None, offset=None, limit=None):
+    def listing(system, file_path, user_context=None, offset=None, limit=None,
+                cursor=None):
+        """List files shared with ``user_context``.
+
+        Pages are sorted on ``(path, name)``. The ``cursor`` of the result
+        fetches the next page with ``search_after``; it is ``None`` on the
+        last page.
+        """
         file_path = file_path or '/'
         file_path = file_path.strip('/')
         if file_path.strip('/').split('/')[0] != user_context:
@@ -75,6 +83,10 @@ class SharedDataFileManager(AgaveFileManager):
         search = IndexedFile.search()
         search.query = query
         search = search.sort('path._exact', 'name._exact')
+        try:
+            search = paginate(search, offset=offset, limit=limit, cursor=cursor)
+        except ValueError:
+            raise ApiException('Invalid cursor.', status=400)
 
         try:
             res = search.execute()
@@ -114,5 +126,6 @@ class SharedDataFileManager(AgaveFileManager):
 
         for f in res:
             result['children'].append(f.to_dict())
+        result['cursor'] = next_cursor(res, limit)
 
-        return result
\ No newline at end of file
+        return result
@@ -37,6 +37,38 @@ class TestPrivateDataManager(TestCase):
         fm = PrivateDataFileManager(mock_ac)
         self.assertEqual(fm.requires_auth, True) 
 
+class TestSharedDataFileManager(TestCase):
+    @patch('designsafe.apps.api.agave.filemanager.shared_data.IndexedFile')
+    def test_listing_pages_with_cursor(self, mock_indexed):
+        from designsafe.libs.elasticsearch.utils import encode_cursor, decode_cursor
+        mock_search = MagicMock()
+        mock_indexed.search.return_value = mock_search
+        paged = mock_search.sort.return_value.extra.return_value.extra.return_value
+        hit = MagicMock()
+        hit.to_dict.return_value = {'name': 'b.txt'}
+        res = MagicMock()
+        res.__iter__.return_value = [hit, hit]
+        res.hits.hits = [{'sort': ['/a/a.txt', 'a.txt']}, {'sort': ['/a/b.txt', 'b.txt']}]
+        paged.execute.return_value = res
+
+        listing = SharedDataFileManager.listing(
+            'designsafe.storage.default', '$SHARE', user_context='user',
+            limit=2, cursor=encode_cursor(['/a/0.txt', '0.txt']))
+
+        mock_search.sort.assert_called_with('path._exact', 'name._exact')
+        mock_search.sort().extra.assert_called_with(size=2)
+        mock_search.sort().extra().extra.assert_called_with(
+            search_after=['/a/0.txt', '0.txt'])
+        paged.execute.assert_called_once_with()
+        self.assertEqual(listing['children'], [{'name': 'b.txt'}, {'name': 'b.txt'}])
+        self.assertEqual(decode_cursor(listing['cursor']), ['/a/b.txt', 'b.txt'])
+
+    @patch('designsafe.apps.api.agave.filemanager.shared_data.IndexedFile')
+    def test_listing_invalid_cursor(self, mock_indexed):
+        with self.assertRaises(ApiException):
+            SharedDataFileManager.listing('designsafe.storage.default', '$SHARE',
+                                          user_context='user', cursor='bogus')
+
 class TestCommunityFileManager(TestCase):
     @patch('designsafe.apps.api.agave.filemanager.agave.BaseFileResource')
     def test_listing(self, mock_afm):
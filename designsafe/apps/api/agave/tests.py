@@ -1,5 +1,6 @@
 import os
 import json
+import threading
 import datetime
 from mock import patch, MagicMock
 from django.test import TestCase
@@ -10,6 +11,8 @@ from designsafe.apps.api.agave.filemanager.lookups import FileLookupManager
 from django.contrib.auth.models import User
 
 from designsafe.apps.api.agave import to_camel_case
+from designsafe.apps.api.agave.clients import AgaveClientFactory, UserClientProvider
+from designsafe.apps.auth.models import AgaveOAuthToken
 from designsafe.apps.api.exceptions import ApiException
 
 class MiscTests(TestCase):
@@ -54,5 +57,145 @@ class TestListingViews_auth(TestCase):
              offset=0, 
              limit=100)
 
-    
 
+class TestAgaveClientFactory(TestCase):
+
+    def setUp(self):
+        self.patch_agave = patch('designsafe.apps.api.agave.clients.Agave')
+        self.mock_agave = self.patch_agave.start()
+        self.mock_agave.side_effect = lambda **kwargs: MagicMock()
+        self.addCleanup(self.patch_agave.stop)
+        self.factory = AgaveClientFactory(resources={}, token_expiry_margin=300)
+
+    def test_service_account_is_cached(self):
+        client = self.factory.service_account()
+        self.assertIs(self.factory.service_account(), client)
+        self.assertIsNot(self.factory.service_account(sandbox=True), client)
+        self.assertEqual(self.mock_agave.call_count, 2)
+        stats = self.factory.stats.snapshot()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_clients_share_pooled_session(self):
+        client = self.factory.service_account()
+        sandbox = self.factory.service_account(sandbox=True)
+        self.assertIs(client.all.http_client.session, self.factory.session)
+        self.assertIs(sandbox.all.http_client.session, self.factory.session)
+        self.assertIs(client.clients_resource.http_client.session, self.factory.session)
+
+    @patch('designsafe.apps.api.agave.clients.time')
+    def test_impersonation_token_reused_until_expiry(self, mock_time):
+        mock_time.time.return_value = 1000
+        session = MagicMock()
+        session.post.return_value.json.return_value = {
+            'access_token': 'TOKEN', 'expires_in': 3600}
+        self.factory._session = session
+        self.factory._pid = os.getpid()
+
+        client = self.factory.impersonate('test_user')
+        mock_time.time.return_value = 1000 + 3600 - 301
+        self.assertIs(self.factory.impersonate('test_user'), client)
+        self.assertEqual(session.post.call_count, 1)
+
+        mock_time.time.return_value = 1000 + 3600 - 300
+        self.assertIsNot(self.factory.impersonate('test_user'), client)
+        self.assertEqual(session.post.call_count, 2)
+        self.assertEqual(
+            session.post.call_args[1]['data']['token_username'],
+            '/'.join([settings.AGAVE_USER_STORE_ID, 'test_user']))
+
+    def test_token_request_does_not_block_other_clients(self):
+        started, release = threading.Event(), threading.Event()
+        session = MagicMock()
+
+        def _post(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            return MagicMock(**{'json.return_value': {'access_token': 'TOKEN',
+                                                      'expires_in': 3600}})
+        session.post.side_effect = _post
+        self.factory._session = session
+        self.factory._pid = os.getpid()
+
+        thread = threading.Thread(target=self.factory.impersonate, args=('test_user',))
+        thread.start()
+        self.assertTrue(started.wait(5))
+        try:
+            self.factory.service_account()
+            self.assertTrue(thread.is_alive())
+        finally:
+            release.set()
+            thread.join(5)
+        self.factory.impersonate('test_user')
+        self.assertEqual(session.post.call_count, 1)
+
+    def test_scope_collects_thread_counters(self):
+        with self.factory.stats.scope('test') as counters:
+            self.factory.service_account()
+            self.factory.service_account()
+        self.factory.service_account()
+        self.assertEqual((counters['hits'], counters['misses']), (1, 1))
+
+
+class TestUserClientProvider(TestCase):
+    fixtures = ['user-data', 'agave-oauth-token-data']
+
+    def setUp(self):
+        self.patch_agave = patch('designsafe.apps.api.agave.clients.Agave')
+        self.mock_agave = self.patch_agave.start()
+        self.mock_agave.side_effect = lambda **kwargs: MagicMock(_token=kwargs['token'])
+        self.addCleanup(self.patch_agave.stop)
+        self.patch_cache = patch('designsafe.apps.api.agave.clients.cache')
+        self.mock_cache = self.patch_cache.start()
+        self.addCleanup(self.patch_cache.stop)
+        self.factory = AgaveClientFactory(resources={})
+        self.provider = UserClientProvider(self.factory, lock_timeout=1,
+                                           poll_interval=0.01)
+        self.token = AgaveOAuthToken.objects.get(user__username='ds_user')
+
+    def test_client_is_memoized_in_scope(self):
+        with self.provider.scope():
+            client = self.provider.client(self.token)
+            self.assertIs(self.provider.client(self.token), client)
+            self.assertIs(client.all.http_client.session, self.factory.session)
+        self.assertIsNot(self.provider.client(self.token), client)
+        self.assertEqual(self.mock_agave.call_count, 2)
+
+    def test_refresh_holding_lock(self):
+        self.mock_cache.add.return_value = True
+        client = self.provider.client(self.token)
+
+        def _refresh():
+            self.token.update(access_token='NEW', refresh_token='REFRESH')
+        self.provider.refresh(self.token, client, MagicMock(side_effect=_refresh))
+
+        self.assertEqual(AgaveOAuthToken.objects.get(pk=self.token.pk).access_token, 'NEW')
+        self.mock_cache.delete.assert_called_with(
+            'agave_token_refresh:{}'.format(self.token.user_id))
+        self.assertEqual(self.provider.counts['refreshed'], 1)
+
+    def test_refresh_waits_for_other_process(self):
+        self.mock_cache.add.return_value = False
+        self.mock_cache.get.return_value = 1234
+        client = self.provider.client(self.token)
+        AgaveOAuthToken.objects.filter(pk=self.token.pk).update(
+            access_token='NEW', refresh_token='REFRESH')
+        agavepy_refresh = MagicMock()
+
+        self.provider.refresh(self.token, client, agavepy_refresh)
+
+        agavepy_refresh.assert_not_called()
+        self.assertEqual((self.token.access_token, client._token), ('NEW', 'NEW'))
+        self.assertEqual(client.refresh_token, 'REFRESH')
+        self.assertEqual(client.refresh_aris.call_count, 1)
+        self.assertEqual(self.provider.counts['joined'], 1)
+
+    def test_refresh_after_wait_times_out(self):
+        self.mock_cache.add.return_value = False
+        self.mock_cache.get.return_value = None
+        client = self.provider.client(self.token)
+        agavepy_refresh = MagicMock()
+
+        self.provider.refresh(self.token, client, agavepy_refresh)
+
+        self.assertEqual(agavepy_refresh.call_count, 1)
+        self.assertEqual(self.provider.counts['refreshed'], 1)
@@ -76,6 +76,8 @@ class FileListingView(BaseApiView):
                 (file_path.strip('/') == '$SHARE'):
                 file_mgr_name = 'shared'
                 kwargs['user_context'] = request.user.username
+        if file_mgr_name == 'shared' and request.GET.get('cursor'):
+            kwargs['cursor'] = request.GET.get('cursor')
 
         fm_cls = FileLookupManager(file_mgr_name)
         fm = fm_cls(agave_client=client)
@@ -318,7 +320,6 @@ class FileMediaView(View):
                         event_data[Notification.EXTRA] = copied.to_dict()
 
                     notification = Notification.objects.create(**event_data)
-                    notification.save()
                     return JsonResponse(copied, encoder=AgaveJSONEncoder, safe=False)
                 except HTTPError as e:
                     logger.exception(e.response.text)
@@ -9,6 +9,7 @@ from designsafe.apps.data.tasks import agave_indexer
 from designsafe.apps.api.exceptions import ApiException
 from designsafe.apps.api.external_resources.googledrive.models.files import GoogleDriveFile
 from designsafe.apps.api.notifications.models import Notification
+from designsafe.apps.api.notifications.pipeline import NotificationBatch
 from designsafe.apps.googledrive_integration.models import GoogleDriveUserToken
 from django.contrib.auth import get_user_model
 from django.core.urlresolvers import reverse
@@ -274,14 +275,21 @@ class FileManager(object):
 
         return None
 
-    def download_file(self, file_id, download_directory_path, username):
+    def download_file(self, file_id, download_directory_path, username, notifications=None):
         """
         Downloads the file for file_id to the given download_path.
 
         :param file_id:
         :param download_directory_path:
+        :param notifications: :class:`NotificationBatch` errors are added to.
+            A batch is created and flushed when omitted.
         :return: the full path to the downloaded file
         """
+        if notifications is None:
+            with NotificationBatch() as notifications:
+                return self.download_file(file_id, download_directory_path,
+                                          username, notifications)
+
         googledrive_file = self.googledrive_api.files().get(fileId=file_id, fields="name, mimeType").execute()
 
         # convert utf-8 chars
@@ -297,14 +305,13 @@ class FileManager(object):
             # elif googledrive_file['mimeType'] == 'application/vnd.google-apps.presentation':
             #     mimeType = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
             # else:
-            n = Notification(event_type='data',
-                             status=Notification.ERROR,
-                             operation='googledrive_download_error',
-                             message='Copying Google-type files is currently unsupported. Export the file to'
-                             ' a standard format and try again.',
-                             user=username,
-                             extra={'path': "'{}' of type {}".format(googledrive_file['name'], googledrive_file['mimeType'])})
-            n.save()
+            notifications.add(event_type='data',
+                              status=Notification.ERROR,
+                              operation='googledrive_download_error',
+                              message='Copying Google-type files is currently unsupported. Export the file to'
+                              ' a standard format and try again.',
+                              user=username,
+                              extra={'path': "'{}' of type {}".format(googledrive_file['name'], googledrive_file['mimeType'])})
             return None
 
         request = self.googledrive_api.files().get_media(fileId=file_id)
@@ -325,23 +332,21 @@ class FileManager(object):
                     backoff_attempts += 1
                     time.sleep(backoff_attempts)
                     if backoff_attempts > 10:
-                        n = Notification(event_type='data',
-                                         status=Notification.ERROR,
-                                         operation='googledrive_download_error',
-                                         message='Rate Limit Exceeded. Try again after a few minutes for this file.',
-                                         user=username,
-                                         extra={'path': "{}".format(googledrive_file['name'])})
-                        n.save()
+                        notifications.add(event_type='data',
+                                          status=Notification.ERROR,
+                                          operation='googledrive_download_error',
+                                          message='Rate Limit Exceeded. Try again after a few minutes for this file.',
+                                          user=username,
+                                          extra={'path': "{}".format(googledrive_file['name'])})
                         return None
                 elif "Only files with binary content can be downloaded" in str(e):
-                    n = Notification(event_type='data',
-                                    status=Notification.ERROR,
-                                    operation='googledrive_download_error',
-                                    message='Only files with binary content can be downloaded. Convert the file to'
-                                    ' a standard format and try again.',
-                                    user=username,
-                                    extra={'path': "'{}' of type {}".format(googledrive_file['name'], googledrive_file['mimeType'])})
-                    n.save()
+                    notifications.add(event_type='data',
+                                      status=Notification.ERROR,
+                                      operation='googledrive_download_error',
+                                      message='Only files with binary content can be downloaded. Convert the file to'
+                                      ' a standard format and try again.',
+                                      user=username,
+                                      extra={'path': "'{}' of type {}".format(googledrive_file['name'], googledrive_file['mimeType'])})
                     return None
                 else:
                     raise
@@ -350,15 +355,23 @@ class FileManager(object):
 
         return file_download_path
 
-    def download_folder(self, folder_id, download_path, username):
+    def download_folder(self, folder_id, download_path, username, notifications=None):
         """
         Recursively download the folder for folder_id, and all of its contents, to the given
         download_path.
 
         :param folder_id:
         :param download_path:
+        :param notifications: :class:`NotificationBatch` the errors of every
+            file in the folder are added to, so they are written in bulk. A
+            batch is created and flushed when omitted.
         :return:
         """
+        if notifications is None:
+            with NotificationBatch() as notifications:
+                return self.download_folder(folder_id, download_path,
+                                            username, notifications)
+
         googledrive_folder = self.googledrive_api.files().get(fileId=folder_id, fields="name").execute()
         # convert utf-8 chars
         safe_dirname = googledrive_folder['name'].encode(sys.getfilesystemencoding(), 'ignore')
@@ -376,10 +389,10 @@ class FileManager(object):
         items = self.googledrive_api.files().list(q="'{}' in parents and trashed=False".format(folder_id)).execute()
         for item in items['files']:
             if item['mimeType'] == 'application/vnd.google-apps.folder':
-                self.download_folder(item['id'], directory_path, username)
+                self.download_folder(item['id'], directory_path, username, notifications)
             else:
                 try:
-                    self.download_file(item['id'], directory_path, username)
+                    self.download_file(item['id'], directory_path, username, notifications)
                     logger.info('Google File download complete: {}'.format('/'.join([directory_path, item['id']])))
                 except Exception as e:
                     logger.exception('Unexpected task failure: googledrive_download', extra={
@@ -389,14 +402,13 @@ class FileManager(object):
                         'error_type': type(e),
                         'error': str(e)
                     })
-                    n = Notification(event_type='data',
-                                    status=Notification.ERROR,
-                                    operation='googledrive_download_error',
-                                    message='We were unable to download file from Google Drive. '
-                                            'Please try again...',
-                                    user=username,
-                                    extra={'path': item['name']})
-                    n.save()
+                    notifications.add(event_type='data',
+                                      status=Notification.ERROR,
+                                      operation='googledrive_download_error',
+                                      message='We were unable to download file from Google Drive. '
+                                              'Please try again...',
+                                      user=username,
+                                      extra={'path': item['name']})
                     raise
 
         return directory_path
@@ -0,0 +1,58 @@
+"""Management command to print request latency and call statistics"""
+import json
+import logging
+from django.core.management.base import BaseCommand
+from designsafe.libs.common import instrumentation
+from designsafe.apps.api.agave import user_clients
+
+logger = logging.getLogger(__name__)
+
+
+def _fmt(value, pattern='{:.1f}'):
+    return '-' if value is None else pattern.format(value)
+
+
+class Command(BaseCommand):
+    """Print per-view statistics aggregated from every portal process.
+
+    Latencies are in milliseconds. ES and Agave columns are average calls
+    and milliseconds per request. Processes flush their statistics every
+    ``INSTRUMENTATION_FLUSH_INTERVAL`` seconds. The table is followed by
+    the user token refreshes of every process.
+    """
+    help = 'Print per-view latency percentiles, response sizes and ES/Agave calls.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', default=False,
+                            help='Print JSON instead of a table.')
+        parser.add_argument('--sort', default='p95',
+                            choices=('count', 'mean', 'p50', 'p95', 'p99',
+                                     'es_ms', 'agave_ms'),
+                            help='Column to sort by, descending.')
+        parser.add_argument('--reset', action='store_true', default=False,
+                            help='Delete the statistics after printing them.')
+
+    def handle(self, *args, **options):
+        stats = instrumentation.aggregated_stats()
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2, sort_keys=True))
+        else:
+            columns = ('count', 'errors', 'p50', 'p95', 'p99', 'size_p95',
+                       'es_calls', 'es_ms', 'agave_calls', 'agave_ms')
+            self.stdout.write('{:<70} {}'.format(
+                'view', ' '.join('{:>11}'.format(col) for col in columns)))
+            key = options['sort']
+            for name, row in sorted(stats.items(),
+                                    key=lambda item: item[1][key] or 0,
+                                    reverse=True):
+                values = [str(row['count']), str(row['errors'])]
+                values += [_fmt(row[col], '{:.0f}' if col == 'size_p95' else '{:.1f}')
+                           for col in columns[2:]]
+                self.stdout.write('{:<70} {}'.format(
+                    name[-70:], ' '.join('{:>11}'.format(val) for val in values)))
+            refreshes = user_clients.refresh_counts()
+            self.stdout.write('Agave token refreshes: {}'.format(', '.join(
+                '{} {}'.format(refreshes[kind], kind) for kind in user_clients.COUNT_KINDS)))
+        if options['reset']:
+            instrumentation.reset_aggregated_stats()
+            self.stdout.write('Statistics deleted.')
@@ -8,4 +8,5 @@ class NotificationsConfig(AppConfig):
 
     def ready(self):
         from designsafe.apps.api.notifications.receivers import (send_notification_ws,
+                                                                 count_unread_notification,
                                                                  send_broadcast_ws)
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Count
 from django.core.serializers.json import DjangoJSONEncoder
 import datetime
 import logging
@@ -53,7 +54,8 @@ class BaseNotify(models.Model):
         }
         return d
 
-    def save(self, *args, **kwargs):
+    def encode_extra(self):
+        """JSON encode ``extra`` if it was given as a dict."""
         if isinstance(self.extra, dict):
             try:
                 self.extra = json.dumps(self.extra, cls=DjangoJSONEncoder)
@@ -65,6 +67,8 @@ class BaseNotify(models.Model):
                         logger.debug('Keys with error: %s . Value: %s', key, self.extra[key])
                         raise
 
+    def save(self, *args, **kwargs):
+        self.encode_extra()
         super(BaseNotify, self).save(*args, **kwargs)
 
     @property
@@ -74,19 +78,53 @@ class BaseNotify(models.Model):
     class Meta:
         abstract = True
 
+class NotificationQuerySet(models.QuerySet):
+    """Notifications updated with one query, keeping unread counters."""
+
+    def _update_unread(self, queryset, sign, **fields):
+        from designsafe.apps.api.notifications import unread
+        if not unread.enabled():
+            return queryset.update(**fields)
+        counts = dict(queryset.order_by().values_list('user').annotate(Count('pk')))
+        updated = queryset.update(**fields)
+        unread.incr({user: sign * count for user, count in counts.items()})
+        return updated
+
+    def mark_read(self):
+        return self._update_unread(self.filter(read=False, deleted=False), -1,
+                                   read=True)
+
+    def mark_unread(self):
+        return self._update_unread(self.filter(read=True, deleted=False), 1,
+                                   read=False)
+
+    def mark_deleted(self):
+        from designsafe.apps.api.notifications import unread
+        if not unread.enabled():
+            return self.filter(deleted=False).update(deleted=True)
+        updated = self._update_unread(self.filter(read=False, deleted=False), -1,
+                                      deleted=True)
+        return updated + self.filter(deleted=False).update(deleted=True)
+
+
 class Notification(BaseNotify):
     # what are the agave length defaults?
     user = models.CharField(max_length=20, db_index=True)
     read = models.BooleanField(default=False)
     deleted = models.BooleanField(default=False)
 
+    objects = NotificationQuerySet.as_manager()
+
+    class Meta:
+        index_together = [('user', 'datetime')]
+
     def mark_read(self):
+        Notification.objects.filter(pk=self.pk).mark_read()
         self.read = True
-        self.save()
 
     def mark_deleted(self):
+        Notification.objects.filter(pk=self.pk).mark_deleted()
         self.deleted = True
-        self.save()
 
     def to_dict(self):
         event_data = super(Notification, self).to_dict()
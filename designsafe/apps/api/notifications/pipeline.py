@@ -0,0 +1,183 @@
+"""
+.. module: designsafe.apps.api.notifications.pipeline
+   :synopsis: Batched notification writes and coalesced websocket messages.
+
+:class:`NotificationBatch` buffers notifications and writes them with a
+single ``bulk_create``. :func:`publish` sends events to a user's websocket
+through a publisher reused across calls.
+
+When ``NOTIFICATIONS_WS_WINDOW`` is set, the first events sent to a user go
+out right away and open a window of that many seconds. Events sent while
+the window is open, from any process, are queued in Redis. They are sent as
+one ``{"event_type": "batch", "events": [...]}`` message when the window
+closes.
+"""
+import json
+import logging
+import threading
+from collections import Counter, OrderedDict
+from django.conf import settings
+from ws4redis.publisher import RedisPublisher
+from ws4redis.redis_store import RedisMessage
+from designsafe.apps.api.notifications.models import Notification
+from designsafe.apps.api.notifications import unread
+
+#pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+#pylint: enable=invalid-name
+
+WEBSOCKETS_FACILITY = 'websockets'
+REDIS_PREFIX = 'notifications_ws'
+# Notifications written per INSERT.
+BATCH_SIZE = 500
+# Users whose publisher is kept around.
+MAX_PUBLISHERS = 1024
+# Seconds queued events are kept if their flush task never runs.
+PENDING_TTL = 300
+
+_publishers = OrderedDict()
+_publishers_lock = threading.Lock()
+_redis = None
+
+
+def redis_connection():
+    """Return the Redis client holding the queued events."""
+    global _redis  # pylint: disable=global-statement
+    if _redis is None:
+        import redis
+        _redis = redis.StrictRedis(**settings.WS4REDIS_CONNECTION)
+    return _redis
+
+
+def publisher(user):
+    """Return the websocket publisher of ``user``.
+
+    Publishers are kept for the :data:`MAX_PUBLISHERS` most recent users.
+    """
+    with _publishers_lock:
+        rp = _publishers.pop(user, None)
+        if rp is None:
+            rp = RedisPublisher(facility=WEBSOCKETS_FACILITY, users=[user])
+            if len(_publishers) >= MAX_PUBLISHERS:
+                _publishers.popitem(last=False)
+        _publishers[user] = rp
+    return rp
+
+
+def frame(events):
+    """Return the websocket message body for ``events``.
+
+    A single event is sent as is, several are wrapped in a ``batch`` event.
+    """
+    if len(events) == 1:
+        return events[0]
+    return {'event_type': 'batch', 'events': events}
+
+
+def send(user, events):
+    """Publish ``events`` to ``user`` as one websocket message."""
+    message = RedisMessage(json.dumps(frame(events)))
+    publisher(user).publish_message(message)
+
+
+def _window_key(user):
+    return '{}:window:{}'.format(REDIS_PREFIX, user)
+
+
+def _pending_key(user):
+    return '{}:pending:{}'.format(REDIS_PREFIX, user)
+
+
+def _pop_pending(conn, user):
+    pipe = conn.pipeline()
+    pipe.lrange(_pending_key(user), 0, -1)
+    pipe.delete(_pending_key(user))
+    pending, _ = pipe.execute()
+    return [json.loads(event) for event in pending]
+
+
+def publish(user, events):
+    """Publish ``events`` to ``user``, coalescing bursts.
+
+    :param str user: Username.
+    :param list events: Event dicts, e.g. ``Notification.to_dict()`` outputs.
+    """
+    window = getattr(settings, 'NOTIFICATIONS_WS_WINDOW', 0)
+    if not window:
+        send(user, events)
+        return
+
+    conn = redis_connection()
+    if conn.set(_window_key(user), 1, nx=True, px=int(window * 1000)):
+        send(user, _pop_pending(conn, user) + events)
+        return
+
+    pipe = conn.pipeline()
+    pipe.rpush(_pending_key(user), *[json.dumps(event) for event in events])
+    pipe.expire(_pending_key(user), PENDING_TTL)
+    queued, _ = pipe.execute()
+    if queued == len(events):
+        # First events queued in this window, send them when it closes.
+        from designsafe.apps.api.tasks import flush_notifications
+        flush_notifications.apply_async(args=[user], countdown=window, queue='api')
+
+
+def flush(user):
+    """Send the events queued for ``user``."""
+    events = _pop_pending(redis_connection(), user)
+    if events:
+        send(user, events)
+
+
+class NotificationBatch(object):
+    """Buffer notifications and write them in bulk.
+
+    Notifications are written with ``bulk_create`` and each user gets one
+    websocket message per flush. ``bulk_create`` does not send ``post_save``
+    and, on MySQL, does not set the primary keys, so events published from
+    a batch have no ``pk``. Unread counters are updated once per flush.
+
+    Usage::
+
+        with NotificationBatch() as batch:
+            for path in paths:
+                batch.add(event_type='data', user=username, ...)
+
+    :param int batch_size: Buffered notifications that trigger a flush.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self._pending = []
+
+    def add(self, **event_data):
+        """Buffer a notification, see :class:`Notification` for the fields."""
+        notification = Notification(**event_data)
+        notification.encode_extra()
+        self._pending.append(notification)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        return notification
+
+    def flush(self):
+        """Write the buffered notifications and publish them."""
+        if not self._pending:
+            return
+        notifications, self._pending = self._pending, []
+        Notification.objects.bulk_create(notifications, batch_size=self.batch_size)
+        unread.incr(Counter(n.user for n in notifications if not n.read))
+
+        events = OrderedDict()
+        for notification in notifications:
+            events.setdefault(notification.user, []).append(notification.to_dict())
+        for user, user_events in events.items():
+            try:
+                publish(user, user_events)
+            except Exception:  # pylint: disable=broad-except
+                logger.debug('Exception sending websocket message', exc_info=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
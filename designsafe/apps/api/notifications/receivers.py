@@ -3,6 +3,7 @@ from ws4redis.publisher import RedisPublisher
 from ws4redis.redis_store import RedisMessage
 from django.db.models.signals import post_save
 from designsafe.apps.api.notifications.models import Notification, Broadcast
+from designsafe.apps.api.notifications import pipeline, unread
 import logging
 import json
 import six
@@ -10,7 +11,7 @@ import cgi
 
 logger = logging.getLogger(__name__)
 
-WEBSOCKETS_FACILITY = 'websockets'
+WEBSOCKETS_FACILITY = pipeline.WEBSOCKETS_FACILITY
 
 @receiver(post_save, sender=Notification, dispatch_uid='notification_msg')
 def send_notification_ws(sender, instance, created, **kwargs):
@@ -19,20 +20,17 @@ def send_notification_ws(sender, instance, created, **kwargs):
     if not created:
         return
     try:
-        rp = RedisPublisher(facility = WEBSOCKETS_FACILITY, users=[instance.user])
-        # logger.debug(instance.to_dict())
-        instance_dict = json.dumps(instance.to_dict())
-        msg = RedisMessage(instance_dict)
-        rp.publish_message(msg)
-        # logger.debug('WS socket msg sent: {}'.format(instance_dict))
+        pipeline.publish(instance.user, [instance.to_dict()])
     except Exception as e:
-        # logger.debug('Exception sending websocket message',
-        #              exc_info=True,
-        #              extra = instance.to_dict())
         logger.debug('Exception sending websocket message',
                      exc_info=True)
     return
 
+@receiver(post_save, sender=Notification, dispatch_uid='notification_unread')
+def count_unread_notification(sender, instance, created, **kwargs):
+    if created and not instance.read:
+        unread.incr({instance.user: 1})
+
 @receiver(post_save, sender=Broadcast, dispatch_uid='broadcast_msg')
 def send_broadcast_ws(sender, instance, created, **kwargs):
     if not created:
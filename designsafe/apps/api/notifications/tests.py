@@ -1,8 +1,11 @@
 import requests
 import json
 import os
-from django.test import TestCase
+from collections import defaultdict
+from django.test import TestCase, override_settings
 from django.test import Client
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.db.models.signals import post_save
 from mock import Mock, patch
@@ -12,6 +15,8 @@ from unittest import skip
 from django.dispatch import receiver
 from django.core.urlresolvers import reverse
 from designsafe.apps.api.notifications.models import Notification
+from designsafe.apps.api.notifications import pipeline
+from designsafe.apps.api.notifications.unread import unread_count
 from .receivers import send_notification_ws
 
 import logging
@@ -193,3 +198,227 @@ class TestWebhookViews(TestCase):
         # no matching running job so it fails
         self.assertEqual(response.status_code, 400)
         self.assertEqual(Notification.objects.count(), 0)
+
+
+class FakeRedis(object):
+    """Just enough of ``StrictRedis`` for the coalescing window."""
+
+    def __init__(self):
+        self.keys = {}
+        self.lists = defaultdict(list)
+
+    def set(self, key, value, nx=False, px=None, ex=None):
+        if nx and key in self.keys:
+            return False
+        self.keys[key] = value
+        return True
+
+    def get(self, key):
+        return self.keys.get(key)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def register_script(self, script):
+        def _incr_if_exists(keys, args, client):
+            def _incr():
+                if keys[0] not in self.keys:
+                    return None
+                self.keys[keys[0]] = max(0, int(self.keys[keys[0]]) + args[0])
+                return self.keys[keys[0]]
+            client.ops.append(_incr)
+        return _incr_if_exists
+
+
+class FakePipeline(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.ops = []
+
+    def lrange(self, key, start, end):
+        self.ops.append(lambda: list(self.conn.lists[key]))
+
+    def delete(self, key):
+        self.ops.append(lambda: int(self.conn.lists.pop(key, None) is not None))
+
+    def rpush(self, key, *values):
+        def _rpush():
+            self.conn.lists[key].extend(values)
+            return len(self.conn.lists[key])
+        self.ops.append(_rpush)
+
+    def expire(self, key, ttl):
+        self.ops.append(lambda: True)
+
+    def execute(self):
+        return [op() for op in self.ops]
+
+
+class NotificationPipelineTestCase(TestCase):
+
+    def setUp(self):
+        pipeline._publishers.clear()
+        patcher = patch('designsafe.apps.api.notifications.pipeline.RedisPublisher')
+        self.mock_publisher = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(pipeline._publishers.clear)
+
+    def _messages(self):
+        publish = self.mock_publisher.return_value.publish_message
+        return [json.loads(c[0][0]) for c in publish.call_args_list]
+
+    def _event_data(self, i, user='ds_user'):
+        return {'event_type': 'data', 'status': Notification.INFO,
+                'operation': 'copy', 'message': 'Copied file {}'.format(i),
+                'user': user, 'extra': {'path': '/file{}'.format(i)}}
+
+    def test_batch_writes_in_bulk(self):
+        with CaptureQueriesContext(connection) as queries:
+            with pipeline.NotificationBatch() as batch:
+                for i in range(100):
+                    batch.add(**self._event_data(i))
+                batch.add(**self._event_data(100, user='other_user'))
+
+        self.assertEqual(Notification.objects.count(), 101)
+        self.assertLessEqual(len(queries), 10)
+        self.assertEqual(Notification.objects.get(message='Copied file 7').extra_content,
+                         {'path': '/file7'})
+
+        messages = self._messages()
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(messages[0]['event_type'], 'batch')
+        self.assertEqual(len(messages[0]['events']), 100)
+        self.assertEqual(messages[1]['user'], 'other_user')
+        self.assertEqual(self.mock_publisher.call_count, 2)
+
+    def test_batch_flushes_at_batch_size(self):
+        batch = pipeline.NotificationBatch(batch_size=10)
+        for i in range(25):
+            batch.add(**self._event_data(i))
+        self.assertEqual(Notification.objects.count(), 20)
+        batch.flush()
+        self.assertEqual(Notification.objects.count(), 25)
+        self.assertEqual(len(self._messages()), 3)
+
+    def test_drive_download_errors_are_batched(self):
+        from designsafe.apps.api.external_resources.googledrive.filemanager.manager \
+            import FileManager
+        file_mgr = FileManager.__new__(FileManager)
+        file_mgr.googledrive_api = Mock()
+        file_mgr.googledrive_api.files.return_value.get.return_value.execute.return_value = {
+            'name': 'doc', 'mimeType': 'application/vnd.google-apps.document'}
+
+        with CaptureQueriesContext(connection) as queries:
+            with pipeline.NotificationBatch() as batch:
+                for i in range(20):
+                    path = file_mgr.download_file('doc{}'.format(i), b'/tmp',
+                                                  'ds_user', batch)
+                    self.assertIsNone(path)
+
+        self.assertEqual(Notification.objects.filter(
+            operation='googledrive_download_error').count(), 20)
+        self.assertLessEqual(len(queries), 5)
+        self.assertEqual(len(self._messages()), 1)
+
+    def test_publisher_is_reused(self):
+        for i in range(50):
+            Notification.objects.create(**self._event_data(i))
+        self.assertEqual(len(self._messages()), 50)
+        self.mock_publisher.assert_called_once_with(facility='websockets',
+                                                    users=['ds_user'])
+
+    @override_settings(NOTIFICATIONS_WS_WINDOW=1)
+    @patch('designsafe.apps.api.tasks.flush_notifications.apply_async')
+    @patch('designsafe.apps.api.notifications.pipeline.redis_connection')
+    def test_burst_is_coalesced(self, mock_redis, mock_flush_task):
+        mock_redis.return_value = conn = FakeRedis()
+
+        for i in range(100):
+            Notification.objects.create(**self._event_data(i))
+
+        # The first event opens the window, the others wait for it to close.
+        self.assertEqual(len(self._messages()), 1)
+        mock_flush_task.assert_called_once_with(args=['ds_user'], countdown=1,
+                                                queue='api')
+        pipeline.flush('ds_user')
+
+        messages = self._messages()
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(messages[0]['message'], 'Copied file 0')
+        self.assertEqual([e['message'] for e in messages[1]['events']],
+                         ['Copied file {}'.format(i) for i in range(1, 100)])
+
+        # Events queued when the next window opens are sent along.
+        conn.lists[pipeline._pending_key('ds_user')].append(json.dumps({'pk': 0}))
+        conn.keys.clear()
+        Notification.objects.create(**self._event_data(100))
+        messages = self._messages()
+        self.assertEqual(len(messages), 3)
+        self.assertEqual(len(messages[2]['events']), 2)
+
+
+class NotificationQueriesTestCase(TestCase):
+    fixtures = ['user-data']
+
+    def setUp(self):
+        post_save.disconnect(sender=Notification, dispatch_uid='notification_msg')
+        self.addCleanup(post_save.connect, send_notification_ws, sender=Notification,
+                        dispatch_uid='notification_msg')
+        self.client.force_login(get_user_model().objects.get(username='ds_user'))
+        for i in range(30):
+            Notification.objects.create(event_type='data', status=Notification.INFO,
+                                        message='Message {}'.format(i),
+                                        user='ds_user', extra={})
+        Notification.objects.create(event_type='job', status=Notification.INFO,
+                                    user='other_user', extra={})
+
+    def test_mark_read_is_one_update(self):
+        with self.assertNumQueries(1):
+            updated = Notification.objects.filter(user='ds_user').mark_read()
+        self.assertEqual(updated, 30)
+        self.assertFalse(Notification.objects.filter(user='ds_user', read=False).exists())
+
+    def test_delete_all(self):
+        with self.assertNumQueries(1):
+            Notification.objects.filter(user='ds_user').mark_deleted()
+        Notification.objects.filter(user='ds_user').update(deleted=False)
+
+        url = reverse('designsafe_api:delete_notification', args=['all'])
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Notification.objects.filter(deleted=False).count(), 1)
+
+    def test_list_with_cursor(self):
+        url = reverse('designsafe_api:event_type_notifications', args=['data'])
+        messages = []
+        response = self.client.get(url, {'limit': 20}).json()
+        self.assertEqual(response['total'], 30)
+        messages += [n['message'] for n in response['notifs']]
+        self.assertTrue(all(n['read'] for n in response['notifs']))
+
+        response = self.client.get(url, {'limit': 20, 'cursor': response['cursor']}).json()
+        self.assertIsNone(response['cursor'])
+        messages += [n['message'] for n in response['notifs']]
+        self.assertEqual(messages, ['Message {}'.format(i) for i in reversed(range(30))])
+        self.assertEqual(Notification.objects.filter(read=False).count(), 1)
+
+        response = self.client.get(url, {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(NOTIFICATIONS_UNREAD_CACHE=True)
+    @patch('designsafe.apps.api.notifications.pipeline.redis_connection')
+    def test_unread_counter(self, mock_redis):
+        mock_redis.return_value = FakeRedis()
+        url = reverse('designsafe_api:badge')
+        self.assertEqual(self.client.get(url).json(), {'unread': 30})
+
+        Notification.objects.create(event_type='data', status=Notification.INFO,
+                                    user='ds_user', extra={})
+        Notification.objects.filter(user='ds_user', message='Message 0').mark_read()
+        Notification.objects.filter(user='ds_user', message='Message 1').mark_deleted()
+        with self.assertNumQueries(0):
+            self.assertEqual(unread_count('ds_user'), 29)
+        self.assertEqual(self.client.get(url).json(), {'unread': 29})
+        self.assertEqual(Notification.objects.filter(user='ds_user', read=False,
+                                                     deleted=False).count(), 29)
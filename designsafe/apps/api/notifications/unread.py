@@ -0,0 +1,92 @@
+"""
+.. module: designsafe.apps.api.notifications.unread
+   :synopsis: Per-user unread notification counters kept in Redis.
+
+The counter of a user is read from the database the first time it is
+needed. After that, the writes to notifications keep it up to date. A
+counter expires ``COUNTER_TTL`` seconds after its last write, which bounds
+any drift, e.g. from a write that raced with the first read.
+
+``NOTIFICATIONS_UNREAD_CACHE = False`` counts in the database every time.
+"""
+import logging
+from django.conf import settings
+
+#pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+#pylint: enable=invalid-name
+
+REDIS_PREFIX = 'notifications_unread'
+COUNTER_TTL = 24 * 60 * 60
+
+# Only counters already read from the database are incremented.
+_INCR_IF_EXISTS = """
+if redis.call('exists', KEYS[1]) == 1 then
+    local value = redis.call('incrby', KEYS[1], ARGV[1])
+    if value < 0 then
+        value = 0
+        redis.call('set', KEYS[1], value)
+    end
+    redis.call('expire', KEYS[1], ARGV[2])
+    return value
+end
+return nil
+"""
+
+
+def enabled():
+    """Whether unread counters are kept in Redis."""
+    return getattr(settings, 'NOTIFICATIONS_UNREAD_CACHE', False)
+
+
+def _key(user):
+    return '{}:{}'.format(REDIS_PREFIX, user)
+
+
+def _count(user):
+    from designsafe.apps.api.notifications.models import Notification
+    return Notification.objects.filter(user=user, read=False, deleted=False).count()
+
+
+def unread_count(user):
+    """Return the number of unread notifications of ``user``."""
+    if not enabled():
+        return _count(user)
+
+    from designsafe.apps.api.notifications.pipeline import redis_connection
+    try:
+        conn = redis_connection()
+        count = conn.get(_key(user))
+        if count is not None:
+            return int(count)
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning('Unable to read unread counter: %s', exc)
+        return _count(user)
+
+    count = _count(user)
+    try:
+        conn.set(_key(user), count, nx=True, ex=COUNTER_TTL)
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning('Unable to set unread counter: %s', exc)
+    return count
+
+
+def incr(counts):
+    """Add to the unread counters.
+
+    :param dict counts: Username to amount, negative amounts decrement.
+    """
+    counts = {user: amount for user, amount in counts.items() if amount}
+    if not counts or not enabled():
+        return
+
+    from designsafe.apps.api.notifications.pipeline import redis_connection
+    try:
+        conn = redis_connection()
+        script = conn.register_script(_INCR_IF_EXISTS)
+        pipe = conn.pipeline(transaction=False)
+        for user, amount in counts.items():
+            script(keys=[_key(user)], args=[amount, COUNTER_TTL], client=pipe)
+        pipe.execute()
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning('Unable to update unread counters: %s', exc)
@@ -3,12 +3,16 @@ from django.http.response import HttpResponseBadRequest
 from django.http import HttpResponse
 from django.core.urlresolvers import reverse
 from django.shortcuts import render
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 
 from designsafe.apps.api.notifications.models import Notification
+from designsafe.apps.api.notifications.unread import unread_count
 
 from designsafe.apps.api.views import BaseApiView
 from designsafe.apps.api.mixins import JSONResponseMixin, SecureMixin
 from designsafe.apps.api.exceptions import ApiException
+from designsafe.libs.elasticsearch.utils import decode_cursor, encode_cursor
 
 import json
 
@@ -18,63 +22,74 @@ logger = logging.getLogger(__name__)
 class ManageNotificationsView(SecureMixin, JSONResponseMixin, BaseApiView):
 
     def get(self, request, event_type = None, *args, **kwargs):
-        limit = request.GET.get('limit', 0)
-        page = request.GET.get('page', 0)
+        """List notifications, newest first, and mark them read.
 
+        Pages are selected with ``page`` or, without counting or skipping
+        rows, with the ``cursor`` returned by the previous page.
+        """
+        limit = int(request.GET.get('limit', 0))
+        page = int(request.GET.get('page', 0))
+        cursor = request.GET.get('cursor')
+
+        notifs = Notification.objects.filter(deleted = False,
+                      user = request.user.username)
         if event_type is not None:
-            notifs = Notification.objects.filter(event_type = event_type,
-                          deleted = False,
-                          user = request.user.username).order_by('-datetime')
-            total = Notification.objects.filter(event_type = event_type,
-                          deleted = False,
-                          user = request.user.username).count()
+            notifs = notifs.filter(event_type = event_type)
+        notifs = notifs.order_by('-datetime', '-pk')
+
+        result = {'page': page}
+        if cursor:
+            try:
+                last_datetime, last_pk = decode_cursor(cursor)
+                last_datetime = parse_datetime(last_datetime)
+                last_pk = int(last_pk)
+            except (TypeError, ValueError):
+                last_datetime = None
+            if last_datetime is None:
+                return HttpResponseBadRequest('Invalid cursor.')
+            notifs = notifs.filter(Q(datetime__lt = last_datetime) |
+                                   Q(datetime = last_datetime, pk__lt = last_pk))
         else:
-            notifs = Notification.objects.filter(deleted = False,
-                          user = request.user.username).order_by('-datetime')
-            total = Notification.objects.filter(deleted = False,
-                          user = request.user.username).count()
+            result['total'] = notifs.count()
+            notifs = notifs[page * limit:]
         if limit:
-            limit = int(limit)
-            page = int(page)
-            offset = page * limit
-            notifs = notifs[offset:offset+limit]
+            notifs = notifs[:limit]
+        notifs = list(notifs)
 
-        for n in notifs:
-            if not n.read:
-                n.mark_read()
+        unread = [n for n in notifs if not n.read]
+        if unread:
+            Notification.objects.filter(pk__in = [n.pk for n in unread]).mark_read()
+            for n in unread:
+                n.read = True
 
-        notifs = [n.to_dict() for n in notifs]
-        return self.render_to_json_response({'notifs':notifs, 'page':page, 'total': total})
-        # return self.render_to_json_response(notifs)
+        result['notifs'] = [n.to_dict() for n in notifs]
+        result['cursor'] = None
+        if limit and len(notifs) == limit:
+            result['cursor'] = encode_cursor([notifs[-1].datetime.isoformat(),
+                                              notifs[-1].pk])
+        return self.render_to_json_response(result)
 
     def post(self, request, *args, **kwargs):
         body_json = json.loads(request.body)
         nid = body_json['id']
         read = body_json['read']
-        n = Notification.get(id = nid)
-        n.read = read
-        n.save()
+        notifs = Notification.objects.filter(pk = nid, user = request.user.username)
+        if read:
+            notifs.mark_read()
+        else:
+            notifs.mark_unread()
+        return HttpResponse('OK')
 
     def delete(self, request, pk, *args, **kwargs):
-        # body_json = json.loads(request.body)
-        # nid = body_json['id']
-        # deleted = body_json['deleted']
-        # n = Notification.objects.get(pk = pk)
-        # n.deleted = deleted
-        # n.save()
-        if pk == 'all':
-            items=Notification.objects.filter(deleted=False, user=str(request.user))
-            for i in items:
-                i.mark_deleted()
-        else:
-            x = Notification.objects.get(pk=pk)
-            x.mark_deleted()
+        notifs = Notification.objects.filter(user = request.user.username)
+        if pk != 'all':
+            notifs = notifs.filter(pk = pk)
+        notifs.mark_deleted()
 
         return HttpResponse('OK')
 
 class NotificationsBadgeView(SecureMixin, JSONResponseMixin, BaseApiView):
 
     def get(self, request, *args, **kwargs):
-        unread = Notification.objects.filter(deleted = False, read = False,
-                      user = request.user.username).count()
-        return self.render_to_json_response({'unread': unread})
+        return self.render_to_json_response(
+            {'unread': unread_count(request.user.username)})
@@ -44,14 +44,14 @@ class JobsWebhookView(JSONResponseMixin, BaseApiView):
 
     def post(self, request, *args, **kwargs):
         """
-        Calls handle_webhook_request on webhook JSON body
+        Queues handle_webhook_request on webhook JSON body
         to notify the user of the progress of the job.
 
         """
 
         job = json.loads(request.body)
 
-        handle_webhook_request(job)
+        handle_webhook_request.apply_async(args=[job], queue='default')
         return HttpResponse('OK')
 
 
@@ -30,6 +30,14 @@ class Project(BaseMetadataResource):
     NAME = 'designsafe.project'
     STORAGE_SYSTEM_ID = 'designsafe.storage.projects'
 
+    # Sort keys of ``ES_list_projects`` and the fields they sort on.
+    ES_SORT_FIELDS = {
+        'created': 'created',
+        'lastUpdated': 'lastUpdated',
+        'projectId': 'value.projectId._exact',
+        'pi': 'value.pi._exact',
+    }
+
     def __init__(self, agave_client, **kwargs):
         defaults = {
             'name': Project.NAME
@@ -56,15 +64,73 @@ class Project(BaseMetadataResource):
         return [cls(agave_client=agave_client, **dict(r, **kwargs)) for r in records]
 
     @classmethod
-    def ES_search(cls, agave_client, query_string, username, **kwargs):
-        from designsafe.apps.projects.models.elasticsearch import IndexedProject
+    def list_user_projects(cls, agave_client, username, offset=0, limit=100,
+                           sort=None):
+        """
+        Get a list of the Projects of a user as dicts ready to serialize.
+
+        Projects are served from the projects index. Agave is only queried
+        when the index can't be searched, or has no projects for the user
+        yet, e.g. right after their first project was created.
+
+        :param agave_client: agavepy.Agave: Agave API client instance
+        :param str username: PI, co-PI or team member of the projects
+        :param str sort: One of :attr:`ES_SORT_FIELDS`, "-" prefixed for
+            descending order
+        :raises ValueError: If ``sort`` is not a known sort key
+        :return: list of project metadata dicts
+        """
+        from elasticsearch import TransportError
+        try:
+            projects = cls.ES_list_projects(username, offset=offset, limit=limit,
+                                            sort=sort)
+            if projects or offset:
+                return projects
+        except TransportError as exc:
+            logger.warning('Unable to list projects of %s from the index: %s',
+                           username, exc)
+        return [prj.to_dict() for prj in
+                cls.list_projects(agave_client, offset=offset, limit=limit)]
+
+    @staticmethod
+    def ES_member_query(username):
+        """Query matching projects where ``username`` is the PI, a co-PI or a
+        team member."""
         from elasticsearch_dsl import Q
-   
         pi_query = Q({'term': {'value.pi._exact': username}})
         copi_query = Q({'term': {'value.coPis._exact': username}})
         team_query = Q({'term': {'value.teamMembers._exact': username}})
+        return pi_query | copi_query | team_query
+
+    @classmethod
+    def ES_list_projects(cls, username, offset=0, limit=100, sort=None):
+        """
+        Get a list of the Projects of a user from the projects index.
+
+        :param str sort: One of :attr:`ES_SORT_FIELDS`, "-" prefixed for
+            descending order. Defaults to oldest first, like Agave.
+        :raises ValueError: If ``sort`` is not a known sort key
+        :return: list of the indexed project metadata dicts
+        """
+        from designsafe.apps.projects.models.elasticsearch import IndexedProject
+        sort = sort or 'created'
+        field = cls.ES_SORT_FIELDS.get(sort.lstrip('-'))
+        if field is None:
+            raise ValueError('Unknown project sort "{}"'.format(sort))
+        order = 'desc' if sort.startswith('-') else 'asc'
+
+        records = IndexedProject.search().filter(cls.ES_member_query(username))
+        records = records.sort({field: {'order': order}}, 'uuid._exact')
+        records = records.extra(from_=offset, size=limit)
+        res = records.execute()
+        return [hit['_source'] for hit in res.to_dict()['hits']['hits']]
+
+    @classmethod
+    def ES_search(cls, agave_client, query_string, username, **kwargs):
+        from designsafe.apps.projects.models.elasticsearch import IndexedProject
+
         records = IndexedProject.search().query('query_string', query=query_string, default_operator='and')
-        records = records.filter(pi_query | copi_query | team_query )
+        records = records.filter(cls.ES_member_query(username))
         records = records.extra(from_=kwargs.get('offset', 0), size=kwargs.get('limit',100))
         records = records.execute()
         return [cls(agave_client=agave_client, **r.to_dict()) for r in records]
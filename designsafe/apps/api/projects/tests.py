@@ -159,3 +159,55 @@ class ProjectDataModelsTestCase(TestCase):
         publication.reserve_publication(pub)
         mock_prj_reserve_xml.assert_called_with(pub)
         mock_update_doi.assert_called_once_with('proj_doi', 'proj_xml', status='public')
+
+
+class ProjectListingTestCase(TestCase):
+
+    @patch('designsafe.apps.projects.models.elasticsearch.IndexedProject.search')
+    def test_es_list_projects(self, mock_search):
+        from designsafe.apps.api.projects.models import Project
+        records = mock_search.return_value.filter.return_value.sort.return_value
+        records.extra.return_value.execute.return_value.to_dict.return_value = {
+            'hits': {'hits': [{'_id': 'uuid-1', '_source': {'uuid': 'uuid-1', 'value': {}}}]}
+        }
+
+        projects = Project.ES_list_projects('user', offset=10, limit=5, sort='-lastUpdated')
+
+        self.assertEqual(projects, [{'uuid': 'uuid-1', 'value': {}}])
+        query = mock_search.return_value.filter.call_args[0][0].to_dict()
+        self.assertEqual(len(query['bool']['should']), 3)
+        mock_search.return_value.filter.return_value.sort.assert_called_with(
+            {'lastUpdated': {'order': 'desc'}}, 'uuid._exact')
+        records.extra.assert_called_with(from_=10, size=5)
+
+    def test_es_list_projects_unknown_sort(self):
+        from designsafe.apps.api.projects.models import Project
+        with self.assertRaises(ValueError):
+            Project.ES_list_projects('user', sort='title')
+
+    @patch('designsafe.apps.api.projects.models.Project.list_projects')
+    @patch('designsafe.apps.api.projects.models.Project.ES_list_projects')
+    def test_list_user_projects_from_index(self, mock_es_list, mock_list):
+        from designsafe.apps.api.projects.models import Project
+        mock_es_list.return_value = [{'uuid': 'uuid-1'}]
+        self.assertEqual(Project.list_user_projects(Mock(), 'user'), [{'uuid': 'uuid-1'}])
+        mock_list.assert_not_called()
+
+    @patch('designsafe.apps.api.projects.models.Project.list_projects')
+    @patch('designsafe.apps.api.projects.models.Project.ES_list_projects')
+    def test_list_user_projects_falls_back_to_agave(self, mock_es_list, mock_list):
+        from elasticsearch import TransportError
+        from designsafe.apps.api.projects.models import Project
+        mock_list.return_value = [Mock(**{'to_dict.return_value': {'uuid': 'uuid-1'}})]
+        ag = Mock()
+
+        mock_es_list.return_value = []
+        self.assertEqual(Project.list_user_projects(ag, 'user'), [{'uuid': 'uuid-1'}])
+        mock_es_list.side_effect = TransportError(500)
+        self.assertEqual(Project.list_user_projects(ag, 'user', offset=100),
+                         [{'uuid': 'uuid-1'}])
+        mock_list.assert_called_with(ag, offset=100, limit=100)
+
+        # An empty page past the first one is the end of the listing.
+        mock_es_list.side_effect = None
+        self.assertEqual(Project.list_user_projects(ag, 'user', offset=100), [])
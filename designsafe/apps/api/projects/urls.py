@@ -14,6 +14,7 @@ from django.conf.urls import url, include
 from designsafe.apps.api.projects.views import (ProjectListingView,
                                                 ProjectCollectionView,
                                                 ProjectDataView,
+                                                ProjectArchiveView,
                                                 ProjectCollaboratorsView,
                                                 ProjectInstanceView,
                                                 ProjectMetaView,
@@ -55,6 +56,9 @@ urlpatterns = [
     url(r'^(?P<project_id>[a-z0-9\-]+)/collaborators/$',
         ProjectCollaboratorsView.as_view(), name='project_collaborators'),
 
+    url(r'^(?P<project_id>[a-z0-9\-]+)/archive/$',
+        ProjectArchiveView.as_view(), name='project_archive'),
+
     url(r'^(?P<project_id>[a-z0-9\-]+)/data/$',
         ProjectDataView.as_view(), name='project_data'),
 
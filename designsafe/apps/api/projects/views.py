@@ -24,7 +24,9 @@ from designsafe.apps.data.models.agave.files import BaseFileResource
 from designsafe.apps.data.models.agave.util import AgaveJSONEncoder
 from designsafe.apps.accounts.models import DesignSafeProfile
 from designsafe.apps.projects.models.utils import lookup_model as project_lookup_model
+from designsafe.apps.projects.managers import entities as project_entities
 from designsafe.libs.common.decorators import profile as profile_fn
+from designsafe.libs.common.archive import archive_response
 from designsafe.apps.api.agave.filemanager.publications import PublicationsManager
 from designsafe.libs.elasticsearch.docs.publications import BaseESPublication
 from designsafe.libs.elasticsearch.docs.publication_legacy import BaseESPublicationLegacy
@@ -154,19 +156,25 @@ class ProjectCollectionView(SecureMixin, BaseApiView):
             return JsonResponse(data, encoder=AgaveJSONEncoder)
         # Add metadata fields to project listings for workspace browser
         if system_id:
-            projects = Project.list_projects(agave_client=ag, **{'path': '', 'type': 'dir', 'system': system_id})
+            projects = Project.list_user_projects(ag, request.user.username)
             for p in projects:
-                p.path = ''
-                p.name = p.value['title']
-                p.system = 'project-{}'.format(p.uuid)
+                p['path'] = ''
+                p['type'] = 'dir'
+                p['name'] = p['value']['title']
+                p['system'] = 'project-{}'.format(p['uuid'])
             data = {
                 'children': projects,
                 'path': 'Projects',
             }
         else:
-            offset = request.GET.get('offset', 0)
-            limit = request.GET.get('limit', 100)
-            projects = Project.list_projects(agave_client=ag, **{'offset':offset, 'limit':limit})
+            offset = int(request.GET.get('offset', 0))
+            limit = int(request.GET.get('limit', 100))
+            try:
+                projects = Project.list_user_projects(
+                    ag, request.user.username, offset=offset, limit=limit,
+                    sort=request.GET.get('sort'))
+            except ValueError as exc:
+                return HttpResponseBadRequest(str(exc))
             data = {'projects': projects}
             
         return JsonResponse(data, encoder=AgaveJSONEncoder)
@@ -438,6 +446,21 @@ class ProjectCollaboratorsView(SecureMixin, BaseApiView):
         return JsonResponse({'status': 'ok'})
 
 
+class ProjectArchiveView(SecureMixin, BaseApiView):
+
+    @profile_fn
+    def get(self, request, project_id):
+        """Stream a zip of the project's files.
+
+        The zip is built while it is sent, so nothing is written to corral.
+        """
+        ag = request.user.agave_oauth.client
+        project = BaseProject.manager().get(ag, uuid=project_id)
+        archive_path, manifest_path = project.archive_paths()
+        return archive_response(project.corral_path, project.archive_name,
+                                exclude=[archive_path, manifest_path])
+
+
 class ProjectDataView(SecureMixin, BaseApiView):
 
     @profile_fn
@@ -458,26 +481,46 @@ class ProjectDataView(SecureMixin, BaseApiView):
 
 class ProjectMetaView(BaseApiView, SecureMixin):
 
+    @staticmethod
+    def _get_project(ag, project_id):
+        """Get a project with the user's client, checking they can read it."""
+        prj_obj = ag.meta.getMetadata(uuid=project_id)
+        prj = project_lookup_model(prj_obj)(**prj_obj)
+        prj.manager().set_client(ag)
+        return prj
+
     @profile_fn
     def get(self, request, project_id=None, name=None, uuid=None):
         """
+        Entities of a project are served by
+        :class:`~designsafe.apps.projects.managers.entities.EntityGraphLoader`.
+        ``?fields=uuid,name,value.title`` returns only the given fields.
 
         :return:
         :rtype: JsonResponse
         """
         ag = request.user.agave_oauth.client
+        fields = [field for field in request.GET.get('fields', '').split(',')
+                  if field]
         try:
             if name is not None and name != 'all':
                 model = project_lookup_model(name=name)
-                resp = model._meta.model_manager.list(ag, project_id)
-                resp_list = [r.to_body_dict() for r in resp]
+                prj = self._get_project(ag, project_id)
+                loader = project_entities.EntityGraphLoader(ag)
+                if name in loader.entity_names(prj):
+                    resp_list = loader.entities(prj, names=[name])
+                else:
+                    resp = model._meta.model_manager.list(ag, project_id)
+                    resp_list = [r.to_body_dict() for r in resp]
                 resp_list = sorted(resp_list, key=lambda x: x['created'])
+                if fields:
+                    resp_list = [project_entities.project_fields(body, fields)
+                                 for body in resp_list]
                 return JsonResponse(resp_list, safe=False)
             elif name == 'all':
-                prj_obj = ag.meta.getMetadata(uuid=project_id)
-                prj = project_lookup_model(prj_obj)(**prj_obj)
-                prj.manager().set_client(ag)
-                resp_list = [ent.to_body_dict() for ent in prj.related_entities()]
+                prj = self._get_project(ag, project_id)
+                loader = project_entities.EntityGraphLoader(ag)
+                resp_list = loader.entities(prj, fields=fields)
                 return JsonResponse(resp_list, safe=False)
             elif uuid is not None:
                 meta = ag.meta.getMetadata(uuid=uuid)
@@ -499,6 +542,7 @@ class ProjectMetaView(BaseApiView, SecureMixin):
         model = project_lookup_model(meta_obj)
         meta = model(**meta_obj)
         ag.meta.deleteMetadata(uuid=uuid)
+        project_entities.invalidate(*meta_obj.get('associationIds', []))
         return JsonResponse(meta.to_body_dict(), safe=False)
 
     @profile_fn
@@ -8,6 +8,7 @@ import logging
 from future.utils import python_2_unicode_compatible
 from elasticsearch_dsl import Q, Index
 from django.conf import settings
+from designsafe.libs.elasticsearch.aliases import index_name as es_index_name
 from designsafe.apps.api.search.searchmanager.base import BaseSearchManager
 
 @python_2_unicode_compatible
@@ -31,7 +32,7 @@ class CMSSearchManager(BaseSearchManager):
         super(CMSSearchManager, self).__init__(cms_index, cms_index.search())
 
     def construct_query(self, system=None, file_path=None):
-        cms_index_name = list(Index(settings.ES_INDEX_PREFIX.format('cms')).get_alias().keys())[0]
+        cms_index_name = es_index_name('cms')
         cms_query = Q(
             'bool',
             must=[
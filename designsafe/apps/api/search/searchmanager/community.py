@@ -7,8 +7,9 @@
 import logging
 from designsafe.apps.api.search.searchmanager.base import BaseSearchManager
 from designsafe.apps.data.models.elasticsearch import IndexedFile
-from elasticsearch_dsl import Q, Search, Index
+from elasticsearch_dsl import Q, Search
 from django.conf import settings
+from designsafe.libs.elasticsearch.aliases import index_name as es_index_name
 
 logger = logging.getLogger(__name__)
 
@@ -34,7 +35,7 @@ class CommunityDataSearchManager(BaseSearchManager):
 
     def construct_query(self, system=None, file_path=None):
 
-        files_index_name = list(Index(settings.ES_INDEX_PREFIX.format('files')).get_alias().keys())[0]
+        files_index_name = es_index_name('files')
 
         ngram_query = Q("query_string", query=self.query_string,
                         fields=["name"],
@@ -6,8 +6,9 @@
 import logging
 from designsafe.apps.api.search.searchmanager.base import BaseSearchManager
 from designsafe.apps.data.models.elasticsearch import IndexedFile
-from elasticsearch_dsl import Q, Search, Index
+from elasticsearch_dsl import Q, Search
 from django.conf import settings
+from designsafe.libs.elasticsearch.aliases import index_name as es_index_name
 
 logger = logging.getLogger(__name__)
 
@@ -29,7 +30,7 @@ class PrivateDataSearchManager(BaseSearchManager):
 
     def construct_query(self, system, file_path=None):
 
-        files_index_name = list(Index(settings.ES_INDEX_PREFIX.format('files')).get_alias().keys())[0]
+        files_index_name = es_index_name('files')
 
         if system == settings.AGAVE_STORAGE_SYSTEM:
             storage_prefix_query = Q({'prefix': {'path._exact': '/' + self.username}})
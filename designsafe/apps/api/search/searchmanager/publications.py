@@ -7,8 +7,9 @@
 import logging
 from designsafe.apps.api.search.searchmanager.base import BaseSearchManager
 from designsafe.apps.data.models.elasticsearch import IndexedPublication
-from elasticsearch_dsl import Q, Search, Index
+from elasticsearch_dsl import Q, Search
 from django.conf import settings
+from designsafe.libs.elasticsearch.aliases import index_names as es_index_names
 from designsafe.libs.elasticsearch.docs.publications import BaseESPublication
 from designsafe.libs.elasticsearch.docs.publication_legacy import BaseESPublicationLegacy
 
@@ -42,8 +43,9 @@ class PublicationsSearchManager(BaseSearchManager):
             "project.value.dois",
             "name"
             ]
-        published_index_name = list(Index(settings.ES_INDEX_PREFIX.format('publications')).get_alias().keys())[0]
-        legacy_index_name = list(Index(settings.ES_INDEX_PREFIX.format('publications-legacy')).get_alias().keys())[0]
+        index_names = es_index_names('publications', 'publications-legacy')
+        published_index_name = index_names['publications']
+        legacy_index_name = index_names['publications-legacy']
         filter_queries = []
         if kwargs.get('type_filters'):
             for type_filter in kwargs['type_filters']:
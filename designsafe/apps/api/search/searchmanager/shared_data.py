@@ -7,8 +7,11 @@
 import logging
 from designsafe.apps.api.search.searchmanager.base import BaseSearchManager
 from designsafe.apps.data.models.elasticsearch import IndexedFile
-from elasticsearch_dsl import Q, search, Index
+from elasticsearch_dsl import Q, search
 from django.conf import settings
+from designsafe.libs.elasticsearch.aliases import index_name as es_index_name
+from designsafe.libs.elasticsearch.utils import paginate, next_cursor
+from designsafe.apps.api.exceptions import ApiException
 
 logger = logging.getLogger(__name__)
 
@@ -30,7 +33,7 @@ class SharedDataSearchManager(BaseSearchManager):
 
     def construct_query(self, system, file_path=None):
 
-        files_index_name = list(Index(settings.ES_INDEX_PREFIX.format('files')).get_alias().keys())[0]
+        files_index_name = es_index_name('files')
 
         if system == settings.AGAVE_STORAGE_SYSTEM:
             storage_prefix_query = Q({'prefix': {'path._exact': '/' + self.username}})
@@ -52,8 +55,13 @@ class SharedDataSearchManager(BaseSearchManager):
 
         return private_files_query
 
-    def listing(self, system, file_path, user_context=None, offset=None, limit=None):
-        """Perform the search and output in a serializable format."""
+    def listing(self, system, file_path, user_context=None, offset=None, limit=None,
+                cursor=None):
+        """Perform the search and output in a serializable format.
+
+        Hits are sorted by score, then ``(path, name)``. The ``cursor`` of
+        the result fetches the next page; it is ``None`` on the last page.
+        """
 
         ngram_query = Q("query_string", query=self.query_string,
                         fields=["name"],
@@ -72,11 +80,14 @@ class SharedDataSearchManager(BaseSearchManager):
         search = search.query(Q('bool', must_not=[Q({'prefix': {'path._exact': '/'+user_context}})]))
         search = search.filter("term", system=system)
         search = search.query(Q('bool', must_not=[Q({'prefix': {'path._exact': '{}/.Trash'.format(user_context)}})]))
+        search = search.sort('_score', 'path._exact', 'name._exact')
+        try:
+            search = paginate(search, offset=offset, limit=limit, cursor=cursor)
+        except ValueError:
+            raise ApiException('Invalid cursor.', status=400)
         res = search.execute()
 
-        children = []
-        if res.hits.total.value:
-            children = [o.to_dict() for o in search[offset:limit]]
+        children = [o.to_dict() for o in res]
 
         result = {
             'trail': [{'name': '$SEARCHSHARED', 'path': '/$SEARCH'}],
@@ -85,8 +96,7 @@ class SharedDataSearchManager(BaseSearchManager):
             'system': system,
             'type': 'dir',
             'children': children,
-            'permissions': 'READ'
+            'permissions': 'READ',
+            'cursor': next_cursor(res, limit)
         }
         return result
-
-
@@ -1,5 +1,5 @@
 from mock import Mock, patch, MagicMock, PropertyMock
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.conf import settings
 from django.core.urlresolvers import reverse
@@ -13,21 +13,47 @@ class SearchViewTests(TestCase):
     @patch('designsafe.apps.api.search.views.CMSSearchManager')
     @patch('designsafe.apps.api.search.views.PublicationsSearchManager')
     @patch('designsafe.apps.api.search.views.Search')
-    @patch('designsafe.apps.api.search.views.Index')
-    def test_search_view(self, mock_index, mock_search, mock_community, mock_published, mock_cms, mock_publications):
+    @patch('designsafe.apps.api.search.views.es_index_names')
+    def test_search_view(self, mock_index_names, mock_search, mock_community, mock_published, mock_cms, mock_publications):
 
-        mock_index().alias().keys.side_effect = [['test-pub'], ['test-pub-legacy'], ['test-files'], ['test-cms']]
-        mock_search().query().count.return_value = 0
-        mock_search().query().highlight().highlight_options().execute().return_value = []
-        mock_search().query().highlight().highlight_options().execute().hits.total.value = 0
+        mock_index_names.return_value = {'publications': 'test-pub', 'publications-legacy': 'test-pub-legacy',
+                                         'files': 'test-files', 'cms': 'test-cms'}
+        mock_res = MagicMock()
+        mock_res.__iter__.return_value = []
+        mock_res.hits.total.value = 0
+        for category, count in (('all', 3), ('public_files', 1), ('published', 2), ('cms', 0)):
+            getattr(mock_res.aggregations.totals.buckets, category).doc_count = count
+        mock_es_query = mock_search().query().extra()
+        mock_es_query.highlight().highlight_options().execute.return_value = mock_res
         url = "{}?type_filter=all&query_string=test".format(reverse('designsafe_api:ds_search_api:search'))
 
         response = self.client.get(url)
 
         self.assertEqual(response.json(), {'hits': [],
-                                           'public_files_total': 0,
-                                           'published_total': 0,
+                                           'public_files_total': 1,
+                                           'published_total': 2,
                                            'cms_total': 0,
                                            'total_hits': 0,
-                                           'all_total': 0})
+                                           'all_total': 3})
+        mock_search().query().extra.assert_called_with(from_=0, size=10)
+        # Hits and every category total come back from a single request.
+        self.assertEqual(mock_es_query.highlight().highlight_options().execute.call_count, 1)
+        filters = mock_es_query.highlight().highlight_options().aggs.bucket.call_args[1]['filters']
+        self.assertEqual(sorted(filters), ['all', 'cms', 'public_files', 'published'])
 
+    @override_settings(SEARCH_CACHE_TIMEOUT=30)
+    @patch('designsafe.apps.api.search.views.cache')
+    @patch('designsafe.apps.api.search.views.SearchView.search')
+    def test_anonymous_results_cached(self, mock_do_search, mock_cache):
+        mock_cache.get.return_value = None
+        mock_do_search.return_value = {'hits': [], 'total_hits': 0}
+        url = "{}?type_filter=cms&query_string=test".format(reverse('designsafe_api:ds_search_api:search'))
+
+        self.client.get(url)
+        cache_key = mock_cache.get.call_args[0][0]
+        mock_cache.set.assert_called_with(cache_key, {'hits': [], 'total_hits': 0}, 30)
+
+        mock_cache.get.return_value = {'hits': [], 'total_hits': 1}
+        response = self.client.get(url)
+        self.assertEqual(response.json(), {'hits': [], 'total_hits': 1})
+        self.assertEqual(mock_do_search.call_count, 1)
@@ -4,13 +4,17 @@
    and for authenticated users any private data that they can
    access.
 """
+import json
+import hashlib
 import logging
 import operator
-from elasticsearch_dsl import Q, Search, Index
+from elasticsearch_dsl import Q, Search
 from elasticsearch import TransportError, ConnectionTimeout
 from django.http import (HttpResponseBadRequest,
                          JsonResponse)
 from django.conf import settings
+from django.core.cache import cache
+from designsafe.libs.elasticsearch.aliases import index_names as es_index_names
 from designsafe.apps.api.views import BaseApiView
 
 from designsafe.apps.api.search.searchmanager.community import CommunityDataSearchManager
@@ -20,6 +24,28 @@ from designsafe.apps.api.search.searchmanager.publications import PublicationsSe
 
 logger = logging.getLogger(__name__)
 
+DOC_TYPES = (
+    ('publications', 'publication'),
+    ('publications-legacy', 'publication'),
+    ('files', 'file'),
+    ('cms', 'modelresult'),
+)
+
+
+def doc_type_map(refresh=False):
+    """Map concrete index names to the doc type reported to the client.
+
+    :param bool refresh: Resolve the aliases again instead of using the
+        cached index names.
+    """
+    index_names = es_index_names(*[key for key, _ in DOC_TYPES], refresh=refresh)
+    return dict((index_names[key], doc_type) for key, doc_type in DOC_TYPES)
+
+
+def _cache_key(query_string, type_filter, offset, limit):
+    key = json.dumps([query_string, type_filter, offset, limit])
+    return 'sitewide_search:{}'.format(hashlib.sha1(key.encode('utf-8')).hexdigest())
+
 
 class SearchView(BaseApiView):
     """Main view to handle sitewise search requests"""
@@ -32,36 +58,51 @@ class SearchView(BaseApiView):
             return HttpResponseBadRequest("limit must not exceed 500")
         type_filter = request.GET.get('type_filter', 'all')
 
-        doc_type_map = {
-            list(Index(settings.ES_INDEX_PREFIX.format('publications')).get_alias().keys())[0]: 'publication',
-            list(Index(settings.ES_INDEX_PREFIX.format('publications-legacy')).get_alias().keys())[0]: 'publication',
-            list(Index(settings.ES_INDEX_PREFIX.format('files')).get_alias().keys())[0]: 'file',
-            list(Index(settings.ES_INDEX_PREFIX.format('cms')).get_alias().keys())[0]: 'modelresult'
-        }
+        cache_key = None
+        cache_timeout = getattr(settings, 'SEARCH_CACHE_TIMEOUT', 30)
+        if not request.user.is_authenticated and cache_timeout:
+            cache_key = _cache_key(q, type_filter, offset, limit)
+            out = cache.get(cache_key)
+            if out is not None:
+                return JsonResponse(out, safe=False)
+
+        out = self.search(request, type_filter, offset, limit)
+
+        if cache_key:
+            cache.set(cache_key, out, cache_timeout)
+        return JsonResponse(out, safe=False)
+
+    def search(self, request, type_filter, offset, limit):
+        """Run the search and the per category totals in one request.
 
+        Hits are restricted to ``type_filter`` with a ``post_filter`` so a
+        ``filters`` aggregation over the unfiltered query can count every
+        category at once.
+        """
         public_files_query = CommunityDataSearchManager(request).construct_query() | PublishedDataSearchManager(request).construct_query()
         publications_query = PublicationsSearchManager(request).construct_query()
-        cms_query = es_query = CMSSearchManager(request).construct_query()
-
-        if type_filter == 'public_files':
-            es_query = Search().query(public_files_query)
-        elif type_filter == 'published':
-            es_query = Search().query(publications_query)
-        elif type_filter == 'cms':
-            es_query = Search().query(cms_query).highlight(
-                    'body',
-                    fragment_size=100).highlight_options(
-                    pre_tags=["<b>"],
-                    post_tags=["</b>"],
-                    require_field_match=False)
-        elif type_filter == 'all':
-            es_query = Search().query(public_files_query | publications_query | cms_query).highlight(
+        cms_query = CMSSearchManager(request).construct_query()
+        all_query = public_files_query | publications_query | cms_query
+
+        category_queries = {
+            'all': all_query,
+            'public_files': public_files_query,
+            'published': publications_query,
+            'cms': cms_query
+        }
+
+        es_query = Search().query(all_query).extra(from_=offset, size=limit)
+        if type_filter != 'all' and type_filter in category_queries:
+            es_query = es_query.post_filter(category_queries[type_filter])
+        if type_filter in ('all', 'cms'):
+            es_query = es_query.highlight(
                     'body',
                     fragment_size=100).highlight_options(
                     pre_tags=["<b>"],
                     post_tags=["</b>"],
                     require_field_match=False)
-            
+        es_query.aggs.bucket('totals', 'filters', filters=category_queries)
+
         try:
             res = es_query.execute()
         except (TransportError, ConnectionTimeout) as err:
@@ -71,10 +112,14 @@ class SearchView(BaseApiView):
 
         out = {}
         hits = []
+        index_doc_types = doc_type_map()
 
         for r in res:
             d = r.to_dict()
-            d["doc_type"] = doc_type_map[r.meta.index]
+            if r.meta.index not in index_doc_types:
+                # An alias moved to a new index since the map was built.
+                index_doc_types = doc_type_map(refresh=True)
+            d["doc_type"] = index_doc_types[r.meta.index]
             if hasattr(r.meta, 'highlight'):
                 highlight = r.meta.highlight.to_dict()
                 d["highlight"] = highlight
@@ -85,11 +130,12 @@ class SearchView(BaseApiView):
                 d["piLabel"] = "{}, {}".format(pi_user.last_name, pi_user.first_name)
             hits.append(d)
 
+        totals = res.aggregations.totals.buckets
         out['total_hits'] = res.hits.total.value
         out['hits'] = hits
-        out['all_total'] = Search().query(public_files_query | publications_query | cms_query).count()
-        out['public_files_total'] = Search().query(public_files_query).count()
-        out['published_total'] = Search().query(publications_query).count()
-        out['cms_total'] = Search().query(cms_query).count()
+        out['all_total'] = totals.all.doc_count
+        out['public_files_total'] = totals.public_files.doc_count
+        out['published_total'] = totals.published.doc_count
+        out['cms_total'] = totals.cms.doc_count
 
-        return JsonResponse(out, safe=False)
+        return out
@@ -14,9 +14,7 @@ from requests.exceptions import HTTPError
 
 from designsafe.apps.api.notifications.models import Notification, Broadcast
 from designsafe.apps.api.agave import get_service_account_client
-from designsafe.apps.projects.models.elasticsearch import IndexedProject
 from designsafe.apps.data.tasks import agave_indexer
-from elasticsearch_dsl.query import Q
 from django.core.mail import send_mail
 
 logger = logging.getLogger(__name__)
@@ -643,76 +641,37 @@ def set_project_id(self, project_uuid):
 @shared_task(bind=True)
 def index_or_update_project(self, uuid):
     """
-    Takes a project UUID and either creates a new document in the 
-    des-projects index or updates the document if one already exists for that
-    project.
+    Takes a project UUID and indexes it into the des-projects index. The
+    document id is the project UUID, so an existing document is replaced.
     """
-    from designsafe.apps.api.projects.models import Project
+    from designsafe.libs.elasticsearch.utils import index_project
 
     client = get_service_account_client()
-    project_model = Project(client)
-    project = project_model.search({'uuid': uuid}, client)[0]
-    project_meta = project.to_dict()
-
-    to_index = {key: value for key, value in iter(list(project_meta.items())) if key != '_links'}
-    to_index['value'] = {key: value for key, value in iter(list(project_meta['value'].items())) if key != 'teamMember'}
-    if not isinstance(to_index['value'].get('awardNumber', []), list):
-        to_index['value']['awardNumber'] = [{'number': to_index['value']['awardNumber'] }]
-    if to_index['value'].get('guestMembers', []) == [None]:
-        to_index['value']['guestMembers'] = []
-    project_search = IndexedProject.search().filter(
-        Q({'term': 
-            {'uuid._exact': uuid}
-        })
-    )
-    res = project_search.execute()
-    
-    if res.hits.total.value == 0:
-        # Create an ES record for the new metadata.
-        # project_info_args = {key:value for key,value in project_info.iteritems() if key != '_links'}
-        project_ES = IndexedProject(**to_index)
-        project_ES.save()
-    elif res.hits.total.value == 1:
-        # Update the record.
-        doc = res[0]
-        doc.update(**to_index)
-    else:
-        # If we're here we've somehow indexed the same project multiple times. 
-        # Delete all records and replace with the metadata passed to the task.
-        for doc in res:
-            IndexedProject.get(doc.meta.id).delete()
-        project_ES = IndexedProject(**to_index) 
-        project_ES.save()
+    index_project(client.meta.getMetadata(uuid=uuid))
 
 @shared_task(bind=True)
 def reindex_projects(self):
     """
-    Performs a listing of all projects using the service account client, then 
-    indexes each project using the index_or_update_project task.
+    Streams a listing of all projects using the service account client and
+    indexes them with the bulk API. Documents of projects that no longer
+    exist are removed afterwards.
     """
-    client = get_service_account_client()
-    query = {'name': 'designsafe.project'}
+    from designsafe.libs.elasticsearch.utils import (bulk_index_projects,
+                                                     iter_project_metadata)
 
-    in_loop = True
-    offset = 0
-    while in_loop:
-        listing = client.meta.listMetadata(q=json.dumps(query), offset=offset, limit=100)
-        offset += 100
+    client = get_service_account_client()
+    indexed = bulk_index_projects(iter_project_metadata(client))
+    logger.info('Reindexed %d projects.', indexed)
 
-        if len(listing) == 0:
-            in_loop = False
-        else:
-            for project in listing:
-                index_or_update_project.apply_async(args=[project.uuid], queue='api')
-   
 @shared_task(bind=True, max_retries=5)
 def copy_publication_files_to_corral(self, project_id):
     # Only copy published files while in prod
     if getattr(settings, 'DESIGNSAFE_ENVIRONMENT', 'dev') != 'default':
         return
 
+    import magic
     from designsafe.libs.elasticsearch.docs.publications import BaseESPublication
-    import shutil
+    from designsafe.libs.common.filecopy import CopyJob
     publication = BaseESPublication(project_id=project_id)
     filepaths = publication.related_file_paths()
     if not len(filepaths):
@@ -728,54 +687,23 @@ def copy_publication_files_to_corral(self, project_id):
             )
         ]
 
-    filepaths = list(set(filepaths))
-    filepaths = sorted(filepaths)
-    base_path = ''.join(['/', publication.projectId])
+    filepaths = sorted(set(filepaths))
     os.chmod('/corral-repl/tacc/NHERI/published', 0o755)
     prefix_dest = '/corral-repl/tacc/NHERI/published/{}'.format(project_id)
-    if not os.path.isdir(prefix_dest):
-        os.mkdir(prefix_dest)
-
     prefix_src = '/corral-repl/tacc/NHERI/projects/{}'.format(publication.project['uuid'])
-    for filepath in filepaths:
-        local_src_path = '{}/{}'.format(prefix_src, filepath)
-        local_dst_path = '{}/{}'.format(prefix_dest, filepath)
-        logger.info('Trying to copy: %s to %s', local_src_path, local_dst_path)
-        if os.path.isdir(local_src_path):
-            try:
-                #os.mkdir(local_dst_path)
-                if not os.path.isdir(os.path.dirname(local_dst_path)):
-                    os.makedirs(os.path.dirname(local_dst_path))
-                shutil.copytree(local_src_path, local_dst_path)
-                for root, dirs, files in os.walk(local_dst_path):
-                    for d in dirs:
-                        os.chmod(os.path.join(root, d), 0o555)
-                    for f in files:
-                        os.chmod(os.path.join(root, f), 0o444)
-                os.chmod(local_dst_path, 0o555)
-            except OSError as exc:
-                logger.info(exc)
-            except IOError as exc:
-                logger.info(exc)
-        else:
-            try:
-                if not os.path.isdir(os.path.dirname(local_dst_path)):
-                    os.makedirs(os.path.dirname(local_dst_path))
-                for root, dirs, files in os.walk(os.path.dirname(local_dst_path)):
-                    for d in dirs:
-                        os.chmod(os.path.join(root, d), 0o555)
-                    for f in files:
-                        os.chmod(os.path.join(root, f), 0o444)
-
-                shutil.copy(local_src_path, local_dst_path)
-                os.chmod(local_dst_path, 0o444)
-            except OSError as exc:
-                logger.info(exc)
-            except IOError as exc:
-                logger.info(exc)
-
-    os.chmod(prefix_dest, 0o555)
-    os.chmod('/corral-repl/tacc/NHERI/published', 0o555)
+    if not os.path.isdir(settings.PUBLICATION_MANIFEST_DIR):
+        os.makedirs(settings.PUBLICATION_MANIFEST_DIR)
+
+    mime = magic.Magic(mime=True)
+    job = CopyJob(prefix_src, prefix_dest, filepaths,
+                  journal_path=publication.copy_journal_path(),
+                  manifest_path=publication.copy_manifest_path(),
+                  max_workers=getattr(settings, 'PUBLICATION_COPY_WORKERS', 8),
+                  sniff=mime.from_buffer)
+    try:
+        job.run()
+    finally:
+        os.chmod('/corral-repl/tacc/NHERI/published', 0o555)
     save_to_fedora.apply_async(args=[project_id])
     agave_indexer.apply_async(kwargs={'username': 'ds_admin', 'systemId': 'designsafe.storage.published', 'filePath': '/' + project_id, 'recurse':True}, queue='indexing')
 
@@ -880,47 +808,25 @@ def set_publish_status(self, project_id, entity_uuids, publish_dois=False):
 
 @shared_task(bind=True, max_retries=5, default_retry_delay=60)
 def save_to_fedora(self, project_id):
-    import requests
     import magic
-    from designsafe.libs.elasticsearch.docs.publications import BaseESPublication 
+    from designsafe.libs.elasticsearch.docs.publications import BaseESPublication
+    from designsafe.libs.common.filecopy import load_manifest
+    from designsafe.libs.common.fedora import FedoraIngest, MimeCache
     try:
         pub = BaseESPublication(project_id=project_id)
         pub.update(status='published')
         _root = os.path.join('/corral-repl/tacc/NHERI/published', project_id)
-        fedora_base = 'http://fedoraweb01.tacc.utexas.edu:8080/fcrepo/rest/publications_01'
-        res = requests.get(fedora_base)
-        if res.status_code == 404 or res.status_code == 410:
-            requests.put(fedora_base)
-        
-        fedora_project_base = ''.join([fedora_base, '/', project_id])
-        res = requests.get(fedora_project_base)
-        if res.status_code == 404 or res.status_code == 410:
-            requests.put(fedora_project_base)
-
-        headers = {'Content-Type': 'text/plain'}
-        #logger.debug('walking: %s', _root)
-        for root, dirs, files in os.walk(_root):
-            for name in files:
-                mime = magic.Magic(mime=True)
-                headers['Content-Type'] = mime.from_file(os.path.join(root, name))
-                #files
-                full_path = os.path.join(root, name)
-                _path = full_path.replace(_root, '', 1)
-                _path = _path.replace('[', '-')
-                _path = _path.replace(']', '-')
-                url = ''.join([fedora_project_base, urllib.parse.quote(_path)])
-                #logger.debug('uploading: %s', url)
-                with open(os.path.join(root, name), 'rb') as _file:
-                    requests.put(url, data=_file, headers=headers)
-
-            for name in dirs:
-                #dirs
-                full_path = os.path.join(root, name)
-                _path = full_path.replace(_root, '', 1)
-                url = ''.join([fedora_project_base, _path])
-                #logger.debug('creating: %s', _path)
-                requests.put(url)
-
+        fedora_base = settings.FEDORA_BASE_URL
+        mime = magic.Magic(mime=True)
+        ingest = FedoraIngest(
+            ''.join([fedora_base, '/', project_id]), _root,
+            journal_path=os.path.join(settings.PUBLICATION_MANIFEST_DIR,
+                                      '{}.fedora.journal'.format(project_id)),
+            mime_cache=MimeCache(mime.from_buffer),
+            manifest=load_manifest(pub.copy_manifest_path()),
+            max_workers=getattr(settings, 'FEDORA_INGEST_WORKERS', 8))
+        ingest.ensure_container(fedora_base)
+        ingest.run()
     except Exception as exc:
         logger.error('Proj Id: %s. %s', project_id, exc)
         raise self.retry(exc=exc)
@@ -966,3 +872,17 @@ def email_collaborator_added_to_project(self, project_id, project_uuid, project_
                         settings.DEFAULT_FROM_EMAIL,
                         [collab_user.email],
                         html_message=body)
+
+
+@shared_task(bind=True)
+def flush_notifications(self, username):
+    """Send the websocket events queued for a user.
+
+    Scheduled by :func:`designsafe.apps.api.notifications.pipeline.publish`
+    when a user's coalescing window closes.
+    """
+    from designsafe.apps.api.notifications import pipeline
+    try:
+        pipeline.flush(username)
+    except Exception:  # pylint: disable=broad-except
+        logger.debug('Exception sending websocket message', exc_info=True)
@@ -0,0 +1,103 @@
+import json
+from mock import patch
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from elasticsearch import TransportError
+from designsafe.apps.api.users import utils as users_utils
+
+
+class SearchViewTestCase(TestCase):
+    fixtures = ['user-data', 'agave-oauth-token-data']
+
+    def setUp(self):
+        user = get_user_model().objects.get(pk=2)
+        user.set_password('user/password')
+        user.save()
+        self.client.login(username='ds_user', password='user/password')
+
+    @patch('designsafe.apps.api.users.views.users_utils.search_users')
+    def test_search_uses_index(self, mock_search):
+        mock_search.return_value = [{'username': 'ds_user', 'first_name': 'DesignSafe',
+                                     'last_name': 'User', 'email': 'user@designsafe-ci.org'}]
+
+        resp = self.client.get(reverse('designsafe_api:user_search'),
+                               {'q': 'desi', 'offset': 20, 'limit': 500})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.content), mock_search.return_value)
+        mock_search.assert_called_with('desi', offset=20, limit=users_utils.SEARCH_MAX_LIMIT)
+
+    @patch('designsafe.apps.api.users.views.users_utils.search_users')
+    def test_search_falls_back_to_db(self, mock_search):
+        mock_search.side_effect = TransportError(503, 'unavailable')
+
+        resp = self.client.get(reverse('designsafe_api:user_search'),
+                               {'q': 'user', 'limit': 1})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([user['username'] for user in json.loads(resp.content)],
+                         ['ds_user'])
+
+    def test_invalid_limit(self):
+        resp = self.client.get(reverse('designsafe_api:user_search'),
+                               {'q': 'desi', 'limit': 'many'})
+        self.assertEqual(resp.status_code, 400)
+
+
+class UsersIndexTestCase(TestCase):
+    fixtures = ['user-data']
+
+    def test_q_to_index_query(self):
+        query = users_utils.q_to_index_query(' DS_User ').to_dict()
+        should = query['bool']['should']
+        self.assertEqual(should[0], {'term': {'username._exact': {'value': 'ds_user',
+                                                                  'boost': 10}}})
+        self.assertEqual(should[1]['multi_match']['type'], 'cross_fields')
+        self.assertEqual(should[2]['multi_match']['fuzziness'], 'AUTO')
+
+    @override_settings(USERS_INDEX_SYNC=True)
+    @patch('designsafe.apps.accounts.receivers.users_utils')
+    def test_user_saves_are_indexed(self, mock_utils):
+        user = get_user_model().objects.get(username='ds_user')
+        user.last_name = 'Renamed'
+        user.save()
+        mock_utils.index_user.assert_called_once_with(user)
+
+        user.save(update_fields=['last_login'])
+        self.assertEqual(mock_utils.index_user.call_count, 1)
+
+        user.delete()
+        mock_utils.unindex_user.assert_called_once_with('ds_user')
+
+    @override_settings(USERS_INDEX_SYNC=True)
+    @patch('designsafe.apps.accounts.receivers.users_utils')
+    def test_no_writes_without_index(self, mock_utils):
+        mock_utils.users_index_ready.return_value = False
+        user = get_user_model().objects.get(username='ds_user')
+        user.save()
+        user.delete()
+        mock_utils.index_user.assert_not_called()
+        mock_utils.unindex_user.assert_not_called()
+
+    @patch('designsafe.libs.elasticsearch.indices.init', create=True)
+    @patch('designsafe.apps.api.users.utils.connections')
+    def test_setup_users_index(self, mock_connections, mock_init):
+        indices = mock_connections.get_connection.return_value.indices
+        indices.exists_alias.return_value = False
+        with patch.object(users_utils, '_index_ready', False):
+            self.assertTrue(users_utils.setup_users_index())
+            mock_init.assert_called_once_with('users', force=True)
+
+            indices.exists_alias.return_value = True
+            self.assertFalse(users_utils.setup_users_index())
+            self.assertTrue(users_utils.users_index_ready())
+        self.assertEqual(indices.exists_alias.call_count, 2)
+
+    @override_settings(USERS_INDEX_SYNC=True)
+    @patch('designsafe.apps.accounts.receivers.users_utils')
+    def test_index_errors_do_not_fail_saves(self, mock_utils):
+        mock_utils.index_user.side_effect = TransportError(503, 'unavailable')
+        user = get_user_model().objects.get(username='ds_user')
+        user.save()
+        self.assertEqual(mock_utils.index_user.call_count, 1)
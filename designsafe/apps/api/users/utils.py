@@ -1,10 +1,21 @@
+from django.conf import settings
 from django.db.models import Q
+from elasticsearch.helpers import streaming_bulk
+from elasticsearch_dsl import Q as ESQ
+from elasticsearch_dsl.connections import connections
+from designsafe.apps.data.models.elasticsearch import IndexedUser
 
 import logging
 import json
 
 logger = logging.getLogger(__name__)
 
+# Fields returned by the user directory search.
+SEARCH_FIELDS = ['first_name', 'last_name', 'email', 'username']
+# Users returned per page of a directory search.
+SEARCH_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
 def list_to_model_queries(q_comps):
     query = None
     if len(q_comps) > 2:
@@ -31,3 +42,92 @@ def q_to_model_queries(q):
         query |= Q(last_name__icontains = q)
 
     return query
+
+def user_doc_dict(user):
+    """Return the ``IndexedUser`` source of ``user``."""
+    return {field: getattr(user, field) or '' for field in SEARCH_FIELDS}
+
+_index_ready = False
+
+
+def users_index_ready(es_client=None):
+    """Return whether the users index alias exists.
+
+    Writing through a missing alias would make ES create an index with a
+    dynamic mapping under that name. Once the alias is found it is not
+    checked again in this process.
+    """
+    global _index_ready  # pylint: disable=global-statement
+    if not _index_ready:
+        es_client = es_client or connections.get_connection()
+        _index_ready = es_client.indices.exists_alias(
+            name=settings.ES_INDICES['users']['alias'])
+    return _index_ready
+
+def setup_users_index(es_client=None):
+    """Create the users index with its mapping unless its alias exists.
+
+    An index ES created under the alias name on a write, with a dynamic
+    mapping, is replaced.
+
+    :returns: ``True`` if the index was created.
+    """
+    from designsafe.libs.elasticsearch import indices
+    if users_index_ready(es_client=es_client):
+        return False
+    indices.init('users', force=True)
+    return True
+
+def index_user(user):
+    """Write ``user`` to the users index."""
+    IndexedUser(meta={'id': user.username}, **user_doc_dict(user)).save()
+
+def unindex_user(username):
+    """Remove ``username`` from the users index."""
+    IndexedUser(meta={'id': username}).delete(ignore=404)
+
+def bulk_index_users(users, chunk_size=None, es_client=None):
+    """Write ``users`` to the users index with the bulk API.
+
+    :returns: Number of users indexed.
+    """
+    es_client = es_client or connections.get_connection()
+    chunk_size = chunk_size or getattr(settings, 'ES_BULK_CHUNK_SIZE', 500)
+    users_alias = settings.ES_INDICES['users']['alias']
+    actions = ({'_op_type': 'index', '_index': users_alias, '_id': user.username,
+                '_source': user_doc_dict(user)} for user in users)
+    indexed = 0
+    for ok, item in streaming_bulk(es_client, actions, chunk_size=chunk_size,
+                                   raise_on_error=False):
+        if ok:
+            indexed += 1
+        else:
+            logger.error('Bulk indexing error: %s', item)
+    return indexed
+
+def q_to_index_query(q):
+    """Return the users index query of a directory search.
+
+    Every word must start a username, name or email. Exact usernames rank
+    first, and words within a couple of typos of a whole username, name or
+    email still match.
+    """
+    return ESQ('bool', minimum_should_match=1, should=[
+        ESQ('term', **{'username._exact': {'value': q.strip().lower(), 'boost': 10}}),
+        ESQ('multi_match', query=q, type='cross_fields', operator='and',
+            fields=['username.prefix^3', 'first_name.prefix^2',
+                    'last_name.prefix^2', 'email.prefix']),
+        ESQ('multi_match', query=q, operator='and', fuzziness='AUTO',
+            fields=SEARCH_FIELDS),
+    ])
+
+def search_users(q, offset=0, limit=SEARCH_LIMIT):
+    """Return one page of the users matching ``q``, best match first.
+
+    :returns: List of dicts with the :data:`SEARCH_FIELDS` of each user.
+    """
+    search = IndexedUser.search().query(q_to_index_query(q))
+    search = search.sort('_score', {'username._exact': 'asc'})
+    search = search.source(includes=SEARCH_FIELDS)
+    search = search.extra(from_=offset, size=limit, track_total_hits=False)
+    return [hit.to_dict() for hit in search.execute()]
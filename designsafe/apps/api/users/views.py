@@ -1,15 +1,16 @@
 import logging
 import json
 from designsafe.apps.api.mixins import SecureMixin
+from designsafe.apps.accounts import tas as tas_profiles
 from designsafe.apps.api.users import utils as users_utils
+from designsafe.apps.data.models.usage import FolderUsage
 from django.contrib.auth import get_user_model
 from django.forms.models import model_to_dict
-from django.http import HttpResponseNotFound, JsonResponse, HttpResponse
+from django.http import HttpResponseNotFound, HttpResponseBadRequest, JsonResponse, HttpResponse
 from django.views.generic.base import View
 from django.core.exceptions import ObjectDoesNotExist
-from pytas.http import TASClient
+from elasticsearch import TransportError
 
-from elasticsearch_dsl import Q, Search
 
 logger = logging.getLogger(__name__)
 
@@ -17,14 +18,9 @@ logger = logging.getLogger(__name__)
 class UsageView(SecureMixin, View):
 
     def get(self, request):
-        current_user = request.user
-        q = Search(index="designsafe")\
-                .query('bool', must=[Q("match", **{"path._path": current_user.username})])\
-                .extra(size=0)
-        q.aggs.metric('total_storage_bytes', 'sum', field="length")
-        result = q.execute()
-        agg = result.to_dict()["aggregations"]
-        out = {"total_storage_bytes": agg["total_storage_bytes"]["value"]}
+        usage = FolderUsage.user_usage(request.user.username)
+        out = {"total_storage_bytes": usage['bytes'],
+               "total_files": usage['files']}
         return JsonResponse(out)
 
 class AuthenticatedView(View):
@@ -68,29 +64,46 @@ class SearchView(SecureMixin, View):
             }
             if(user.profile.orcid_id):
                 res_dict['orcid_id'] = user.profile.orcid_id
-            try:
-                user_tas = TASClient().get_user(username=q)
+            user_tas = tas_profiles.get_user(q)
+            if user_tas:
                 res_dict['profile'] = {
                     'institution': user_tas['institution']
                 }
-            except Exception as err:
+            else:
                 logger.info('No Profile.')
 
             return JsonResponse(res_dict)
 
         q = request.GET.get('q')
         role = request.GET.get('role')
-        user_rs = model.objects.filter()
-        if q:
-            query = users_utils.q_to_model_queries(q)
-            if query is None:
-                return JsonResponse({})
-
-            user_rs = user_rs.filter(query)
-        if role:
-            logger.info(role)
-            user_rs = user_rs.filter(groups__name=role)
-        resp = [model_to_dict(u, fields=resp_fields) for u in user_rs]
+        try:
+            offset = max(int(request.GET.get('offset', 0)), 0)
+            limit = min(max(int(request.GET.get('limit', users_utils.SEARCH_LIMIT)), 1),
+                        users_utils.SEARCH_MAX_LIMIT)
+        except ValueError:
+            return HttpResponseBadRequest('Invalid offset or limit')
+
+        resp = None
+        if q and not role:
+            try:
+                resp = users_utils.search_users(q, offset=offset, limit=limit)
+            except TransportError as exc:
+                logger.warning('Unable to search the users index: %s', exc)
+
+        if resp is None:
+            user_rs = model.objects.filter()
+            if q:
+                query = users_utils.q_to_model_queries(q)
+                if query is None:
+                    return JsonResponse({})
+
+                user_rs = user_rs.filter(query)
+            if role:
+                logger.info(role)
+                user_rs = user_rs.filter(groups__name=role)
+            if q:
+                user_rs = user_rs.order_by('username')[offset:offset + limit]
+            resp = [model_to_dict(u, fields=resp_fields) for u in user_rs]
         if len(resp):
             return JsonResponse(resp, safe=False)
         else:
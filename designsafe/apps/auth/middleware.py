@@ -1,6 +1,7 @@
 from django.contrib.auth import logout
 from django.core.exceptions import ObjectDoesNotExist
 from requests.exceptions import RequestException, HTTPError
+from designsafe.apps.api.agave import user_clients
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,6 +10,7 @@ logger = logging.getLogger(__name__)
 class AgaveTokenRefreshMiddleware(object):
 
     def process_request(self, request):
+        user_clients.begin()
         if request.path != '/logout/' and request.user.is_authenticated:
             try:
                 agave_oauth = request.user.agave_oauth
@@ -29,6 +31,7 @@ class AgaveTokenRefreshMiddleware(object):
                 logout(request)
 
     def process_response(self, request, response):
+        user_clients.end()
         if hasattr(request, 'user'):
             if request.user.is_authenticated:
                 response['Authorization'] = 'Bearer ' + request.user.agave_oauth.access_token
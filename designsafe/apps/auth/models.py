@@ -64,13 +64,13 @@ class AgaveOAuthToken(models.Model):
 
     @property
     def client(self):
-        return Agave(api_server=getattr(settings, 'AGAVE_TENANT_BASEURL'),
-                     api_key=getattr(settings, 'AGAVE_CLIENT_KEY'),
-                     api_secret=getattr(settings, 'AGAVE_CLIENT_SECRET'),
-                     token=self.access_token,
-                     resources=AGAVE_RESOURCES,
-                     refresh_token=self.refresh_token,
-                     token_callback=self.update)
+        """
+        Agave client acting as this token's user. The same client is
+        returned for the whole request or task, see
+        :class:`designsafe.apps.api.agave.clients.UserClientProvider`.
+        """
+        from designsafe.apps.api.agave import user_clients
+        return user_clients.client(self)
 
     def update(self, **kwargs):
         for k, v in six.iteritems(kwargs):
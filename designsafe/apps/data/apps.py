@@ -18,12 +18,14 @@ class DataConfig(AppConfig):
 
     def ready(self):  # pylint:disable=too-many-locals
         """Run stuff when app is ready."""
+        from designsafe.libs.elasticsearch.connection import InstrumentedConnection
         try:
             connections.create_connection('default',
                                           hosts=settings.ES_CONNECTIONS[settings.DESIGNSAFE_ENVIRONMENT]['hosts'],
                                           http_auth=settings.ES_AUTH,
                                           max_retries=3,
                                           retry_on_timeout=True,
+                                          connection_class=InstrumentedConnection,
                                           )
         except AttributeError as exc:
             logger.error('Missing ElasticSearch config. %s', exc)
@@ -0,0 +1,133 @@
+"""Management command to benchmark folder listings of the files index"""
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from elasticsearch.helpers import bulk
+from elasticsearch_dsl.connections import connections
+from designsafe.apps.data.models.elasticsearch import IndexedFile
+from designsafe.libs.elasticsearch.docs.files import BaseESFile
+from designsafe.libs.elasticsearch.utils import file_doc_id
+
+SYSTEM = 'bench.system'
+FOLDER = '/bench/folder'
+
+
+def file_action(index, i, permissions):
+    """Bulk action indexing the ``i``-th file of the benchmark folder."""
+    path = '{}/file_{:06d}.txt'.format(FOLDER, i)
+    return {
+        '_index': index,
+        '_id': file_doc_id(SYSTEM, path),
+        '_source': {
+            'name': 'file_{:06d}.txt'.format(i),
+            'path': path,
+            'basePath': FOLDER,
+            'system': SYSTEM,
+            'systemId': SYSTEM,
+            'type': 'file',
+            'format': 'raw',
+            'mimeType': 'text/plain',
+            'length': i,
+            'lastModified': '2020-01-01T00:00:00.000-06:00',
+            'permissions': [{
+                'username': 'user_{}'.format(j),
+                'recursive': False,
+                'permission': {'read': True, 'write': j % 2 == 0,
+                               'execute': False}
+            } for j in range(permissions)],
+        }
+    }
+
+
+def legacy_children(limit):
+    """List the benchmark folder the way ``IndexedFile.children`` did
+    before, with a search per page and a GET per hit."""
+    docs = []
+    search_after = None
+    while True:
+        search = IndexedFile.search()
+        search = search.filter('term', **{'basePath._exact': FOLDER})
+        search = search.filter('term', **{'system._exact': SYSTEM})
+        search = search.sort('_id').extra(size=limit)
+        if search_after:
+            search = search.extra(search_after=search_after)
+        res = search.execute()
+        docs.extend(IndexedFile.get(doc.meta.id) for doc in res)
+        if len(res.hits) < limit:
+            return docs
+        search_after = res.hits.hits[-1]['sort']
+
+
+class Command(BaseCommand):
+    """Times listing a folder with ``--children`` files.
+
+    The folder is indexed into a scratch index created with the files
+    mapping, which is deleted afterwards. It is listed the way
+    ``IndexedFile.children`` did before, then with documents built from
+    the search hits, with source filtering and with page prefetching.
+    Reports the requests sent to Elasticsearch and the best wall time of
+    each listing. Usage: `./manage.py bench_file_children --children 10000`.
+    """
+    help = 'Benchmark listing the children of a folder in the files index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--children', type=int, default=10000,
+                            help='Files in the listed folder.')
+        parser.add_argument('--permissions', type=int, default=10,
+                            help='Permission entries per file.')
+        parser.add_argument('--page-size', type=int, default=100,
+                            help='Children fetched per request.')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs of each listing, the best one is reported.')
+
+    def handle(self, *args, **options):
+        client = connections.get_connection()
+        files_index = IndexedFile._index
+        scratch = files_index.clone(
+            name='{}-bench-{}'.format(files_index._name, uuid.uuid4().hex[:8]))
+        scratch.create()
+        IndexedFile._index = scratch
+        try:
+            bulk(client, (file_action(scratch._name, i, options['permissions'])
+                          for i in range(options['children'])),
+                 chunk_size=1000)
+            scratch.refresh()
+            self._run(client, options)
+        finally:
+            IndexedFile._index = files_index
+            scratch.delete(ignore=404)
+
+    def _run(self, client, options):
+        limit = options['page_size']
+        root = IndexedFile(system=SYSTEM, path=FOLDER)
+        listings = [
+            ('search + get', lambda: legacy_children(limit)),
+            ('hits', lambda: list(BaseESFile('ds_admin', wrapped_doc=root).children(
+                limit=limit, prefetch=False))),
+            ('hits, fields', lambda: list(BaseESFile('ds_admin', wrapped_doc=root).children(
+                limit=limit, fields=IndexedFile.LISTING_FIELDS, prefetch=False))),
+            ('hits, fields, prefetch', lambda: list(BaseESFile('ds_admin', wrapped_doc=root).children(
+                limit=limit, fields=IndexedFile.LISTING_FIELDS))),
+        ]
+
+        requests = [0]
+        perform_request = client.transport.perform_request
+
+        def counted_request(*args, **kwargs):
+            requests[0] += 1
+            return perform_request(*args, **kwargs)
+
+        client.transport.perform_request = counted_request
+        try:
+            for label, listing in listings:
+                best = None
+                for _ in range(options['repeat']):
+                    requests[0] = 0
+                    start = time.time()
+                    count = len(listing())
+                    elapsed = time.time() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                self.stdout.write('{:<24} {:>7} children {:>7} requests {:>9.1f} ms'.format(
+                    label, count, requests[0], best * 1000))
+        finally:
+            client.transport.perform_request = perform_request
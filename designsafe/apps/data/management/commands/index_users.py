@@ -0,0 +1,31 @@
+"""Management command to write every user to the users index"""
+import logging
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from designsafe.apps.api.users.utils import bulk_index_users, setup_users_index
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    """
+    Writes every user account to the users index searched by the user
+    directory. The index is created with its mapping first if its alias
+    does not exist. Users are kept in sync as they are saved once the
+    index exists, run this once to create it and whenever it falls behind.
+    Usage: `./manage.py index_users`.
+    """
+
+    help = "Write every user to the users index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Users per bulk request. Defaults to '
+                                 'settings.ES_BULK_CHUNK_SIZE.')
+
+    def handle(self, *args, **options):
+        if setup_users_index():
+            self.stdout.write('Created the users index.')
+        users = get_user_model().objects.only(
+            'username', 'first_name', 'last_name', 'email').iterator()
+        indexed = bulk_index_users(users, chunk_size=options.get('chunk_size'))
+        self.stdout.write('Indexed {} users.'.format(indexed))
@@ -0,0 +1,32 @@
+"""Management command to rebuild storage usage rollups"""
+import logging
+from django.core.management import BaseCommand
+from designsafe.libs.elasticsearch.utils import rebuild_usage
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    """
+    Recomputes the storage usage of every folder from the files index (see
+    :class:`designsafe.apps.data.models.usage.FolderUsage`). The index is
+    read with a sliced scroll in parallel and the rollups are replaced in
+    one transaction. Usage: `./manage.py rebuild_usage --workers 8`.
+
+    The indexer keeps rollups up to date, run this once after deploying
+    them and whenever they drift from the index.
+    """
+
+    help = "Recompute storage usage rollups from the files index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes. Defaults to '
+                                 'settings.ES_MAINTENANCE_WORKERS.')
+        parser.add_argument('--restart', default=False, action='store_true',
+                            help='Ignore the checkpoint of an interrupted run.')
+
+    def handle(self, *args, **options):
+        stats = rebuild_usage(workers=options.get('workers'),
+                              resume=not options.get('restart'))
+        self.stdout.write('Scanned {} documents, wrote {} folders.'.format(
+            stats.get('docs', 0), stats.get('rows', 0)))
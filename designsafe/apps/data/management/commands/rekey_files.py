@@ -0,0 +1,39 @@
+"""Management command to move file documents to deterministic ids"""
+import logging
+from django.core.management import BaseCommand
+from designsafe.libs.elasticsearch.utils import rekey_files
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    """
+    Moves every document of the files index to the id derived from its
+    system and path (see :func:`designsafe.libs.elasticsearch.utils.file_doc_id`).
+    Documents are created under their new id with the bulk API and their old
+    id is deleted once the create succeeded; a document already under the
+    new id is never overwritten, and duplicates of a path collapse into it. Usage: `./manage.py rekey_files --workers 8`.
+
+    Documents already under their id are left alone, so the command can be
+    run again safely. Run it after `repair_paths`, since fixing a path
+    changes its id. Do not run it while the files index is being rebuilt
+    with `swap_reindex`.
+    """
+
+    help = "Move file documents to ids derived from their system and path."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes. Defaults to '
+                                 'settings.ES_MAINTENANCE_WORKERS.')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Documents per bulk request.')
+        parser.add_argument('--restart', default=False, action='store_true',
+                            help='Ignore the checkpoint of an interrupted run.')
+
+    def handle(self, *args, **options):
+        stats = rekey_files(limit=options.get('chunk_size'),
+                            workers=options.get('workers'),
+                            resume=not options.get('restart'))
+        self.stdout.write('Scanned {} documents, {} moved, {} old ids deleted, '
+                          '{} errors.'.format(stats.get('docs', 0), stats.get('written', 0),
+                                              stats.get('deleted', 0), stats.get('errors', 0)))
@@ -1,76 +1,77 @@
-import logging 
+import logging
 from django.core.management import BaseCommand, CommandError
-from django.utils.six.moves import input
 from django.conf import settings
-import elasticsearch
-from elasticsearch import TransportError
 from elasticsearch_dsl import Index
 from elasticsearch_dsl.connections import connections
-from designsafe.libs.elasticsearch.indices import setup_index
+from designsafe.libs.elasticsearch.aliases import registry as alias_registry
+from designsafe.libs.elasticsearch.reindex import (ONLINE_INDICES, online_reindex,
+                                                   swap_aliases)
+
+logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
     """
-    This command reindexes all documents in the default files index in order to 
-    apply new mappings/analyzers. It does NOT crawl Agave for file metadata, it
-    only uses data that already exists in the file index. Usage is as simple as 
-    running `./manage.py reindex-files`. 
+    This command reindexes all documents of an index in order to apply new
+    mappings/analyzers. It does NOT crawl Agave for file metadata, it only
+    uses data that already exists in the index. Usage is as simple as
+    running `./manage.py swap_reindex --index files`.
+
+    This works by resetting the index aliased as `<alias>-reindex` (applying
+    any new mappings/analyzers defined in the index's document class) and
+    copying the current index into it with Elasticsearch's `_reindex` API.
+    Writes made while the copy runs go to both indices, and documents
+    written during the copy are copied again before the aliases are
+    swapped, so the index stays usable the whole time. See
+    :func:`designsafe.libs.elasticsearch.reindex.online_reindex`.
 
-    This works by resetting the index aliased as settings.ES_REINDEX_INDEX_ALIAS
-    (applying any new mappings/analyzers defined in the portal.libs.elasticsearch.docs.base.IndexedFile
-     class) and reindexing from the default files index to this new index. The 
-     aliases are then swapped so that any Elasticsearch queries on the backend now 
-     target the reindexed documents. 
+    Only the files index mirrors its writes, so it is the only one that
+    can be reindexed. `--swap-only` works with any index.
     """
 
-    help = "Reindex all files into a fresh index, then swap aliases with the current default index."
+    help = "Reindex an index into a fresh index while in use, then swap aliases."
 
     def add_arguments(self, parser):
         parser.add_argument('--index', help='key in settings.ES_INDICES to reindex')
         parser.add_argument('--cleanup', help='Remove documents after swapping aliases to save space.', default=False, action='store_true')
         parser.add_argument('--swap-only', help='Only swap index aliases without reindexing.', default=False, action='store_true')
+        parser.add_argument('--requests-per-second', type=int, default=None,
+                            help='Documents copied per second, -1 for no throttle. '
+                                 'Defaults to settings.ES_REINDEX_REQUESTS_PER_SECOND.')
+        parser.add_argument('--slices', default='auto',
+                            help='Parallel slices of the copy (default: auto).')
+        parser.add_argument('--poll-interval', type=int, default=10,
+                            help='Seconds between reindex task status checks.')
 
     def handle(self, *args, **options):
-        HOSTS = settings.ES_CONNECTIONS[settings.DESIGNSAFE_ENVIRONMENT]['hosts']
-        es_client = elasticsearch.Elasticsearch(HOSTS, http_auth=settings.ES_AUTH)
+        es_client = connections.get_connection()
         index = options.get('index')
-        cleanup = options.get('cleanup')
-        swap_only = options.get('swap-only')
-
-        index_config = settings.ES_INDICES[index]
+        if index not in settings.ES_INDICES:
+            raise CommandError('Unknown index "{}". Use one of: {}'.format(
+                index, ', '.join(sorted(settings.ES_INDICES))))
 
-        default_index_alias = index_config['alias']
+        default_index_alias = settings.ES_INDICES[index]['alias']
         reindex_index_alias = default_index_alias + '-reindex'
 
-        if not swap_only:
-            confirm = eval(input('This will delete any documents in the index "{}" and recreate the index. Continue? (Y/n) '.format(reindex_index_alias)))
-            if confirm != 'Y':
-                raise SystemExit
-            # Set up a fresh reindexing alias.
-            setup_index(index_config, force=True, reindex=True)
-
-        try:
-            default_index_name = list(Index(default_index_alias, using=es_client).get_alias().keys())[0]
-            reindex_index_name = list(Index(reindex_index_alias, using=es_client).get_alias().keys())[0]
-        except Exception as e:
-            self.stdout.write('Unable to lookup required indices by alias. Have you set up both a default and a reindexing index?')
-            raise SystemExit
-
-        if not swap_only:
-            # Reindex file metadata from the default index to the reindexing index
-            elasticsearch.helpers.reindex(es_client, default_index_name, reindex_index_name)
-
-        alias_body = {
-            'actions': [
-                {'remove': {'index': default_index_name, 'alias': default_index_alias}},
-                {'remove': {'index': reindex_index_name, 'alias': reindex_index_alias}},
-                {'add': {'index': default_index_name, 'alias': reindex_index_alias}},
-                {'add': {'index': reindex_index_name, 'alias': default_index_alias}},
-            ]
-        }
-        # Swap the aliases of the default and reindexing aliases.
-        es_client.indices.update_aliases(alias_body)
+        if options.get('swap_only'):
+            swap_aliases(es_client, default_index_alias, reindex_index_alias)
+        elif index not in ONLINE_INDICES:
+            raise CommandError('Writes to the "{}" index are not mirrored while it is '
+                               'copied. Only these indices can be reindexed: {}'.format(
+                                   index, ', '.join(ONLINE_INDICES)))
+        else:
+            slices = options.get('slices')
+            result = online_reindex(
+                index,
+                requests_per_second=options.get('requests_per_second'),
+                slices=int(slices) if slices.isdigit() else slices,
+                poll_interval=options.get('poll_interval'),
+                es_client=es_client
+            )
+            self.stdout.write('Copied {} documents, {} caught up.'.format(
+                result['task'].get('created', 0), result['catch_up']))
 
         # Re-initialize the new reindexing index to save space.
-        if cleanup:
-            reindex_index_name = list(Index(reindex_index_alias, using=es_client).get_alias().keys())[0]
+        if options.get('cleanup'):
+            reindex_index_name = alias_registry.index_name(reindex_index_alias,
+                                                           refresh=True)
             Index(reindex_index_name, using=es_client).delete(ignore=404)
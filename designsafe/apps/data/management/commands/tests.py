@@ -2,24 +2,25 @@ from mock import Mock, patch, MagicMock, PropertyMock, call
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.conf import settings
-from django.core.management import call_command
+from django.core.management import call_command, CommandError
 import datetime
 
 
 class TestSwapReindex(TestCase):
 
     def setUp(self):
-        self.patch_setup = patch('designsafe.apps.data.management.commands.swap_reindex.setup_index')
+        self.patch_reindex = patch('designsafe.apps.data.management.commands.swap_reindex.online_reindex')
+        self.patch_swap = patch('designsafe.apps.data.management.commands.swap_reindex.swap_aliases')
         self.patch_connections = patch('designsafe.apps.data.management.commands.swap_reindex.connections')
-        self.patch_elasticsearch = patch('designsafe.apps.data.management.commands.swap_reindex.elasticsearch')
 
-        self.mock_setup = self.patch_setup.start()
+        self.mock_reindex = self.patch_reindex.start()
+        self.mock_swap = self.patch_swap.start()
         self.mock_connections = self.patch_connections.start()
-        self.mock_elasticsearch = self.patch_elasticsearch.start()
+        self.mock_reindex.return_value = {'task': {'created': 10}, 'catch_up': 2}
 
-        self.addCleanup(self.patch_setup.stop)
+        self.addCleanup(self.patch_reindex.stop)
+        self.addCleanup(self.patch_swap.stop)
         self.addCleanup(self.patch_connections.stop)
-        self.addCleanup(self.patch_elasticsearch.stop)
 
     @patch('designsafe.apps.data.management.commands.swap_reindex.Command.handle')
     def test_working(self, mock_handle):
@@ -27,68 +28,71 @@ class TestSwapReindex(TestCase):
         call_command('swap_reindex', **opts)
         self.assertEqual(mock_handle.call_count, 1)
 
-    @patch('designsafe.apps.data.management.commands.swap_reindex.input')
-    def test_raises_when_user_does_not_proceed(self, mock_input):
-        mock_input.return_value = 'n'
-        opts = {'index': 'files'}
-        with self.assertRaises(SystemExit):
-            call_command('swap_reindex', **opts)
-
-    @patch('designsafe.apps.data.management.commands.swap_reindex.Index')
-    @patch('designsafe.apps.data.management.commands.swap_reindex.input')
-    def test_raises_exception_when_no_index(self, mock_input, mock_index):
-        mock_input.return_value = 'Y'
-        
-        mock_index.return_value.get_alias.return_value.keys.side_effect = Exception
-        opts = {'index': 'files'}
-        
-        with self.assertRaises(SystemExit):
-            call_command('swap_reindex', **opts)
+    def test_raises_on_unknown_index(self):
+        with self.assertRaises(CommandError):
+            call_command('swap_reindex', index='not_an_index')
 
-    @patch('designsafe.apps.data.management.commands.swap_reindex.Index')
-    @patch('designsafe.apps.data.management.commands.swap_reindex.input')
-    def test_performs_reindex_from_default_to_reindex(self, mock_input, mock_index):
-        mock_input.return_value = 'Y'
+    def test_raises_on_index_without_dual_writes(self):
+        with self.assertRaises(CommandError):
+            call_command('swap_reindex', index='projects')
+        self.mock_reindex.assert_not_called()
 
-        mock_index.return_value.get_alias.return_value.keys.side_effect = [['DEFAULT_NAME'], ['REINDEX_NAME']]
-        opts = {'index': 'files'}
+    def test_performs_online_reindex(self):
+        call_command('swap_reindex', index='files', requests_per_second=100, slices='4')
 
-        mock_client = MagicMock()
-        self.mock_elasticsearch.Elasticsearch.return_value = mock_client
+        mock_client = self.mock_connections.get_connection.return_value
+        self.mock_reindex.assert_called_with('files', requests_per_second=100,
+                                             slices=4, poll_interval=10,
+                                             es_client=mock_client)
+        self.mock_swap.assert_not_called()
 
-        call_command('swap_reindex', **opts)
+    def test_swap_only(self):
+        call_command('swap_reindex', index='files', swap_only=True)
 
-        self.mock_elasticsearch.helpers.reindex.assert_called_with(mock_client, 'DEFAULT_NAME', 'REINDEX_NAME')
+        self.mock_reindex.assert_not_called()
+        self.mock_swap.assert_called_with(self.mock_connections.get_connection.return_value,
+                                          'designsafe-dev-files',
+                                          'designsafe-dev-files-reindex')
 
+    @patch('designsafe.apps.data.management.commands.swap_reindex.alias_registry')
     @patch('designsafe.apps.data.management.commands.swap_reindex.Index')
-    @patch('designsafe.apps.data.management.commands.swap_reindex.input')
-    def test_performs_swap_with_correct_args(self, mock_input, mock_index):
-        mock_input.return_value = 'Y'
+    def test_cleanup(self, mock_index, mock_registry):
+        mock_registry.index_name.return_value = 'REINDEX_NAME'
+        call_command('swap_reindex', index='files', cleanup=True)
 
-        mock_index.return_value.get_alias.return_value.keys.side_effect = [['DEFAULT_NAME'], ['REINDEX_NAME']]
-        opts = {'index': 'files'}
+        mock_index.assert_called_with('REINDEX_NAME', using=self.mock_connections.get_connection.return_value)
+        self.assertEqual(mock_index.return_value.delete.call_count, 1)
 
-        call_command('swap_reindex', **opts)
 
-        mock_alias = {
-            'actions': [
-                {'remove': {'index': 'DEFAULT_NAME', 'alias': 'designsafe-dev-files'}},
-                {'remove': {'index': 'REINDEX_NAME', 'alias': 'designsafe-dev-files-reindex'}},
-                {'add': {'index': 'DEFAULT_NAME', 'alias': 'designsafe-dev-files-reindex'}},
-                {'add': {'index': 'REINDEX_NAME', 'alias': 'designsafe-dev-files'}},
-            ]
-        }
-        self.mock_elasticsearch.Elasticsearch().indices.update_aliases.assert_called_with(mock_alias)
 
-    @patch('designsafe.apps.data.management.commands.swap_reindex.Index')
-    @patch('designsafe.apps.data.management.commands.swap_reindex.input')
-    def test_cleanup(self, mock_input, mock_index):
-        mock_input.return_value = 'Y'
+class TestRekeyFiles(TestCase):
 
-        mock_index.return_value.get_alias.return_value.keys.side_effect = [['DEFAULT_NAME'], ['REINDEX_NAME'], ['REINDEX_NAME']]
-        opts = {'index': 'files', 'cleanup': True}
+    @patch('designsafe.apps.data.management.commands.rekey_files.rekey_files')
+    def test_rekey_files(self, mock_rekey):
+        mock_rekey.return_value = {'docs': 3, 'written': 2, 'errors': 0}
+        call_command('rekey_files', workers=2, chunk_size=50, restart=True)
+        mock_rekey.assert_called_with(limit=50, workers=2, resume=False)
 
-        call_command('swap_reindex', **opts)
 
-        self.assertEqual(mock_index.return_value.delete.call_count, 1)
+class TestRebuildUsage(TestCase):
+
+    @patch('designsafe.apps.data.management.commands.rebuild_usage.rebuild_usage')
+    def test_rebuild_usage(self, mock_rebuild):
+        mock_rebuild.return_value = {'docs': 3, 'rows': 2}
+        call_command('rebuild_usage', workers=2)
+        mock_rebuild.assert_called_with(workers=2, resume=True)
+
+
+class TestIndexUsers(TestCase):
+    fixtures = ['user-data']
 
+    @patch('designsafe.apps.data.management.commands.index_users.setup_users_index')
+    @patch('designsafe.apps.data.management.commands.index_users.bulk_index_users')
+    def test_index_users(self, mock_bulk, mock_setup):
+        mock_bulk.return_value = 2
+        call_command('index_users', chunk_size=50)
+        mock_setup.assert_called_once_with()
+        users, = mock_bulk.call_args[0]
+        self.assertEqual(sorted(user.username for user in users),
+                         sorted(get_user_model().objects.values_list('username', flat=True)))
+        self.assertEqual(mock_bulk.call_args[1], {'chunk_size': 50})
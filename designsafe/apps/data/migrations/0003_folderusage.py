@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data', '0002_auto_20171213_2125'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FolderUsage',
+            fields=[
+                ('id', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('parent', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('system', models.CharField(max_length=255)),
+                ('path', models.TextField()),
+                ('direct_bytes', models.BigIntegerField(default=0)),
+                ('direct_files', models.BigIntegerField(default=0)),
+                ('total_bytes', models.BigIntegerField(default=0)),
+                ('total_files', models.BigIntegerField(default=0)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
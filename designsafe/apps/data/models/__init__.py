@@ -0,0 +1 @@
+from designsafe.apps.data.models.usage import FolderUsage
@@ -5,6 +5,7 @@ import json
 import re
 import logging
 import datetime
+import functools
 from designsafe.apps.api import tasks
 from designsafe.apps.projects.models import Category
 
@@ -14,6 +15,8 @@ REGISTRY = {}
 LAZY_OPS = []
 
 class RelatedQuery(object):
+    __slots__ = ('uuid', 'uuids', 'related_obj_name', 'rel_cls', '_query')
+
     def __init__(self, uuid=None, uuids=None, related_obj_name=None, rel_cls=None):
         self.uuid = uuid
         self.uuids = uuids or []
@@ -88,10 +91,13 @@ def register_class(cls, name, model_name):
     if REGISTRY.get(registry_key) is None:
         REGISTRY[registry_key] = cls
 
+CAMELCASE_RE = re.compile('([A-Z])+')
+
+@functools.lru_cache(maxsize=4096)
 def camelcase_to_spinal(string):
-    rec = re.compile('([A-Z])+')
-    return rec.sub(r'_\1', string).lower()
+    return CAMELCASE_RE.sub(r'_\1', string).lower()
 
+@functools.lru_cache(maxsize=4096)
 def spinal_to_camelcase(string):
     comps = string.split('_')
     if string.startswith('_'):
@@ -141,6 +147,40 @@ class Manager(object):
         for meta in metas:
             yield self.model_cls(**meta)
 
+class FieldDescriptor(object):
+    """Stores a field's value in the instance ``__dict__``.
+
+    Reading the attribute returns the value converted by the field's
+    ``to_python``. Without a field the stored value is returned as is, this
+    shadows fields of a parent model the subclass does not declare.
+    """
+    __slots__ = ('attname', 'to_python')
+
+    def __init__(self, attname, field=None):
+        self.attname = attname
+        self.to_python = getattr(field, 'to_python', None)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        try:
+            value = instance.__dict__[self.attname]
+        except KeyError:
+            raise AttributeError('\'{0}\' has no attribute \'{1}\''.format(
+                owner.__name__, self.attname))
+        if self.to_python is None:
+            return value
+        return self.to_python(value)
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.attname] = value
+
+    def __delete__(self, instance):
+        try:
+            del instance.__dict__[self.attname]
+        except KeyError:
+            raise AttributeError(self.attname)
+
 class Links(object):
     def __init__(self, values):
         for attrname, val in six.iteritems(values):
@@ -160,6 +200,7 @@ class Options(object):
         self._reverse_fields = []
         self._fields_map = {}
         self._fields = []
+        self._camel_names = {}
         self.name = model_name
         self.model_name = model_name
         self.model_manager = None
@@ -172,6 +213,7 @@ class Options(object):
         else:
             self._fields_map[field.attname] = field
         self._fields.append(field)
+        self._camel_names[field.attname] = spinal_to_camelcase(field.attname)
 
     def contribute_to_class(self, cls, name):
         cls._meta = self
@@ -235,6 +277,13 @@ class BaseModel(type):
         if not opts.model_manager:
             setattr(cls._meta, 'model_manager', Manager(cls))
 
+        for attrname, field in six.iteritems(opts._fields_map):
+            setattr(cls, attrname, FieldDescriptor(attrname, field))
+        for parent in cls.__mro__[1:]:
+            for attrname, attr in list(six.iteritems(vars(parent))):
+                if isinstance(attr, FieldDescriptor) and attrname not in vars(cls):
+                    setattr(cls, attrname, FieldDescriptor(attrname))
+
         if not isinstance(opts.model_manager, Manager):
             raise ValueError("Model Manager must be a Manager class.")
 
@@ -303,16 +352,8 @@ class Model(object, metaclass=BaseModel):
 
         super(Model, self).__init__()
     
-    def __getattribute__(self, name):
-        opts = object.__getattribute__(self, '_meta')
-        _cls = opts._fields_map.get(name, None)
-        if _cls is not None and hasattr(_cls, 'to_python'):
-            return _cls.to_python(object.__getattribute__(self, name))
-        
-        return object.__getattribute__(self, name)
-
     def _get_init_value(self, field, values, name):
-        attrname = spinal_to_camelcase(name)
+        attrname = self._meta._camel_names.get(name) or spinal_to_camelcase(name)
         return values.get(attrname, field.get_default())
 
     @property
@@ -411,9 +452,10 @@ class Model(object, metaclass=BaseModel):
 
         #dict_obj['value'] = {}
         value_dict = {}
+        camel_names = self._meta._camel_names
         for field in self._meta._fields:
             value = getattr(self, field.attname)
-            attrname = spinal_to_camelcase(field.attname)
+            attrname = camel_names[field.attname]
             try:
                 if isinstance(value, RelatedQuery):
                     value_dict[attrname] = value.serialize(value.uuids)
@@ -437,14 +479,24 @@ class Model(object, metaclass=BaseModel):
         if ('lastUpdated' in dict_obj and isinstance(dict_obj['lastUpdated'], datetime.datetime)):
             dict_obj['lastUpdated'] = dict_obj['lastUpdated'].isoformat()
         if self.uuid:
-            category, _ = Category.objects.get_or_create(uuid=self.uuid)
+            # Loaders serializing many entities prefetch their categories.
+            category = self.__dict__.get('_category')
+            if category is None:
+                category, _ = Category.objects.get_or_create(uuid=self.uuid)
             dict_obj['_ui'] = category.to_dict()
         return dict_obj
 
     def save(self, agave_client):
+        """Add or update the metadata record.
+
+        The cached entities of the projects the record was and is now
+        associated to are invalidated.
+        """
+        from designsafe.apps.projects.managers import entities as project_entities
         if self.parent:
             self.parent.save(agave_client)
 
+        association_ids = list(self.association_ids)
         body = self.to_body_dict()
         body.pop('_relatedFields', None)
         if self.uuid is None:
@@ -456,6 +508,8 @@ class Model(object, metaclass=BaseModel):
             tasks.index_or_update_project.apply_async(args=[self.uuid], queue='api')
         
         self.update(**ret)
+        project_entities.invalidate(*set(association_ids +
+                                         ret.get('associationIds', [])))
         return ret
 
     def associate(self, value):
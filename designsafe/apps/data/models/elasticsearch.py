@@ -10,9 +10,12 @@ from elasticsearch_dsl import (Search, Document, Date, Nested,
                                Boolean, Keyword,
                                GeoPoint, MetaField, Index)
 from elasticsearch_dsl.query import Q
-from elasticsearch import TransportError, ConnectionTimeout
+from elasticsearch import TransportError, ConnectionTimeout, NotFoundError
 from designsafe.libs.elasticsearch.analyzers import path_analyzer, file_analyzer, file_pattern_analyzer, reverse_file_analyzer
+from designsafe.libs.elasticsearch.analyzers import name_autocomplete_analyzer, name_search_analyzer
 from designsafe.libs.elasticsearch.exceptions import DocumentNotFound
+from designsafe.libs.elasticsearch.dual_writes import mirror_index, mirror_delete
+from designsafe.libs.elasticsearch.utils import file_doc_id
 
 #pylint: disable=invalid-name
 logger = logging.getLogger(__name__)
@@ -39,6 +42,7 @@ class IndexedFile(Document):
     })
     systemId = Text()
     basePath=Text(fields={ '_exact': Keyword() })
+    childrenDigest = Keyword()
     dsMeta = Nested()
     permissions = Nested(properties={
         'username': Keyword(),
@@ -50,6 +54,12 @@ class IndexedFile(Document):
         })
     })
 
+    # Source fields of file listings, without the permissions.
+    LISTING_FIELDS = ['name', 'path', 'basePath', 'system', 'type', 'format',
+                      'length', 'lastModified', 'mimeType']
+    # Source fields BaseESFile.delete reads, to recurse into folders.
+    DELETE_FIELDS = ['system', 'path', 'format']
+
     @classmethod
     def _pems_filter(self):
         term_username_query = Q(
@@ -68,30 +78,93 @@ class IndexedFile(Document):
         return nested_query
 
     @classmethod
-    def from_path(cls, system, path):
-        Index(settings.ES_INDICES['files']['alias']).refresh()
+    def _legacy_from_paths(cls, system, paths):
+        """Search the documents of ``paths`` that are not under their
+        deterministic id yet, while ``ES_FILES_LEGACY_LOOKUP`` is set.
+
+        :returns: Dict of path to document, one per path.
+        """
+        if not paths or not getattr(settings, 'ES_FILES_LEGACY_LOOKUP', False):
+            return {}
         search = cls.search()
-        sys_filter = Q('term', **{'system._exact': system})
-        path_filter = Q('term', **{'path._exact': path})
-        search = search.filter(sys_filter & path_filter)
+        search = search.filter('term', **{'system._exact': system})
+        search = search.filter('terms', **{'path._exact': list(paths)})
+        search = search.extra(collapse={'field': 'path._exact'}, size=len(paths))
+        return {doc.path: doc for doc in search.execute()}
+
+    @classmethod
+    def from_path(cls, system, path):
+        """Return the document of ``path`` on ``system``.
+
+        Documents are stored under :func:`file_doc_id`, so this is a
+        realtime GET and sees documents that were not refreshed yet.
+        Documents indexed before ``rekey_files`` ran are searched by
+        system and path.
+
+        :raises DocumentNotFound: If ``path`` is not indexed.
+        """
         try:
-            res = search.execute()
-        except Exception as exc:
-            raise exc
-        if res.hits.total.value > 1:
-            id_filter = Q('term', **{'_id': res[0].meta.id}) 
-            # Delete all files indexed with the same system/path, except the first result
-            delete_query = sys_filter & path_filter & ~id_filter
-            cls.search().filter(delete_query).delete()
-            return cls.get(res[0].meta.id)
-        elif res.hits.total.value == 1:
-            return cls.get(res[0].meta.id)
-        else:
+            return cls.get(file_doc_id(system, path))
+        except NotFoundError:
+            doc = cls._legacy_from_paths(system, [path]).get(path)
+            if doc is not None:
+                return doc
             raise DocumentNotFound("No document found for "
                                    "{}/{}".format(system, path))
 
     @classmethod
-    def children(cls, username, system, path, limit=100, search_after=None):
+    def from_paths(cls, system, paths):
+        """Return the documents of ``paths`` on ``system`` with one realtime
+        ``mget``, ``None`` for each path that is not indexed.
+
+        Paths missing from the ``mget`` are searched like in
+        :meth:`from_path`, with a single search."""
+        if not paths:
+            return []
+        docs = cls.mget([file_doc_id(system, path) for path in paths],
+                        missing='none')
+        missing = [path for path, doc in zip(paths, docs) if doc is None]
+        legacy = cls._legacy_from_paths(system, missing)
+        return [doc if doc is not None else legacy.get(path)
+                for path, doc in zip(paths, docs)]
+
+    def save(self, *args, **kwargs):
+        """Save, and mirror the document while its index is rebuilt.
+
+        New documents get the id of their system and path.
+        """
+        if 'id' not in self.meta and self.system and self.path:
+            self.meta.id = file_doc_id(self.system, self.path)
+        res = super(IndexedFile, self).save(*args, **kwargs)
+        mirror_index(settings.ES_INDICES['files']['alias'], self.meta.id,
+                     self.to_dict(), version=getattr(self.meta, 'version', None))
+        return res
+
+    def update(self, *args, **kwargs):
+        """Update, and mirror the document while its index is rebuilt."""
+        res = super(IndexedFile, self).update(*args, **kwargs)
+        mirror_index(settings.ES_INDICES['files']['alias'], self.meta.id,
+                     self.to_dict(), version=getattr(self.meta, 'version', None))
+        return res
+
+    def delete(self, *args, **kwargs):
+        """Delete, and mirror the delete while the index is rebuilt."""
+        res = super(IndexedFile, self).delete(*args, **kwargs)
+        mirror_delete(settings.ES_INDICES['files']['alias'], self.meta.id)
+        return res
+
+    @classmethod
+    def children(cls, username, system, path, limit=100, search_after=None,
+                 fields=None):
+        """Return a page of the documents whose ``basePath`` is ``path``.
+
+        Documents are built from the search hits. ``fields`` only fetches
+        those source fields, e.g. :attr:`LISTING_FIELDS`; documents listed
+        that way are partial and must not be saved.
+
+        :return: ``(children, sort_key)``, ``sort_key`` is the
+            ``search_after`` of the next page.
+        """
         search = cls.search()
         # search = search.filter(cls._pems_filter(username))
         search = search.filter('term', **{'basePath._exact': path})
@@ -100,14 +173,12 @@ class IndexedFile(Document):
         search = search.extra(size=limit)
         if search_after:
             search = search.extra(search_after=search_after)
-        try:
-            res = search.execute()
-        except TransportError:
-            raise TransportError
+        if fields:
+            search = search.source(includes=fields)
+        res = search.execute()
         if len(res.hits) > 0:
-            wrapped_children = [cls.get(doc.meta.id) for doc in res]
             sort_key = res.hits.hits[-1]['sort']
-            return wrapped_children, sort_key
+            return list(res), sort_key
         else:
             return [], None
 
@@ -450,3 +521,27 @@ class IndexedPublicationLegacy(Document):
         name = settings.ES_INDICES['publications_legacy']['alias']
     class Meta:
         dynamic = MetaField('strict')
+
+def _name_field():
+    return Text(fields={
+        '_exact': Keyword(),
+        'prefix': Text(analyzer=name_autocomplete_analyzer,
+                       search_analyzer=name_search_analyzer)
+    })
+
+@python_2_unicode_compatible
+class IndexedUser(Document):
+    """User directory entry, stored under the username.
+
+    ``prefix`` subfields index every prefix of each word, so a search as
+    the user types is a term lookup.
+    """
+    username = _name_field()
+    first_name = _name_field()
+    last_name = _name_field()
+    email = _name_field()
+
+    class Index:
+        name = settings.ES_INDICES['users']['alias']
+    class Meta:
+        dynamic = MetaField('strict')
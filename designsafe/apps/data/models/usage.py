@@ -0,0 +1,183 @@
+"""
+.. module: designsafe.apps.data.models.usage
+   :synopsis: Storage usage rollups of the folders in the files index.
+
+Each indexed folder has a :class:`FolderUsage` row with the size and count
+of the files directly in it, and the totals of its whole subtree. The
+indexer updates the row of a level every time it writes that level and
+adds the difference to the totals of every ancestor, so the usage of a
+home directory or project is a primary key lookup.
+
+Rows can drift from the index if a write is lost, e.g. when the database
+is unavailable while indexing. ``./manage.py rebuild_usage`` recomputes
+every row from the files index.
+"""
+import logging
+import os
+from django.conf import settings
+from django.db import models, transaction, DatabaseError, IntegrityError
+from django.db.models import F
+from designsafe.libs.elasticsearch.utils import file_doc_id
+
+#pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+#pylint: enable=invalid-name
+
+
+def _normpath(path):
+    return '/' + path.strip('/')
+
+
+def _ancestors(path):
+    """Return the ancestors of ``path``, closest first."""
+    ancestors = []
+    while path != '/':
+        path = os.path.dirname(path)
+        ancestors.append(path)
+    return ancestors
+
+
+class FolderUsage(models.Model):
+    """Storage used by a folder of the files index.
+
+    Rows are keyed by :func:`file_doc_id` of the folder and point to the
+    row of their parent folder. ``direct_*`` counts the files in the
+    folder, ``total_*`` the files in the folder and every subfolder.
+    """
+    id = models.CharField(max_length=64, primary_key=True)
+    parent = models.CharField(max_length=64, db_index=True, blank=True)
+    system = models.CharField(max_length=255)
+    path = models.TextField()
+    direct_bytes = models.BigIntegerField(default=0)
+    direct_files = models.BigIntegerField(default=0)
+    total_bytes = models.BigIntegerField(default=0)
+    total_files = models.BigIntegerField(default=0)
+    last_updated = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return "%s:%s" % (self.system, self.path)
+
+    @classmethod
+    def new(cls, system, path, **kwargs):
+        """Return an unsaved row for ``path`` on ``system``."""
+        path = _normpath(path)
+        parent = '' if path == '/' else file_doc_id(system, os.path.dirname(path))
+        return cls(id=file_doc_id(system, path), parent=parent, system=system,
+                   path=path, **kwargs)
+
+    @classmethod
+    def _create_chain(cls, system, path):
+        """Create the missing rows of ``path`` and its ancestors."""
+        chain = [path] + _ancestors(path)
+        ids = {file_doc_id(system, chain_path): chain_path for chain_path in chain}
+        existing = set(cls.objects.filter(id__in=list(ids)).values_list('id', flat=True))
+        missing = [cls.new(system, chain_path) for chain_path in reversed(chain)
+                   if file_doc_id(system, chain_path) not in existing]
+        if not missing:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.bulk_create(missing)
+        except IntegrityError:
+            # Another indexer created some of them.
+            for row in missing:
+                cls.objects.get_or_create(id=row.id, defaults={
+                    'parent': row.parent, 'system': row.system, 'path': row.path})
+
+    @classmethod
+    def record_level(cls, system, path, folders, files):
+        """Record the listing of ``path`` written to the files index.
+
+        Subfolders that are no longer listed are removed with their subtree
+        and their totals are subtracted from ``path`` and its ancestors.
+        Errors are logged and not raised, so indexing does not fail because
+        of usage rollups.
+
+        :param folders: ``BaseFileResource`` folders of the level.
+        :param files: ``BaseFileResource`` files of the level.
+        """
+        path = _normpath(path)
+        level_bytes = sum(obj.length or 0 for obj in files)
+        level_files = len(files)
+        listed = [file_doc_id(system, obj.path) for obj in folders]
+        try:
+            cls._create_chain(system, path)
+            with transaction.atomic():
+                row = cls.objects.select_for_update().get(id=file_doc_id(system, path))
+                delta_bytes = level_bytes - row.direct_bytes
+                delta_files = level_files - row.direct_files
+                stale = list(cls.objects.filter(parent=row.id).exclude(id__in=listed))
+                for child in stale:
+                    delta_bytes -= child.total_bytes
+                    delta_files -= child.total_files
+                cls._delete_subtrees([child.id for child in stale])
+
+                cls.objects.filter(id=row.id).update(direct_bytes=level_bytes,
+                                                     direct_files=level_files)
+                if delta_bytes or delta_files:
+                    chain = [row.id] + [file_doc_id(system, ancestor)
+                                        for ancestor in _ancestors(path)]
+                    cls.objects.filter(id__in=chain).update(
+                        total_bytes=F('total_bytes') + delta_bytes,
+                        total_files=F('total_files') + delta_files)
+        except DatabaseError as exc:
+            logger.warning('Unable to update usage of %s:%s: %s', system, path, exc)
+
+    @classmethod
+    def _delete_subtrees(cls, ids):
+        while ids:
+            children = list(cls.objects.filter(parent__in=ids).values_list('id', flat=True))
+            cls.objects.filter(id__in=ids).delete()
+            ids = children
+
+    @classmethod
+    def replace_all(cls, direct, batch_size=1000):
+        """Replace every row with rollups of ``direct``.
+
+        :param dict direct: ``(system, path)`` of each folder to the
+            ``(bytes, files)`` directly in it.
+        :returns: Number of rows written.
+        """
+        rows = {}
+
+        def _row(system, path):
+            if (system, path) not in rows:
+                rows[(system, path)] = cls.new(system, path)
+            return rows[(system, path)]
+
+        for (system, path), (level_bytes, level_files) in direct.items():
+            path = _normpath(path)
+            row = _row(system, path)
+            row.direct_bytes += level_bytes
+            row.direct_files += level_files
+            for chain_path in [path] + _ancestors(path):
+                row = _row(system, chain_path)
+                row.total_bytes += level_bytes
+                row.total_files += level_files
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(list(rows.values()), batch_size=batch_size)
+        return len(rows)
+
+    @classmethod
+    def usage(cls, system, path):
+        """Return the ``bytes`` and ``files`` stored under ``path``.
+
+        Folders that were never indexed use nothing.
+        """
+        row = cls.objects.filter(id=file_doc_id(system, path)).values(
+            'total_bytes', 'total_files').first()
+        if row is None:
+            return {'bytes': 0, 'files': 0}
+        return {'bytes': row['total_bytes'], 'files': row['total_files']}
+
+    @classmethod
+    def user_usage(cls, username):
+        """Storage used by the home directory of ``username``."""
+        return cls.usage(settings.AGAVE_STORAGE_SYSTEM, '/' + username)
+
+    @classmethod
+    def project_usage(cls, project_uuid):
+        """Storage used by the project ``project_uuid``."""
+        system = settings.PROJECT_STORAGE_SYSTEM_TEMPLATE['id'].format(project_uuid)
+        return cls.usage(system, '/')
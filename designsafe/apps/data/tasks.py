@@ -6,9 +6,11 @@ from designsafe.apps.api.agave import get_service_account_client
 logger = logging.getLogger(__name__)
 
 @shared_task(bind=True, max_retries=3, retry_backoff=True, rate_limit="1/s")
-def agave_indexer(self, systemId, filePath='/', username=None, recurse=True, update_pems = True, ignore_hidden=True, reindex=False, paths_to_ignore=[]):
+def agave_indexer(self, systemId, filePath='/', username=None, recurse=True, update_pems = True, ignore_hidden=True, reindex=False, paths_to_ignore=[], bulk=True, incremental=False):
     from designsafe.libs.elasticsearch.utils import index_level
-    from designsafe.libs.elasticsearch.utils import walk_levels
+    from designsafe.libs.elasticsearch.utils import bulk_index_level
+    from designsafe.libs.elasticsearch.utils import incremental_index_level
+    from designsafe.libs.elasticsearch.utils import walk_levels_fast
 
     if username != None:
         pems_username = username
@@ -20,12 +22,19 @@ def agave_indexer(self, systemId, filePath='/', username=None, recurse=True, upd
         filePath = '/' + filePath
 
     try:
-        filePath, folders, files = next(walk_levels(client, systemId, filePath, ignore_hidden=ignore_hidden, paths_to_ignore=paths_to_ignore))
+        walker = walk_levels_fast(client, systemId, filePath, ignore_hidden=ignore_hidden, paths_to_ignore=paths_to_ignore)
+        filePath, folders, files = next(walker)
+        walker.close()
     except Exception as exc:
         logger.debug(exc)
         raise self.retry(exc=exc)
 
-    index_level(client, filePath, folders, files, systemId, pems_username, update_pems=update_pems, reindex=reindex)
+    if incremental:
+        folders = incremental_index_level(client, filePath, folders, files, systemId, update_pems=update_pems)
+    elif bulk:
+        bulk_index_level(client, filePath, folders, files, systemId, update_pems=update_pems)
+    else:
+        index_level(client, filePath, folders, files, systemId, pems_username, update_pems=update_pems, reindex=reindex)
     if recurse:
         for child in folders:
-            self.delay(systemId, filePath=child.path, reindex=reindex, update_pems=update_pems)
+            self.delay(systemId, filePath=child.path, reindex=reindex, update_pems=update_pems, bulk=bulk, incremental=incremental)
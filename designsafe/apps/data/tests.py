@@ -0,0 +1,92 @@
+import json
+from mock import MagicMock
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from designsafe.apps.data.models.usage import FolderUsage
+
+
+def listed(path, length=0):
+    """Listing entry as returned by walk_levels."""
+    return MagicMock(path=path, length=length)
+
+
+class FolderUsageTestCase(TestCase):
+
+    def test_record_level_rolls_up(self):
+        FolderUsage.record_level('test.system', '/ds_user/data', [],
+                                 [listed('/ds_user/data/a', 10),
+                                  listed('/ds_user/data/b', 5)])
+        FolderUsage.record_level('test.system', '/ds_user', [listed('/ds_user/data')],
+                                 [listed('/ds_user/c', 1)])
+
+        self.assertEqual(FolderUsage.usage('test.system', '/ds_user/data'),
+                         {'bytes': 15, 'files': 2})
+        self.assertEqual(FolderUsage.usage('test.system', '/ds_user'),
+                         {'bytes': 16, 'files': 3})
+        self.assertEqual(FolderUsage.usage('test.system', '/'),
+                         {'bytes': 16, 'files': 3})
+        row = FolderUsage.objects.get(path='/ds_user')
+        self.assertEqual((row.direct_bytes, row.direct_files), (1, 1))
+
+    def test_record_level_applies_changes(self):
+        FolderUsage.record_level('test.system', '/ds_user/data', [],
+                                 [listed('/ds_user/data/a', 10)])
+        FolderUsage.record_level('test.system', '/ds_user/data', [],
+                                 [listed('/ds_user/data/a', 4),
+                                  listed('/ds_user/data/b', 2)])
+
+        self.assertEqual(FolderUsage.usage('test.system', '/ds_user'),
+                         {'bytes': 6, 'files': 2})
+
+    def test_record_level_removes_stale_folders(self):
+        FolderUsage.record_level('test.system', '/ds_user', [listed('/ds_user/data')], [])
+        FolderUsage.record_level('test.system', '/ds_user/data', [listed('/ds_user/data/sub')],
+                                 [listed('/ds_user/data/a', 10)])
+        FolderUsage.record_level('test.system', '/ds_user/data/sub', [],
+                                 [listed('/ds_user/data/sub/b', 3)])
+        self.assertEqual(FolderUsage.usage('test.system', '/ds_user'),
+                         {'bytes': 13, 'files': 2})
+
+        FolderUsage.record_level('test.system', '/ds_user', [], [])
+
+        self.assertEqual(FolderUsage.usage('test.system', '/ds_user'),
+                         {'bytes': 0, 'files': 0})
+        self.assertFalse(FolderUsage.objects.filter(path__startswith='/ds_user/').exists())
+
+    def test_replace_all(self):
+        FolderUsage.record_level('test.system', '/stale', [], [listed('/stale/a', 1)])
+
+        rows = FolderUsage.replace_all({
+            ('test.system', '/ds_user/data'): (15, 2),
+            ('test.system', '/ds_user'): (1, 1),
+            ('project-1234', '/'): (7, 1),
+        })
+
+        self.assertEqual(rows, 4)
+        self.assertEqual(FolderUsage.usage('test.system', '/ds_user'),
+                         {'bytes': 16, 'files': 3})
+        self.assertEqual(FolderUsage.usage('test.system', '/stale'),
+                         {'bytes': 0, 'files': 0})
+        self.assertEqual(FolderUsage.project_usage('1234'), {'bytes': 7, 'files': 1})
+
+
+class UsageViewTestCase(TestCase):
+    fixtures = ['user-data', 'agave-oauth-token-data']
+
+    def setUp(self):
+        user = get_user_model().objects.get(pk=2)
+        user.set_password('user/password')
+        user.save()
+
+    @override_settings(AGAVE_STORAGE_SYSTEM='test.system')
+    def test_usage_is_read_from_rollups(self):
+        FolderUsage.record_level('test.system', '/ds_user', [],
+                                 [listed('/ds_user/a', 10), listed('/ds_user/b', 5)])
+        self.client.login(username='ds_user', password='user/password')
+
+        resp = self.client.get(reverse('designsafe_api:user_usage'))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.content),
+                         {'total_storage_bytes': 15, 'total_files': 2})
@@ -99,7 +99,6 @@ def generic_webhook_handler(request):
         return HttpResponse(json.dumps(e.message), content_type='application/json', status=400)
 
     n = Notification.objects.create(**event_data)
-    n.save()
 
     # create metadata for Interactive connection and save to agave metadata
     try:
@@ -0,0 +1,107 @@
+"""Management command to benchmark the agave metadata model layer"""
+import timeit
+import uuid as uuid_lib
+from django.core.management.base import BaseCommand
+from designsafe.apps.projects.models.agave.experimental import (
+    ExperimentalProject,
+    Experiment
+)
+
+
+def project_meta():
+    """Agave metadata record of a synthetic experimental project."""
+    return {
+        'uuid': None,
+        'name': 'designsafe.project',
+        'associationIds': [],
+        'owner': 'ds_admin',
+        'created': '2020-01-01T00:00:00.000-06:00',
+        'lastUpdated': '2020-01-01T00:00:00.000-06:00',
+        'value': {
+            'projectId': 'PRJ-0000',
+            'title': 'Benchmark project',
+            'pi': 'pi_user',
+            'coPis': ['copi_{}'.format(i) for i in range(5)],
+            'teamMembers': ['member_{}'.format(i) for i in range(20)],
+            'description': 'x' * 1000,
+            'projectType': 'experimental',
+            'keywords': 'benchmark, synthetic',
+        },
+        '_links': {'self': {'href': 'https://agave/meta/v2/data/'}},
+    }
+
+
+def entity_meta(i, project_uuid):
+    """Agave metadata record of a synthetic experiment.
+
+    ``uuid`` is left empty, ``to_body_dict`` looks up the UI category of
+    saved entities in the database and that is not what is measured here.
+    """
+    return {
+        'uuid': None,
+        'name': 'designsafe.project.experiment',
+        'associationIds': [project_uuid],
+        'owner': 'ds_admin',
+        'created': '2020-01-01T00:00:00.000-06:00',
+        'lastUpdated': '2020-01-01T00:00:00.000-06:00',
+        'value': {
+            'title': 'Experiment {}'.format(i),
+            'description': 'x' * 500,
+            'experimentType': 'wave',
+            'experimentalFacility': 'ohhwrl-oregon',
+            'equipmentType': 'lwf',
+            'procedureStart': '2020-01-01T00:00:00.000Z',
+            'procedureEnd': '2020-01-02T00:00:00.000Z',
+            'authors': [{'name': 'member_{}'.format(j), 'order': j,
+                         'authorship': True} for j in range(5)],
+            'project': [project_uuid],
+            'dois': [],
+        },
+        '_links': {'self': {'href': 'https://agave/meta/v2/data/'}},
+    }
+
+
+class Command(BaseCommand):
+    """Times the agave metadata model layer on a synthetic project.
+
+    Builds an experimental project with ``--entities`` experiments and
+    reports the throughput of constructing the models, reading their
+    fields and serializing them with ``to_body_dict``. No Agave or
+    database requests are made.
+    """
+    help = 'Benchmark metadata model construction and serialization.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entities', type=int, default=1000,
+                            help='Number of entities in the synthetic project.')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Runs of each measurement, the best one is reported.')
+
+    def handle(self, *args, **options):
+        project_uuid = str(uuid_lib.uuid4())
+        count = options['entities']
+        metas = [entity_meta(i, project_uuid) for i in range(count)]
+        prj = ExperimentalProject(**project_meta())
+        entities = [Experiment(**meta) for meta in metas]
+        fieldnames = [field.attname for field in Experiment._meta._fields]
+
+        def construct():
+            for meta in metas:
+                Experiment(**meta)
+
+        def read_fields():
+            for ent in entities:
+                for attrname in fieldnames:
+                    getattr(ent, attrname)
+
+        def serialize():
+            prj.to_body_dict()
+            for ent in entities:
+                ent.to_body_dict()
+
+        for label, func in [('construct', construct),
+                            ('read fields', read_fields),
+                            ('to_body_dict', serialize)]:
+            best = min(timeit.repeat(func, number=1, repeat=options['repeat']))
+            self.stdout.write('{:<14} {:>9.1f} ms {:>11.0f} entities/s'.format(
+                label, best * 1000, count / best))
@@ -0,0 +1,178 @@
+"""Entity graph loader.
+
+.. :module: designsafe.apps.projects.managers.entities
+    :synopsis: Load every entity related to a project.
+
+Entities (experiments, simulations, reports, ...) are Agave metadata
+records associated to a project. :class:`EntityGraphLoader` pages through
+all of them with one query per page, several pages at a time, and groups
+the records by model name in a single pass. The serialized entities are
+cached per project UUID for ``PROJECT_ENTITIES_CACHE_TIMEOUT`` seconds.
+Metadata ``Model.save`` and views deleting entities call :func:`invalidate`.
+"""
+from __future__ import unicode_literals, absolute_import
+import json
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from designsafe.apps.projects.models.categories import Category
+
+
+LOG = logging.getLogger(__name__)
+
+CACHE_KEY = 'project_entities:{uuid}'
+# Metadata records fetched per ``listMetadata`` call.
+PAGE_SIZE = 100
+# Pages fetched concurrently once a project has more than one page.
+MAX_WORKERS = 4
+
+
+def cache_key(project_uuid):
+    """Cache key of the entities of a project."""
+    return CACHE_KEY.format(uuid=project_uuid)
+
+
+def invalidate(*project_uuids):
+    """Drop the cached entities of the given projects."""
+    keys = [cache_key(uuid) for uuid in project_uuids if uuid]
+    if keys:
+        cache.delete_many(keys)
+
+
+def project_fields(body, fields):
+    """Return only ``fields`` of a serialized entity.
+
+    ``value.<key>`` selects a single key of the entity's ``value``.
+
+    :param dict body: Entity as returned by ``to_body_dict``.
+    :param list fields: Field names, e.g. ``['uuid', 'name', 'value.title']``.
+    """
+    projected = {}
+    for field in fields:
+        if field.startswith('value.'):
+            key = field[len('value.'):]
+            if key in body.get('value', {}):
+                projected.setdefault('value', {})[key] = body['value'][key]
+        elif field in body:
+            projected[field] = body[field]
+    return projected
+
+
+class EntityGraphLoader(object):
+    """Load the entities related to a project.
+
+    :param agave_client: Agave client used to list the metadata records.
+    :param int page_size: Records per ``listMetadata`` call.
+    :param int max_workers: Pages fetched concurrently.
+    """
+
+    def __init__(self, agave_client, page_size=PAGE_SIZE, max_workers=MAX_WORKERS):
+        self._ac = agave_client
+        self.page_size = page_size
+        self.max_workers = max_workers
+
+    @staticmethod
+    def entity_names(project):
+        """Metadata names of the entities of ``project``'s model."""
+        names = []
+        for attrname in project._meta._reverse_fields:
+            name = getattr(project, attrname).related_obj_name
+            if name != 'designsafe.file' and name not in names:
+                names.append(name)
+        return names
+
+    def list_metadata(self, project_uuid, names):
+        """Return every metadata record named ``names`` associated to a project.
+
+        The first page is fetched alone since most projects fit in it.
+        Then ``max_workers`` pages are fetched at a time until one comes
+        back short.
+        """
+        query = json.dumps({'name': {'$in': names}, 'associationIds': project_uuid})
+
+        def _page(offset):
+            return self._ac.meta.listMetadata(q=query, offset=offset,
+                                              limit=self.page_size)
+
+        pages = [_page(0)]
+        offset = self.page_size
+        if len(pages[0]) >= self.page_size:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while len(pages[-1]) >= self.page_size:
+                    offsets = [offset + i * self.page_size
+                               for i in range(self.max_workers)]
+                    for page in executor.map(_page, offsets):
+                        pages.append(page)
+                        if len(page) < self.page_size:
+                            break
+                    offset = offsets[-1] + self.page_size
+
+        # A record created while paging can shift another one to the next page.
+        seen = set()
+        records = []
+        for page in pages:
+            for record in page:
+                if record['uuid'] not in seen:
+                    seen.add(record['uuid'])
+                    records.append(record)
+        return records
+
+    def related_entities(self, project):
+        """Return model instances of every entity of ``project``."""
+        from designsafe.apps.projects.models.utils import lookup_model
+        records = self.list_metadata(project.uuid, self.entity_names(project))
+        return [lookup_model(record)(**record) for record in records]
+
+    @staticmethod
+    def prefetch_categories(entities):
+        """Fetch the UI categories of ``entities`` with one query.
+
+        Entities without a category yet create it when serialized.
+        """
+        uuids = [ent.uuid for ent in entities if ent.uuid]
+        categories = Category.objects.filter(uuid__in=uuids)\
+            .prefetch_related('ui_orders')
+        by_uuid = {category.uuid: category for category in categories}
+        for ent in entities:
+            if ent.uuid in by_uuid:
+                ent._category = by_uuid[ent.uuid]
+
+    def load(self, project):
+        """Return the serialized entities of ``project`` grouped by name.
+
+        :returns: Ordered dict of metadata name to list of ``to_body_dict``
+            outputs, in the order Agave listed them.
+        """
+        timeout = getattr(settings, 'PROJECT_ENTITIES_CACHE_TIMEOUT', 0)
+        key = cache_key(project.uuid)
+        if timeout:
+            grouped = cache.get(key)
+            if grouped is not None:
+                return grouped
+
+        grouped = OrderedDict((name, []) for name in self.entity_names(project))
+        entities = self.related_entities(project)
+        self.prefetch_categories(entities)
+        for ent in entities:
+            grouped.setdefault(ent.name, []).append(ent.to_body_dict())
+
+        if timeout:
+            cache.set(key, grouped, timeout)
+        return grouped
+
+    def entities(self, project, names=None, fields=None):
+        """Return the serialized entities of ``project``.
+
+        :param list names: Only return entities with these metadata names.
+        :param list fields: Only return these fields, see :func:`project_fields`.
+        """
+        grouped = self.load(project)
+        entities = []
+        for name, bodies in grouped.items():
+            if names is None or name in names:
+                entities += bodies
+        if fields:
+            entities = [project_fields(body, fields) for body in entities]
+        return entities
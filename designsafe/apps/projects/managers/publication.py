@@ -7,8 +7,7 @@
 
 import logging
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ObjectDoesNotExist
-from pytas.http import TASClient
+from designsafe.apps.accounts import tas as tas_profiles
 from designsafe.apps.api.agave import service_account
 from designsafe.apps.data.models.agave.files import BaseFileResource
 from designsafe.apps.projects.managers import datacite as DataciteManager
@@ -96,6 +95,7 @@ def draft_publication(
     """
     mgr = ProjectsManager(service_account())
     prj = mgr.get_project_by_id(project_id)
+    tas_profiles.warm_project(prj)
     responses = []
 
     ### Draft Entity DOI(s) ###
@@ -193,6 +193,7 @@ def publish_resource(project_id, entity_uuids=None, publish_dois=False):
     """
     mgr = ProjectsManager(service_account())
     prj = mgr.get_project_by_id(project_id)
+    tas_profiles.warm_project(prj)
     responses = []
 
     if publish_dois:
@@ -260,25 +261,27 @@ def _transform_authors(entity, publication):
     Sets authors on the publication
     """
     entity['value']['authors'] = []
+    usernames = [author.get('name') for author in publication['authors']
+                 if not author.get('guest', False)]
+    users = {user.username: user for user in
+             get_user_model().objects.filter(username__in=usernames)}
+    profiles = tas_profiles.get_users(list(users), raise_errors=True)
     for author in publication['authors']:
         if author.get('guest', False):
             continue
-        user = None
-        try:
-            user = get_user_model().objects.get(username=author.get('name'))
-        except ObjectDoesNotExist:
-            LOG.exception(
+        user = users.get(author.get('name'))
+        if not user:
+            LOG.error(
                 "Error retrieving user: %(user)s",
                 {"user": author.get('name')}
             )
-        if not user:
             continue
 
         entity['value']['authors'].append(author.get('name'))
         author['lname'] = user.last_name
         author['fname'] = user.first_name
         author['email'] = user.email
-        user_tas = TASClient().get_user(username=user.username)
+        user_tas = profiles.get(user.username) or {}
         author['inst'] = user_tas.get('institution')
     entity['authors'] = publication['authors']
 
@@ -388,6 +391,7 @@ def freeze_project_and_entity_metadata(project_id, entity_uuids=None):
     """
     mgr = ProjectsManager(service_account())
     prj = mgr.get_project_by_id(project_id)
+    tas_profiles.warm_project(prj)
     pub_doc = BaseESPublication(project_id=project_id)
     publication = pub_doc.to_dict()
 
@@ -3,13 +3,13 @@ import datetime
 import logging
 import six
 import json
-import zipfile
 import os
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ObjectDoesNotExist
-from pytas.http import TASClient
+from designsafe.apps.accounts import tas as tas_profiles
 from designsafe.apps.data.models.agave.base import Model as MetadataModel
 from designsafe.apps.data.models.agave import fields
+from designsafe.libs.common.archive import ArchiveBuilder
 
 
 logger = logging.getLogger(__name__)
@@ -192,8 +192,16 @@ class Project(MetadataModel):
                 self.project_id = prj.project_id
         super(Project, self).save(ag)
 
-    def related_entities(self, offset=0, limit=100):
+    def related_entities(self, offset=0, limit=None):
+        """Return the entities related to this project.
+
+        Every entity is returned unless ``limit`` is given.
+        """
         from designsafe.apps.projects.models.utils import lookup_model
+        if limit is None:
+            from designsafe.apps.projects.managers.entities import EntityGraphLoader
+            loader = EntityGraphLoader(self.manager().agave_client)
+            return loader.related_entities(self)[offset:]
         relattrs = self._meta._reverse_fields
         rel_names = [getattr(self, attrname).related_obj_name for attrname in relattrs \
                          if getattr(self, attrname).related_obj_name != 'designsafe.file']
@@ -204,63 +212,39 @@ class Project(MetadataModel):
         ents = [lookup_model(rsp)(**rsp) for rsp in resp]
         return ents
 
+    @property
+    def corral_path(self):
+        """Path of the project's files on the corral mount."""
+        return '/corral-repl/tacc/NHERI/projects/{}'.format(self.uuid)
+
+    @property
+    def archive_name(self):
+        """File name of the project's zip archive."""
+        return str(self.project_id) + '_archive.zip'
+
+    def archive_paths(self):
+        """Return the archive and manifest paths inside the project directory."""
+        archive_path = os.path.join(self.corral_path, self.archive_name)
+        manifest_path = os.path.join(self.corral_path,
+                                     '.{}.manifest.json'.format(self.archive_name))
+        return archive_path, manifest_path
+
     def archive(self):
-        ARCHIVE_NAME = str(self.project_id) + '_archive.zip'
-        proj_dir = '/corral-repl/tacc/NHERI/projects/{}'.format(self.uuid)
-
-        def create_archive(project_directory):
-            try:
-                logger.debug("Creating new archive for %s" % project_directory)
-
-                # create archive within the project directory
-                archive_path = os.path.join(project_directory, ARCHIVE_NAME)
-                abs_path = project_directory.rsplit('/',1)[0]
-
-                
-
-                zf = zipfile.ZipFile(archive_path, mode='w', allowZip64=True)
-                for dirs, _, files in os.walk(project_directory):
-                    for f in files:
-                        if f == ARCHIVE_NAME:
-                            continue
-                        # write files without abs file path
-                        zf.write(os.path.join(dirs, f), os.path.join(dirs.replace(abs_path,''), f))
-                zf.close()
-            except:
-                logger.debug("Creating archive failed for " % 
-                    project_directory)
-
-        def update_archive(project_directory):
-            try:
-                logger.debug("Updating archive for %s" % project_directory)
-
-                archive_path = os.path.join(project_directory, ARCHIVE_NAME)
-                archive_timestamp = os.path.getmtime(archive_path)
-                zf = zipfile.ZipFile(archive_path, mode='a', allowZip64=True)
-                for dirs, _, files in os.walk(project_directory):
-                    for f in files:
-                        if f == ARCHIVE_NAME:
-                            continue
-                        file_path = os.path.join(dirs, f)
-                        file_timestamp = os.path.getmtime(file_path)
-                        if file_timestamp > archive_timestamp:
-                            if file_path in zf.namelist():
-                                zf.close()
-                                logger.debug(
-                                    "Modified file, deleting archive and " \
-                                    "re-archiving project directory %s" % 
-                                    project_directory)
-                                os.remove(archive_path)
-                                create_archive(project_directory)
-                                break
-            except:
-                logger.debug("Updating archive failed for project directory" % 
-                    project_directory)
-        
-        if ARCHIVE_NAME not in os.listdir(proj_dir):
-            create_archive(proj_dir)
-        else:
-            update_archive(proj_dir)
+        """Create or update the project's zip archive.
+
+        Only files added or modified since the last run are compressed.
+        """
+        archive_path, manifest_path = self.archive_paths()
+        builder = ArchiveBuilder(
+            self.corral_path, archive_path,
+            max_workers=getattr(settings, 'ARCHIVE_MAX_WORKERS', 4),
+            manifest_path=manifest_path)
+        try:
+            stats = builder.build()
+            logger.debug('Archived %s: %s', self.corral_path, stats)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('Archiving failed for project directory %s',
+                             self.corral_path)
 
     def to_datacite_json(self):
         """Serialize project to datacite json."""
@@ -354,17 +338,18 @@ def _process_authors(authors):
     """
     creators_details = []
     institutions = []
+    usernames = [author['name'] for author in authors if not author.get('guest')]
+    users = {user.username: user for user in
+             get_user_model().objects.filter(username__in=usernames)}
+    profiles = tas_profiles.get_users(list(users), raise_errors=True)
     for author in authors:
         user_obj = None
         user_tas = None
         if not author.get('guest'):
-            try:
-                user_obj = get_user_model().objects.get(username=author['name'])
-            except ObjectDoesNotExist:
-                pass
+            user_obj = users.get(author['name'])
 
         if user_obj:
-            user_tas = TASClient().get_user(username=user_obj.username)
+            user_tas = profiles.get(user_obj.username)
 
         if user_obj and user_tas:
             creators_details.append({
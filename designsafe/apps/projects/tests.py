@@ -1,3 +1,182 @@
-from django.test import TestCase
+from mock import MagicMock, patch
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from django.test import TestCase, override_settings
+from designsafe.apps.data.models.agave.base import FieldDescriptor
+from designsafe.apps.projects.models.agave.base import _process_authors
+from designsafe.apps.projects.managers.publication import _transform_authors
+from designsafe.apps.projects.models.agave.experimental import (ExperimentalProject,
+                                                                Experiment)
+from designsafe.apps.projects.managers.entities import (EntityGraphLoader,
+                                                        project_fields)
 
-# Create your tests here.
+
+class MetadataModelFieldsTestCase(TestCase):
+
+    def setUp(self):
+        self.meta = {
+            'uuid': None,
+            'name': 'designsafe.project.experiment',
+            'associationIds': ['prj-uuid'],
+            'value': {
+                'title': 'Experiment',
+                'experimentType': 'wave',
+                'authors': [{'name': 'user', 'order': 0}],
+                'project': ['prj-uuid'],
+            },
+            '_links': {},
+        }
+
+    def test_fields_use_descriptors(self):
+        self.assertIsInstance(Experiment.__dict__['title'], FieldDescriptor)
+        exp = Experiment(**self.meta)
+        self.assertEqual(exp.__dict__['experiment_type'], 'wave')
+        self.assertEqual(exp.experiment_type_other, '')
+
+    def test_read_converts_value(self):
+        exp = Experiment(**self.meta)
+        exp.title = 42
+        self.assertEqual(exp.title, '42')
+        # List fields return a copy, as before.
+        exp.authors.append({'name': 'other'})
+        self.assertEqual(len(exp.authors), 1)
+
+    def test_inherited_field_not_declared(self):
+        # ExperimentalProject does not declare Project's data_type.
+        prj = ExperimentalProject(value={'title': 'Project', 'pi': 'user'})
+        self.assertFalse(hasattr(prj, 'data_type'))
+        prj.data_type = ['raw']
+        self.assertIs(prj.data_type, prj.__dict__['data_type'])
+
+    def test_to_body_dict(self):
+        body = Experiment(**self.meta).to_body_dict()
+        self.assertEqual(body['associationIds'], ['prj-uuid'])
+        self.assertEqual(body['value']['experimentType'], 'wave')
+        self.assertEqual(body['value']['project'], ['prj-uuid'])
+        self.assertEqual(body['value']['authors'], [{'name': 'user', 'order': 0}])
+
+
+class EntityGraphLoaderTestCase(TestCase):
+
+    def setUp(self):
+        self.prj = ExperimentalProject(uuid='prj-uuid', value={'title': 'Project'})
+        self.client = MagicMock()
+
+    def _records(self, start, count, name='designsafe.project.experiment'):
+        return [{'uuid': 'ent-{}'.format(i), 'name': name,
+                 'associationIds': ['prj-uuid'], 'created': str(i),
+                 'value': {'title': 'Entity {}'.format(i)}, '_links': {}}
+                for i in range(start, start + count)]
+
+    def test_list_metadata_pages(self):
+        pages = {0: self._records(0, 2), 2: self._records(2, 2),
+                 4: self._records(4, 2), 6: self._records(6, 1)}
+        self.client.meta.listMetadata.side_effect = \
+            lambda q, offset, limit: pages.get(offset, [])
+        loader = EntityGraphLoader(self.client, page_size=2, max_workers=2)
+
+        records = loader.list_metadata('prj-uuid', ['designsafe.project.experiment'])
+
+        self.assertEqual([r['uuid'] for r in records],
+                         ['ent-{}'.format(i) for i in range(7)])
+        offsets = sorted(c[1]['offset'] for c in self.client.meta.listMetadata.call_args_list)
+        self.assertEqual(offsets, [0, 2, 4, 6, 8])
+
+    def test_list_metadata_single_page(self):
+        self.client.meta.listMetadata.return_value = self._records(0, 3)
+        loader = EntityGraphLoader(self.client, page_size=10)
+        self.assertEqual(len(loader.list_metadata('prj-uuid', ['x'])), 3)
+        self.client.meta.listMetadata.assert_called_once()
+
+    @override_settings(PROJECT_ENTITIES_CACHE_TIMEOUT=60)
+    @patch('designsafe.apps.projects.managers.entities.cache')
+    @patch('designsafe.apps.projects.managers.entities.EntityGraphLoader.prefetch_categories')
+    def test_load_groups_and_caches(self, mock_prefetch, mock_cache):
+        mock_cache.get.return_value = None
+        self.client.meta.listMetadata.return_value = \
+            self._records(0, 2) + self._records(2, 1, 'designsafe.project.analysis')
+        loader = EntityGraphLoader(self.client)
+
+        grouped = loader.load(self.prj)
+
+        self.assertEqual(len(grouped['designsafe.project.experiment']), 2)
+        self.assertEqual(len(grouped['designsafe.project.analysis']), 1)
+        mock_cache.set.assert_called_with('project_entities:prj-uuid', grouped, 60)
+
+        mock_cache.get.return_value = grouped
+        entities = loader.entities(self.prj, names=['designsafe.project.analysis'],
+                                   fields=['uuid', 'value.title'])
+        self.assertEqual(entities, [{'uuid': 'ent-2', 'value': {'title': 'Entity 2'}}])
+        self.assertEqual(self.client.meta.listMetadata.call_count, 1)
+
+    @patch('designsafe.apps.data.models.agave.base.tasks')
+    @patch('designsafe.apps.projects.managers.entities.invalidate')
+    def test_model_save_invalidates(self, mock_invalidate, mock_tasks):
+        record = self._records(0, 1)[0]
+        exp = Experiment(**record)
+        self.client.meta.updateMetadata.return_value = dict(
+            record, associationIds=['prj-uuid', 'prj-other'])
+
+        exp.save(self.client)
+
+        self.assertEqual(sorted(mock_invalidate.call_args[0]), ['prj-other', 'prj-uuid'])
+
+    def test_project_fields(self):
+        body = {'uuid': 'u', 'name': 'n', 'value': {'title': 't', 'dois': []}}
+        self.assertEqual(project_fields(body, ['uuid', 'value.dois', 'value.missing']),
+                         {'uuid': 'u', 'value': {'dois': []}})
+
+
+class ProcessAuthorsTestCase(TestCase):
+    fixtures = ['user-data']
+
+    @patch('designsafe.apps.projects.models.agave.base.tas_profiles.get_users')
+    def test_profiles_are_fetched_in_one_batch(self, mock_get_users):
+        mock_get_users.return_value = {
+            'ds_user': {'institution': 'UT Austin'},
+            'ds_admin': None,
+        }
+        authors = [
+            {'name': 'ds_user', 'order': 0},
+            {'name': 'ds_admin', 'order': 1},
+            {'name': 'guest', 'guest': True, 'fname': 'Guest', 'lname': 'Author',
+             'inst': 'TACC', 'order': 2},
+            {'name': 'unknown', 'order': 3},
+        ]
+
+        creators, institutions = _process_authors(authors)
+
+        self.assertEqual(mock_get_users.call_count, 1)
+        self.assertEqual(mock_get_users.call_args[1], {'raise_errors': True})
+        self.assertIn('ds_user', mock_get_users.call_args[0][0])
+        self.assertNotIn('guest', mock_get_users.call_args[0][0])
+        self.assertNotIn('unknown', mock_get_users.call_args[0][0])
+        self.assertEqual([creator['familyName'] for creator in creators],
+                         ['User', 'Author'])
+        self.assertEqual(institutions, {'UT Austin', 'TACC'})
+
+
+class TransformAuthorsTestCase(TestCase):
+    fixtures = ['user-data']
+
+    @patch('designsafe.apps.projects.managers.publication.tas_profiles.get_users')
+    def test_unreachable_tas_fails_publication(self, mock_get_users):
+        mock_get_users.side_effect = RequestsConnectionError('TAS unavailable')
+        entity = {'value': {}}
+        publication = {'authors': [{'name': 'ds_user', 'order': 0}]}
+
+        with self.assertRaises(RequestsConnectionError):
+            _transform_authors(entity, publication)
+        self.assertNotIn('inst', publication['authors'][0])
+
+    @patch('designsafe.apps.projects.managers.publication.tas_profiles.get_users')
+    def test_authors_are_filled_from_profiles(self, mock_get_users):
+        mock_get_users.return_value = {'ds_user': {'institution': 'UT Austin'}}
+        entity = {'value': {}}
+        publication = {'authors': [{'name': 'ds_user', 'order': 0},
+                                   {'name': 'guest', 'guest': True, 'order': 1}]}
+
+        _transform_authors(entity, publication)
+
+        self.assertEqual(entity['value']['authors'], ['ds_user'])
+        self.assertEqual(publication['authors'][0]['inst'], 'UT Austin')
+        self.assertEqual(publication['authors'][0]['lname'], 'User')
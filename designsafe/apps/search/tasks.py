@@ -16,3 +16,9 @@ def update_search_index():
 @shared_task(bind=True)
 def index_community_data(self):
     agave_indexer.delay('designsafe.storage.community', paths_to_ignore=['Trash'])
+
+@shared_task(bind=True)
+def index_storage_incremental(self, systemId, filePath='/'):
+    """Re-index a storage system, only writing what changed since the
+    last pass."""
+    agave_indexer.apply_async(kwargs={'systemId': systemId, 'filePath': filePath, 'incremental': True, 'paths_to_ignore': ['Trash']}, queue='indexing')
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workspace', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobStatus',
+            fields=[
+                ('job_id', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('username', models.CharField(max_length=150)),
+                ('status', models.CharField(max_length=32)),
+                ('output_indexed', models.BooleanField(default=False)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -4,6 +4,7 @@ from designsafe.apps.signals.signals import generic_event
 from designsafe.apps.notifications.models import Notification
 from ws4redis.publisher import RedisPublisher
 from ws4redis.redis_store import RedisMessage
+from designsafe.apps.workspace.models.job_status import JobStatus
 
 import json
 import logging
@@ -0,0 +1,55 @@
+import logging
+from django.db import models, transaction, IntegrityError
+from django.utils import timezone
+
+#pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+#pylint: enable=invalid-name
+
+
+class JobStatus(models.Model):
+    """Last status received from the jobs webhook, per job.
+
+    Webhook callbacks are retried and can arrive more than once, so the
+    status is changed with a conditional ``UPDATE`` on the primary key and
+    only the callback that changes it notifies the user.
+    """
+    TERMINAL = ('FINISHED', 'FAILED', 'STOPPED')
+
+    job_id = models.CharField(max_length=64, primary_key=True)
+    username = models.CharField(max_length=150)
+    status = models.CharField(max_length=32)
+    output_indexed = models.BooleanField(default=False)
+    last_updated = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return "%s: %s" % (self.job_id, self.status)
+
+    @classmethod
+    def set_status(cls, job_id, username, status):
+        """Record ``status`` for a job.
+
+        Statuses received after a terminal one are ignored.
+
+        :return: ``True`` if the status changed, ``False`` for duplicates.
+        """
+        updated = cls.objects.filter(job_id=job_id).exclude(
+            status=status).exclude(status__in=cls.TERMINAL).update(
+                status=status, last_updated=timezone.now())
+        if updated:
+            return True
+        if cls.objects.filter(job_id=job_id).exists():
+            return False
+        try:
+            with transaction.atomic():
+                cls.objects.create(job_id=job_id, username=username, status=status)
+        except IntegrityError:
+            # Another worker recorded the job first.
+            return cls.set_status(job_id, username, status)
+        return True
+
+    @classmethod
+    def claim_output_indexing(cls, job_id):
+        """Return ``True`` once per job, to the caller that indexes its output."""
+        return cls.objects.filter(job_id=job_id, output_indexed=False).update(
+            output_indexed=True) == 1
@@ -8,7 +8,7 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
 from designsafe.apps.api.agave import impersonate_service_account
 from designsafe.apps.api.notifications.models import Notification
-from django.db import transaction
+from designsafe.apps.workspace.models import JobStatus
 from agavepy.agave import AgaveException
 from celery import shared_task
 from requests import ConnectionError, HTTPError
@@ -90,13 +90,17 @@ def submit_job(request, username, job_post):
         raise JobSubmitError(**err_resp)
 
 
-def handle_webhook_request(job):
+@shared_task(bind=True)
+def handle_webhook_request(self, job):
     """Notifies the user of the job status by instantiating and saving
     a Notification instance.
 
     If the job is finished, we also index the job and  alert the user to the
     URL of the job's location in the data depot.
 
+    Duplicate callbacks are dropped by :meth:`JobStatus.set_status`, and the
+    output of a job is indexed once.
+
     Args:
         job (dict): Dictionary containing the webhook data.
 
@@ -106,9 +110,7 @@ def handle_webhook_request(job):
         username = job['owner']
         job_id = job['id']
 
-        user = get_user_model().objects.get(username=username)
-        ag = user.agave_oauth.client
-        # ag_job = ag.jobs.get(jobId=job_id)
+        get_user_model().objects.get(username=username)
 
         try:
             job['remoteSubmitted'] = str(job['remoteSubmitted'])
@@ -118,8 +120,12 @@ def handle_webhook_request(job):
 
         job_status = job['status']
         job_name = job['name']
-        # logger.debug(current_status)
         logger.debug(job_status)
+
+        if not JobStatus.set_status(job_id, username, job_status):
+            logger.debug('duplicate notification received.')
+            return
+
         event_data = {
             Notification.EVENT_TYPE: 'job',
             Notification.JOB_ID: job_id,
@@ -135,27 +141,11 @@ def handle_webhook_request(job):
             event_data[Notification.STATUS] = Notification.ERROR
             event_data[Notification.MESSAGE] = "Job '%s' Failed. Please try again..." % (job_name)
             event_data[Notification.OPERATION] = 'job_failed'
-
-            with transaction.atomic():
-                last_notification = Notification.objects.select_for_update().filter(jobId=job_id).last()
-                should_notify = True
-
-                if last_notification:
-                    last_status = last_notification.to_dict()['extra']['status']
-                    logger.debug('last status: ' + last_status)
-
-                    if job_status == last_status:
-                        logger.debug('duplicate notification received.')
-                        should_notify = False
-
-                if should_notify:
-                    n = Notification.objects.select_for_update().create(**event_data)
-                    n.save()
+            Notification.objects.create(**event_data)
 
         elif job_status == 'FINISHED':
             logger.debug('JOB STATUS CHANGE: id=%s status=%s' % (job_id, job_status))
 
-
             logger.debug('archivePath: {}'.format(job['archivePath']))
             target_path = reverse('designsafe_data:data_depot')
             os.path.join(target_path, 'agave', archive_id.strip('/'))
@@ -164,32 +154,16 @@ def handle_webhook_request(job):
             event_data[Notification.EXTRA]['target_path'] = target_path
             event_data[Notification.MESSAGE] = "Job '%s' finished!" % (job_name)
             event_data[Notification.OPERATION] = 'job_finished'
+            Notification.objects.create(**event_data)
+            logger.debug('Event data with action link %s' % event_data)
 
-            with transaction.atomic():
-                last_notification = Notification.objects.select_for_update().filter(jobId=job_id).last()
-                should_notify = True
-
-                if last_notification:
-                    last_status = last_notification.to_dict()['extra']['status']
-                    logger.debug('last status: ' + last_status)
-
-                    if job_status == last_status:
-                        logger.debug('duplicate notification received.')
-                        should_notify = False
-
-                if should_notify:
-                    n = Notification.objects.select_for_update().create(**event_data)
-                    n.save()
-                    logger.debug('Event data with action link %s' % event_data)
-
-                    try:
-                        logger.debug('Preparing to Index Job Output job=%s', job_name)
-
-                        archivePath = '/'.join([job['archiveSystem'], job['archivePath']])
-                        agave_indexer.apply_async(kwargs={'username': 'ds_admin', 'systemId': job['archiveSystem'], 'filePath': job['archivePath'], 'recurse':True}, queue='indexing')
-                        logger.debug('Finished Indexing Job Output job=%s', job_name)
-                    except Exception as e:
-                        logger.exception('Error indexing job output')
+            if JobStatus.claim_output_indexing(job_id):
+                try:
+                    logger.debug('Preparing to Index Job Output job=%s', job_name)
+                    agave_indexer.apply_async(kwargs={'username': 'ds_admin', 'systemId': job['archiveSystem'], 'filePath': job['archivePath'], 'recurse':True}, queue='indexing')
+                    logger.debug('Finished Indexing Job Output job=%s', job_name)
+                except Exception as e:
+                    logger.exception('Error indexing job output')
 
         else:
             # notify
@@ -197,25 +171,8 @@ def handle_webhook_request(job):
             event_data[Notification.STATUS] = Notification.INFO
             event_data[Notification.MESSAGE] = "Job '%s' updated to %s." % (job_name, job_status)
             event_data[Notification.OPERATION] = 'job_status_update'
-
-            with transaction.atomic():
-                last_notification = Notification.objects.select_for_update().filter(jobId=job_id).last()
-
-                should_notify = True
-
-                if last_notification:
-                    last_status = last_notification.to_dict()['extra']['status']
-                    logger.debug('last status: ' + last_status)
-
-                    if job_status == last_status:
-                        logger.debug('duplicate notification received.')
-                        should_notify = False
-
-                if should_notify:
-                    n = Notification.objects.select_for_update().create(**event_data)
-                    n.save()
-
-                    logger.debug(n.pk)
+            n = Notification.objects.create(**event_data)
+            logger.debug(n.pk)
 
     except ObjectDoesNotExist:
         logger.exception('Unable to locate local user account: %s' % username)
@@ -3,6 +3,9 @@ import os
 from mock import patch
 from django.test import TestCase
 from .models.app_descriptions import AppDescription
+from .models.job_status import JobStatus
+from .tasks import handle_webhook_request
+from designsafe.apps.api.notifications.models import Notification
 from django.core.urlresolvers import reverse
 from django.contrib.auth import get_user_model
 
@@ -108,3 +111,35 @@ class TestAppsApiViews(TestCase):
     def test_licensed_apps(self):
         # TODO: test to make sure the licensing stuff works
         pass
+
+
+class JobStatusTestCase(TestCase):
+    fixtures = ['user-data', 'agave-oauth-token-data']
+
+    def setUp(self):
+        with open('designsafe/apps/api/notifications/json/submitting.json') as f:
+            self.job = json.load(f)
+
+    def test_set_status_is_a_compare_and_set(self):
+        self.assertTrue(JobStatus.set_status('job-1', 'ds_user', 'PENDING'))
+        self.assertFalse(JobStatus.set_status('job-1', 'ds_user', 'PENDING'))
+        self.assertTrue(JobStatus.set_status('job-1', 'ds_user', 'RUNNING'))
+        self.assertTrue(JobStatus.set_status('job-1', 'ds_user', 'FINISHED'))
+        # Late callbacks do not move a job out of a terminal status.
+        self.assertFalse(JobStatus.set_status('job-1', 'ds_user', 'RUNNING'))
+        self.assertEqual(JobStatus.objects.get(job_id='job-1').status, 'FINISHED')
+
+    def test_claim_output_indexing_once(self):
+        JobStatus.set_status('job-1', 'ds_user', 'FINISHED')
+        self.assertTrue(JobStatus.claim_output_indexing('job-1'))
+        self.assertFalse(JobStatus.claim_output_indexing('job-1'))
+
+    @patch('designsafe.apps.workspace.tasks.agave_indexer')
+    def test_finished_job_is_indexed_once(self, mock_indexer):
+        self.job['status'] = 'FINISHED'
+        handle_webhook_request(dict(self.job))
+        handle_webhook_request(dict(self.job))
+
+        self.assertEqual(
+            Notification.objects.filter(jobId=self.job['id']).count(), 1)
+        self.assertEqual(mock_indexer.apply_async.call_count, 1)
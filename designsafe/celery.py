@@ -40,6 +40,14 @@ if settings.COMMUNITY_INDEX_SCHEDULE:
         'schedule': crontab(**settings.COMMUNITY_INDEX_SCHEDULE)
     }
 
+if getattr(settings, 'INCREMENTAL_INDEX_SCHEDULE', {}):
+    for system_id in (settings.AGAVE_STORAGE_SYSTEM, settings.PUBLISHED_SYSTEM):
+        app.conf.beat_schedule['index_incremental_{}'.format(system_id)] = {
+            'task': 'designsafe.apps.search.tasks.index_storage_incremental',
+            'schedule': crontab(**settings.INCREMENTAL_INDEX_SCHEDULE),
+            'args': (system_id,)
+        }
+
 @app.task(bind=True)
 def debug_task(self):
     print('Request: {0!r}'.format(self.request))
@@ -0,0 +1,477 @@
+"""
+.. module: designsafe.libs.common.archive
+   :synopsis: Incremental and streaming zip archives of directory trees.
+
+:class:`ArchiveBuilder` keeps a JSON manifest (path, size, mtime, crc)
+beside the archive it writes. When it runs again, members whose size and
+mtime did not change are copied from the previous archive as raw compressed
+bytes. Only new or modified files are compressed, in a thread pool
+(``zlib`` releases the GIL). Files that are already compressed
+(:data:`STORED_EXTENSIONS`) are stored without deflate.
+
+:func:`stream_archive` writes the same zip layout to a generator, so a
+directory can be sent as a ``StreamingHttpResponse`` without materialising
+the archive on disk.
+"""
+import os
+import json
+import zlib
+import time
+import struct
+import logging
+import tempfile
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+#pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+#pylint: enable=invalid-name
+
+STORED_EXTENSIONS = frozenset([
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar',
+    '.h5', '.hdf5', '.nc',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp',
+    '.mp4', '.m4v', '.mov', '.avi', '.mkv', '.wmv', '.mp3', '.m4a',
+])
+CHUNK_SIZE = 1024 * 1024
+SPOOL_SIZE = 64 * 1024 * 1024
+MANIFEST_SUFFIX = '.manifest.json'
+MANIFEST_VERSION = 1
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_MARKER = 0xFFFFFFFF
+
+
+def compress_type(name):
+    """Return the zip compression method to use for ``name``."""
+    _, ext = os.path.splitext(name.lower())
+    if ext in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def _dos_datetime(mtime):
+    local = time.localtime(mtime)
+    if local.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    dostime = local.tm_hour << 11 | local.tm_min << 5 | local.tm_sec // 2
+    dosdate = (local.tm_year - 1980) << 9 | local.tm_mon << 5 | local.tm_mday
+    return dostime, dosdate
+
+
+def scan(source_dir, arcname_root=None, exclude=()):
+    """Walk ``source_dir`` and describe every file to archive.
+
+    :param str source_dir: Directory to archive.
+    :param str arcname_root: Prefix stripped from paths to build member
+        names. Defaults to the parent of ``source_dir`` so members start
+        with the directory's own name.
+    :param exclude: Absolute paths to leave out.
+    :returns: ``OrderedDict`` of member name to
+        ``{'path', 'size', 'mtime', 'mode'}``, in a stable order.
+    """
+    source_dir = source_dir.rstrip('/')
+    if arcname_root is None:
+        arcname_root = os.path.dirname(source_dir)
+    exclude = set(exclude)
+    entries = OrderedDict()
+    for root, dirs, files in os.walk(source_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if path in exclude:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                logger.warning('Unable to stat %s, skipping it.', path)
+                continue
+            arcname = os.path.relpath(path, arcname_root).replace(os.sep, '/')
+            entries[arcname] = {
+                'path': path,
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'mode': stat.st_mode
+            }
+    return entries
+
+
+class ZipWriter(object):
+    """Minimal zip64-capable zip writer.
+
+    Every method returns the bytes to append to the output and keeps track
+    of the offset, so the same writer serves files and generators.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.members = []
+
+    def _advance(self, data):
+        self.offset += len(data)
+        return data
+
+    def data(self, data):
+        """Account for member data written by the caller."""
+        return self._advance(data)
+
+    def skip(self, length):
+        """Account for ``length`` bytes the caller copied on its own."""
+        self.offset += length
+
+    def local_header(self, member, streaming=False):
+        """Return the local file header for ``member``.
+
+        ``member`` is a dict with ``name``, ``method``, ``mtime``, ``mode``
+        and, unless ``streaming``, ``crc``, ``csize`` and ``usize``. When
+        streaming, sizes follow the data in :meth:`data_descriptor`.
+        """
+        name = member['name'].encode('utf-8')
+        member['offset'] = self.offset
+        member['flags'] = 0x800
+        if streaming:
+            member['flags'] |= 0x08
+            member['zip64'] = True
+            crc = 0
+            extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0)
+        else:
+            crc = member['crc']
+            member['zip64'] = member['usize'] >= ZIP64_LIMIT or \
+                member['csize'] >= ZIP64_LIMIT
+            extra = b''
+            if member['zip64']:
+                extra = struct.pack('<HHQQ', 0x0001, 16, member['usize'], member['csize'])
+        if member['zip64']:
+            csize = usize = ZIP64_MARKER
+        else:
+            csize, usize = member['csize'], member['usize']
+        dostime, dosdate = _dos_datetime(member['mtime'])
+        self.members.append(member)
+        header = struct.pack('<IHHHHHIIIHH', 0x04034b50,
+                             45 if member['zip64'] else 20,
+                             member['flags'], member['method'], dostime, dosdate,
+                             crc, csize, usize, len(name), len(extra))
+        return self._advance(header + name + extra)
+
+    def data_descriptor(self, member):
+        """Return the data descriptor closing a streamed ``member``."""
+        return self._advance(struct.pack('<IIQQ', 0x08074b50, member['crc'],
+                                          member['csize'], member['usize']))
+
+    def central_directory(self):
+        """Return the central directory and end records."""
+        start = self.offset
+        records = []
+        for member in self.members:
+            name = member['name'].encode('utf-8')
+            fields = []
+            usize, csize, offset = member['usize'], member['csize'], member['offset']
+            if usize >= ZIP64_LIMIT:
+                fields.append(usize)
+                usize = ZIP64_MARKER
+            if csize >= ZIP64_LIMIT:
+                fields.append(csize)
+                csize = ZIP64_MARKER
+            if offset >= ZIP64_LIMIT:
+                fields.append(offset)
+                offset = ZIP64_MARKER
+            extra = b''
+            if fields:
+                extra = struct.pack('<HH' + 'Q' * len(fields), 0x0001,
+                                    8 * len(fields), *fields)
+            version = 45 if fields or member['zip64'] else 20
+            dostime, dosdate = _dos_datetime(member['mtime'])
+            records.append(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50,
+                                       (3 << 8) | version, version,
+                                       member['flags'], member['method'],
+                                       dostime, dosdate, member['crc'],
+                                       csize, usize, len(name), len(extra), 0,
+                                       0, 0, (member['mode'] & 0xFFFF) << 16,
+                                       offset) + name + extra)
+        directory = b''.join(records)
+        self._advance(directory)
+        size = len(directory)
+        count = len(self.members)
+
+        end = b''
+        if count >= 0xFFFF or size >= ZIP64_LIMIT or start >= ZIP64_LIMIT:
+            zip64_end = self.offset
+            end += struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0,
+                               count, count, size, start)
+            end += struct.pack('<IIQI', 0x07064b50, 0, zip64_end, 1)
+        end += struct.pack('<IHHHHIIH', 0x06054b50, 0, 0,
+                           min(count, 0xFFFF), min(count, 0xFFFF),
+                           ZIP64_MARKER if size >= ZIP64_LIMIT else size,
+                           ZIP64_MARKER if start >= ZIP64_LIMIT else start, 0)
+        self._advance(end)
+        return directory + end
+
+
+def _checksum(path):
+    crc = 0
+    size = 0
+    with open(path, 'rb') as src:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+    return crc & 0xFFFFFFFF, size
+
+
+def _deflate(path):
+    """Deflate ``path`` into a spool file.
+
+    :returns: ``(crc, usize, csize, spool)``
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    crc = 0
+    size = 0
+    with open(path, 'rb') as src:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            spool.write(compressor.compress(chunk))
+    spool.write(compressor.flush())
+    csize = spool.tell()
+    spool.seek(0)
+    return crc & 0xFFFFFFFF, size, csize, spool
+
+
+def _prepare(member):
+    """Compress, or checksum, a new or modified member.
+
+    Runs in a worker thread.
+    """
+    if member['method'] == zipfile.ZIP_STORED:
+        if 'crc' not in member:
+            member['crc'], member['usize'] = _checksum(member['path'])
+        member['csize'] = member['usize']
+        return member, None
+    member['crc'], member['usize'], member['csize'], spool = _deflate(member['path'])
+    return member, spool
+
+
+def _copy(src, out, length):
+    remaining = length
+    while remaining:
+        chunk = src.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise IOError('Unexpected end of file')
+        out.write(chunk)
+        remaining -= len(chunk)
+
+
+class ArchiveBuilder(object):
+    """Build and incrementally update a zip archive of a directory.
+
+    :param str source_dir: Directory to archive.
+    :param str archive_path: Where to write the zip file.
+    :param str arcname_root: See :func:`scan`.
+    :param int max_workers: Threads compressing members.
+    :param str manifest_path: Defaults to ``archive_path`` plus
+        :data:`MANIFEST_SUFFIX`.
+    :param dict checksums: Known ``{'size', 'mtime', 'crc32'}`` by member
+        name, e.g. from a copy manifest. Stored members that match are
+        not read twice.
+    """
+
+    def __init__(self, source_dir, archive_path, arcname_root=None,
+                 max_workers=4, manifest_path=None, checksums=None):
+        self.source_dir = source_dir
+        self.archive_path = archive_path
+        self.arcname_root = arcname_root
+        self.max_workers = max_workers
+        self.manifest_path = manifest_path or archive_path + MANIFEST_SUFFIX
+        self.checksums = checksums or {}
+
+    def load_manifest(self):
+        """Return manifest entries, empty if there is no usable manifest."""
+        try:
+            with open(self.manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (IOError, OSError, ValueError):
+            return {}
+        if manifest.get('version') != MANIFEST_VERSION:
+            return {}
+        return manifest.get('entries', {})
+
+    def _write_manifest(self, members):
+        entries = {}
+        for member in members:
+            entries[member['name']] = {
+                'size': member['usize'],
+                'mtime': member['mtime'],
+                'crc': member['crc'],
+                'method': member['method']
+            }
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as manifest_file:
+            json.dump({'version': MANIFEST_VERSION, 'entries': entries},
+                      manifest_file, sort_keys=True)
+        os.rename(tmp_path, self.manifest_path)
+
+    def _previous_members(self, manifest):
+        """Return zip infos of the previous archive that match the manifest."""
+        if not manifest or not os.path.exists(self.archive_path):
+            return {}
+        try:
+            with zipfile.ZipFile(self.archive_path) as previous:
+                infos = previous.infolist()
+        except (zipfile.BadZipfile, IOError, OSError):
+            logger.warning('Unable to read %s, rebuilding it.', self.archive_path)
+            return {}
+        return dict((info.filename, info) for info in infos
+                    if info.filename in manifest and
+                    info.CRC == manifest[info.filename]['crc'] and
+                    info.file_size == manifest[info.filename]['size'])
+
+    def build(self):
+        """Bring the archive up to date with the source directory.
+
+        :returns: Dict with counts of ``reused``, ``compressed`` and
+            ``removed`` members.
+        """
+        exclude = [self.archive_path, self.manifest_path,
+                   self.archive_path + '.tmp', self.manifest_path + '.tmp']
+        files = scan(self.source_dir, self.arcname_root, exclude)
+        manifest = self.load_manifest()
+        previous = self._previous_members(manifest)
+
+        members = []
+        reused = 0
+        for arcname, stat in files.items():
+            member = {'name': arcname, 'path': stat['path'],
+                      'mtime': stat['mtime'], 'mode': stat['mode']}
+            info = previous.get(arcname)
+            entry = manifest.get(arcname)
+            if info is not None and entry['size'] == stat['size'] and \
+                    entry['mtime'] == stat['mtime']:
+                member.update({'method': info.compress_type, 'crc': info.CRC,
+                               'usize': info.file_size,
+                               'csize': info.compress_size, 'info': info})
+                reused += 1
+            else:
+                member['method'] = compress_type(arcname)
+                known = self.checksums.get(arcname)
+                if member['method'] == zipfile.ZIP_STORED and known and \
+                        known['size'] == stat['size'] and \
+                        known['mtime'] == stat['mtime']:
+                    member.update({'crc': known['crc32'], 'usize': known['size']})
+            members.append(member)
+
+        removed = len(set(manifest) - set(files))
+        stats = {'reused': reused, 'compressed': len(members) - reused,
+                 'removed': removed}
+        if previous and not stats['compressed'] and not removed and \
+                len(previous) == len(manifest):
+            logger.debug('Archive %s is up to date.', self.archive_path)
+            return stats
+
+        logger.debug('Writing archive %s: %s', self.archive_path, stats)
+        tmp_path = self.archive_path + '.tmp'
+        try:
+            self._write(tmp_path, members)
+            os.rename(tmp_path, self.archive_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._write_manifest(members)
+        return stats
+
+    def _write(self, tmp_path, members):
+        writer = ZipWriter()
+        previous = None
+        if any('info' in member for member in members):
+            previous = open(self.archive_path, 'rb')
+        pending = deque()
+        to_prepare = iter([member for member in members if 'info' not in member])
+        try:
+            with open(tmp_path, 'wb') as out, \
+                    ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+
+                def _submit():
+                    # Keep a bounded number of members compressed ahead of
+                    # the writer so spool files do not pile up.
+                    while len(pending) < self.max_workers * 2:
+                        member = next(to_prepare, None)
+                        if member is None:
+                            return
+                        pending.append(executor.submit(_prepare, member))
+
+                _submit()
+                for member in members:
+                    if 'info' in member:
+                        info = member.pop('info')
+                        out.write(writer.local_header(member))
+                        previous.seek(info.header_offset)
+                        header = previous.read(30)
+                        name_len, extra_len = struct.unpack('<HH', header[26:30])
+                        previous.seek(name_len + extra_len, os.SEEK_CUR)
+                        _copy(previous, out, member['csize'])
+                        writer.skip(member['csize'])
+                        continue
+
+                    prepared, spool = pending.popleft().result()
+                    _submit()
+                    out.write(writer.local_header(prepared))
+                    if spool is None:
+                        with open(prepared['path'], 'rb') as src:
+                            _copy(src, out, prepared['csize'])
+                    else:
+                        with spool:
+                            _copy(spool, out, prepared['csize'])
+                    writer.skip(prepared['csize'])
+                out.write(writer.central_directory())
+        finally:
+            if previous is not None:
+                previous.close()
+
+
+def stream_archive(source_dir, arcname_root=None, exclude=()):
+    """Yield a zip archive of ``source_dir`` chunk by chunk.
+
+    Members are written with data descriptors so nothing has to be known
+    before the bytes are sent. See :func:`scan` for the parameters.
+    """
+    writer = ZipWriter()
+    for arcname, stat in scan(source_dir, arcname_root, exclude).items():
+        member = {'name': arcname, 'method': compress_type(arcname),
+                  'mtime': stat['mtime'], 'mode': stat['mode']}
+        try:
+            src = open(stat['path'], 'rb')
+        except (IOError, OSError):
+            logger.warning('Unable to read %s, skipping it.', stat['path'])
+            continue
+        with src:
+            yield writer.local_header(member, streaming=True)
+            compressor = None
+            if member['method'] == zipfile.ZIP_DEFLATED:
+                compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                              zlib.DEFLATED, -15)
+            crc = 0
+            usize = 0
+            csize = 0
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                crc = zlib.crc32(chunk, crc)
+                usize += len(chunk)
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    csize += len(chunk)
+                    yield writer.data(chunk)
+            if compressor is not None:
+                chunk = compressor.flush()
+                csize += len(chunk)
+                yield writer.data(chunk)
+        member.update({'crc': crc & 0xFFFFFFFF, 'usize': usize, 'csize': csize})
+        yield writer.data_descriptor(member)
+    yield writer.central_directory()
+
+
+def archive_response(source_dir, filename, arcname_root=None, exclude=()):
+    """Return a ``StreamingHttpResponse`` sending ``source_dir`` as a zip."""
+    from django.http import StreamingHttpResponse
+    response = StreamingHttpResponse(stream_archive(source_dir, arcname_root, exclude),
+                                     content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+    return response
@@ -1,13 +1,8 @@
-import os
-import re
-import time
 import warnings
 import functools
-import cProfile, pstats
 import inspect
 import logging
-from django.conf import settings
-from django.http import HttpRequest
+from designsafe.libs.common import instrumentation
 
 logger = logging.getLogger(__name__)
 
@@ -30,59 +25,35 @@ def deprecated(func):
     return new_func
 
 def profile(func):
+    """Record the latency and ES/Agave calls of ``func``.
+
+    Calls are recorded as their own span in
+    :mod:`designsafe.libs.common.instrumentation`, named after the module,
+    class and function. One in ``PROFILE_SAMPLE_RATE`` calls is profiled
+    with cProfile, unless the request it runs in already is. ``func`` is
+    called directly when instrumentation is disabled, see
+    :func:`~designsafe.libs.common.instrumentation.enabled`.
+    """
+    spec = inspect.getfullargspec(func)
+    is_method = bool(spec.args) and spec.args[0] == 'self'
+
     @functools.wraps(func)
     def decorated_function(*args, **kwargs):
-        if getattr(settings, 'PORTAL_PROFILE', False):
-            prf = cProfile.Profile()
-            prf.enable()
-            resp = func(*args, **kwargs)
-            prf.disable()
-
-            stats_dirpath = os.path.join(os.path.dirname(__file__), '../../../stats')
-            spec = inspect.getargspec(func)
-            if spec.args and spec.args[0] == 'self':
-                _self = args[0]
-                clsname = _self.__class__.__name__
-                modulename = _self.__module__
-                funcname = func.__name__
-                filename = '{}.{}.{}'.format(modulename, clsname, funcname)
-                request = args[1]
-            else:
-                modulename = func.__module__
-                funcname = func.__name__
-                filename = '{}.{}'.format(modulename, funcname)
-                request = args[0]
-
-            filename = re.sub(r"[^a-zA-Z0-9\_\-]", "_", filename)
-
-            filepath = os.path.join(stats_dirpath, filename)
-            if not os.path.isdir(stats_dirpath):
-                os.mkdir(stats_dirpath)
-
-            if os.path.isfile(filepath + '.stats'):
-                filename += '_{}'.format(str(time.time()))
-                filepath = os.path.join(stats_dirpath, filename)
-
-            filepath_prof = filepath + '.prof'
-            filepath_stats = filepath + '.stats'
-
-            prf.dump_stats(filepath_prof)
-            with open(filepath_stats, 'w+') as flo:
-                if isinstance(request, HttpRequest):
-                    flo.write(
-                        """Request path: {path}
-                        POST: {post}
-                        GET: {get}
-                        """.format(
-                            path=request.path,
-                            post=request.POST.dict(),
-                            get=request.GET.dict())
-                        )
-                prfs = pstats.Stats(prf, stream=flo).sort_stats('cumtime')
-                prfs.print_stats()
+        if not instrumentation.enabled():
+            return func(*args, **kwargs)
+        if is_method and args:
+            name = '{}.{}.{}'.format(args[0].__module__,
+                                     args[0].__class__.__name__,
+                                     func.__name__)
         else:
+            name = '{}.{}'.format(func.__module__, func.__name__)
+        span = instrumentation.registry.start(name)
+        error = True
+        try:
             resp = func(*args, **kwargs)
-
+            error = False
+        finally:
+            instrumentation.registry.finish(span, error=error)
         return resp
 
     return decorated_function
@@ -0,0 +1,300 @@
+"""
+.. module: designsafe.libs.common.fedora
+   :synopsis: Concurrent, resumable ingest of a directory tree into Fedora.
+
+:class:`FedoraIngest` mirrors a local directory as Fedora containers and
+binaries:
+
+- Containers are created up front, parents before children.
+- Files are sent by a bounded pool of threads sharing one pooled session.
+- Every container and file that Fedora accepts is appended to a progress
+  journal, so a retried ingest only sends what is missing.
+- MIME types come from a checksum manifest when one is given. Otherwise
+  they are detected once per extension, or once per file head for files
+  without an extension.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import quote
+
+#pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+#pylint: enable=invalid-name
+
+HEAD_SIZE = 2048
+OK_STATUSES = (200, 201, 204)
+CONTAINER_OK_STATUSES = OK_STATUSES + (409,)
+
+
+class FedoraIngestError(Exception):
+    """Raised when some resources could not be ingested."""
+
+
+class MimeCache(object):
+    """Cache MIME types by extension, or by file head without one.
+
+    :param detect: Callable returning a MIME type for a bytes buffer,
+        e.g. ``magic.Magic(mime=True).from_buffer``.
+    """
+
+    def __init__(self, detect):
+        self.detect = detect
+        self._lock = threading.Lock()
+        self._types = {}
+
+    def lookup(self, path):
+        """Return the MIME type of the file at ``path``."""
+        _, ext = os.path.splitext(path)
+        ext = ext.lower()
+        if ext:
+            key = ext
+            head = None
+        else:
+            with open(path, 'rb') as _file:
+                head = _file.read(HEAD_SIZE)
+            key = hashlib.sha1(head).hexdigest()
+        with self._lock:
+            if key in self._types:
+                return self._types[key]
+        if head is None:
+            with open(path, 'rb') as _file:
+                head = _file.read(HEAD_SIZE)
+        mime_type = self.detect(head) or 'application/octet-stream'
+        with self._lock:
+            self._types[key] = mime_type
+        return mime_type
+
+
+class FedoraIngest(object):
+    """Ingest ``root`` under the Fedora container at ``base_url``.
+
+    :param str base_url: URL of the container to ingest into.
+    :param str root: Local directory to ingest.
+    :param str journal_path: Progress record of ingested resources.
+    :param mime_cache: :class:`MimeCache` for files missing from
+        ``manifest``.
+    :param dict manifest: Copy manifest, see
+        :func:`designsafe.libs.common.filecopy.load_manifest`.
+    :param int max_workers: Concurrent uploads.
+    :param int retries: Attempts per resource before giving up.
+    :param timeout: ``requests`` timeout.
+    """
+
+    def __init__(self, base_url, root, journal_path, mime_cache,
+                 manifest=None, max_workers=8, retries=3, timeout=(5, 600)):
+        self.base_url = base_url.rstrip('/')
+        self.root = root.rstrip('/')
+        self.journal_path = journal_path
+        self.mime_cache = mime_cache
+        self.manifest = manifest or {}
+        self.max_workers = max_workers
+        self.retries = retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._journal_lock = threading.Lock()
+
+    @staticmethod
+    def resource_path(path):
+        """Fedora path for a path relative to the ingest root."""
+        path = path.replace('[', '-').replace(']', '-')
+        return quote('/' + path.strip('/'))
+
+    def url(self, path):
+        """Fedora URL for a path relative to the ingest root."""
+        return self.base_url + self.resource_path(path)
+
+    def load_journal(self):
+        """Return ``{(kind, path): entry}`` of resources already ingested."""
+        done = {}
+        try:
+            with open(self.journal_path) as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    done[(entry['kind'], entry['path'])] = entry
+        except (IOError, OSError):
+            pass
+        return done
+
+    def _record(self, entry):
+        with self._journal_lock:
+            with open(self.journal_path, 'a') as journal:
+                journal.write(json.dumps(entry) + '\n')
+
+    def ensure_container(self, url):
+        """Create the container at ``url`` if it does not exist."""
+        res = self.session.get(url, timeout=self.timeout)
+        if res.status_code in (404, 410):
+            res = self.session.put(url, timeout=self.timeout)
+            if res.status_code not in CONTAINER_OK_STATUSES:
+                res.raise_for_status()
+
+    def _put(self, url, file_path=None, headers=None):
+        """PUT to ``url``, retrying connection errors and 5xx responses.
+
+        :param str file_path: Local file sent as the body, reopened on
+            every attempt.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                if file_path is not None:
+                    with open(file_path, 'rb') as _file:
+                        res = self.session.put(url, data=_file, headers=headers,
+                                               timeout=self.timeout)
+                else:
+                    res = self.session.put(url, headers=headers, timeout=self.timeout)
+                if res.status_code < 500:
+                    return res
+                error = requests.HTTPError('{} {}'.format(res.status_code, url),
+                                           response=res)
+            except requests.RequestException as exc:
+                error = exc
+            if attempt >= self.retries:
+                raise error
+            time.sleep(min(2 ** attempt, 30))
+
+    def create_container(self, path):
+        """Create the container for directory ``path``."""
+        res = self._put(self.url(path))
+        if res.status_code not in CONTAINER_OK_STATUSES:
+            res.raise_for_status()
+        self._record({'kind': 'container', 'path': path})
+
+    def upload(self, path, stat):
+        """Upload the file at ``path``, relative to the ingest root.
+
+        :returns: Bytes sent.
+        """
+        full_path = os.path.join(self.root, path)
+        entry = self.manifest.get(path, {})
+        mime_type = entry.get('mimeType') or self.mime_cache.lookup(full_path)
+        res = self._put(self.url(path), file_path=full_path,
+                        headers={'Content-Type': mime_type})
+        if res.status_code not in OK_STATUSES:
+            res.raise_for_status()
+        self._record({'kind': 'file', 'path': path, 'size': stat.st_size,
+                      'mtime': stat.st_mtime})
+        return stat.st_size
+
+    def scan(self):
+        """Return ``(directories, files)`` under the ingest root.
+
+        Directories are sorted so parents come before children, files are
+        ``(path, stat)`` tuples.
+        """
+        directories = []
+        files = []
+        for root, dirs, names in os.walk(self.root):
+            dirs.sort()
+            rel_root = os.path.relpath(root, self.root)
+            for name in dirs:
+                directories.append(os.path.normpath(os.path.join(rel_root, name)))
+            for name in sorted(names):
+                path = os.path.normpath(os.path.join(rel_root, name))
+                try:
+                    files.append((path, os.stat(os.path.join(self.root, path))))
+                except OSError as exc:
+                    logger.info(exc)
+        return directories, files
+
+    def _run_pool(self, executor, tasks):
+        """Run ``(callable, args)`` tasks with a bounded queue.
+
+        :returns: ``(results, failures)``
+        """
+        results = []
+        failures = []
+        pending = deque()
+
+        def _collect(future, args):
+            try:
+                results.append(future.result())
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning('Fedora ingest of %s failed: %s', args[0], exc)
+                failures.append(args[0])
+
+        for func, args in tasks:
+            pending.append((executor.submit(func, *args), args))
+            while len(pending) > self.max_workers * 4:
+                _collect(*pending.popleft())
+        while pending:
+            _collect(*pending.popleft())
+        return results, failures
+
+    def run(self):
+        """Ingest everything not ingested yet.
+
+        :raises FedoraIngestError: If some resources failed. Running again
+            resumes from the progress journal.
+        :returns: Dict with ``containers``, ``files``, ``bytes``,
+            ``skipped`` and ``seconds``.
+        """
+        start = time.time()
+        journal_dir = os.path.dirname(self.journal_path)
+        if journal_dir and not os.path.isdir(journal_dir):
+            os.makedirs(journal_dir)
+        self.ensure_container(self.base_url)
+        done = self.load_journal()
+        directories, files = self.scan()
+        failures = []
+        stats = {'containers': 0, 'files': 0, 'bytes': 0, 'skipped': 0}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Create containers level by level so parents exist first.
+            by_depth = {}
+            for path in directories:
+                if ('container', path) in done:
+                    stats['skipped'] += 1
+                    continue
+                by_depth.setdefault(path.count('/'), []).append(path)
+            failed_dirs = set()
+            for depth in sorted(by_depth):
+                tasks = [(self.create_container, (path,)) for path in by_depth[depth]
+                         if not any(path.startswith(failed + '/') for failed in failed_dirs)]
+                results, failed = self._run_pool(executor, tasks)
+                stats['containers'] += len(results)
+                failed_dirs.update(failed)
+                failures.extend(failed)
+
+            tasks = []
+            for path, stat in files:
+                entry = done.get(('file', path))
+                if entry is not None and entry['size'] == stat.st_size and \
+                        entry['mtime'] == stat.st_mtime:
+                    stats['skipped'] += 1
+                    continue
+                if any(path.startswith(failed + '/') for failed in failed_dirs):
+                    failures.append(path)
+                    continue
+                tasks.append((self.upload, (path, stat)))
+            results, failed = self._run_pool(executor, tasks)
+            stats['files'] = len(results)
+            stats['bytes'] = sum(results)
+            failures.extend(failed)
+
+        stats['seconds'] = time.time() - start
+        elapsed = max(stats['seconds'], 0.001)
+        logger.info('Fedora ingest of %s: %d containers, %d files, %d bytes, '
+                    '%d skipped in %.1fs (%.1f files/s, %.0f bytes/s)',
+                    self.root, stats['containers'], stats['files'],
+                    stats['bytes'], stats['skipped'], stats['seconds'],
+                    stats['files'] / elapsed, stats['bytes'] / elapsed)
+        if failures:
+            raise FedoraIngestError('{} resources failed to ingest into {}'.format(
+                len(failures), self.base_url))
+        return stats
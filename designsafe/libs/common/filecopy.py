@@ -0,0 +1,281 @@
+"""
+.. module: designsafe.libs.common.filecopy
+   :synopsis: Parallel, resumable tree copies with a checksum manifest.
+
+:class:`CopyJob` copies files with a bounded thread pool. Large files are
+copied kernel-side with ``os.copy_file_range``, or ``os.sendfile`` where
+that is unavailable. Every finished file is appended to a journal, so a
+retried job skips files already copied whose size and mtime still match.
+Permissions are set in one pass once everything is copied.
+
+The job writes a manifest with the size, mtime, SHA-256 and CRC-32 of
+every file. Later stages read it with :func:`load_manifest` instead of
+reading the data again.
+"""
+import os
+import json
+import zlib
+import errno
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+#pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+#pylint: enable=invalid-name
+
+CHUNK_SIZE = 1024 * 1024
+KERNEL_COPY_THRESHOLD = 64 * 1024 * 1024
+MANIFEST_VERSION = 1
+TMP_PREFIX = '.copying-'
+
+
+def load_manifest(path):
+    """Return the files of a copy manifest, empty if there is none.
+
+    :returns: Dict of relative path to
+        ``{'size', 'mtime', 'sha256', 'crc32', ...}``.
+    """
+    try:
+        with open(path) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (IOError, OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('files', {})
+
+
+def _kernel_copy(src, dst, size):
+    """Copy ``size`` bytes between open files without a userspace buffer.
+
+    :returns: ``False`` if the kernel cannot copy between these files.
+    """
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    copied = 0
+    while copied < size:
+        try:
+            if copy_file_range is not None:
+                count = copy_file_range(src.fileno(), dst.fileno(), size - copied)
+            else:
+                count = os.sendfile(dst.fileno(), src.fileno(), copied,
+                                    min(size - copied, 1 << 30))
+        except OSError as exc:
+            if copied == 0 and exc.errno in (errno.EXDEV, errno.ENOSYS,
+                                             errno.EINVAL, errno.EOPNOTSUPP):
+                return False
+            raise
+        if count == 0:
+            break
+        copied += count
+    return True
+
+
+class CopyJob(object):
+    """Copy files under ``src_root`` to ``dst_root``.
+
+    :param str src_root: Source directory.
+    :param str dst_root: Destination directory.
+    :param list paths: Files or directories to copy, relative to
+        ``src_root``.
+    :param str journal_path: Append-only record of finished files.
+    :param str manifest_path: Where the checksum manifest is written.
+    :param int max_workers: Files copied at the same time.
+    :param sniff: Optional callable given the first chunk of every file.
+        Its result is stored in the manifest as ``mimeType``.
+    :param int dir_mode: Mode set on destination directories at the end.
+    :param int file_mode: Mode set on destination files at the end.
+    """
+
+    def __init__(self, src_root, dst_root, paths, journal_path, manifest_path,
+                 max_workers=8, sniff=None, dir_mode=0o555, file_mode=0o444):
+        self.src_root = src_root.rstrip('/')
+        self.dst_root = dst_root.rstrip('/')
+        self.paths = paths
+        self.journal_path = journal_path
+        self.manifest_path = manifest_path
+        self.max_workers = max_workers
+        self.sniff = sniff
+        self.dir_mode = dir_mode
+        self.file_mode = file_mode
+        self._journal_lock = threading.Lock()
+        self._dirs_lock = threading.Lock()
+        self._ready_dirs = set()
+
+    def files(self):
+        """Yield ``(relative path, stat)`` of every file to copy."""
+        for path in sorted(set(path.strip('/') for path in self.paths)):
+            src_path = os.path.join(self.src_root, path)
+            if os.path.isdir(src_path):
+                for root, dirs, files in os.walk(src_path):
+                    dirs.sort()
+                    rel_root = os.path.relpath(root, self.src_root)
+                    self._ensure_dir(os.path.join(self.dst_root, rel_root))
+                    for name in sorted(files):
+                        try:
+                            stat = os.stat(os.path.join(root, name))
+                        except OSError as exc:
+                            logger.info(exc)
+                            continue
+                        yield os.path.join(rel_root, name), stat
+            else:
+                try:
+                    stat = os.stat(src_path)
+                except OSError as exc:
+                    logger.info(exc)
+                    continue
+                yield path, stat
+
+    def load_journal(self):
+        """Return journal entries by relative path, last one wins."""
+        entries = {}
+        try:
+            with open(self.journal_path) as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last line from an interrupted run.
+                        continue
+                    entries[entry['path']] = entry
+        except (IOError, OSError):
+            pass
+        return entries
+
+    def _record(self, entry):
+        with self._journal_lock:
+            with open(self.journal_path, 'a') as journal:
+                journal.write(json.dumps(entry) + '\n')
+
+    def _ensure_dir(self, path):
+        """Create ``path`` or make it writable again after a previous run."""
+        with self._dirs_lock:
+            if path in self._ready_dirs:
+                return
+            if os.path.isdir(path):
+                os.chmod(path, 0o755)
+            else:
+                os.makedirs(path)
+            self._ready_dirs.add(path)
+
+    def _is_copied(self, entry, stat, dst_path):
+        if entry is None or entry['size'] != stat.st_size or \
+                entry['mtime'] != stat.st_mtime:
+            return False
+        try:
+            return os.path.getsize(dst_path) == stat.st_size
+        except OSError:
+            return False
+
+    def copy_file(self, path, stat):
+        """Copy one file and return its manifest entry.
+
+        Runs in a worker thread.
+        """
+        src_path = os.path.join(self.src_root, path)
+        dst_path = os.path.join(self.dst_root, path)
+        dst_dir = os.path.dirname(dst_path)
+        self._ensure_dir(dst_dir)
+        tmp_path = os.path.join(dst_dir, TMP_PREFIX + os.path.basename(dst_path))
+
+        sha256 = hashlib.sha256()
+        crc = 0
+        head = None
+        with open(src_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            if stat.st_size >= KERNEL_COPY_THRESHOLD and \
+                    _kernel_copy(src, dst, stat.st_size):
+                dst.flush()
+                # Checksum what was written, which also verifies the copy.
+                with open(tmp_path, 'rb') as written:
+                    for chunk in iter(lambda: written.read(CHUNK_SIZE), b''):
+                        if head is None:
+                            head = chunk
+                        sha256.update(chunk)
+                        crc = zlib.crc32(chunk, crc)
+            else:
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate()
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                    if head is None:
+                        head = chunk
+                    sha256.update(chunk)
+                    crc = zlib.crc32(chunk, crc)
+                    dst.write(chunk)
+        os.utime(tmp_path, (stat.st_atime, stat.st_mtime))
+        os.rename(tmp_path, dst_path)
+
+        entry = {'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime,
+                 'sha256': sha256.hexdigest(), 'crc32': crc & 0xFFFFFFFF}
+        if self.sniff is not None:
+            entry['mimeType'] = self.sniff(head or b'')
+        self._record(entry)
+        return entry
+
+    def set_permissions(self):
+        """Set ``dir_mode`` and ``file_mode`` on the destination tree."""
+        for root, dirs, files in os.walk(self.dst_root, topdown=False):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.startswith(TMP_PREFIX):
+                    os.remove(path)
+                    continue
+                os.chmod(path, self.file_mode)
+            for name in dirs:
+                os.chmod(os.path.join(root, name), self.dir_mode)
+        os.chmod(self.dst_root, self.dir_mode)
+
+    def write_manifest(self, files):
+        """Write the manifest atomically."""
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as manifest_file:
+            json.dump({'version': MANIFEST_VERSION, 'files': files},
+                      manifest_file, sort_keys=True)
+        os.rename(tmp_path, self.manifest_path)
+
+    def run(self):
+        """Copy every file not already copied, then set permissions.
+
+        Errors copying single files are logged and the file is left out
+        of the manifest, so a retry copies it again.
+
+        :returns: The manifest files dict.
+        """
+        self._ensure_dir(self.dst_root)
+        journal = self.load_journal()
+        manifest = {}
+        skipped = 0
+        pending = deque()
+
+        def _collect(future, path):
+            try:
+                entry = future.result()
+            except (IOError, OSError) as exc:
+                logger.info('Unable to copy %s: %s', path, exc)
+                return
+            manifest[path] = dict((key, value) for key, value in entry.items()
+                                  if key != 'path')
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for path, stat in self.files():
+                entry = journal.get(path)
+                if self._is_copied(entry, stat, os.path.join(self.dst_root, path)):
+                    manifest[path] = dict((key, value) for key, value in entry.items()
+                                          if key != 'path')
+                    skipped += 1
+                    continue
+                pending.append((executor.submit(self.copy_file, path, stat), path))
+                # Bound the number of queued files so huge trees do not
+                # sit in memory as futures.
+                while len(pending) > self.max_workers * 4:
+                    _collect(*pending.popleft())
+            while pending:
+                _collect(*pending.popleft())
+
+        self.set_permissions()
+        self.write_manifest(manifest)
+        logger.info('Copied %d files to %s, %d already copied.',
+                    len(manifest) - skipped, self.dst_root, skipped)
+        return manifest
@@ -0,0 +1,354 @@
+"""
+.. module: designsafe.libs.common.instrumentation
+   :synopsis: Low-overhead latency histograms and sampled profiling.
+
+Every request, and every function decorated with
+:func:`designsafe.libs.common.decorators.profile`, is recorded as a *span*
+with these measurements:
+
+- its duration in a log-bucketed histogram, giving p50/p95/p99
+- the response size
+- the number and duration of Elasticsearch and Agave calls made while it
+  ran (see :func:`record_call`)
+
+Recording a span only touches in-process counters. Each process merges its
+counters into Redis at most every ``INSTRUMENTATION_FLUSH_INTERVAL``
+seconds. The ``instrumentation_stats`` management command reads the totals
+of all processes from there.
+
+Full ``cProfile`` profiling is sampled: one in
+``PROFILE_SAMPLE_RATE`` spans is profiled and dumped to
+``PROFILE_STATS_DIR``.
+"""
+import os
+import re
+import time
+import random
+import bisect
+import logging
+import cProfile
+import threading
+from django.conf import settings
+
+#pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+#pylint: enable=invalid-name
+
+REDIS_PREFIX = 'instrumentation'
+CALL_KINDS = ('es', 'agave')
+
+
+def _geometric_bounds(start, factor, count):
+    bounds = []
+    bound = float(start)
+    for _ in range(count):
+        bounds.append(bound)
+        bound *= factor
+    return bounds
+
+
+# Milliseconds, from 0.5ms to about 10 minutes with ~19% resolution.
+LATENCY_BOUNDS = _geometric_bounds(0.5, 1.19, 81)
+# Bytes, from 64B to 4GB.
+SIZE_BOUNDS = _geometric_bounds(64, 2, 27)
+
+
+def percentile(bounds, buckets, fraction):
+    """Estimate a percentile from histogram buckets.
+
+    :param list bounds: Upper bounds of the buckets.
+    :param buckets: Counts by bucket index; the last index counts values
+        above every bound.
+    :param float fraction: e.g. ``0.95``.
+    """
+    total = sum(buckets.values()) if isinstance(buckets, dict) else sum(buckets)
+    if not total:
+        return None
+    rank = fraction * total
+    seen = 0
+    for index in range(len(bounds) + 1):
+        count = buckets.get(index, 0) if isinstance(buckets, dict) else buckets[index]
+        seen += count
+        if count and seen >= rank:
+            if index >= len(bounds):
+                return bounds[-1]
+            return bounds[index]
+    return bounds[-1]
+
+
+class Histogram(object):
+    """Fixed-bucket histogram. Not thread-safe; callers hold a lock."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, fraction):
+        return percentile(self.bounds, self.buckets, fraction)
+
+
+class SpanStats(object):
+    """Counters of one span name."""
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BOUNDS)
+        self.size = Histogram(SIZE_BOUNDS)
+        self.errors = 0
+        self.calls = dict((kind, 0) for kind in CALL_KINDS)
+        self.call_time = dict((kind, 0.0) for kind in CALL_KINDS)
+
+    def to_fields(self):
+        """Flatten to integer Redis hash fields (times in microseconds)."""
+        fields = {
+            'count': self.latency.count,
+            'errors': self.errors,
+            'latency_us': int(self.latency.total * 1000),
+            'size_count': self.size.count,
+            'size_bytes': int(self.size.total),
+        }
+        for kind in CALL_KINDS:
+            fields['{}_calls'.format(kind)] = self.calls[kind]
+            fields['{}_us'.format(kind)] = int(self.call_time[kind] * 1000000)
+        for index, count in enumerate(self.latency.buckets):
+            if count:
+                fields['lat:{}'.format(index)] = count
+        for index, count in enumerate(self.size.buckets):
+            if count:
+                fields['size:{}'.format(index)] = count
+        return fields
+
+
+class Span(object):
+    """Measurements of one request or function call in progress."""
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.time()
+        self.calls = dict((kind, 0) for kind in CALL_KINDS)
+        self.call_time = dict((kind, 0.0) for kind in CALL_KINDS)
+        self.profiler = None
+
+
+class Registry(object):
+    """Process-wide span statistics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {}
+        self._flushed_at = time.time()
+        self._pid = os.getpid()
+
+    def current(self):
+        """Return the innermost span of this thread, if any."""
+        spans = getattr(self._local, 'spans', None)
+        return spans[-1] if spans else None
+
+    def start(self, name, profile=None, root=False):
+        """Start a span in this thread.
+
+        :param bool profile: Profile the span with cProfile. Sampled when
+            ``None``.
+        :param bool root: Drop spans left over in this thread, e.g. by a
+            request that never finished.
+        """
+        span = Span(name)
+        spans = getattr(self._local, 'spans', None)
+        if spans is None or root:
+            for stale in spans or ():
+                if stale.profiler is not None:
+                    stale.profiler.disable()
+            spans = self._local.spans = []
+        if profile is None:
+            profile = _sampled()
+        # cProfile allows one active profiler per thread.
+        if profile and not any(outer.profiler for outer in spans):
+            span.profiler = cProfile.Profile()
+            span.profiler.enable()
+        spans.append(span)
+        return span
+
+    def finish(self, span, size=None, error=False):
+        """Record ``span`` and return its duration in seconds."""
+        duration = time.time() - span.start
+        if span.profiler is not None:
+            span.profiler.disable()
+            _dump_profile(span)
+        spans = getattr(self._local, 'spans', [])
+        if span in spans:
+            spans.remove(span)
+        # Calls made inside a nested span belong to the outer ones too.
+        for outer in spans:
+            for kind in CALL_KINDS:
+                outer.calls[kind] += span.calls[kind]
+                outer.call_time[kind] += span.call_time[kind]
+
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked: the parent owns what was recorded before.
+                self._pid = os.getpid()
+                self._stats = {}
+            stats = self._stats.get(span.name)
+            if stats is None:
+                stats = self._stats[span.name] = SpanStats()
+            stats.latency.record(duration * 1000)
+            if size is not None and size >= 0:
+                stats.size.record(size)
+            if error:
+                stats.errors += 1
+            for kind in CALL_KINDS:
+                stats.calls[kind] += span.calls[kind]
+                stats.call_time[kind] += span.call_time[kind]
+        self.maybe_flush()
+        return duration
+
+    def record_call(self, kind, seconds):
+        """Add an external call to the current span."""
+        span = self.current()
+        if span is not None:
+            span.calls[kind] += 1
+            span.call_time[kind] += seconds
+
+    def snapshot(self):
+        """Return a copy of this process' statistics by span name."""
+        with self._lock:
+            return dict((name, stats.to_fields())
+                        for name, stats in self._stats.items())
+
+    def maybe_flush(self):
+        """Flush to Redis if the flush interval passed."""
+        interval = getattr(settings, 'INSTRUMENTATION_FLUSH_INTERVAL', 10)
+        if interval is None or time.time() - self._flushed_at < interval:
+            return
+        self.flush()
+
+    def flush(self):
+        """Merge the counters of this process into Redis and reset them."""
+        with self._lock:
+            stats, self._stats = self._stats, {}
+            self._flushed_at = time.time()
+        if not stats:
+            return
+        try:
+            conn = redis_connection()
+            pipe = conn.pipeline(transaction=False)
+            for name, span_stats in stats.items():
+                pipe.sadd(REDIS_PREFIX + ':names', name)
+                key = '{}:{}'.format(REDIS_PREFIX, name)
+                for field, value in span_stats.to_fields().items():
+                    pipe.hincrby(key, field, value)
+            pipe.execute()
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning('Unable to flush instrumentation stats: %s', exc)
+
+
+def redis_connection():
+    """Return a Redis client for the aggregated statistics."""
+    import redis
+    conf = getattr(settings, 'INSTRUMENTATION_REDIS', None) or settings.WS4REDIS_CONNECTION
+    return redis.StrictRedis(**conf)
+
+
+def aggregated_stats():
+    """Read the statistics of every process from Redis.
+
+    :returns: Dict of span name to a dict with ``count``, ``errors``,
+        ``p50``, ``p95``, ``p99``, ``mean`` (ms), ``size_mean``,
+        ``size_p95`` (bytes) and ``<kind>_calls``/``<kind>_ms`` per request.
+    """
+    conn = redis_connection()
+    names = sorted(name.decode('utf-8') if isinstance(name, bytes) else name
+                   for name in conn.smembers(REDIS_PREFIX + ':names'))
+    pipe = conn.pipeline(transaction=False)
+    for name in names:
+        pipe.hgetall('{}:{}'.format(REDIS_PREFIX, name))
+    out = {}
+    for name, raw in zip(names, pipe.execute()):
+        fields = dict((key.decode('utf-8') if isinstance(key, bytes) else key, int(value))
+                      for key, value in raw.items())
+        out[name] = summarize(fields)
+    return out
+
+
+def summarize(fields):
+    """Turn flattened span fields into a summary dict."""
+    count = fields.get('count', 0)
+    latency = dict((int(key.split(':')[1]), value) for key, value in fields.items()
+                   if key.startswith('lat:'))
+    sizes = dict((int(key.split(':')[1]), value) for key, value in fields.items()
+                 if key.startswith('size:'))
+    summary = {
+        'count': count,
+        'errors': fields.get('errors', 0),
+        'mean': fields.get('latency_us', 0) / 1000.0 / count if count else None,
+        'p50': percentile(LATENCY_BOUNDS, latency, 0.5),
+        'p95': percentile(LATENCY_BOUNDS, latency, 0.95),
+        'p99': percentile(LATENCY_BOUNDS, latency, 0.99),
+        'size_mean': fields.get('size_bytes', 0) / float(fields['size_count'])
+                     if fields.get('size_count') else None,
+        'size_p95': percentile(SIZE_BOUNDS, sizes, 0.95),
+    }
+    for kind in CALL_KINDS:
+        summary['{}_calls'.format(kind)] = \
+            fields.get('{}_calls'.format(kind), 0) / float(count) if count else None
+        summary['{}_ms'.format(kind)] = \
+            fields.get('{}_us'.format(kind), 0) / 1000.0 / count if count else None
+    return summary
+
+
+def reset_aggregated_stats():
+    """Delete the statistics stored in Redis."""
+    conn = redis_connection()
+    names = conn.smembers(REDIS_PREFIX + ':names')
+    keys = ['{}:{}'.format(REDIS_PREFIX, name.decode('utf-8') if isinstance(name, bytes) else name)
+            for name in names]
+    conn.delete(REDIS_PREFIX + ':names', *keys)
+
+
+def enabled():
+    """Whether spans are recorded at all.
+
+    Requires ``INSTRUMENTATION_ENABLED`` or a ``PROFILE_SAMPLE_RATE``.
+    """
+    return bool(getattr(settings, 'INSTRUMENTATION_ENABLED', False) or
+                getattr(settings, 'PROFILE_SAMPLE_RATE', 0))
+
+
+def _sampled():
+    rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+    return bool(rate) and random.randint(1, rate) == 1
+
+
+def _dump_profile(span):
+    stats_dir = getattr(settings, 'PROFILE_STATS_DIR', None)
+    if not stats_dir:
+        return
+    try:
+        if not os.path.isdir(stats_dir):
+            os.makedirs(stats_dir)
+        filename = '{}.{:.6f}.{}.prof'.format(
+            re.sub(r'[^a-zA-Z0-9_\-]', '_', span.name), span.start, os.getpid())
+        span.profiler.dump_stats(os.path.join(stats_dir, filename))
+    except (IOError, OSError) as exc:
+        logger.warning('Unable to dump profile of %s: %s', span.name, exc)
+
+
+#pylint: disable=invalid-name
+registry = Registry()
+#pylint: enable=invalid-name
+
+
+def record_call(kind, seconds):
+    """Add an ES or Agave call to the span running in this thread.
+
+    :param str kind: One of :data:`CALL_KINDS`.
+    :param float seconds: Call duration.
+    """
+    registry.record_call(kind, seconds)
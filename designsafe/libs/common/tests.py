@@ -0,0 +1,379 @@
+import io
+import os
+import zlib
+import stat
+import hashlib
+import shutil
+import zipfile
+import tempfile
+import threading
+import socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from mock import patch, MagicMock
+from django.test import TestCase
+from designsafe.libs.common import archive
+from designsafe.libs.common.archive import ArchiveBuilder, stream_archive
+from designsafe.libs.common import filecopy
+from designsafe.libs.common.filecopy import CopyJob, load_manifest
+from designsafe.libs.common.fedora import FedoraIngest, FedoraIngestError, MimeCache
+from designsafe.libs.common import instrumentation
+from designsafe.libs.common.decorators import profile
+
+
+class TestArchive(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.source = os.path.join(self.tmp_dir, 'PRJ-1234')
+        os.makedirs(os.path.join(self.source, 'data'))
+        for i in range(5):
+            self._write('data/file{}.txt'.format(i), 'text {}\n'.format(i) * 100)
+        self._write('video.mp4', os.urandom(1024))
+        self.archive_path = os.path.join(self.tmp_dir, 'PRJ-1234_archive.zip')
+
+    def _write(self, name, data, mtime=None):
+        path = os.path.join(self.source, name)
+        with open(path, 'wb' if isinstance(data, bytes) else 'w') as _file:
+            _file.write(data)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def test_build(self):
+        stats = ArchiveBuilder(self.source, self.archive_path, max_workers=2).build()
+        self.assertEqual(stats, {'reused': 0, 'compressed': 6, 'removed': 0})
+
+        with zipfile.ZipFile(self.archive_path) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            self.assertEqual(zip_file.read('PRJ-1234/data/file1.txt'), b'text 1\n' * 100)
+            self.assertEqual(zip_file.getinfo('PRJ-1234/video.mp4').compress_type,
+                             zipfile.ZIP_STORED)
+            self.assertEqual(zip_file.getinfo('PRJ-1234/data/file1.txt').compress_type,
+                             zipfile.ZIP_DEFLATED)
+        self.assertTrue(os.path.exists(self.archive_path + archive.MANIFEST_SUFFIX))
+
+    def test_only_changed_files_are_compressed(self):
+        builder = ArchiveBuilder(self.source, self.archive_path)
+        builder.build()
+        self.assertEqual(builder.build(), {'reused': 6, 'compressed': 0, 'removed': 0})
+
+        self._write('data/file2.txt', 'changed', mtime=1)
+        os.remove(os.path.join(self.source, 'data', 'file3.txt'))
+        with patch('designsafe.libs.common.archive._prepare',
+                   side_effect=archive._prepare) as mock_prepare:
+            stats = builder.build()
+        self.assertEqual(stats, {'reused': 4, 'compressed': 1, 'removed': 1})
+        self.assertEqual(mock_prepare.call_count, 1)
+
+        with zipfile.ZipFile(self.archive_path) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            self.assertEqual(zip_file.read('PRJ-1234/data/file2.txt'), b'changed')
+            self.assertNotIn('PRJ-1234/data/file3.txt', zip_file.namelist())
+
+    def test_stream_archive(self):
+        data = b''.join(stream_archive(self.source))
+        with zipfile.ZipFile(io.BytesIO(data)) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            self.assertEqual(len(zip_file.namelist()), 6)
+            self.assertEqual(zip_file.read('PRJ-1234/data/file4.txt'), b'text 4\n' * 100)
+
+    def test_known_checksums_skip_reading(self):
+        path = os.path.join(self.source, 'video.mp4')
+        with open(path, 'rb') as _file:
+            crc = zlib.crc32(_file.read()) & 0xFFFFFFFF
+        stat = os.stat(path)
+        checksums = {'PRJ-1234/video.mp4': {'size': stat.st_size,
+                                            'mtime': stat.st_mtime,
+                                            'crc32': crc}}
+        with patch('designsafe.libs.common.archive._checksum') as mock_checksum:
+            ArchiveBuilder(self.source, self.archive_path, checksums=checksums).build()
+        mock_checksum.assert_not_called()
+        with zipfile.ZipFile(self.archive_path) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+
+    @patch('designsafe.libs.common.archive.ZIP64_LIMIT', 512)
+    def test_zip64(self):
+        ArchiveBuilder(self.source, self.archive_path).build()
+        with zipfile.ZipFile(self.archive_path) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+        data = b''.join(stream_archive(self.source))
+        with zipfile.ZipFile(io.BytesIO(data)) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+
+
+class TestCopyJob(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(self._cleanup)
+        self.src = os.path.join(self.tmp_dir, 'src')
+        self.dst = os.path.join(self.tmp_dir, 'dst')
+        os.makedirs(os.path.join(self.src, 'data', 'sub'))
+        self.files = {
+            'data/a.txt': b'a' * 100,
+            'data/sub/b.bin': os.urandom(2048),
+            'report.pdf': b'%PDF-1.4 test'
+        }
+        for path, data in self.files.items():
+            with open(os.path.join(self.src, path), 'wb') as _file:
+                _file.write(data)
+        self.journal_path = os.path.join(self.tmp_dir, 'PRJ-1234.journal')
+        self.manifest_path = os.path.join(self.tmp_dir, 'PRJ-1234.manifest.json')
+
+    def _cleanup(self):
+        # The destination is made read-only by the job.
+        for root, dirs, _ in os.walk(self.tmp_dir):
+            for name in dirs:
+                os.chmod(os.path.join(root, name), 0o755)
+        shutil.rmtree(self.tmp_dir)
+
+    def _job(self, **kwargs):
+        return CopyJob(self.src, self.dst, ['data', 'report.pdf'],
+                       self.journal_path, self.manifest_path, max_workers=2,
+                       **kwargs)
+
+    def test_copy(self):
+        manifest = self._job(sniff=lambda head: 'test/mime').run()
+
+        self.assertEqual(sorted(manifest), sorted(self.files))
+        for path, data in self.files.items():
+            dst_path = os.path.join(self.dst, path)
+            with open(dst_path, 'rb') as _file:
+                self.assertEqual(_file.read(), data)
+            self.assertEqual(manifest[path]['sha256'], hashlib.sha256(data).hexdigest())
+            self.assertEqual(manifest[path]['crc32'], zlib.crc32(data) & 0xFFFFFFFF)
+            self.assertEqual(manifest[path]['mimeType'], 'test/mime')
+            self.assertEqual(stat.S_IMODE(os.stat(dst_path).st_mode), 0o444)
+        self.assertEqual(stat.S_IMODE(os.stat(os.path.join(self.dst, 'data')).st_mode), 0o555)
+        self.assertEqual(load_manifest(self.manifest_path), manifest)
+
+    def test_retry_skips_copied_files(self):
+        self._job().run()
+        with open(os.path.join(self.src, 'data', 'a.txt'), 'wb') as _file:
+            _file.write(b'changed')
+
+        with patch.object(CopyJob, 'copy_file', autospec=True,
+                          side_effect=CopyJob.copy_file) as mock_copy:
+            manifest = self._job().run()
+
+        self.assertEqual([c[0][1] for c in mock_copy.call_args_list], ['data/a.txt'])
+        self.assertEqual(manifest['data/a.txt']['size'], 7)
+        with open(os.path.join(self.dst, 'data', 'a.txt'), 'rb') as _file:
+            self.assertEqual(_file.read(), b'changed')
+
+    @patch('designsafe.libs.common.filecopy.KERNEL_COPY_THRESHOLD', 1024)
+    def test_kernel_copy(self):
+        manifest = self._job().run()
+        data = self.files['data/sub/b.bin']
+        with open(os.path.join(self.dst, 'data', 'sub', 'b.bin'), 'rb') as _file:
+            self.assertEqual(_file.read(), data)
+        self.assertEqual(manifest['data/sub/b.bin']['sha256'],
+                         hashlib.sha256(data).hexdigest())
+
+
+class _FedoraStandIn(socketserver.ThreadingMixIn, HTTPServer):
+    """Local HTTP server answering like Fedora's REST API."""
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _FedoraHandler)
+        self.lock = threading.Lock()
+        self.resources = {}
+        self.requests = []
+        self.fail_paths = set()
+
+
+class _FedoraHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        with self.server.lock:
+            exists = self.path in self.server.resources
+        self._reply(200 if exists else 404)
+
+    def do_PUT(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        with self.server.lock:
+            self.server.requests.append(self.path)
+            if self.path in self.server.fail_paths:
+                self._reply(403)
+                return
+            parent = self.path.rsplit('/', 1)[0]
+            if parent and parent not in self.server.resources:
+                self._reply(404)
+                return
+            self.server.resources[self.path] = (self.headers.get('Content-Type'), body)
+        self._reply(201)
+
+
+class TestFedoraIngest(TestCase):
+
+    def setUp(self):
+        self.server = _FedoraStandIn()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.server.resources['/rest'] = (None, b'')
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.root = os.path.join(self.tmp_dir, 'PRJ-1234')
+        os.makedirs(os.path.join(self.root, 'data', 'run [1]'))
+        self.files = {
+            'data/a.txt': b'a' * 100,
+            'data/run [1]/b.csv': b'1,2,3',
+            'data/run [1]/noext': b'binary',
+            'readme.md': b'# readme',
+        }
+        for path, data in self.files.items():
+            with open(os.path.join(self.root, path), 'wb') as _file:
+                _file.write(data)
+        self.journal_path = os.path.join(self.tmp_dir, 'journal', 'PRJ-1234.fedora.journal')
+        self.detect = MagicMock(return_value='text/plain')
+
+    def _ingest(self, manifest=None):
+        base_url = 'http://127.0.0.1:{}/rest/PRJ-1234'.format(self.server.server_address[1])
+        return FedoraIngest(base_url, self.root, self.journal_path,
+                            MimeCache(self.detect), manifest=manifest,
+                            max_workers=3, retries=1)
+
+    def test_ingest(self):
+        stats = self._ingest(manifest={'readme.md': {'mimeType': 'text/markdown'}}).run()
+
+        self.assertEqual(stats['files'], 4)
+        self.assertEqual(stats['containers'], 2)
+        self.assertEqual(stats['bytes'], sum(len(data) for data in self.files.values()))
+        resources = self.server.resources
+        self.assertEqual(resources['/rest/PRJ-1234/data/run%20-1-/b.csv'],
+                         ('text/plain', b'1,2,3'))
+        self.assertEqual(resources['/rest/PRJ-1234/readme.md'],
+                         ('text/markdown', b'# readme'))
+        # .txt and .csv are detected once each, the file without an
+        # extension by its content.
+        self.assertEqual(self.detect.call_count, 3)
+
+    def test_resume(self):
+        self.server.fail_paths.add('/rest/PRJ-1234/data/a.txt')
+        with self.assertRaises(FedoraIngestError):
+            self._ingest().run()
+
+        self.server.fail_paths.clear()
+        del self.server.requests[:]
+        stats = self._ingest().run()
+
+        self.assertEqual(stats['files'], 1)
+        self.assertEqual(self.server.requests, ['/rest/PRJ-1234/data/a.txt'])
+
+
+class TestInstrumentation(TestCase):
+
+    def setUp(self):
+        self.registry = instrumentation.Registry()
+        patcher = patch('designsafe.libs.common.instrumentation.registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.settings = patch('designsafe.libs.common.instrumentation.settings',
+                              INSTRUMENTATION_ENABLED=True,
+                              INSTRUMENTATION_FLUSH_INTERVAL=None,
+                              PROFILE_SAMPLE_RATE=0,
+                              PROFILE_STATS_DIR=None)
+        self.settings.start()
+        self.addCleanup(self.settings.stop)
+
+    def test_percentiles(self):
+        histogram = instrumentation.Histogram(instrumentation.LATENCY_BOUNDS)
+        for value in range(1, 101):
+            histogram.record(value)
+        self.assertAlmostEqual(histogram.percentile(0.5), 50, delta=50 * 0.2)
+        self.assertAlmostEqual(histogram.percentile(0.99), 99, delta=99 * 0.2)
+        self.assertIsNone(instrumentation.Histogram([1]).percentile(0.5))
+
+    def test_calls_are_added_to_enclosing_spans(self):
+        outer = self.registry.start('view', root=True)
+        instrumentation.record_call('es', 0.01)
+        inner = self.registry.start('helper')
+        instrumentation.record_call('agave', 0.2)
+        instrumentation.record_call('es', 0.03)
+        self.registry.finish(inner)
+        self.registry.finish(outer, size=1000)
+
+        stats = self.registry.snapshot()
+        self.assertEqual(stats['helper']['es_calls'], 1)
+        self.assertEqual(stats['view']['es_calls'], 2)
+        self.assertEqual(stats['view']['es_us'], 40000)
+        self.assertEqual(stats['view']['agave_calls'], 1)
+        self.assertEqual(stats['view']['size_bytes'], 1000)
+        self.assertIsNone(self.registry.current())
+
+    def test_profile_decorator(self):
+        @profile
+        def view(request):
+            instrumentation.record_call('es', 0.01)
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            view(MagicMock())
+        stats = self.registry.snapshot()
+        name = '{}.view'.format(__name__)
+        self.assertEqual(stats[name]['count'], 1)
+        self.assertEqual(stats[name]['errors'], 1)
+        self.assertEqual(stats[name]['es_calls'], 1)
+
+    def test_profile_decorator_disabled(self):
+        @profile
+        def view(request):
+            return 'response'
+
+        with patch('designsafe.libs.common.instrumentation.settings',
+                   INSTRUMENTATION_ENABLED=False, PROFILE_SAMPLE_RATE=0), \
+                patch.object(self.registry, 'start') as mock_start, \
+                patch.object(self.registry, 'maybe_flush') as mock_flush:
+            self.assertEqual(view(MagicMock()), 'response')
+        mock_start.assert_not_called()
+        mock_flush.assert_not_called()
+        self.assertEqual(self.registry.snapshot(), {})
+
+    def test_flush(self):
+        span = self.registry.start('view')
+        self.registry.finish(span)
+        with patch('designsafe.libs.common.instrumentation.redis_connection') as mock_conn:
+            self.registry.flush()
+        pipe = mock_conn.return_value.pipeline.return_value
+        pipe.sadd.assert_called_with('instrumentation:names', 'view')
+        pipe.hincrby.assert_any_call('instrumentation:view', 'count', 1)
+        pipe.execute.assert_called_once_with()
+        self.assertEqual(self.registry.snapshot(), {})
+
+    def test_summarize(self):
+        fields = {'count': 4, 'latency_us': 40000, 'es_calls': 8, 'es_us': 2000,
+                  'lat:10': 2, 'lat:20': 2}
+        summary = instrumentation.summarize(fields)
+        self.assertEqual(summary['mean'], 10.0)
+        self.assertEqual(summary['es_calls'], 2.0)
+        self.assertEqual(summary['es_ms'], 0.5)
+        self.assertEqual(summary['p50'], instrumentation.LATENCY_BOUNDS[10])
+        self.assertEqual(summary['p99'], instrumentation.LATENCY_BOUNDS[20])
+
+    def test_sampled_profile_is_dumped(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        with patch('designsafe.libs.common.instrumentation.settings',
+                   INSTRUMENTATION_FLUSH_INTERVAL=None,
+                   PROFILE_SAMPLE_RATE=1, PROFILE_STATS_DIR=tmp_dir):
+            outer = self.registry.start('designsafe.view', root=True)
+            inner = self.registry.start('designsafe.helper')
+            self.assertIsNone(inner.profiler)
+            self.registry.finish(inner)
+            self.registry.finish(outer)
+        self.assertEqual(len(os.listdir(tmp_dir)), 1)
+        self.assertTrue(os.listdir(tmp_dir)[0].startswith('designsafe_view.'))
@@ -0,0 +1,136 @@
+"""
+.. module: designsafe.libs.elasticsearch.aliases
+   :synopsis: Cached resolution of index aliases to concrete index names.
+
+Search and file managers filter on ``_index`` with the concrete index name
+behind an alias. Resolving that name with a live ``_alias`` call on every
+request adds a round trip to ES per manager, so names are cached here.
+
+Entries live for ``ES_ALIAS_CACHE_TTL`` seconds. :func:`invalidate` drops
+them in this process and bumps a generation counter in the Django cache so
+other processes drop theirs within ``ES_ALIAS_CHECK_INTERVAL`` seconds.
+"""
+import time
+import logging
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from elasticsearch_dsl.connections import connections
+
+#pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+#pylint: enable=invalid-name
+
+GENERATION_CACHE_KEY = 'es_alias_registry_generation'
+
+
+class AliasRegistry(object):
+    """In-process cache of alias to concrete index name.
+
+    :param int ttl: Seconds a resolved alias is reused.
+    :param int check_interval: Seconds between checks of the shared
+        generation counter.
+    """
+
+    def __init__(self, ttl=None, check_interval=None):
+        self.ttl = ttl if ttl is not None else \
+            getattr(settings, 'ES_ALIAS_CACHE_TTL', 300)
+        self.check_interval = check_interval if check_interval is not None else \
+            getattr(settings, 'ES_ALIAS_CHECK_INTERVAL', 5)
+        self._lock = threading.Lock()
+        self._indices = {}
+        self._generation = None
+        self._checked_at = 0
+
+    def _check_generation(self, now):
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        generation = cache.get(GENERATION_CACHE_KEY)
+        if generation != self._generation:
+            self._generation = generation
+            self._indices = {}
+
+    def resolve(self, *aliases, **kwargs):
+        """Resolve several aliases, with at most one ``_alias`` call.
+
+        :param str aliases: Aliases to resolve.
+        :param bool refresh: Ignore cached entries.
+        :param using: ES connection alias or client.
+        :returns: Dict of alias to concrete index name.
+        """
+        refresh = kwargs.get('refresh', False)
+        using = kwargs.get('using', 'default')
+        now = time.time()
+        with self._lock:
+            self._check_generation(now)
+            resolved = {}
+            missing = []
+            for alias in aliases:
+                entry = self._indices.get(alias)
+                if not refresh and entry is not None and now < entry[1]:
+                    resolved[alias] = entry[0]
+                else:
+                    missing.append(alias)
+
+        if missing:
+            es_client = connections.get_connection(using)
+            indices = es_client.indices.get_alias(index=','.join(missing))
+            found = {}
+            for index_name in sorted(indices):
+                for alias in indices[index_name].get('aliases', {}):
+                    found.setdefault(alias, index_name)
+                if index_name in missing:
+                    # A concrete index name resolves to itself.
+                    found.setdefault(index_name, index_name)
+            with self._lock:
+                for alias in missing:
+                    if alias not in found:
+                        raise KeyError('No index found for alias {}'.format(alias))
+                    self._indices[alias] = (found[alias], now + self.ttl)
+                    resolved[alias] = found[alias]
+        return resolved
+
+    def index_name(self, alias, **kwargs):
+        """Return the concrete index name behind ``alias``."""
+        return self.resolve(alias, **kwargs)[alias]
+
+    def invalidate(self, *aliases):
+        """Forget resolved aliases, all of them if none are given.
+
+        Other processes are told through the Django cache.
+        """
+        with self._lock:
+            if aliases:
+                for alias in aliases:
+                    self._indices.pop(alias, None)
+            else:
+                self._indices = {}
+            generation = time.time()
+            self._generation = generation
+        cache.set(GENERATION_CACHE_KEY, generation, None)
+
+
+#pylint: disable=invalid-name
+registry = AliasRegistry()
+#pylint: enable=invalid-name
+
+
+def index_name(key, **kwargs):
+    """Return the concrete index for an index key, e.g. ``'files'``.
+
+    :param str key: Key formatted into ``settings.ES_INDEX_PREFIX``.
+    """
+    return registry.index_name(settings.ES_INDEX_PREFIX.format(key), **kwargs)
+
+
+def index_names(*keys, **kwargs):
+    """Return a dict of index key to concrete index name."""
+    aliases = dict((settings.ES_INDEX_PREFIX.format(key), key) for key in keys)
+    resolved = registry.resolve(*aliases, **kwargs)
+    return dict((aliases[alias], name) for alias, name in resolved.items())
+
+
+def invalidate(*aliases):
+    """Forget resolved aliases in every process."""
+    registry.invalidate(*aliases)
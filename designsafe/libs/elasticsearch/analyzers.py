@@ -23,4 +23,12 @@ file_pattern_analyzer = analyzer('file_ext_analyzer',
 
 reverse_file_analyzer = analyzer('file_reverse',
                         tokenizer=tokenizer('keyword'),
-                        filter=['lowercase', 'reverse'])
\ No newline at end of file
+                        filter=['lowercase', 'reverse'])
+
+name_autocomplete_analyzer = analyzer('name_autocomplete',
+                        tokenizer=tokenizer('name_edge_ngram', 'edge_ngram', min_gram=1, max_gram=20, token_chars=["letter", "digit"]),
+                        filter=['lowercase', 'asciifolding'])
+
+name_search_analyzer = analyzer('name_search',
+                        tokenizer=tokenizer('standard'),
+                        filter=['lowercase', 'asciifolding'])
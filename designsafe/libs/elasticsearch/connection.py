@@ -0,0 +1,18 @@
+"""
+.. module: designsafe.libs.elasticsearch.connection
+   :synopsis: Elasticsearch connection class counting calls per request.
+"""
+import time
+from elasticsearch.connection import Urllib3HttpConnection
+from designsafe.libs.common.instrumentation import record_call
+
+
+class InstrumentedConnection(Urllib3HttpConnection):
+    """Urllib3 connection adding every call to the current request's stats."""
+
+    def perform_request(self, *args, **kwargs):  # pylint: disable=arguments-differ
+        start = time.time()
+        try:
+            return super(InstrumentedConnection, self).perform_request(*args, **kwargs)
+        finally:
+            record_call('es', time.time() - start)
@@ -6,6 +6,7 @@
 from future.utils import python_2_unicode_compatible
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 from designsafe.apps.data.models.elasticsearch import IndexedFile
 from designsafe.libs.elasticsearch.docs.base import BaseESResource
@@ -59,31 +60,44 @@ class BaseESFile(BaseESResource):
         #else:
         #    return IndexedFile
 
-    def children(self, limit=100):
+    def children(self, limit=100, fields=None, prefetch=True):
         """
         Yield all children (i.e. documents whose basePath matches self.path) by 
         paginating with the search_after api.
 
+        ``fields`` only fetches those source fields, see
+        :attr:`IndexedFile.LISTING_FIELDS`. With ``prefetch`` the next page
+        is requested while the current one is consumed, so at most two pages
+        are held at a time.
+
         """
-        res, search_after = self._index_cls(self._reindex).children(
-                                                self.username,
-                                                self.system,
-                                                self.path, 
-                                                limit=limit)
-        for doc in res:
-                yield BaseESFile(self.username, wrapped_doc=doc)
-
-        while not len(res) < limit: # If the number or results doesn't match the limit, we're done paginating.
-            # Retrieve the sort key from the last element then use  
-            # search_after to get the next page of results
-            res, search_after = self._index_cls(self._reindex).children(
-                                                self.username,
-                                                self.system,
-                                                self.path, 
-                                                limit=limit,
-                                                search_after=search_after)
-            for doc in res:
-                yield BaseESFile(self.username, wrapped_doc=doc)
+        index_cls = self._index_cls(self._reindex)
+
+        def page(search_after=None):
+            return index_cls.children(self.username, self.system, self.path,
+                                      limit=limit, search_after=search_after,
+                                      fields=fields)
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            res, search_after = page()
+            while res:
+                # If the number of results doesn't match the limit, we're done paginating.
+                last_page = len(res) < limit
+                next_page = None
+                if not last_page and executor:
+                    next_page = executor.submit(page, search_after)
+                for doc in res:
+                    yield BaseESFile(self.username, wrapped_doc=doc)
+                if last_page:
+                    break
+                if next_page:
+                    res, search_after = next_page.result()
+                else:
+                    res, search_after = page(search_after)
+        finally:
+            if executor:
+                executor.shutdown(wait=False)
 
     def save(self, using=None, index=None, validate=True, **kwargs):
         """Save document
@@ -6,12 +6,15 @@
 
 import logging
 import os
-import zipfile
+import six
 from future.utils import python_2_unicode_compatible
 from designsafe.apps.data.models.elasticsearch import IndexedPublication
 from designsafe.libs.elasticsearch.docs.base import BaseESResource
 from designsafe.libs.elasticsearch.exceptions import DocumentNotFound
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from designsafe.libs.common.archive import ArchiveBuilder
+from designsafe.libs.common.filecopy import load_manifest
 
 # pylint: disable=invalid-name
 logger = logging.getLogger(__name__)
@@ -160,6 +163,16 @@ class BaseESPublication(BaseESResource):
 
         return file_paths
 
+    def copy_manifest_path(self):
+        """Checksum manifest written when the files were copied to corral."""
+        return os.path.join(settings.PUBLICATION_MANIFEST_DIR,
+                            '{}.manifest.json'.format(self.projectId))
+
+    def copy_journal_path(self):
+        """Journal of files already copied to corral."""
+        return os.path.join(settings.PUBLICATION_MANIFEST_DIR,
+                            '{}.journal'.format(self.projectId))
+
     def archive(self):
         archive_name = '{}_archive.zip'.format(self.projectId)
         pub_dir = '/corral-repl/tacc/NHERI/published/'
@@ -186,15 +199,15 @@ class BaseESPublication(BaseESResource):
             archive_path = os.path.join(arc_dir, archive_name)
 
             try:
-                logger.debug("Creating archive for {}".format(self.projectId))
-
-                zf = zipfile.ZipFile(archive_path, mode='w', allowZip64=True)
-                for dirs, _, files in os.walk(arc_source):
-                    for f in files:
-                        if f == archive_name:
-                            continue
-                        zf.write(os.path.join(dirs, f), os.path.join(dirs.replace(pub_dir, ''), f))
-                zf.close()
+                logger.debug("Archiving {}".format(self.projectId))
+                checksums = dict(
+                    ('/'.join([self.projectId, path]), entry) for path, entry in
+                    six.iteritems(load_manifest(self.copy_manifest_path())))
+                builder = ArchiveBuilder(
+                    arc_source, archive_path,
+                    max_workers=getattr(settings, 'ARCHIVE_MAX_WORKERS', 4),
+                    checksums=checksums)
+                builder.build()
             except Exception as e:
                 logger.exception("Archive creation failed for {}".format(arc_source))
             finally:
@@ -1,5 +1,5 @@
 from mock import Mock, patch, MagicMock, PropertyMock, call
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.conf import settings
 import datetime
@@ -8,7 +8,8 @@ from designsafe.libs.elasticsearch.docs.files import BaseESFile
 from designsafe.apps.data.models.elasticsearch import IndexedFile
 from designsafe.libs.elasticsearch.docs.base import BaseESResource
 from designsafe.libs.elasticsearch.exceptions import DocumentNotFound
-from elasticsearch.exceptions import TransportError
+from elasticsearch.exceptions import TransportError, NotFoundError
+from designsafe.libs.elasticsearch.utils import file_doc_id
 
 class TestBaseESFile(TestCase):
     def setUp(self):
@@ -102,14 +103,38 @@ class TestBaseESFile(TestCase):
             continue
 
         mock_index().children.assert_has_calls([
-            call('test_user', 'test.system', '/path/to/file', limit=1),
-            call('test_user', 'test.system', '/path/to/file', limit=1, search_after='KEY1'),
-            call('test_user', 'test.system', '/path/to/file', limit=1, search_after='KEY2'),
+            call('test_user', 'test.system', '/path/to/file', limit=1,
+                 search_after=None, fields=None),
+            call('test_user', 'test.system', '/path/to/file', limit=1,
+                 search_after='KEY1', fields=None),
+            call('test_user', 'test.system', '/path/to/file', limit=1,
+                 search_after='KEY2', fields=None),
         ])
 
         # Check that iteration ends after all children have been listed.
         self.assertRaises(StopIteration, child_generator.__next__)
 
+    @patch('designsafe.libs.elasticsearch.docs.files.BaseESFile._index_cls')
+    def test_children_stops_on_short_page(self, mock_index):
+        docs = [IndexedFile(**{'name': 'child{}'.format(i), 'system': 'test.system',
+                               'path': '/path/to/child{}'.format(i)})
+                for i in range(3)]
+        mock_index.return_value.children.side_effect = [
+            (docs[:2], 'KEY1'),
+            (docs[2:], 'KEY2'),
+        ]
+        base = BaseESFile('test_user', system='test.system',
+                          wrapped_doc=IndexedFile(system='test.system', path='/path/to'))
+        object.__setattr__(base, 'username', 'test_user')
+        object.__setattr__(base, '_reindex', False)
+        object.__setattr__(base, 'system', 'test.system')
+        object.__setattr__(base, 'path', '/path/to')
+
+        children = list(base.children(limit=2, fields=['path']))
+
+        self.assertEqual(len(children), 3)
+        self.assertEqual(mock_index.return_value.children.call_count, 2)
+
     @patch('designsafe.apps.data.models.elasticsearch.IndexedFile.save')
     def test_save(self, mock_save):
         wrapped_doc = IndexedFile(
@@ -228,71 +253,78 @@ class TestIndexedFile(TestCase):
         # self.assertTrue(hasattr(f, 'lastUpdated'))
         # self.assertTrue(hasattr(f, 'pems'))
 
+    @patch('designsafe.apps.data.models.elasticsearch.mirror_index')
     @patch('designsafe.apps.data.models.elasticsearch.Document.save')
-    def test_save(self, mock_save):
-        f = IndexedFile()
+    def test_save(self, mock_save, mock_mirror):
+        f = IndexedFile(system='test.system', path='/path/to/res1')
         f.save()
         mock_save.assert_called_with()
 
+    @override_settings(ES_FILES_LEGACY_LOOKUP=False)
     @patch('designsafe.apps.data.models.elasticsearch.IndexedFile.search')
-    def test_from_path_with_404(self, mock_search):
-        mock_search().filter().execute.side_effect = TransportError(404)
-        with self.assertRaises(TransportError):
-            IndexedFile.from_path('test.system', '/')
-
-    @patch('designsafe.apps.data.models.elasticsearch.IndexedFile.search')
-    def test_from_path_raises_when_no_hits(self, mock_search):
-        mock_search().filter().execute.return_value.hits.total.value = 0
+    @patch('designsafe.apps.data.models.elasticsearch.IndexedFile.get')
+    def test_from_path_with_404(self, mock_get, mock_search):
+        mock_get.side_effect = NotFoundError(404)
         with self.assertRaises(DocumentNotFound):
             IndexedFile.from_path('test.system', '/')
+        mock_search.assert_not_called()
 
+    @override_settings(ES_FILES_LEGACY_LOOKUP=True)
     @patch('designsafe.apps.data.models.elasticsearch.IndexedFile.search')
     @patch('designsafe.apps.data.models.elasticsearch.IndexedFile.get')
-    def test_from_path_1_hit(self, mock_get, mock_search):
-        search_res = IndexedFile(
-            **{'name': 'res1', 'system': 'test.system', 'path': '/path/to/res1'})
-
-        sys_filter = Q('term', **{'system._exact': 'test.system'})
-        path_filter = Q('term', **{'path._exact': '/path/to/res1'})
-
-        mock_res = MagicMock()
-        mock_res.hits.total.value = 1
-
-        mock_search().filter().execute.return_value = mock_res
-        mock_get.return_value = search_res
-
-        doc_from_path = IndexedFile.from_path('test.system', '/path/to/res1')
-
-        mock_search().filter.assert_called_with(sys_filter & path_filter)
-
-        self.assertEqual(doc_from_path, search_res)
+    def test_from_path_falls_back_to_legacy_search(self, mock_get, mock_search):
+        mock_get.side_effect = NotFoundError(404)
+        legacy = IndexedFile(system='test.system', path='/path/to/res1')
+        search = mock_search.return_value.filter.return_value.filter.return_value
+        search.extra.return_value.execute.return_value = [legacy]
+
+        self.assertIs(IndexedFile.from_path('test.system', '/path/to/res1'), legacy)
+        mock_search.return_value.filter.assert_called_with(
+            'term', **{'system._exact': 'test.system'})
+        search.extra.assert_called_with(collapse={'field': 'path._exact'}, size=1)
+
+        search.extra.return_value.execute.return_value = []
+        with self.assertRaises(DocumentNotFound):
+            IndexedFile.from_path('test.system', '/path/to/res2')
 
-    @patch('designsafe.apps.data.models.elasticsearch.IndexedFile.delete')
     @patch('designsafe.apps.data.models.elasticsearch.IndexedFile.search')
     @patch('designsafe.apps.data.models.elasticsearch.IndexedFile.get')
-    def test_from_path_multiple_hits(self, mock_get, mock_search, mock_delete):
-        """
-        When there are multiple files sharing a system and path, ensure we delete
-        all but one and return the remaining document.
-        """
-        search_res = IndexedFile(
+    def test_from_path_gets_by_id(self, mock_get, mock_search):
+        doc = IndexedFile(
             **{'name': 'res1', 'system': 'test.system', 'path': '/path/to/res1'})
-
-        sys_filter = Q('term', **{'system._exact': 'test.system'})
-        path_filter = Q('term', **{'path._exact': '/path/to/res1'})
-
-        # Need to mock either slicing the result or retrieving a single element.
-  
-        mock_res = MagicMock()
-        mock_res.hits.total.value = 3
-        mock_search().filter().execute.return_value = mock_res
-        mock_get.return_value = search_res
+        mock_get.return_value = doc
 
         doc_from_path = IndexedFile.from_path('test.system', '/path/to/res1')
 
-        self.assertEqual(mock_search().filter().delete.call_count, 1)
+        mock_get.assert_called_with(file_doc_id('test.system', '/path/to/res1'))
+        mock_search.assert_not_called()
+        self.assertEqual(doc_from_path, doc)
 
-        self.assertEqual(doc_from_path, search_res)
+    @override_settings(ES_FILES_LEGACY_LOOKUP=True)
+    @patch('designsafe.apps.data.models.elasticsearch.IndexedFile.search')
+    @patch('designsafe.apps.data.models.elasticsearch.IndexedFile.mget')
+    def test_from_paths(self, mock_mget, mock_search):
+        doc_a = IndexedFile(system='test.system', path='/path/a')
+        legacy_b = IndexedFile(system='test.system', path='/path/b')
+        mock_mget.return_value = [doc_a, None, None]
+        search = mock_search.return_value.filter.return_value
+        search.filter.return_value.extra.return_value.execute.return_value = [legacy_b]
+
+        docs = IndexedFile.from_paths('test.system', ['/path/a', '/path/b', '/path/c'])
+
+        mock_mget.assert_called_with([file_doc_id('test.system', '/path/a'),
+                                      file_doc_id('test.system', '/path/b'),
+                                      file_doc_id('test.system', '/path/c')],
+                                     missing='none')
+        search.filter.assert_called_with('terms', **{'path._exact': ['/path/b', '/path/c']})
+        self.assertEqual(docs, [doc_a, legacy_b, None])
+
+    @patch('designsafe.apps.data.models.elasticsearch.mirror_index')
+    @patch('designsafe.apps.data.models.elasticsearch.Document.save')
+    def test_save_sets_file_doc_id(self, mock_save, mock_mirror):
+        f = IndexedFile(system='test.system', path='/path/to/res1')
+        f.save()
+        self.assertEqual(f.meta.id, file_doc_id('test.system', '/path/to/res1'))
 
     @patch('designsafe.apps.data.models.elasticsearch.IndexedFile.search')
     def test_children_raises_on_404(self, mock_search):
@@ -319,8 +351,15 @@ class TestIndexedFile(TestCase):
         mock_search().filter().filter().sort().extra().execute().__iter__.return_value = [search_res]
         mock_search().filter().filter().sort().extra().execute.return_value.hits.hits = [{'sort': 'MOCK SORTKEY'}]
 
-        mock_get.return_value = search_res
-
         children = IndexedFile.children('test_user', system='test.system', path='/')
-        mock_get.assert_called_with('MOCK ID')
+        mock_get.assert_not_called()
         self.assertEqual(children, ([search_res], 'MOCK SORTKEY'))
+
+    @patch('designsafe.apps.data.models.elasticsearch.IndexedFile.search')
+    def test_children_source_fields(self, mock_search):
+        search = mock_search().filter().filter().sort().extra()
+        search.source().execute.return_value.hits.__len__.return_value = 0
+
+        IndexedFile.children('test_user', system='test.system', path='/',
+                             fields=IndexedFile.LISTING_FIELDS)
+        search.source.assert_called_with(includes=IndexedFile.LISTING_FIELDS)
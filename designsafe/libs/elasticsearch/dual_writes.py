@@ -0,0 +1,243 @@
+"""
+.. module: designsafe.libs.elasticsearch.dual_writes
+   :synopsis: Mirror writes to an index being rebuilt by an online reindex.
+
+While an index behind an alias is copied into a new index, writes made
+through the alias are repeated against the new index as well, see
+:func:`designsafe.libs.elasticsearch.reindex.online_reindex`.
+
+The alias to new index mapping is kept in Redis, so every process sees
+it. Processes check it again at most every ``ES_ALIAS_CHECK_INTERVAL``
+seconds. The id of every mirrored document also goes into a journal set,
+once the write through the alias has been acknowledged. The catch-up pass
+of the reindex copies these documents again, because a mirrored write can
+land before the copy writes an older version of the document.
+
+Mirrored writes and the catch-up pass carry the version of the document
+in the source index with ``version_type='external_gte'``, so an older copy
+never overwrites a newer one.
+"""
+import time
+import logging
+import threading
+from collections import deque
+from django.conf import settings
+from elasticsearch.helpers import streaming_bulk
+from elasticsearch_dsl.connections import connections
+
+#pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+#pylint: enable=invalid-name
+
+REDIS_PREFIX = 'es_dual_write'
+JOURNAL_BATCH = 500
+VERSION_TYPE = 'external_gte'
+
+
+def redis_connection():
+    """Return a Redis client for the dual write state."""
+    import redis
+    return redis.StrictRedis(**settings.WS4REDIS_CONNECTION)
+
+
+def _target_key(alias):
+    return '{}:{}'.format(REDIS_PREFIX, alias)
+
+
+def _journal_key(alias):
+    return '{}:{}:ids'.format(REDIS_PREFIX, alias)
+
+
+class DualWrites(object):
+    """In-process view of the aliases whose writes are mirrored.
+
+    :param int check_interval: Seconds a looked up target is reused.
+    """
+
+    def __init__(self, check_interval=None):
+        self.check_interval = check_interval if check_interval is not None else \
+            getattr(settings, 'ES_ALIAS_CHECK_INTERVAL', 5)
+        self._lock = threading.Lock()
+        self._targets = {}
+
+    def target(self, alias):
+        """Return the index mirroring ``alias``, or ``None``."""
+        now = time.time()
+        with self._lock:
+            entry = self._targets.get(alias)
+            if entry is not None and now < entry[1]:
+                return entry[0]
+        try:
+            target = redis_connection().get(_target_key(alias))
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning('Unable to look up dual writes of %s: %s', alias, exc)
+            target = None
+        if isinstance(target, bytes):
+            target = target.decode('utf-8')
+        with self._lock:
+            self._targets[alias] = (target, now + self.check_interval)
+        return target
+
+    def start(self, alias, index):
+        """Mirror writes of ``alias`` to ``index`` in every process."""
+        conn = redis_connection()
+        conn.delete(_journal_key(alias))
+        conn.set(_target_key(alias), index)
+        with self._lock:
+            self._targets.pop(alias, None)
+
+    def stop(self, alias):
+        """Stop mirroring writes of ``alias`` and drop its journal."""
+        conn = redis_connection()
+        conn.delete(_target_key(alias), _journal_key(alias))
+        with self._lock:
+            self._targets.pop(alias, None)
+
+    def journal(self, alias, ids):
+        """Add document ids to the catch-up journal of ``alias``."""
+        if ids:
+            redis_connection().sadd(_journal_key(alias), *ids)
+
+    def pop_journal(self, alias, count=JOURNAL_BATCH):
+        """Remove and return up to ``count`` journaled ids."""
+        ids = redis_connection().spop(_journal_key(alias), count) or []
+        return [_id.decode('utf-8') if isinstance(_id, bytes) else _id for _id in ids]
+
+
+#pylint: disable=invalid-name
+registry = DualWrites()
+#pylint: enable=invalid-name
+
+
+def sync_actions(es_client, alias, dest, ids):
+    """Return bulk actions copying the documents ``ids`` from ``alias`` to
+    ``dest`` with their current version.
+
+    Documents missing from ``alias`` are deleted from ``dest``.
+    """
+    docs = es_client.mget(index=alias, body={'ids': ids})['docs']
+    actions = []
+    for doc in docs:
+        if doc.get('found'):
+            actions.append({'_op_type': 'index', '_index': dest,
+                            '_id': doc['_id'], '_source': doc['_source'],
+                            'version': doc['_version'],
+                            'version_type': VERSION_TYPE})
+        else:
+            actions.append({'_op_type': 'delete', '_index': dest,
+                            '_id': doc['_id']})
+    return actions
+
+
+def _write_mirrored(es_client, actions):
+    # Version conflicts mean a newer copy is already there.
+    for ok, item in streaming_bulk(es_client, actions, raise_on_error=False):
+        if not ok:
+            result = list(item.values())[0]
+            if result.get('status') not in (404, 409):
+                logger.warning('Unable to mirror: %s', item)
+
+
+def mirror_index(alias, doc_id, body, version=None, es_client=None):
+    """Repeat an index request made through ``alias``.
+
+    :param int version: Version of the document in ``alias`` after the
+        write. Older copies written later will not overwrite it.
+    """
+    target = registry.target(alias)
+    if target is None:
+        return
+    es_client = es_client or connections.get_connection()
+    kwargs = {}
+    if version is not None:
+        kwargs = {'version': version, 'version_type': VERSION_TYPE}
+    try:
+        es_client.index(index=target, id=doc_id, body=body, ignore=409, **kwargs)
+    except Exception as exc:  # pylint: disable=broad-except
+        # The catch-up pass copies the document from the journal.
+        logger.warning('Unable to mirror %s to %s: %s', doc_id, target, exc)
+    registry.journal(alias, [doc_id])
+
+
+def mirror_delete(alias, doc_id, es_client=None):
+    """Repeat a delete request made through ``alias``."""
+    target = registry.target(alias)
+    if target is None:
+        return
+    es_client = es_client or connections.get_connection()
+    try:
+        es_client.delete(index=target, id=doc_id, ignore=404)
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning('Unable to mirror deleting %s from %s: %s', doc_id, target, exc)
+    registry.journal(alias, [doc_id])
+
+
+def delete_by_query(es_client, alias, query):
+    """Run ``delete_by_query`` through ``alias`` and mirror it.
+
+    The ids the query matches are read before it runs and journaled once
+    it is done, since the copy may write them again.
+    """
+    target = registry.target(alias)
+    ids = []
+    if target is not None:
+        from elasticsearch.helpers import scan
+        ids = [hit['_id'] for hit in scan(es_client, index=alias, _source=False,
+                                          query={'query': query})]
+    res = es_client.delete_by_query(index=alias, body={'query': query},
+                                    conflicts='proceed')
+    if target is not None:
+        es_client.delete_by_query(index=target, body={'query': query},
+                                  conflicts='proceed')
+        for start in range(0, len(ids), JOURNAL_BATCH):
+            registry.journal(alias, ids[start:start + JOURNAL_BATCH])
+    return res
+
+
+def mirrored_bulk(es_client, actions, **kwargs):
+    """:func:`elasticsearch.helpers.streaming_bulk` that mirrors the
+    acknowledged actions made through an alias with dual writes.
+
+    Index and delete actions are repeated with the version the write got.
+    Partial updates are mirrored by copying the updated documents. The ids
+    are journaled after the mirrored writes.
+
+    :returns: The ``(ok, item)`` results of the writes through the aliases.
+    """
+    sent = deque()
+
+    def _actions():
+        for action in actions:
+            sent.append(action)
+            yield action
+
+    pending = {}
+
+    def _flush(alias):
+        target, ids, mirrored, updated = pending.pop(alias)
+        if updated:
+            mirrored += sync_actions(es_client, alias, target, updated)
+        _write_mirrored(es_client, mirrored)
+        registry.journal(alias, ids)
+
+    for ok, item in streaming_bulk(es_client, _actions(), **kwargs):
+        action = sent.popleft()
+        yield ok, item
+        alias = action.get('_index')
+        target = registry.target(alias) if ok and alias else None
+        if target is None:
+            continue
+        op_type = action.get('_op_type', 'index')
+        result = item[op_type]
+        entry = pending.setdefault(alias, (target, [], [], []))
+        entry[1].append(action['_id'])
+        if op_type == 'update':
+            entry[3].append(action['_id'])
+        else:
+            mirrored = dict(action, _index=target, version=result['_version'],
+                            version_type=VERSION_TYPE)
+            entry[2].append(mirrored)
+        if len(entry[1]) >= JOURNAL_BATCH:
+            _flush(alias)
+    for alias in list(pending):
+        _flush(alias)
@@ -14,6 +14,7 @@ from elasticsearch_dsl import (Index)
 from elasticsearch_dsl.query import Q
 from elasticsearch import TransportError, ConnectionTimeout, Elasticsearch
 from designsafe.libs.elasticsearch.analyzers import path_analyzer
+from designsafe.libs.elasticsearch.aliases import invalidate as invalidate_aliases
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -63,6 +64,7 @@ def setup_index(index_config, force=False, reindex=False):
         index.settings(**index_config['kwargs'])
 
         index.create()
+        invalidate_aliases(alias)
 
 def init(name='all', force=False):
     if name != 'all':
@@ -0,0 +1,264 @@
+"""
+.. module: designsafe.libs.elasticsearch.maintenance
+   :synopsis: Parallel, resumable maintenance jobs over a whole index.
+
+A job is split into numbered *parts* that run in a pool of worker
+processes, each with its own Elasticsearch connection. Finished parts are
+appended to a checkpoint file, so an interrupted job only runs the parts
+that did not finish. The checkpoint is removed once every part is done.
+
+:func:`transform_index` reads the index with a sliced scroll, one slice per
+part, and writes the actions returned by a transform function with
+:func:`elasticsearch.helpers.streaming_bulk`. :func:`dedup_files` finds
+duplicate file documents with a composite aggregation split in partitions.
+"""
+import os
+import json
+import logging
+import multiprocessing
+from collections import Counter
+from django.conf import settings
+from elasticsearch.helpers import scan, streaming_bulk
+from elasticsearch_dsl.connections import connections
+from designsafe.libs.elasticsearch.utils import file_doc_id
+
+#pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+#pylint: enable=invalid-name
+
+# Duplicate (system, path) buckets handled per aggregation request.
+DEDUP_BUCKETS = 1000
+# Documents of a single duplicate bucket returned by top_hits.
+DEDUP_TOP_HITS = 100
+
+
+def checkpoint_path(name, parts):
+    """Checkpoint file of job ``name`` split in ``parts`` parts."""
+    directory = getattr(settings, 'ES_MAINTENANCE_DIR', '/tmp/es-maintenance')
+    return os.path.join(directory, '{}.{}.checkpoint'.format(name, parts))
+
+
+def load_checkpoint(path):
+    """Return ``{part: stats}`` of the parts finished in ``path``."""
+    done = {}
+    try:
+        with open(path) as checkpoint:
+            for line in checkpoint:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                done[entry['part']] = entry['stats']
+    except (IOError, OSError):
+        pass
+    return done
+
+
+def _init_worker():
+    """Give a forked worker its own connection instead of the parent's."""
+    connections.create_connection(
+        'default',
+        hosts=settings.ES_CONNECTIONS[settings.DESIGNSAFE_ENVIRONMENT]['hosts'],
+        http_auth=settings.ES_AUTH,
+        max_retries=3,
+        retry_on_timeout=True,
+    )
+
+
+def _run_part(task):
+    func, part, parts, kwargs = task
+    return part, func(connections.get_connection(), part, parts, **kwargs)
+
+
+def run_parts(name, func, parts, workers=None, resume=True, **kwargs):
+    """Run ``func(es_client, part, parts, **kwargs)`` for every part.
+
+    :param str name: Job name, used for the checkpoint file.
+    :param func: Module level function returning a dict of counters.
+    :param int parts: Number of parts.
+    :param int workers: Worker processes. Defaults to
+        ``settings.ES_MAINTENANCE_WORKERS``; 1 runs in this process.
+    :param bool resume: Skip parts finished by an interrupted run.
+    :returns: Counters summed over every part.
+    """
+    workers = workers or getattr(settings, 'ES_MAINTENANCE_WORKERS', 4)
+    path = checkpoint_path(name, parts)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    if not resume and os.path.exists(path):
+        os.remove(path)
+    done = load_checkpoint(path)
+    totals = Counter()
+    for stats in done.values():
+        totals.update(stats)
+    tasks = [(func, part, parts, kwargs) for part in range(parts) if part not in done]
+    if done:
+        logger.info('Resuming %s: %d of %d parts already done.', name, len(done), parts)
+
+    pool = None
+    if workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(workers, len(tasks)), initializer=_init_worker)
+        results = pool.imap_unordered(_run_part, tasks)
+    else:
+        results = (_run_part(task) for task in tasks)
+    try:
+        for part, stats in results:
+            with open(path, 'a') as checkpoint:
+                checkpoint.write(json.dumps({'part': part, 'stats': stats}) + '\n')
+            totals.update(stats)
+            logger.info('%s: part %d of %d done, %s', name, part + 1, parts, stats)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    os.remove(path)
+    return dict(totals)
+
+
+def _write(es_client, actions, stats, chunk_size):
+    for ok, item in streaming_bulk(es_client, actions, chunk_size=chunk_size,
+                                   raise_on_error=False,
+                                   raise_on_exception=False):
+        if ok:
+            stats['written'] += 1
+        else:
+            stats['errors'] += 1
+            logger.error('Bulk maintenance error: %s', item)
+
+
+def transform_slice(es_client, part, parts, index, transform, query=None,
+                    chunk_size=None):
+    """Apply ``transform`` to the documents of one scroll slice.
+
+    :param transform: Module level function given a raw hit, returning a
+        bulk action, a list of bulk actions or ``None``.
+    :returns: ``docs``, ``written`` and ``errors`` counters.
+    """
+    chunk_size = chunk_size or getattr(settings, 'ES_BULK_CHUNK_SIZE', 500)
+    body = {'query': query or {'match_all': {}}}
+    if parts > 1:
+        body['slice'] = {'id': part, 'max': parts}
+    stats = Counter(docs=0, written=0, errors=0)
+
+    def _actions():
+        for hit in scan(es_client, query=body, index=index, size=chunk_size,
+                        scroll='10m'):
+            stats['docs'] += 1
+            action = transform(hit)
+            if isinstance(action, list):
+                for item in action:
+                    yield item
+            elif action is not None:
+                yield action
+
+    _write(es_client, _actions(), stats, chunk_size)
+    return dict(stats)
+
+
+def transform_index(name, index, transform, query=None, slices=None,
+                    workers=None, resume=True, chunk_size=None):
+    """Apply ``transform`` to every document of ``index`` in parallel.
+
+    :param str name: Job name, used for the checkpoint file.
+    :param str index: Index or alias.
+    :param transform: Module level function given a raw hit, returning a
+        bulk action, a list of bulk actions or ``None``.
+    :param dict query: Only transform matching documents.
+    :param int slices: Scroll slices. Defaults to four per worker so an
+        interrupted job loses little work; at most 1024.
+    :returns: ``docs``, ``written`` and ``errors`` counters.
+    """
+    workers = workers or getattr(settings, 'ES_MAINTENANCE_WORKERS', 4)
+    slices = min(slices or workers * 4, 1024)
+    return run_parts(name, transform_slice, slices, workers=workers,
+                     resume=resume, index=index, transform=transform,
+                     query=query, chunk_size=chunk_size)
+
+
+def dedup_partition(es_client, part, parts, index, chunk_size=None):
+    """Delete duplicate file documents in one partition of paths.
+
+    Every ``(system, path)`` pair of the partition is paged through with a
+    composite aggregation and ``top_hits``. The document keyed by
+    :func:`~designsafe.libs.elasticsearch.utils.file_doc_id` is kept, or
+    the most recently modified one if there is none. Paths are assigned to
+    a partition by their hash.
+
+    :returns: ``groups``, ``written`` (documents deleted) and ``errors``
+        counters.
+    """
+    chunk_size = chunk_size or getattr(settings, 'ES_BULK_CHUNK_SIZE', 500)
+    stats = Counter(groups=0, written=0, errors=0)
+    body = {
+        'size': 0,
+        'query': {'bool': {'filter': [{'script': {'script': {
+            'source': "doc['path._exact'].size() > 0 && "
+                      "Math.floorMod(doc['path._exact'].value.hashCode(), "
+                      "params.parts) == params.part",
+            'params': {'part': part, 'parts': parts}
+        }}}]}},
+        'aggs': {'pairs': {
+            'composite': {
+                'size': DEDUP_BUCKETS,
+                'sources': [
+                    {'system': {'terms': {'field': 'system._exact'}}},
+                    {'path': {'terms': {'field': 'path._exact'}}}
+                ]
+            },
+            'aggs': {'docs': {'top_hits': {
+                'size': DEDUP_TOP_HITS,
+                '_source': False,
+                'sort': [{'lastModified': {'order': 'desc',
+                                           'unmapped_type': 'date'}}]
+            }}}
+        }}
+    }
+    while True:
+        res = es_client.search(index=index, body=body)
+        pairs = res['aggregations']['pairs']
+        actions = []
+        for bucket in pairs['buckets']:
+            if bucket['doc_count'] < 2:
+                continue
+            stats['groups'] += 1
+            hits = bucket['docs']['hits']['hits']
+            overflow = bucket['doc_count'] > len(hits)
+            keep_id = file_doc_id(bucket['key']['system'], bucket['key']['path'])
+            hit_ids = [hit['_id'] for hit in hits]
+            if keep_id not in hit_ids and not (
+                    overflow and es_client.exists(index=index, id=keep_id)):
+                keep_id = hit_ids[0]
+            actions += [{'_op_type': 'delete', '_index': hit['_index'],
+                         '_id': hit['_id']} for hit in hits if hit['_id'] != keep_id]
+            if overflow:
+                # More duplicates than top_hits returned.
+                if keep_id not in hit_ids:
+                    hit_ids.insert(0, keep_id)
+                deleted = es_client.delete_by_query(
+                    index=index, conflicts='proceed',
+                    body={'query': {'bool': {
+                        'filter': [
+                            {'term': {'system._exact': bucket['key']['system']}},
+                            {'term': {'path._exact': bucket['key']['path']}}
+                        ],
+                        'must_not': [{'ids': {'values': hit_ids}}]
+                    }}})
+                stats['written'] += deleted.get('deleted', 0)
+                stats['errors'] += len(deleted.get('failures', []))
+        _write(es_client, actions, stats, chunk_size)
+        if 'after_key' not in pairs or not pairs['buckets']:
+            break
+        body['aggs']['pairs']['composite']['after'] = pairs['after_key']
+    return dict(stats)
+
+
+def dedup_files(partitions=None, workers=None, resume=True):
+    """Delete duplicate documents of the files index.
+
+    :param int partitions: Path partitions. Defaults to four per worker.
+    :returns: ``groups``, ``written`` and ``errors`` counters.
+    """
+    workers = workers or getattr(settings, 'ES_MAINTENANCE_WORKERS', 4)
+    return run_parts('full_dedup', dedup_partition, partitions or workers * 4,
+                     workers=workers, resume=resume,
+                     index=settings.ES_INDICES['files']['alias'])
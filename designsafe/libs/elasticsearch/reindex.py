@@ -0,0 +1,166 @@
+"""
+.. module: designsafe.libs.elasticsearch.reindex
+   :synopsis: Online reindex of an index into a fresh one, then alias swap.
+
+:func:`online_reindex` rebuilds the index behind an alias while it is in
+use, so mapping changes need no maintenance window. It runs these steps:
+
+1. Create a fresh index under the ``<alias>-reindex`` alias.
+2. Turn on dual writes, see :mod:`designsafe.libs.elasticsearch.dual_writes`,
+   and wait until every process has seen them.
+3. Copy the documents server-side with ``_reindex``, ``slices=auto`` and
+   ``requests_per_second`` throttling. ``op_type=create`` keeps documents
+   already written by dual writes.
+4. Poll the task until the copy is done.
+5. Copy the documents written during the copy again (the catch-up pass).
+6. Swap the aliases atomically and turn dual writes off.
+
+Only indices in :data:`ONLINE_INDICES` can be rebuilt this way: writes to
+the other indices do not go through dual writes and would be lost.
+"""
+import time
+import logging
+from django.conf import settings
+from elasticsearch.helpers import streaming_bulk
+from elasticsearch_dsl.connections import connections
+from designsafe.libs.elasticsearch import dual_writes
+from designsafe.libs.elasticsearch.aliases import (registry as alias_registry,
+                                                   invalidate as invalidate_aliases)
+
+#pylint: disable=invalid-name
+logger = logging.getLogger(__name__)
+#pylint: enable=invalid-name
+
+# Keys of settings.ES_INDICES whose writes are mirrored by dual writes.
+ONLINE_INDICES = ('files',)
+
+
+class ReindexError(Exception):
+    """Raised when a reindex task fails."""
+
+
+def start_reindex(es_client, source, dest, requests_per_second=None,
+                  slices='auto'):
+    """Start a server-side copy of ``source`` into ``dest``.
+
+    :param int requests_per_second: Throttle, -1 for none. Defaults to
+        ``settings.ES_REINDEX_REQUESTS_PER_SECOND``.
+    :returns: Task id.
+    """
+    if requests_per_second is None:
+        requests_per_second = getattr(settings, 'ES_REINDEX_REQUESTS_PER_SECOND', -1)
+    res = es_client.reindex(
+        body={
+            'conflicts': 'proceed',
+            'source': {'index': source,
+                       'size': getattr(settings, 'ES_BULK_CHUNK_SIZE', 500)},
+            'dest': {'index': dest, 'op_type': 'create'}
+        },
+        wait_for_completion=False,
+        slices=slices,
+        requests_per_second=requests_per_second,
+        refresh=True
+    )
+    return res['task']
+
+
+def wait_for_task(es_client, task_id, poll_interval=10):
+    """Poll a task until it completes.
+
+    :raises ReindexError: If the task failed or had failed documents.
+    :returns: The task response.
+    """
+    while True:
+        res = es_client.tasks.get(task_id=task_id)
+        status = res['task'].get('status', {})
+        logger.info('Reindex task %s: %s of %s documents copied, %s skipped.',
+                    task_id, status.get('created', 0), status.get('total', 0),
+                    status.get('version_conflicts', 0))
+        if res.get('completed'):
+            if res.get('error'):
+                raise ReindexError('Reindex task {} failed: {}'.format(
+                    task_id, res['error']))
+            response = res.get('response', {})
+            if response.get('failures'):
+                raise ReindexError('Reindex task {} had {} failures, first: {}'.format(
+                    task_id, len(response['failures']), response['failures'][0]))
+            return response
+        time.sleep(poll_interval)
+
+
+def catch_up(es_client, alias, dest, batch_size=dual_writes.JOURNAL_BATCH):
+    """Copy documents journaled by dual writes from ``alias`` to ``dest``.
+
+    Documents missing from ``alias`` are deleted from ``dest``. Documents
+    are written with their version in ``alias``, so a newer copy written
+    by dual writes is kept.
+
+    :returns: Number of documents copied or deleted.
+    """
+    synced = 0
+    while True:
+        ids = dual_writes.registry.pop_journal(alias, batch_size)
+        if not ids:
+            return synced
+        actions = dual_writes.sync_actions(es_client, alias, dest, ids)
+        for ok, item in streaming_bulk(es_client, actions, raise_on_error=False):
+            status = list(item.values())[0].get('status')
+            if not ok and status not in (404, 409):
+                logger.error('Catch-up error: %s', item)
+        synced += len(ids)
+
+
+def swap_aliases(es_client, alias, reindex_alias):
+    """Atomically swap the indices behind ``alias`` and ``reindex_alias``."""
+    resolved = alias_registry.resolve(alias, reindex_alias, refresh=True)
+    index_name = resolved[alias]
+    reindex_name = resolved[reindex_alias]
+    es_client.indices.update_aliases(body={
+        'actions': [
+            {'remove': {'index': index_name, 'alias': alias}},
+            {'remove': {'index': reindex_name, 'alias': reindex_alias}},
+            {'add': {'index': index_name, 'alias': reindex_alias}},
+            {'add': {'index': reindex_name, 'alias': alias}},
+        ]
+    })
+    # Make every process resolve the swapped aliases again.
+    invalidate_aliases(alias, reindex_alias)
+
+
+def online_reindex(index_key, requests_per_second=None, slices='auto',
+                   poll_interval=10, es_client=None):
+    """Rebuild the index of ``settings.ES_INDICES[index_key]`` while in use.
+
+    :returns: Dict with the ``task`` response and the number of documents
+        synced by the ``catch_up`` pass.
+    :raises ReindexError: If writes to the index are not mirrored, see
+        :data:`ONLINE_INDICES`.
+    """
+    if index_key not in ONLINE_INDICES:
+        raise ReindexError('Writes to the {} index are not mirrored, it cannot '
+                           'be reindexed online.'.format(index_key))
+    from designsafe.libs.elasticsearch.indices import setup_index
+    es_client = es_client or connections.get_connection()
+    index_config = settings.ES_INDICES[index_key]
+    alias = index_config['alias']
+    reindex_alias = alias + '-reindex'
+
+    setup_index(index_config, force=True, reindex=True)
+    resolved = alias_registry.resolve(alias, reindex_alias, refresh=True)
+    source, dest = resolved[alias], resolved[reindex_alias]
+    logger.info('Reindexing %s into %s.', source, dest)
+
+    dual_writes.registry.start(alias, dest)
+    try:
+        # Let every process pick up the dual writes before the copy starts.
+        time.sleep(dual_writes.registry.check_interval + 1)
+        task_id = start_reindex(es_client, source, dest,
+                                requests_per_second=requests_per_second,
+                                slices=slices)
+        response = wait_for_task(es_client, task_id, poll_interval=poll_interval)
+        synced = catch_up(es_client, alias, dest)
+        logger.info('Caught up %d documents written during the copy.', synced)
+        swap_aliases(es_client, alias, reindex_alias)
+    finally:
+        dual_writes.registry.stop(alias)
+    return {'task': response, 'catch_up': synced}
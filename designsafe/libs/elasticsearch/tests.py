@@ -0,0 +1,737 @@
+import os
+import shutil
+import tempfile
+from mock import Mock, patch, MagicMock, call
+from django.test import TestCase, override_settings
+from django.conf import settings
+from elasticsearch_dsl import Search
+from designsafe.libs.elasticsearch.utils import (file_doc_dict,
+                                                 file_doc_id,
+                                                 level_actions,
+                                                 index_level,
+                                                 bulk_index_levels,
+                                                 level_digest,
+                                                 incremental_index_level,
+                                                 walk_levels,
+                                                 walk_levels_parallel,
+                                                 walk_levels_local,
+                                                 project_doc_dict,
+                                                 iter_project_metadata,
+                                                 index_project,
+                                                 bulk_index_projects,
+                                                 repair_path_action,
+                                                 rekey_file_action,
+                                                 rekey_slice,
+                                                 rebuild_usage,
+                                                 encode_cursor,
+                                                 decode_cursor,
+                                                 paginate,
+                                                 next_cursor)
+from designsafe.libs.elasticsearch import maintenance
+from designsafe.libs.elasticsearch import dual_writes
+from designsafe.libs.elasticsearch.reindex import (ReindexError, wait_for_task,
+                                                   catch_up, online_reindex)
+from designsafe.libs.elasticsearch.aliases import AliasRegistry
+
+
+class TestBulkIndexing(TestCase):
+
+    def setUp(self):
+        self.folder = MagicMock(path='/path/to/folder')
+        self.folder.to_dict.return_value = {
+            'name': 'folder', 'path': '/path/to/folder', 'format': 'folder',
+            'permissions': 'ALL', 'trail': [], '_links': {}}
+        self.file = MagicMock(path='/path/to/file.txt')
+        self.file.to_dict.return_value = {
+            'name': 'file.txt', 'path': '/path/to/file.txt', 'format': 'raw',
+            'permissions': 'ALL', 'trail': [], '_links': {}}
+
+    def test_file_doc_dict(self):
+        doc = file_doc_dict(self.file, [{'username': 'test_user', '_links': {}}])
+        self.assertEqual(doc['basePath'], '/path/to')
+        self.assertEqual(doc['permissions'], [{'username': 'test_user'}])
+        self.assertNotIn('trail', doc)
+        self.assertNotIn('_links', doc)
+
+    def test_file_doc_dict_without_pems(self):
+        doc = file_doc_dict(self.file)
+        self.assertNotIn('permissions', doc)
+
+    def test_file_doc_id(self):
+        self.assertEqual(file_doc_id('test.system', '/path/to/file.txt'),
+                         file_doc_id('test.system', 'path/to/file.txt/'))
+        self.assertNotEqual(file_doc_id('test.system', '/path/to/file.txt'),
+                            file_doc_id('other.system', '/path/to/file.txt'))
+        self.assertEqual(len(file_doc_id('test.system', '/' + 'a' * 2000)), 64)
+
+    def test_level_actions_use_file_doc_ids(self):
+        client = MagicMock()
+        client.files.listPermissions.return_value = []
+        actions = list(level_actions(client, '/path/to', [self.folder], [self.file],
+                                     'test.system'))
+
+        self.assertEqual(len(actions), 2)
+        self.assertEqual(actions[0]['_id'], file_doc_id('test.system', '/path/to/folder'))
+        self.assertEqual(actions[1]['_id'], file_doc_id('test.system', '/path/to/file.txt'))
+        self.assertEqual(actions[0]['_index'], settings.ES_INDICES['files']['alias'])
+        client.files.listPermissions.assert_has_calls([
+            call(systemId='test.system', filePath='/path/to/folder'),
+            call(systemId='test.system', filePath='/path/to/file.txt')
+        ])
+
+    @patch('designsafe.apps.data.models.usage.FolderUsage.record_level')
+    @patch('designsafe.libs.elasticsearch.utils.delete_stale_children')
+    @patch('designsafe.libs.elasticsearch.dual_writes.streaming_bulk')
+    def test_bulk_index_levels(self, mock_bulk, mock_delete, mock_usage):
+        es_client = MagicMock()
+
+        def _consume(client, actions, **kwargs):
+            return [(True, action) for action in actions]
+        mock_bulk.side_effect = _consume
+
+        indexed = bulk_index_levels(MagicMock(),
+                                    [('/path/to', [self.folder], [self.file])],
+                                    'test.system', update_pems=False,
+                                    chunk_size=10, es_client=es_client)
+
+        self.assertEqual(indexed, 2)
+        self.assertEqual(mock_bulk.call_args[1]['chunk_size'], 10)
+        self.assertEqual(mock_delete.call_count, 1)
+        self.assertEqual(mock_delete.call_args[0][:2], ('test.system', '/path/to'))
+        self.assertEqual(len(mock_delete.call_args[0][2]), 2)
+        mock_usage.assert_called_with('test.system', '/path/to',
+                                      [self.folder], [self.file])
+
+    @patch('designsafe.apps.data.models.usage.FolderUsage.record_level')
+    @patch('designsafe.apps.data.models.elasticsearch.IndexedFile.from_paths')
+    @patch('designsafe.libs.elasticsearch.docs.files.BaseESFile')
+    def test_index_level_deletes_stale_children(self, mock_file, mock_from_paths, mock_usage):
+        mock_from_paths.return_value = [None, None]
+        stale = MagicMock(path='/path/to/stale')
+        mock_file.return_value.children.return_value = [stale]
+
+        index_level(MagicMock(), '/path/to', [self.folder], [self.file],
+                    'test.system', 'test_user', update_pems=False)
+
+        fields = mock_file.return_value.children.call_args[1]['fields']
+        self.assertIn('system', fields)
+        self.assertIn('format', fields)
+        stale.delete.assert_called_with()
+        self.assertEqual(mock_file.return_value.save.call_count, 2)
+
+    @patch('designsafe.apps.data.models.usage.FolderUsage.record_level')
+    @patch('designsafe.apps.data.models.elasticsearch.IndexedFile')
+    @patch('designsafe.libs.elasticsearch.docs.files.BaseESFile')
+    def test_index_level_local_listing(self, mock_file, mock_indexed, mock_usage):
+        """Listings from a local walk have no permissions, trail or links."""
+        mock_indexed.from_paths.return_value = [None]
+        mock_file.return_value.children.return_value = []
+        local_file = MagicMock(path='/path/to/file.txt')
+        local_file.to_dict.return_value = {
+            'name': 'file.txt', 'path': '/path/to/file.txt', 'format': 'raw'}
+
+        index_level(MagicMock(), '/path/to', [], [local_file],
+                    'test.system', 'test_user', update_pems=False)
+
+        mock_indexed.assert_called_with(name='file.txt', path='/path/to/file.txt',
+                                        format='raw', basePath='/path/to')
+        self.assertEqual(mock_file.return_value.save.call_count, 1)
+
+
+
+class TestProjectIndexing(TestCase):
+
+    def setUp(self):
+        self.metas = [
+            {'uuid': 'PRJ_UUID_{}'.format(i), 'name': 'designsafe.project',
+             '_links': {}, 'value': {'title': 'Project {}'.format(i),
+                                     'teamMember': ['test_user'],
+                                     'awardNumber': '1234',
+                                     'guestMembers': [None]}}
+            for i in range(3)
+        ]
+
+    def test_project_doc_dict(self):
+        doc = project_doc_dict(self.metas[0])
+        self.assertNotIn('_links', doc)
+        self.assertNotIn('teamMember', doc['value'])
+        self.assertEqual(doc['value']['awardNumber'], [{'number': '1234'}])
+        self.assertEqual(doc['value']['guestMembers'], [])
+
+    def test_iter_project_metadata(self):
+        client = MagicMock()
+        client.meta.listMetadata.side_effect = [self.metas[:2], self.metas[2:], []]
+        metas = list(iter_project_metadata(client, page_size=2))
+        self.assertEqual(metas, self.metas)
+        self.assertEqual(client.meta.listMetadata.call_args_list[1][1]['offset'], 2)
+
+    @patch('designsafe.libs.elasticsearch.utils.streaming_bulk')
+    def test_bulk_index_projects(self, mock_bulk):
+        es_client = MagicMock()
+
+        def _consume(client, actions, **kwargs):
+            return [(True, action) for action in actions]
+        mock_bulk.side_effect = _consume
+
+        indexed = bulk_index_projects(iter(self.metas), es_client=es_client)
+
+        self.assertEqual(indexed, 3)
+        query = es_client.delete_by_query.call_args[1]['body']['query']
+        self.assertEqual(query['bool']['must_not']['ids']['values'],
+                         ['PRJ_UUID_0', 'PRJ_UUID_1', 'PRJ_UUID_2'])
+
+    @patch('designsafe.libs.elasticsearch.utils.streaming_bulk')
+    def test_bulk_errors_skip_pruning(self, mock_bulk):
+        es_client = MagicMock()
+
+        def _consume(client, actions, **kwargs):
+            return [(False, {'index': action}) for action in actions]
+        mock_bulk.side_effect = _consume
+
+        self.assertEqual(bulk_index_projects(self.metas, es_client=es_client), 0)
+        es_client.delete_by_query.assert_not_called()
+
+    def test_index_project(self):
+        es_client = MagicMock()
+        index_project(self.metas[0], es_client=es_client)
+        self.assertEqual(es_client.index.call_args[1]['id'], 'PRJ_UUID_0')
+        query = es_client.delete_by_query.call_args[1]['body']['query']
+        self.assertEqual(query['bool']['must_not'], [{'ids': {'values': ['PRJ_UUID_0']}}])
+
+class TestIncrementalIndexing(TestCase):
+
+    def setUp(self):
+        self.folder = MagicMock(path='/path/to/folder')
+        self.folder.to_dict.return_value = {
+            'name': 'folder', 'path': '/path/to/folder', 'format': 'folder',
+            'lastModified': '2020-01-01T00:00:00-06:00', 'length': 4096}
+        self.file = MagicMock(path='/path/to/file.txt')
+        self.file.to_dict.return_value = {
+            'name': 'file.txt', 'path': '/path/to/file.txt', 'format': 'raw',
+            'lastModified': '2020-01-01T00:00:00-06:00', 'length': 10}
+
+        self.patch_bulk = patch('designsafe.libs.elasticsearch.dual_writes.streaming_bulk')
+        self.mock_bulk = self.patch_bulk.start()
+        self.mock_bulk.return_value = []
+        self.patch_root = patch('designsafe.libs.elasticsearch.utils._root_doc')
+        self.mock_root = self.patch_root.start()
+        self.patch_existing = patch('designsafe.libs.elasticsearch.utils.existing_level_docs')
+        self.mock_existing = self.patch_existing.start()
+        self.patch_delete = patch('designsafe.libs.elasticsearch.utils.delete_stale_children')
+        self.mock_delete = self.patch_delete.start()
+        self.patch_usage = patch('designsafe.apps.data.models.usage.FolderUsage.record_level')
+        self.mock_usage = self.patch_usage.start()
+
+        self.addCleanup(self.patch_bulk.stop)
+        self.addCleanup(self.patch_root.stop)
+        self.addCleanup(self.patch_existing.stop)
+        self.addCleanup(self.patch_delete.stop)
+        self.addCleanup(self.patch_usage.stop)
+
+    def _stored(self, obj, doc_id, digest=None):
+        from designsafe.libs.elasticsearch.utils import _as_datetime
+        obj_dict = obj.to_dict()
+        return {'id': doc_id,
+                'lastModified': _as_datetime(obj_dict['lastModified']),
+                'length': obj_dict['length'],
+                'childrenDigest': digest}
+
+    def test_digest_ignores_order(self):
+        self.assertEqual(level_digest([self.folder], [self.file]),
+                         level_digest([], [self.file, self.folder]))
+
+    def test_matching_digest_skips_writes_not_children(self):
+        self.mock_root.return_value = MagicMock(
+            childrenDigest=level_digest([self.folder], [self.file]))
+        self.mock_existing.return_value = {
+            '/path/to/folder': self._stored(self.folder, 'ID1', digest='abc'),
+            '/path/to/file.txt': self._stored(self.file, 'ID2')}
+
+        to_walk = incremental_index_level(MagicMock(), '/path/to', [self.folder],
+                                          [self.file], 'test.system',
+                                          es_client=MagicMock())
+        self.assertEqual(to_walk, [self.folder])
+        self.mock_existing.assert_not_called()
+        self.mock_bulk.assert_not_called()
+        self.mock_delete.assert_not_called()
+        self.mock_usage.assert_not_called()
+
+    def test_only_changed_docs_are_written(self):
+        self.mock_root.return_value = MagicMock(childrenDigest='OLD DIGEST')
+        self.mock_root.return_value.meta.id = 'ROOT_ID'
+        stored_file = self._stored(self.file, 'ID2')
+        stored_file['length'] = 5
+        self.mock_existing.return_value = {
+            '/path/to/folder': self._stored(self.folder, 'ID1', digest='abc'),
+            '/path/to/file.txt': stored_file}
+
+        to_walk = incremental_index_level(MagicMock(), '/path/to', [self.folder],
+                                          [self.file], 'test.system',
+                                          update_pems=False,
+                                          es_client=MagicMock())
+
+        actions = list(self.mock_bulk.call_args[0][1])
+        file_id = file_doc_id('test.system', '/path/to/file.txt')
+        self.assertEqual([a['_id'] for a in actions], [file_id, 'ROOT_ID'])
+        self.assertEqual(actions[1]['doc'],
+                         {'childrenDigest': level_digest([self.folder], [self.file])})
+        self.assertEqual(sorted(self.mock_delete.call_args[0][2]), sorted(['ID1', file_id]))
+        self.mock_usage.assert_called_with('test.system', '/path/to',
+                                           [self.folder], [self.file])
+        self.assertEqual(to_walk, [self.folder])
+
+
+class TestParallelWalk(TestCase):
+
+    def setUp(self):
+        def _entry(path, fmt):
+            return {'name': os.path.basename(path) or '.', 'path': path,
+                    'format': fmt, 'system': 'test.system'}
+        self.tree = {
+            '/root': [_entry('/root', 'folder')] +
+                     [_entry('/root/dir{}'.format(i), 'folder') for i in range(3)] +
+                     [_entry('/root/file{}'.format(i), 'raw') for i in range(150)],
+            '/root/dir0': [_entry('/root/dir0/file', 'raw')],
+            '/root/dir1': [],
+            '/root/dir2': [_entry('/root/dir2/sub', 'folder')],
+            '/root/dir2/sub': [_entry('/root/dir2/sub/file', 'raw')]
+        }
+        self.tree['/root'][0]['name'] = '.'
+
+        def _list(systemId, filePath, offset=0, limit=100):
+            return self.tree[filePath][offset:offset + limit]
+        self.client = MagicMock()
+        self.client.files.list.side_effect = _list
+
+    def _levels(self, walker):
+        return {root: sorted(f.path for f in folders + files)
+                for root, folders, files in walker}
+
+    def test_same_levels_as_walk_levels(self):
+        expected = self._levels(walk_levels(self.client, 'test.system', '/root'))
+        levels = self._levels(walk_levels_parallel(self.client, 'test.system', '/root',
+                                                   max_workers=3, prefetch_pages=2))
+        self.assertEqual(levels, expected)
+        self.assertEqual(len(levels['/root']), 153)
+
+    def test_pruning_folders(self):
+        walker = walk_levels_parallel(self.client, 'test.system', '/root')
+        root, folders, files = next(walker)
+        del folders[:]
+        self.assertEqual(list(walker), [])
+
+    def test_local_walk(self):
+        local_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, local_root)
+        os.makedirs(os.path.join(local_root, 'dir'))
+        with open(os.path.join(local_root, 'dir', 'file.txt'), 'w') as _file:
+            _file.write('data')
+        open(os.path.join(local_root, '.hidden'), 'w').close()
+
+        levels = list(walk_levels_local('test.system', '/root', local_root,
+                                        ignore_hidden=True))
+
+        self.assertEqual([level[0] for level in levels], ['/root', '/root/dir'])
+        self.assertEqual([f.path for f in levels[0][1]], ['/root/dir'])
+        self.assertEqual(levels[0][2], [])
+        _file = levels[1][2][0]
+        self.assertEqual(_file.path, '/root/dir/file.txt')
+        self.assertEqual(_file.length, 4)
+        self.assertEqual(_file.format, 'raw')
+        self.assertEqual(_file.mimeType, 'text/plain')
+
+
+class TestAliasRegistry(TestCase):
+
+    def setUp(self):
+        self.patch_connections = patch('designsafe.libs.elasticsearch.aliases.connections')
+        self.mock_connections = self.patch_connections.start()
+        self.es_client = self.mock_connections.get_connection.return_value
+        self.es_client.indices.get_alias.return_value = {
+            'files-2020': {'aliases': {'files': {}}},
+            'cms-2020': {'aliases': {'cms': {}}}}
+        self.patch_cache = patch('designsafe.libs.elasticsearch.aliases.cache')
+        self.mock_cache = self.patch_cache.start()
+        self.mock_cache.get.return_value = None
+        self.addCleanup(self.patch_connections.stop)
+        self.addCleanup(self.patch_cache.stop)
+        self.registry = AliasRegistry(ttl=300, check_interval=0)
+
+    def test_resolves_once(self):
+        self.assertEqual(self.registry.resolve('files', 'cms'),
+                         {'files': 'files-2020', 'cms': 'cms-2020'})
+        self.assertEqual(self.registry.index_name('files'), 'files-2020')
+        self.es_client.indices.get_alias.assert_called_once_with(index='files,cms')
+
+    def test_missing_alias_raises(self):
+        with self.assertRaises(KeyError):
+            self.registry.index_name('missing')
+
+    def test_invalidate(self):
+        self.registry.index_name('files')
+        self.registry.invalidate('files')
+        self.registry.index_name('files')
+        self.assertEqual(self.es_client.indices.get_alias.call_count, 2)
+        self.assertEqual(self.mock_cache.set.call_count, 1)
+
+    def test_other_process_invalidation(self):
+        self.registry.index_name('files')
+        self.mock_cache.get.return_value = 12345.0
+        self.registry.index_name('files')
+        self.assertEqual(self.es_client.indices.get_alias.call_count, 2)
+
+
+
+def _fail_on_part_two(es_client, part, parts):
+    if part == 2:
+        raise RuntimeError('interrupted')
+    return {'docs': 1}
+
+
+class TestMaintenance(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        patcher = override_settings(ES_MAINTENANCE_DIR=self.tmp_dir)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        patcher = patch('designsafe.libs.elasticsearch.maintenance.connections')
+        self.es_client = patcher.start().get_connection.return_value
+        self.addCleanup(patcher.stop)
+
+    def test_repair_path_action(self):
+        hit = {'_index': 'files-1', '_id': 'ID',
+               '_source': {'name': 'file.txt', 'path': 'path/to', 'basePath': '/path'}}
+        action = repair_path_action(hit)
+        self.assertEqual(action['doc'], {'path': '/path/to/file.txt', 'basePath': '/path/to'})
+        hit['_source'].update(path='/path/to/file.txt', basePath='/path/to')
+        self.assertIsNone(repair_path_action(hit))
+
+    def test_rekey_file_action(self):
+        source = {'name': 'file.txt', 'system': 'test.system', 'path': '/path/to/file.txt'}
+        hit = {'_index': 'files-1', '_id': 'RANDOM_ID', '_source': source}
+        doc_id = file_doc_id('test.system', '/path/to/file.txt')
+        self.assertEqual(rekey_file_action(hit), {
+            '_op_type': 'create', '_index': 'files-1', '_id': doc_id, '_source': source})
+        hit['_id'] = doc_id
+        self.assertIsNone(rekey_file_action(hit))
+
+    @patch('designsafe.libs.elasticsearch.maintenance.streaming_bulk')
+    @patch('designsafe.libs.elasticsearch.utils.streaming_bulk')
+    @patch('designsafe.libs.elasticsearch.utils.scan')
+    def test_rekey_slice_deletes_after_create(self, mock_scan, mock_create, mock_delete):
+        def _hit(doc_id, path):
+            return {'_index': 'files-1', '_id': doc_id,
+                    '_source': {'system': 'test.system', 'path': path}}
+        mock_scan.return_value = iter([_hit('A', '/a'), _hit('B', '/b'), _hit('C', '/c'),
+                                       _hit(file_doc_id('test.system', '/d'), '/d')])
+        mock_create.return_value = [
+            (True, {'create': {'status': 201}}),
+            (False, {'create': {'status': 409}}),
+            (False, {'create': {'status': 500}}),
+        ]
+        mock_delete.side_effect = lambda client, actions, **kwargs: [
+            (True, action) for action in actions]
+
+        stats = rekey_slice(self.es_client, 0, 1, 'files')
+
+        self.assertEqual([action['_op_type'] for action in mock_create.call_args[0][1]],
+                         ['create'] * 3)
+        deleted = [action['_id'] for action in mock_delete.call_args[0][1]]
+        self.assertEqual(deleted, ['A', 'B'])
+        self.assertEqual(stats, {'docs': 4, 'written': 2, 'deleted': 2, 'errors': 1})
+
+    @patch('designsafe.libs.elasticsearch.maintenance.streaming_bulk')
+    @patch('designsafe.libs.elasticsearch.maintenance.scan')
+    def test_transform_index_with_action_lists(self, mock_scan, mock_bulk):
+        mock_scan.return_value = iter([{'_index': 'files-1', '_id': 'A', '_source': {}}])
+        mock_bulk.side_effect = lambda client, actions, **kwargs: [
+            (True, action) for action in actions]
+
+        stats = maintenance.transform_index(
+            'test', 'files', lambda hit: [hit, hit], slices=1, workers=1)
+
+        self.assertEqual(stats, {'docs': 1, 'written': 2, 'errors': 0})
+
+    @patch('designsafe.libs.elasticsearch.maintenance.streaming_bulk')
+    @patch('designsafe.libs.elasticsearch.maintenance.scan')
+    def test_transform_index(self, mock_scan, mock_bulk):
+        mock_scan.side_effect = lambda client, query, **kwargs: iter([
+            {'_index': 'files-1', '_id': query['slice']['id'], '_source': {}},
+            {'_index': 'files-1', '_id': 'skip', '_source': {}}])
+        mock_bulk.side_effect = lambda client, actions, **kwargs: [
+            (True, action) for action in actions]
+
+        stats = maintenance.transform_index(
+            'test', 'files', lambda hit: hit if hit['_id'] != 'skip' else None,
+            slices=3, workers=1)
+
+        self.assertEqual(stats, {'docs': 6, 'written': 3, 'errors': 0})
+        self.assertEqual(sorted(call[1]['query']['slice']['id']
+                                for call in mock_scan.call_args_list), [0, 1, 2])
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_resume(self):
+        with self.assertRaises(RuntimeError):
+            maintenance.run_parts('test', _fail_on_part_two, 4, workers=1)
+        self.assertEqual(
+            sorted(maintenance.load_checkpoint(maintenance.checkpoint_path('test', 4))),
+            [0, 1])
+
+        func = MagicMock(return_value={'docs': 1})
+        stats = maintenance.run_parts('test', func, 4, workers=1)
+        self.assertEqual([call[0][1] for call in func.call_args_list], [2, 3])
+        self.assertEqual(stats, {'docs': 4})
+
+    @patch('designsafe.apps.data.models.usage.FolderUsage.replace_all')
+    @patch('designsafe.libs.elasticsearch.utils.scan')
+    def test_rebuild_usage(self, mock_scan, mock_replace):
+        def _hit(path, fmt='raw', length=0):
+            return {'_source': {'system': 'test.system', 'path': path,
+                                'format': fmt, 'length': length}}
+        mock_scan.side_effect = lambda client, query, **kwargs: iter({
+            0: [_hit('/ds_user/a.txt', length=10), _hit('/ds_user/empty', 'folder')],
+            1: [_hit('ds_user/b.txt', length=5)],
+        }[query['slice']['id']])
+        mock_replace.return_value = 3
+
+        stats = rebuild_usage(workers=1, slices=2)
+
+        self.assertEqual(stats, {'docs': 3, 'rows': 3})
+        mock_replace.assert_called_with({
+            ('test.system', '/ds_user'): [15, 2],
+            ('test.system', '/ds_user/empty'): [0, 0]})
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    @patch('designsafe.libs.elasticsearch.maintenance.streaming_bulk')
+    def test_dedup_partition(self, mock_bulk):
+        def _hits(*ids):
+            return {'hits': {'hits': [{'_index': 'files-1', '_id': _id} for _id in ids]}}
+        after_key = {'system': 'test.system', 'path': '/path/to/file.txt'}
+        self.es_client.search.side_effect = [
+            {'aggregations': {'pairs': {'after_key': after_key, 'buckets': [
+                {'key': {'system': 'test.system', 'path': '/path/to'},
+                 'doc_count': 1, 'docs': _hits('D')},
+                {'key': after_key, 'doc_count': 4, 'docs': _hits('A', 'B', 'C')},
+            ]}}},
+            {'aggregations': {'pairs': {'buckets': []}}},
+        ]
+        self.es_client.delete_by_query.return_value = {'deleted': 1, 'failures': []}
+        self.es_client.exists.return_value = False
+        mock_bulk.side_effect = lambda client, actions, **kwargs: [
+            (True, action) for action in actions]
+
+        stats = maintenance.dedup_partition(self.es_client, 1, 8, 'files')
+
+        self.assertEqual(stats, {'groups': 1, 'written': 3, 'errors': 0})
+        self.assertEqual([action['_id'] for action in mock_bulk.call_args_list[0][0][1]],
+                         ['B', 'C'])
+        bodies = [c[1]['body'] for c in self.es_client.search.call_args_list]
+        script = bodies[0]['query']['bool']['filter'][0]['script']['script']
+        self.assertEqual(script['params'], {'part': 1, 'parts': 8})
+        self.assertEqual(bodies[1]['aggs']['pairs']['composite']['after'], after_key)
+        query = self.es_client.delete_by_query.call_args[1]['body']['query']['bool']
+        self.assertEqual(query['must_not'], [{'ids': {'values': ['A', 'B', 'C']}}])
+
+    @patch('designsafe.libs.elasticsearch.maintenance.streaming_bulk')
+    def test_dedup_partition_keeps_canonical_doc(self, mock_bulk):
+        canonical = file_doc_id('test.system', '/path/to/file.txt')
+        key = {'system': 'test.system', 'path': '/path/to/file.txt'}
+        self.es_client.search.side_effect = [
+            {'aggregations': {'pairs': {'buckets': [
+                {'key': key, 'doc_count': 3, 'docs': {'hits': {'hits': [
+                    {'_index': 'files-1', '_id': _id}
+                    for _id in ('A', canonical, 'B')]}}},
+                {'key': dict(key, path='/path/to/other.txt'), 'doc_count': 3,
+                 'docs': {'hits': {'hits': [
+                     {'_index': 'files-1', '_id': _id} for _id in ('C', 'D')]}}},
+            ]}}},
+        ]
+        self.es_client.exists.return_value = True
+        self.es_client.delete_by_query.return_value = {'deleted': 1, 'failures': []}
+        mock_bulk.side_effect = lambda client, actions, **kwargs: [
+            (True, action) for action in actions]
+
+        stats = maintenance.dedup_partition(self.es_client, 0, 1, 'files')
+
+        self.assertEqual(stats, {'groups': 2, 'written': 5, 'errors': 0})
+        self.assertEqual([action['_id'] for action in mock_bulk.call_args[0][1]],
+                         ['A', 'B', 'C', 'D'])
+        # The canonical doc of the second pair was beyond the top hits.
+        other = file_doc_id('test.system', '/path/to/other.txt')
+        self.es_client.exists.assert_called_once_with(index='files', id=other)
+        query = self.es_client.delete_by_query.call_args[1]['body']['query']['bool']
+        self.assertEqual(query['must_not'], [{'ids': {'values': [other, 'C', 'D']}}])
+
+
+
+class TestOnlineReindex(TestCase):
+
+    def setUp(self):
+        patcher = patch('designsafe.libs.elasticsearch.dual_writes.redis_connection')
+        self.redis = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.registry = dual_writes.DualWrites(check_interval=60)
+        patcher = patch('designsafe.libs.elasticsearch.dual_writes.registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('designsafe.libs.elasticsearch.dual_writes.streaming_bulk')
+    def test_mirrored_bulk(self, mock_bulk):
+        self.redis.get.side_effect = lambda key: b'files-new' if key.endswith(':files') else None
+        actions = [
+            {'_op_type': 'index', '_index': 'files', '_id': 'A', '_source': {}},
+            {'_op_type': 'update', '_index': 'files', '_id': 'B', 'doc': {'x': 1}},
+            {'_op_type': 'index', '_index': 'other', '_id': 'C', '_source': {}},
+            {'_op_type': 'index', '_index': 'files', '_id': 'D', '_source': {}},
+        ]
+        results = [
+            (True, {'index': {'_id': 'A', '_version': 3, 'status': 200}}),
+            (True, {'update': {'_id': 'B', '_version': 2, 'status': 200}}),
+            (True, {'index': {'_id': 'C', '_version': 1, 'status': 201}}),
+            (False, {'index': {'_id': 'D', 'status': 400}}),
+        ]
+        written = []
+
+        def _bulk(client, bulk_actions, **kwargs):
+            bulk_actions = list(bulk_actions)
+            if bulk_actions[0]['_index'] == 'files-new':
+                written.extend(bulk_actions)
+                return []
+            # Nothing is journaled before the writes are acknowledged.
+            self.redis.sadd.assert_not_called()
+            return results
+        mock_bulk.side_effect = _bulk
+        es_client = MagicMock()
+        es_client.mget.return_value = {'docs': [
+            {'_id': 'B', 'found': True, '_version': 2, '_source': {'x': 1, 'y': 2}}]}
+
+        self.assertEqual(list(dual_writes.mirrored_bulk(es_client, iter(actions))), results)
+
+        self.assertEqual(written, [
+            {'_op_type': 'index', '_index': 'files-new', '_id': 'A', '_source': {},
+             'version': 3, 'version_type': 'external_gte'},
+            {'_op_type': 'index', '_index': 'files-new', '_id': 'B',
+             '_source': {'x': 1, 'y': 2}, 'version': 2, 'version_type': 'external_gte'}])
+        es_client.mget.assert_called_once_with(index='files', body={'ids': ['B']})
+        self.redis.sadd.assert_called_once_with('es_dual_write:files:ids', 'A', 'B')
+        # Targets are looked up once per check interval.
+        self.assertEqual(self.redis.get.call_count, 2)
+
+    def test_delete_by_query_journals_after_delete(self):
+        self.redis.get.return_value = b'files-new'
+        es_client = MagicMock()
+        es_client.delete_by_query.side_effect = \
+            lambda **kwargs: self.redis.sadd.assert_not_called()
+        with patch('elasticsearch.helpers.scan') as mock_scan:
+            mock_scan.return_value = [{'_id': 'A'}, {'_id': 'B'}]
+            dual_writes.delete_by_query(es_client, 'files', {'match_all': {}})
+
+        self.assertEqual([c[1]['index'] for c in es_client.delete_by_query.call_args_list],
+                         ['files', 'files-new'])
+        self.redis.sadd.assert_called_once_with('es_dual_write:files:ids', 'A', 'B')
+
+    def test_no_mirror_without_dual_writes(self):
+        self.redis.get.return_value = None
+        es_client = MagicMock()
+        dual_writes.mirror_index('files', 'A', {}, es_client=es_client)
+        es_client.index.assert_not_called()
+        self.redis.sadd.assert_not_called()
+
+    @patch('designsafe.libs.elasticsearch.reindex.time.sleep')
+    def test_wait_for_task(self, mock_sleep):
+        es_client = MagicMock()
+        es_client.tasks.get.side_effect = [
+            {'completed': False, 'task': {'status': {'created': 1, 'total': 2}}},
+            {'completed': True, 'task': {'status': {'created': 2, 'total': 2}},
+             'response': {'created': 2, 'failures': []}},
+        ]
+        self.assertEqual(wait_for_task(es_client, 'node:1', poll_interval=3)['created'], 2)
+        mock_sleep.assert_called_once_with(3)
+
+        es_client.tasks.get.side_effect = [
+            {'completed': True, 'task': {}, 'response': {'failures': [{'id': 'A'}]}}]
+        with self.assertRaises(ReindexError):
+            wait_for_task(es_client, 'node:1')
+
+    @patch('designsafe.libs.elasticsearch.reindex.streaming_bulk')
+    def test_catch_up(self, mock_bulk):
+        self.redis.spop.side_effect = [[b'A', b'B'], []]
+        es_client = MagicMock()
+        es_client.mget.return_value = {'docs': [
+            {'_id': 'A', 'found': True, '_version': 4, '_source': {'name': 'a'}},
+            {'_id': 'B', 'found': False}]}
+        mock_bulk.return_value = []
+
+        self.assertEqual(catch_up(es_client, 'files', 'files-new'), 2)
+        es_client.mget.assert_called_once_with(index='files', body={'ids': ['A', 'B']})
+        self.assertEqual(mock_bulk.call_args[0][1], [
+            {'_op_type': 'index', '_index': 'files-new', '_id': 'A', '_source': {'name': 'a'},
+             'version': 4, 'version_type': 'external_gte'},
+            {'_op_type': 'delete', '_index': 'files-new', '_id': 'B'}])
+
+    @patch('designsafe.libs.elasticsearch.reindex.time.sleep')
+    @patch('designsafe.libs.elasticsearch.reindex.invalidate_aliases')
+    @patch('designsafe.libs.elasticsearch.reindex.alias_registry')
+    @patch('designsafe.libs.elasticsearch.indices.setup_index')
+    def test_online_reindex(self, mock_setup, mock_aliases, mock_invalidate, mock_sleep):
+        mock_aliases.resolve.return_value = {'designsafe-dev-files': 'files-old',
+                                             'designsafe-dev-files-reindex': 'files-new'}
+        self.redis.spop.return_value = []
+        es_client = MagicMock()
+        es_client.reindex.return_value = {'task': 'node:1'}
+        es_client.tasks.get.return_value = {'completed': True, 'task': {},
+                                            'response': {'created': 5}}
+
+        result = online_reindex('files', requests_per_second=100, es_client=es_client)
+
+        self.assertEqual(result, {'task': {'created': 5}, 'catch_up': 0})
+        self.redis.set.assert_called_with('es_dual_write:designsafe-dev-files', 'files-new')
+        self.assertEqual(es_client.reindex.call_args[1]['body']['dest'],
+                         {'index': 'files-new', 'op_type': 'create'})
+        self.assertEqual(es_client.reindex.call_args[1]['slices'], 'auto')
+        self.assertEqual(es_client.reindex.call_args[1]['requests_per_second'], 100)
+        actions = es_client.indices.update_aliases.call_args[1]['body']['actions']
+        self.assertIn({'add': {'index': 'files-new', 'alias': 'designsafe-dev-files'}}, actions)
+        self.redis.delete.assert_called_with('es_dual_write:designsafe-dev-files',
+                                             'es_dual_write:designsafe-dev-files:ids')
+
+    def test_online_reindex_refuses_index_without_dual_writes(self):
+        es_client = MagicMock()
+        with self.assertRaises(ReindexError):
+            online_reindex('projects', es_client=es_client)
+        es_client.reindex.assert_not_called()
+        self.redis.set.assert_not_called()
+
+
+class TestCursorPagination(TestCase):
+
+    def test_cursor_round_trip(self):
+        token = encode_cursor(['/user/dir/a.txt', 'a.txt'])
+        self.assertNotIn('=', token)
+        self.assertEqual(decode_cursor(token), ['/user/dir/a.txt', 'a.txt'])
+        self.assertIsNone(encode_cursor([]))
+
+    def test_decode_invalid_cursor(self):
+        for token in ['not a cursor', encode_cursor(['x'])[:-2], 'e30']:
+            with self.assertRaises(ValueError):
+                decode_cursor(token)
+
+    def test_paginate(self):
+        search = Search().sort('path._exact', 'name._exact')
+        self.assertEqual(paginate(search, offset=200, limit=100).to_dict()['from'], 200)
+
+        body = paginate(search, offset=200, limit=100,
+                        cursor=encode_cursor(['/a', 'a'])).to_dict()
+        self.assertEqual(body['search_after'], ['/a', 'a'])
+        self.assertEqual(body['size'], 100)
+        self.assertNotIn('from', body)
+
+    def test_next_cursor(self):
+        res = MagicMock()
+        res.hits.hits = [{'sort': ['/a', 'a']}, {'sort': ['/b', 'b']}]
+        self.assertEqual(decode_cursor(next_cursor(res, 2)), ['/b', 'b'])
+        self.assertIsNone(next_cursor(res, 3))
+        res.hits.hits = []
+        self.assertIsNone(next_cursor(res, 2))
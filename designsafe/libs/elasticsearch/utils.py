@@ -1,9 +1,23 @@
 from future.utils import python_2_unicode_compatible
 import urllib.request, urllib.parse, urllib.error
 import logging
+import json
+import base64
+import binascii
 import os 
+import re
+import hashlib
+import mimetypes
+import datetime
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dateutil import parser as date_parser
 
 from django.conf import settings
+from elasticsearch_dsl.connections import connections
+from elasticsearch_dsl.query import Q
+from elasticsearch.helpers import scan, streaming_bulk
+from designsafe.libs.elasticsearch.dual_writes import mirrored_bulk, delete_by_query
 
 logger = logging.getLogger(__name__)
 
@@ -41,7 +55,6 @@ def walk_levels(client, system, path, bottom_up=False, ignore_hidden=False, path
     ...         del folders[:]
 
     """
-    from designsafe.apps.data.models.agave.files import BaseFileResource
     listing = []
     offset = 0
     page = client.files.list(systemId=system,
@@ -54,18 +67,9 @@ def walk_levels(client, system, path, bottom_up=False, ignore_hidden=False, path
                                  filePath=urllib.parse.quote(path),
                                  offset=offset)
 
-    folders = []
-    files = []
-    for json_file in listing:
-        if json_file['name'] == '.':
-            continue
-        if (ignore_hidden and json_file['name'][0] == '.') or (json_file['name'] in paths_to_ignore):
-            continue
-        _file = BaseFileResource(client, **json_file)
-        if _file.format == 'folder':
-            folders.append(_file)
-        else:
-            files.append(_file)
+    folders, files = _split_listing(client, listing,
+                                    ignore_hidden=ignore_hidden,
+                                    paths_to_ignore=paths_to_ignore)
     if not bottom_up:
         yield (path, folders, files)
     for child in folders:
@@ -84,34 +88,600 @@ def walk_levels(client, system, path, bottom_up=False, ignore_hidden=False, path
     if bottom_up:
         yield (path, folders, files)
 
+def _split_listing(client, listing, ignore_hidden=False, paths_to_ignore=[]):
+    """Split a raw listing into ``BaseFileResource`` folders and files."""
+    from designsafe.apps.data.models.agave.files import BaseFileResource
+    folders = []
+    files = []
+    for json_file in listing:
+        if json_file['name'] == '.':
+            continue
+        if (ignore_hidden and json_file['name'][0] == '.') or (json_file['name'] in paths_to_ignore):
+            continue
+        _file = BaseFileResource(client, **json_file)
+        if _file.format == 'folder':
+            folders.append(_file)
+        else:
+            files.append(_file)
+    return folders, files
+
+# pylint: disable=too-many-locals,too-many-branches
+@python_2_unicode_compatible
+def walk_levels_parallel(client, system, path, ignore_hidden=False,
+                         paths_to_ignore=[], max_workers=8, prefetch_pages=4,
+                         page_size=100):
+    """Walk a path in an Agave storage system listing folders concurrently.
+
+    Yields the same ``(root, folders, files)`` tuples as :func:`walk_levels`
+    but keeps up to ``max_workers`` ``files.list`` requests in flight at
+    once: sibling folders are listed in parallel and up to
+    ``prefetch_pages`` successive pages of each folder are requested ahead
+    of knowing whether they exist.
+
+    Levels are yielded as soon as their listing is complete, so the order
+    is roughly breadth-first rather than depth-first and ``bottom_up`` is
+    not supported. Modifying ``folders`` inplace still prunes the walk.
+    No new request is sent while the caller is processing a level, which
+    bounds the number of listings held in memory.
+
+    :param int max_workers: Maximum concurrent requests to the files API.
+    :param int prefetch_pages: Pages requested ahead for each folder.
+    :param int page_size: Entries per ``files.list`` page.
+    """
+    pending = {}
+    queue = deque([path])
+    states = {}
+
+    def _fetch(folder_path, offset):
+        return client.files.list(systemId=system,
+                                 filePath=urllib.parse.quote(folder_path),
+                                 offset=offset,
+                                 limit=page_size)
+
+    def _schedule(executor):
+        for folder_path in list(queue):
+            state = states.setdefault(folder_path, {'pages': {}, 'next': 0,
+                                                    'end': None})
+            while len(pending) < max_workers and \
+                    (state['end'] is None or state['next'] <= state['end']) and \
+                    state['next'] < (len(state['pages']) + prefetch_pages) * page_size:
+                future = executor.submit(_fetch, folder_path, state['next'])
+                pending[future] = (folder_path, state['next'])
+                state['next'] += page_size
+            if len(pending) >= max_workers:
+                return
+
+    def _complete(folder_path):
+        state = states[folder_path]
+        if state['end'] is None:
+            return False
+        return all(offset in state['pages']
+                   for offset in range(0, state['end'] + 1, page_size))
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        _schedule(executor)
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            finished = []
+            for future in done:
+                folder_path, offset = pending.pop(future)
+                page = future.result()
+                state = states.get(folder_path)
+                if state is None:
+                    # Prefetched page past the end of a level already yielded.
+                    continue
+                state['pages'][offset] = page
+                if len(page) < page_size and \
+                        (state['end'] is None or offset < state['end']):
+                    state['end'] = offset
+                if _complete(folder_path) and folder_path in queue:
+                    queue.remove(folder_path)
+                    finished.append(folder_path)
+            _schedule(executor)
+            for folder_path in finished:
+                state = states.pop(folder_path)
+                listing = []
+                for offset in range(0, state['end'] + 1, page_size):
+                    listing += state['pages'][offset]
+                folders, files = _split_listing(client, listing,
+                                                ignore_hidden=ignore_hidden,
+                                                paths_to_ignore=paths_to_ignore)
+                yield (folder_path, folders, files)
+                queue.extend(child.path for child in folders)
+            _schedule(executor)
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+# pylint: enable=too-many-locals,too-many-branches
+
+def mounted_path(system, path='/'):
+    """Return the local POSIX path for ``path`` in an Agave storage system.
+
+    Uses :attr:`AgaveFileManager.SYSTEM_ID_PATHS` to map a system id to its
+    corral mount. Returns ``None`` if the system is not mapped or the path
+    is not mounted on this host.
+    """
+    from designsafe.apps.api.agave.filemanager.agave import AgaveFileManager
+    base_path = AgaveFileManager(None).base_mounted_path(system)
+    if base_path is None:
+        return None
+    if re.search(r'^project\-', system):
+        base_path = os.path.join(base_path, system.replace('project-', '', 1))
+    local_path = os.path.join(base_path, path.strip('/'))
+    if not os.path.isdir(local_path):
+        return None
+    return local_path
+
+def _local_file_dict(system, path, entry):
+    stat = entry.stat(follow_symlinks=False)
+    last_modified = datetime.datetime.fromtimestamp(stat.st_mtime).astimezone()
+    # Agave reports timestamps with millisecond precision.
+    last_modified = last_modified.replace(
+        microsecond=last_modified.microsecond // 1000 * 1000)
+    is_dir = entry.is_dir(follow_symlinks=False)
+    return {
+        'name': entry.name,
+        'path': '/' + os.path.join(path, entry.name).strip('/'),
+        'system': system,
+        'format': 'folder' if is_dir else 'raw',
+        'type': 'dir' if is_dir else 'file',
+        'mimeType': 'text/directory' if is_dir else \
+            mimetypes.guess_type(entry.name)[0] or 'application/octet-stream',
+        'length': stat.st_size,
+        'lastModified': last_modified.isoformat()
+    }
+
+@python_2_unicode_compatible
+def walk_levels_local(system, path, local_root, ignore_hidden=False,
+                      paths_to_ignore=[], client=None):
+    """Walk a mounted storage system with :func:`os.scandir`.
+
+    Yields the same ``(root, folders, files)`` tuples as :func:`walk_levels`
+    with ``BaseFileResource`` objects shaped like an Agave listing, without
+    going through the Agave files API.
+
+    :param str local_root: Local path ``path`` is mounted at, see
+        :func:`mounted_path`.
+    """
+    levels = deque([(path, local_root)])
+    while levels:
+        level_path, local_path = levels.popleft()
+        try:
+            with os.scandir(local_path) as entries:
+                listing = [_local_file_dict(system, level_path, entry)
+                           for entry in entries]
+        except OSError as exc:
+            logger.warning('Unable to list %s: %s', local_path, exc)
+            continue
+        folders, files = _split_listing(client, listing,
+                                        ignore_hidden=ignore_hidden,
+                                        paths_to_ignore=paths_to_ignore)
+        yield (level_path, folders, files)
+        levels.extend((child.path, os.path.join(local_path, child.name))
+                      for child in folders)
+
+@python_2_unicode_compatible
+def walk_levels_fast(client, system, path, ignore_hidden=False,
+                     paths_to_ignore=[], use_mounts=True, **kwargs):
+    """Walk a storage system the fastest way available on this host.
+
+    Uses :func:`walk_levels_local` when the system is mounted locally and
+    :func:`walk_levels_parallel` otherwise. Extra ``kwargs`` are passed to
+    :func:`walk_levels_parallel`.
+    """
+    local_root = mounted_path(system, path) if use_mounts else None
+    if local_root is not None:
+        return walk_levels_local(system, path, local_root,
+                                 ignore_hidden=ignore_hidden,
+                                 paths_to_ignore=paths_to_ignore,
+                                 client=client)
+    return walk_levels_parallel(client, system, path,
+                                ignore_hidden=ignore_hidden,
+                                paths_to_ignore=paths_to_ignore, **kwargs)
+
 @python_2_unicode_compatible
 def index_level(client, path, folders, files, systemId, username, reindex=False, update_pems=True):
     """
     Index a set of folders and files corresponding to the output from one 
     iteration of walk_levels
     """
+    from designsafe.apps.data.models.elasticsearch import IndexedFile
+    from designsafe.apps.data.models.usage import FolderUsage
     from designsafe.libs.elasticsearch.docs.files import BaseESFile
-    for obj in folders + files:
-            obj_dict = obj.to_dict()
-            obj_dict.pop('permissions')
-            obj_dict.pop('trail')
-            obj_dict.pop('_links')
-            obj_dict['basePath'] = os.path.dirname(obj.path)
-            doc = BaseESFile(username, reindex=reindex, **obj_dict)
+    stored = IndexedFile.from_paths(systemId, [obj.path for obj in folders + files])
+    for obj, wrapped in zip(folders + files, stored):
+            obj_dict = file_doc_dict(obj)
+            if wrapped is None:
+                wrapped = IndexedFile(**obj_dict)
+            doc = BaseESFile(username, wrapped_doc=wrapped, reindex=reindex)
             
             saved = doc.save()
             
             if update_pems:
                 permissions = client.files.listPermissions(systemId=systemId, filePath=obj.path)
                 for pem in permissions:
-                    pem.pop('_links')
+                    pem.pop('_links', None)
                 doc.update(**{'permissions': permissions})
 
     children_paths = [_file.path for _file in folders + files]
     es_root = BaseESFile(username, systemId, path, reindex=reindex)
-    for doc in es_root.children():
+    for doc in es_root.children(fields=IndexedFile.DELETE_FIELDS):
         if doc is not None and doc.path not in children_paths and doc.path != path:
             doc.delete()
+    FolderUsage.record_level(systemId, path, folders, files)
+
+def file_doc_dict(obj, permissions=None):
+    """Return the ``IndexedFile`` body for a ``BaseFileResource``.
+
+    :param obj: File from an Agave listing.
+    :param list permissions: Permissions as returned by
+        ``client.files.listPermissions``. Omitted from the body when ``None``.
+    """
+    obj_dict = dict(obj.to_dict())
+    obj_dict.pop('permissions', None)
+    obj_dict.pop('trail', None)
+    obj_dict.pop('_links', None)
+    obj_dict['basePath'] = os.path.dirname(obj.path)
+    if permissions is not None:
+        for pem in permissions:
+            pem.pop('_links', None)
+        obj_dict['permissions'] = permissions
+    return obj_dict
+
+def _level_search(system, path):
+    """Search for every document directly under ``path``."""
+    from designsafe.apps.data.models.elasticsearch import IndexedFile
+    search = IndexedFile.search()
+    search = search.filter('term', **{'basePath._exact': path})
+    search = search.filter('term', **{'system._exact': system})
+    return search
+
+def file_doc_id(system, path):
+    """Return the id of the document of ``path`` on ``system``.
+
+    Ids are derived from the system and the normalized path, so a file has
+    a single document that can be fetched with a realtime GET.
+    """
+    key = '{}:/{}'.format(system, path.strip('/'))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def level_actions(client, path, folders, files, systemId, update_pems=True):
+    """Yield bulk ``index`` actions for one iteration of ``walk_levels``.
+
+    Documents are written under :func:`file_doc_id`, existing ones are
+    overwritten in place.
+    """
+    files_alias = settings.ES_INDICES['files']['alias']
+    for obj in folders + files:
+        permissions = None
+        if update_pems:
+            permissions = client.files.listPermissions(systemId=systemId,
+                                                       filePath=obj.path)
+        yield {
+            '_op_type': 'index',
+            '_index': files_alias,
+            '_id': file_doc_id(systemId, obj.path),
+            '_source': file_doc_dict(obj, permissions)
+        }
+
+def delete_stale_children(system, path, keep_ids, es_client=None):
+    """Delete documents under ``path`` that were not written in this pass.
+
+    Documents directly under ``path`` whose id is not in ``keep_ids`` (stale
+    entries and duplicates) are removed together with the subtrees of any
+    stale folders with a single ``delete_by_query``.
+    """
+    es_client = es_client or connections.get_connection()
+    files_alias = settings.ES_INDICES['files']['alias']
+    keep_ids = list(keep_ids)
+    stale_search = _level_search(system, path).exclude('ids', values=keep_ids)
+
+    live_paths = set()
+    if keep_ids:
+        live_search = _level_search(system, path).filter('ids', values=keep_ids)
+        live_paths = {hit.path for hit in live_search.source(['path']).scan()}
+    stale_folders = set()
+    for hit in stale_search.source(['path', 'format']).scan():
+        if hit.format == 'folder' and hit.path not in live_paths \
+                and hit.path != path:
+            stale_folders.add(hit.path)
+
+    stale_query = stale_search.to_dict()['query']
+    if stale_folders:
+        subtree_query = Q('term', **{'system._exact': system}) & \
+            Q('terms', **{'path._path': sorted(stale_folders)})
+        stale_query = (Q(stale_query) | subtree_query).to_dict()
+
+    return delete_by_query(es_client, files_alias, stale_query)
+
+@python_2_unicode_compatible
+def bulk_index_levels(client, levels, systemId, update_pems=True,
+                      chunk_size=None, es_client=None):
+    """Index one or more iterations of ``walk_levels`` with the bulk API.
+
+    Documents for every level are sent through
+    :func:`elasticsearch.helpers.streaming_bulk` in chunks of
+    ``chunk_size`` instead of one request per file, then stale children of
+    each level are removed with :func:`delete_stale_children`. Usage
+    rollups are updated per level, see
+    :meth:`designsafe.apps.data.models.usage.FolderUsage.record_level`.
+
+    :param client: Agave client used to list permissions.
+    :param levels: Iterable of ``(path, folders, files)`` tuples.
+    :param str systemId: Agave storage system id.
+    :param bool update_pems: Fetch and index permissions for each file.
+    :param int chunk_size: Documents per bulk request. Defaults to
+        ``settings.ES_BULK_CHUNK_SIZE``.
+    :returns: Number of documents indexed.
+    :rtype: int
+    """
+    from designsafe.apps.data.models.usage import FolderUsage
+    es_client = es_client or connections.get_connection()
+    chunk_size = chunk_size or getattr(settings, 'ES_BULK_CHUNK_SIZE', 500)
+    written = {}
+
+    def _actions():
+        for path, folders, files in levels:
+            level_ids = written.setdefault(path, [])
+            for action in level_actions(client, path, folders, files, systemId,
+                                        update_pems=update_pems):
+                level_ids.append(action['_id'])
+                yield action
+            FolderUsage.record_level(systemId, path, folders, files)
+
+    indexed = 0
+    for ok, item in mirrored_bulk(es_client, _actions(),
+                                  chunk_size=chunk_size,
+                                  raise_on_error=False):
+        if ok:
+            indexed += 1
+        else:
+            logger.error('Bulk indexing error: %s', item)
+
+    for path, level_ids in written.items():
+        delete_stale_children(systemId, path, level_ids, es_client=es_client)
+    return indexed
+
+@python_2_unicode_compatible
+def bulk_index_level(client, path, folders, files, systemId,
+                     update_pems=True, chunk_size=None, es_client=None):
+    """Bulk counterpart of :func:`index_level` for a single level."""
+    return bulk_index_levels(client, [(path, folders, files)], systemId,
+                             update_pems=update_pems, chunk_size=chunk_size,
+                             es_client=es_client)
+
+def _as_datetime(value):
+    if isinstance(value, str):
+        return date_parser.parse(value)
+    return value
+
+def level_digest(folders, files):
+    """Return a digest of the name, ``lastModified`` and ``length`` of every
+    entry in a level, independent of listing order."""
+    entries = []
+    for obj in folders + files:
+        obj_dict = obj.to_dict()
+        entries.append('{}|{}|{}'.format(obj_dict.get('name'),
+                                         _as_datetime(obj_dict.get('lastModified')),
+                                         obj_dict.get('length')))
+    return hashlib.sha1('\n'.join(sorted(entries)).encode('utf-8')).hexdigest()
+
+def existing_level_docs(system, path):
+    """Map the path of each document directly under ``path`` to its stored
+    id, ``lastModified``, ``length`` and ``childrenDigest``."""
+    docs = {}
+    search = _level_search(system, path).source(
+        ['path', 'lastModified', 'length', 'childrenDigest'])
+    for hit in search.scan():
+        docs.setdefault(hit.path, {
+            'id': hit.meta.id,
+            'lastModified': _as_datetime(hit.lastModified),
+            'length': hit.length,
+            'childrenDigest': hit.childrenDigest
+        })
+    return docs
+
+def _root_doc(system, path):
+    from designsafe.apps.data.models.elasticsearch import IndexedFile
+    search = IndexedFile.search()
+    search = search.filter('term', **{'path._exact': path})
+    search = search.filter('term', **{'system._exact': system})
+    search = search.source(['childrenDigest']).extra(size=1)
+    res = search.execute()
+    if not res.hits:
+        return None
+    return res.hits[0]
+
+def _is_unchanged(obj, stored):
+    obj_dict = obj.to_dict()
+    return stored is not None and \
+        _as_datetime(obj_dict.get('lastModified')) == stored['lastModified'] and \
+        obj_dict.get('length') == stored['length']
+
+@python_2_unicode_compatible
+def incremental_index_level(client, path, folders, files, systemId,
+                            update_pems=True, chunk_size=None, es_client=None):
+    """Index only the entries of a level that changed since the last pass.
+
+    Entries whose ``lastModified`` and ``length`` match the stored document
+    are left alone (including their permissions). A digest of the level is
+    stored on the folder's own document as ``childrenDigest``; when it
+    matches, nothing is written for this level.
+
+    :returns: Child folders to walk. The digest only covers the entries
+        directly under ``path``, so every child folder is returned and
+        changes further down are found when their own level is compared.
+    :rtype: list
+    """
+    from designsafe.apps.data.models.usage import FolderUsage
+    es_client = es_client or connections.get_connection()
+    chunk_size = chunk_size or getattr(settings, 'ES_BULK_CHUNK_SIZE', 500)
+    files_alias = settings.ES_INDICES['files']['alias']
+    digest = level_digest(folders, files)
+    root = _root_doc(systemId, path)
+    if root is not None and root.childrenDigest == digest:
+        return folders
+
+    existing = existing_level_docs(systemId, path)
+    changed_folders = [obj for obj in folders
+                       if not _is_unchanged(obj, existing.get(obj.path))]
+    changed_files = [obj for obj in files
+                     if not _is_unchanged(obj, existing.get(obj.path))]
+    changed_paths = {obj.path for obj in changed_folders + changed_files}
+    actions = list(level_actions(client, path, changed_folders, changed_files,
+                                 systemId, update_pems=update_pems))
+    if root is not None:
+        actions.append({
+            '_op_type': 'update',
+            '_index': files_alias,
+            '_id': root.meta.id,
+            'doc': {'childrenDigest': digest}
+        })
+    for ok, item in mirrored_bulk(es_client, actions,
+                                  chunk_size=chunk_size, raise_on_error=False):
+        if not ok:
+            logger.error('Bulk indexing error: %s', item)
+
+    keep_ids = [action['_id'] for action in actions
+                if action['_op_type'] == 'index']
+    keep_ids += [existing[obj.path]['id'] for obj in folders + files
+                 if obj.path not in changed_paths]
+    delete_stale_children(systemId, path, keep_ids, es_client=es_client)
+    FolderUsage.record_level(systemId, path, folders, files)
+
+    return folders
+
+def encode_cursor(sort_values):
+    """Return an opaque, URL safe token for ``search_after`` sort values."""
+    if not sort_values:
+        return None
+    data = json.dumps(list(sort_values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    """Return the ``search_after`` sort values of a cursor token.
+
+    :raises ValueError: If the token was not made by :func:`encode_cursor`.
+    """
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(data.decode('utf-8'))
+    except (TypeError, ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValueError('Invalid cursor {}'.format(token))
+    if not isinstance(values, list) or not values:
+        raise ValueError('Invalid cursor {}'.format(token))
+    return values
+
+def paginate(search, offset=None, limit=None, cursor=None):
+    """Return ``search`` limited to one page.
+
+    A page after ``cursor`` uses ``search_after`` and does not depend on
+    how deep it is; ``offset`` is only used without a cursor. ``search``
+    must be sorted on unique values so pages do not overlap.
+
+    :raises ValueError: If ``cursor`` is not a valid token.
+    """
+    search = search.extra(size=limit or 100)
+    if cursor:
+        return search.extra(search_after=decode_cursor(cursor))
+    return search.extra(from_=offset or 0)
+
+def next_cursor(res, limit=None):
+    """Return the cursor of the page after ``res``, or ``None`` if it is the last."""
+    hits = res.hits.hits
+    if not hits or len(hits) < (limit or 100):
+        return None
+    return encode_cursor(hits[-1]['sort'])
+
+def project_doc_dict(meta):
+    """Return the ``IndexedProject`` source for a project metadata record."""
+    doc = {key: value for key, value in meta.items() if key != '_links'}
+    doc['value'] = {key: value for key, value in meta['value'].items()
+                    if key != 'teamMember'}
+    if not isinstance(doc['value'].get('awardNumber', []), list):
+        doc['value']['awardNumber'] = [{'number': doc['value']['awardNumber']}]
+    if doc['value'].get('guestMembers', []) == [None]:
+        doc['value']['guestMembers'] = []
+    return doc
+
+def iter_project_metadata(client, page_size=100):
+    """Yield every ``designsafe.project`` metadata record, one page at a time."""
+    query = json.dumps({'name': 'designsafe.project'})
+    offset = 0
+    while True:
+        listing = client.meta.listMetadata(q=query, offset=offset, limit=page_size)
+        if not listing:
+            return
+        for meta in listing:
+            yield meta
+        offset += page_size
+
+def index_project(meta, es_client=None):
+    """Index one project under its UUID and drop older copies of it.
+
+    Projects used to be indexed under random ids, so a project could have
+    several documents. Those are removed once the UUID keyed one exists.
+    """
+    es_client = es_client or connections.get_connection()
+    projects_alias = settings.ES_INDICES['projects']['alias']
+    es_client.index(index=projects_alias, id=meta['uuid'],
+                    body=project_doc_dict(meta))
+    query = Q('term', **{'uuid._exact': meta['uuid']}) & \
+        ~Q('ids', values=[meta['uuid']])
+    es_client.delete_by_query(index=projects_alias,
+                              body={'query': query.to_dict()},
+                              conflicts='proceed')
+
+def bulk_index_projects(metas, chunk_size=None, es_client=None, prune=True):
+    """Index project metadata records with the bulk API.
+
+    Documents are keyed by project UUID, so indexing a project twice
+    overwrites it instead of creating a duplicate.
+
+    :param metas: Iterable of project metadata records, e.g.
+        :func:`iter_project_metadata`.
+    :param int chunk_size: Documents per bulk request. Defaults to
+        ``settings.ES_BULK_CHUNK_SIZE``.
+    :param bool prune: When every document was written, delete documents
+        of projects not in ``metas`` and any not keyed by UUID.
+    :returns: Number of documents indexed.
+    :rtype: int
+    """
+    es_client = es_client or connections.get_connection()
+    chunk_size = chunk_size or getattr(settings, 'ES_BULK_CHUNK_SIZE', 500)
+    projects_alias = settings.ES_INDICES['projects']['alias']
+    written = set()
+
+    def _actions():
+        for meta in metas:
+            written.add(meta['uuid'])
+            yield {
+                '_op_type': 'index',
+                '_index': projects_alias,
+                '_id': meta['uuid'],
+                '_source': project_doc_dict(meta)
+            }
+
+    indexed = 0
+    errors = 0
+    for ok, item in streaming_bulk(es_client, _actions(),
+                                   chunk_size=chunk_size,
+                                   raise_on_error=False):
+        if ok:
+            indexed += 1
+        else:
+            errors += 1
+            logger.error('Bulk indexing error: %s', item)
+
+    if prune and not errors:
+        es_client.delete_by_query(
+            index=projects_alias,
+            body={'query': {'bool': {'must_not': {'ids': {'values': sorted(written)}}}}},
+            conflicts='proceed'
+        )
+    return indexed
 
 @python_2_unicode_compatible
 def repair_path(name, path):
@@ -120,76 +690,193 @@ def repair_path(name, path):
     path = path.strip('/')
     return '/{path}'.format(path=path)
 
+def repair_path_action(hit):
+    """Bulk update fixing the ``path`` and ``basePath`` of a file hit."""
+    source = hit.get('_source', {})
+    if source.get('name') is None or source.get('path') is None:
+        return None
+    new_path = repair_path(source['name'], source['path'])
+    new_basepath = os.path.dirname(new_path)
+    if new_path == source['path'] and new_basepath == source.get('basePath'):
+        return None
+    return {
+        '_op_type': 'update',
+        '_index': hit['_index'],
+        '_id': hit['_id'],
+        'doc': {
+            'path': new_path,
+            'basePath': new_basepath
+        }
+    }
+
+def rekey_file_action(hit):
+    """Bulk action creating a file hit under its :func:`file_doc_id`.
+
+    ``create`` never overwrites a document the indexer already wrote under
+    that id, see :func:`rekey_slice`.
+    """
+    source = hit.get('_source', {})
+    if source.get('system') is None or source.get('path') is None:
+        return None
+    doc_id = file_doc_id(source['system'], source['path'])
+    if hit['_id'] == doc_id:
+        return None
+    return {'_op_type': 'create', '_index': hit['_index'], '_id': doc_id,
+            '_source': source}
+
+def rekey_slice(es_client, part, parts, index, chunk_size=None):
+    """Move the file documents of one scroll slice to their
+    :func:`file_doc_id`.
+
+    Each chunk of documents is created under the new ids, then the old ids
+    are deleted. A create conflicting with an existing document (409)
+    means the indexer or a duplicate of the same path got there first, so
+    the old document is deleted too. Documents whose create failed
+    otherwise are kept.
+
+    :returns: ``docs``, ``written`` (documents moved), ``deleted`` and
+        ``errors`` counters.
+    """
+    from designsafe.libs.elasticsearch.maintenance import _write
+    chunk_size = chunk_size or getattr(settings, 'ES_BULK_CHUNK_SIZE', 500)
+    body = {'query': {'match_all': {}}}
+    if parts > 1:
+        body['slice'] = {'id': part, 'max': parts}
+    stats = Counter(docs=0, written=0, deleted=0, errors=0)
+
+    def _move(moves):
+        deletes = []
+        results = streaming_bulk(es_client, [action for _, action in moves],
+                                 chunk_size=chunk_size, raise_on_error=False,
+                                 raise_on_exception=False)
+        for (hit, _), (ok, item) in zip(moves, results):
+            if ok or item.get('create', {}).get('status') == 409:
+                stats['written'] += 1
+                deletes.append({'_op_type': 'delete', '_index': hit['_index'],
+                                '_id': hit['_id']})
+            else:
+                stats['errors'] += 1
+                logger.error('Unable to rekey file document %s: %s', hit['_id'], item)
+        delete_stats = Counter()
+        _write(es_client, deletes, delete_stats, chunk_size)
+        stats['deleted'] += delete_stats['written']
+        stats['errors'] += delete_stats['errors']
+
+    moves = []
+    for hit in scan(es_client, query=body, index=index, size=chunk_size,
+                    scroll='10m'):
+        stats['docs'] += 1
+        action = rekey_file_action(hit)
+        if action is not None:
+            moves.append((hit, action))
+        if len(moves) >= chunk_size:
+            _move(moves)
+            moves = []
+    if moves:
+        _move(moves)
+    return dict(stats)
+
 @python_2_unicode_compatible
-def repair_paths(limit=1000):
-    from designsafe.apps.data.models.elasticsearch import IndexedFile
-    from elasticsearch import Elasticsearch
-    from elasticsearch.helpers import bulk
+def rekey_files(limit=1000, workers=None, resume=True, slices=None):
+    """Move every file document to its :func:`file_doc_id`.
 
-    files_alias = settings.ES_INDICES['files']['alias']
-    HOSTS = settings.ES_CONNECTIONS[settings.DESIGNSAFE_ENVIRONMENT]['hosts']
-    es_client = Elasticsearch(hosts=HOSTS)
-    file_search = IndexedFile.search().sort('_id').extra(size=limit)
-    res = file_search.execute()
-
-    while res.hits:
-        update_ops = []
-        for hit in res.hits:
-            
-            if hit.name is None or hit.path is None:
-                continue
-
-            new_path = repair_path(hit.name, hit.path)
-            new_basepath = os.path.dirname(new_path)
-
-            update_ops.append({
-                '_op_type': 'update',
-                '_index': files_alias,
-                '_type': 'file',
-                '_id': hit.meta.id,
-                'doc': {
-                    'path': new_path,
-                    'basePath': new_basepath
-                }
-            })
-            
-            # use from_path to remove any duplicates.
-            # IndexedFile.from_path(hit.system, hit.path)
-        
-        bulk(es_client, update_ops)
-        search_after = res.hits.hits[-1]['sort']
-        logger.debug(search_after)
-        file_search = IndexedFile.search().sort('_id').extra(size=limit, search_after=search_after)
-        res = file_search.execute()
+    Runs :func:`rekey_slice` over a sliced scroll in ``workers`` processes,
+    see :func:`designsafe.libs.elasticsearch.maintenance.run_parts`.
+    """
+    from designsafe.libs.elasticsearch.maintenance import run_parts
+    workers = workers or getattr(settings, 'ES_MAINTENANCE_WORKERS', 4)
+    slices = min(slices or workers * 4, 1024)
+    return run_parts('rekey_files', rekey_slice, slices, workers=workers,
+                     resume=resume, index=settings.ES_INDICES['files']['alias'],
+                     chunk_size=limit)
 
+@python_2_unicode_compatible
+def repair_paths(limit=1000, workers=None, resume=True):
+    """Fix ``path`` and ``basePath`` of every file document.
+
+    Runs over a sliced scroll in ``workers`` processes, see
+    :func:`designsafe.libs.elasticsearch.maintenance.transform_index`.
+    """
+    from designsafe.libs.elasticsearch.maintenance import transform_index
+    return transform_index('repair_paths', settings.ES_INDICES['files']['alias'],
+                           repair_path_action, workers=workers, resume=resume,
+                           chunk_size=limit)
 
 @python_2_unicode_compatible
-def full_dedup(limit=1000):
-    from designsafe.apps.data.models.elasticsearch import IndexedFile
-    from elasticsearch import Elasticsearch
-    from elasticsearch.helpers import bulk
+def full_dedup(workers=None, resume=True):
+    """Delete duplicate file documents, keeping one per system and path.
 
-    files_alias = settings.ES_INDICES['files']['alias']
-    HOSTS = settings.ES_CONNECTIONS[settings.DESIGNSAFE_ENVIRONMENT]['hosts']
-    es_client = Elasticsearch(hosts=HOSTS)
-    file_search = IndexedFile.search().sort('_id').extra(size=limit)
-    res = file_search.execute()
+    See :func:`designsafe.libs.elasticsearch.maintenance.dedup_files`.
+    """
+    from designsafe.libs.elasticsearch.maintenance import dedup_files
+    return dedup_files(workers=workers, resume=resume)
 
-    while res.hits:
-        for hit in res.hits:
-            
-            if hit.name is None or hit.path is None:
-                continue
+def usage_slice(es_client, part, parts, index, job, chunk_size=None):
+    """Sum the size and count of the files of one scroll slice per folder.
 
-            print((hit.meta.id))
-            try:
-                IndexedFile.from_path(hit.system, hit.path)
-            except Exception as e:
-                print(e)
-        
-        search_after = res.hits.hits[-1]['sort']
-        logger.debug(search_after)
-        file_search = IndexedFile.search().sort('_id').extra(size=limit, search_after=search_after)
-        res = file_search.execute()
+    The sums are written next to the checkpoint of ``job`` and merged by
+    :func:`rebuild_usage`. Folder documents are listed with no files so
+    empty folders get a row.
 
+    :returns: ``docs`` and ``folders`` counters.
+    """
+    from designsafe.libs.elasticsearch.maintenance import checkpoint_path
+    chunk_size = chunk_size or getattr(settings, 'ES_BULK_CHUNK_SIZE', 500)
+    body = {'query': {'match_all': {}},
+            '_source': ['system', 'path', 'format', 'length']}
+    if parts > 1:
+        body['slice'] = {'id': part, 'max': parts}
+    folders = {}
+    docs = 0
+    for hit in scan(es_client, query=body, index=index, size=chunk_size,
+                    scroll='10m'):
+        docs += 1
+        source = hit['_source']
+        if not source.get('system') or not source.get('path'):
+            continue
+        path = '/' + source['path'].strip('/')
+        if source.get('format') == 'folder':
+            folders.setdefault((source['system'], path), [0, 0])
+        else:
+            sums = folders.setdefault((source['system'], os.path.dirname(path)), [0, 0])
+            sums[0] += source.get('length') or 0
+            sums[1] += 1
+    with open('{}.{}'.format(checkpoint_path(job, parts), part), 'w') as sums_file:
+        json.dump([[system, path] + sums for (system, path), sums in folders.items()],
+                  sums_file)
+    return {'docs': docs, 'folders': len(folders)}
+
+def rebuild_usage(workers=None, resume=True, slices=None):
+    """Recompute every usage rollup from the files index.
+
+    The index is read with a sliced scroll in ``workers`` processes, see
+    :func:`designsafe.libs.elasticsearch.maintenance.run_parts`, then the
+    rollups table is replaced in one transaction. Levels indexed while
+    this runs may be counted in the old rollups only.
+
+    :returns: ``docs`` read and ``rows`` written.
+    """
+    from django import db
+    from designsafe.apps.data.models.usage import FolderUsage
+    from designsafe.libs.elasticsearch.maintenance import run_parts, checkpoint_path
+    workers = workers or getattr(settings, 'ES_MAINTENANCE_WORKERS', 4)
+    slices = min(slices or workers * 4, 1024)
+    # Worker processes must not share the database connection.
+    db.connections.close_all()
+    stats = run_parts('rebuild_usage', usage_slice, slices, workers=workers,
+                      resume=resume, index=settings.ES_INDICES['files']['alias'],
+                      job='rebuild_usage')
 
+    direct = {}
+    part_paths = ['{}.{}'.format(checkpoint_path('rebuild_usage', slices), part)
+                  for part in range(slices)]
+    for part_path in part_paths:
+        with open(part_path) as sums_file:
+            for system, path, size, count in json.load(sums_file):
+                sums = direct.setdefault((system, path), [0, 0])
+                sums[0] += size
+                sums[1] += count
+    rows = FolderUsage.replace_all(direct)
+    for part_path in part_paths:
+        os.remove(part_path)
+    return {'docs': stats.get('docs', 0), 'rows': rows}
@@ -131,8 +131,20 @@ CACHES = {
   },
 }
 
+# Seconds anonymous sitewide search results are cached for. 0 disables.
+SEARCH_CACHE_TIMEOUT = int(os.environ.get('SEARCH_CACHE_TIMEOUT', 30))
+
+# Seconds the entities of a project are cached for. 0 disables.
+PROJECT_ENTITIES_CACHE_TIMEOUT = int(os.environ.get('PROJECT_ENTITIES_CACHE_TIMEOUT', 300))
+
+# Seconds TAS user profiles are cached for, see designsafe.apps.accounts.tas.
+# 0 disables.
+TAS_PROFILE_CACHE_TIMEOUT = int(os.environ.get('TAS_PROFILE_CACHE_TIMEOUT', 3600))
+# Seconds users without a TAS profile are remembered as missing.
+TAS_PROFILE_NEGATIVE_CACHE_TIMEOUT = int(os.environ.get('TAS_PROFILE_NEGATIVE_CACHE_TIMEOUT', 300))
+
 MIDDLEWARE_CLASSES = (
-    'designsafe.middleware.RequestProfilingMiddleware',
+    'designsafe.middleware.InstrumentationMiddleware',
     'djng.middleware.AngularUrlMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -517,6 +529,15 @@ WS4REDIS_CONNECTION = {
     'db': os.environ.get('WS_BACKEND_DB'),
 }
 WS4REDIS_EXPIRE = 0
+# Seconds a user's notifications are coalesced into one websocket
+# message for, see designsafe.apps.api.notifications.pipeline. 0 disables.
+NOTIFICATIONS_WS_WINDOW = float(os.environ.get('NOTIFICATIONS_WS_WINDOW', 0.5))
+# Keep per-user unread notification counts in Redis, see
+# designsafe.apps.api.notifications.unread.
+NOTIFICATIONS_UNREAD_CACHE = os.environ.get('NOTIFICATIONS_UNREAD_CACHE', 'True') == 'True'
+# Keep the users index in sync with user saves, see
+# designsafe.apps.accounts.receivers.
+USERS_INDEX_SYNC = os.environ.get('USERS_INDEX_SYNC', 'True') == 'True'
 
 # Analytics
 #
@@ -557,6 +578,17 @@ AGAVE_JWT_USER_CLAIM_FIELD = os.environ.get('AGAVE_JWT_USER_CLAIM_FIELD')
 AGAVE_USER_STORE_ID = os.environ.get('AGAVE_USER_STORE_ID', 'TACC')
 AGAVE_USE_SANDBOX = os.environ.get('AGAVE_USE_SANDBOX', 'False').lower() == 'true'
 
+# Connections kept open per worker process by the shared Agave client session.
+AGAVE_CLIENT_POOL_SIZE = int(os.environ.get('AGAVE_CLIENT_POOL_SIZE', 10))
+AGAVE_CLIENT_RETRIES = int(os.environ.get('AGAVE_CLIENT_RETRIES', 3))
+AGAVE_CLIENT_TIMEOUT = (float(os.environ.get('AGAVE_CLIENT_CONNECT_TIMEOUT', 5)),
+                        float(os.environ.get('AGAVE_CLIENT_READ_TIMEOUT', 120)))
+# Impersonation tokens are renewed this many seconds before they expire.
+AGAVE_TOKEN_EXPIRY_MARGIN = int(os.environ.get('AGAVE_TOKEN_EXPIRY_MARGIN', 300))
+# Seconds a process may spend refreshing a user's token before others stop
+# waiting for it, see designsafe.apps.api.agave.clients.UserClientProvider.
+AGAVE_TOKEN_REFRESH_LOCK_TIMEOUT = int(os.environ.get('AGAVE_TOKEN_REFRESH_LOCK_TIMEOUT', 10))
+
 DS_ADMIN_USERNAME = os.environ.get('DS_ADMIN_USERNAME')
 DS_ADMIN_PASSWORD = os.environ.get('DS_ADMIN_PASSWORD')
 
@@ -586,6 +618,19 @@ PROJECT_STORAGE_SYSTEM_TEMPLATE = {
 
 PUBLISHED_SYSTEM = 'designsafe.storage.published'
 
+# Copy journals and checksum manifests of published files.
+PUBLICATION_MANIFEST_DIR = os.environ.get('PUBLICATION_MANIFEST_DIR',
+                                          '/corral-repl/tacc/NHERI/publication-manifests')
+PUBLICATION_COPY_WORKERS = int(os.environ.get('PUBLICATION_COPY_WORKERS', 8))
+
+FEDORA_BASE_URL = os.environ.get(
+    'FEDORA_BASE_URL',
+    'http://fedoraweb01.tacc.utexas.edu:8080/fcrepo/rest/publications_01')
+FEDORA_INGEST_WORKERS = int(os.environ.get('FEDORA_INGEST_WORKERS', 8))
+
+# Threads compressing files when project and publication archives are built.
+ARCHIVE_MAX_WORKERS = int(os.environ.get('ARCHIVE_MAX_WORKERS', 4))
+
 # RECAPTCHA SETTINGS FOR LESS SPAMMO
 DJANGOCMS_FORMS_RECAPTCHA_PUBLIC_KEY = os.environ.get('DJANGOCMS_FORMS_RECAPTCHA_PUBLIC_KEY')
 DJANGOCMS_FORMS_RECAPTCHA_SECRET_KEY = os.environ.get('DJANGOCMS_FORMS_RECAPTCHA_SECRET_KEY')
@@ -606,6 +651,16 @@ if os.environ.get('PORTAL_PROFILE') == 'True':
 else:
     PORTAL_PROFILE = False
 
+# Request latency histograms and ES/Agave call counts, see
+# designsafe.libs.common.instrumentation.
+INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', 'True') == 'True'
+# Seconds between merges of a process' stats into Redis.
+INSTRUMENTATION_FLUSH_INTERVAL = int(os.environ.get('INSTRUMENTATION_FLUSH_INTERVAL', 10))
+# Profile 1 in N requests with cProfile. 0 disables. PORTAL_PROFILE
+# profiles every request.
+PROFILE_SAMPLE_RATE = int(os.environ.get('PROFILE_SAMPLE_RATE', 1 if PORTAL_PROFILE else 0))
+PROFILE_STATS_DIR = os.environ.get('PROFILE_STATS_DIR', os.path.join(BASE_DIR, 'stats'))
+
 from designsafe.settings.celery_settings import *
 from designsafe.settings.external_resource_settings import *
 from designsafe.settings.elasticsearch_settings import *
@@ -632,3 +687,6 @@ PORTAL_DATA_DEPOT_SEARCH_MANAGERS = {
 }
 
 COMMUNITY_INDEX_SCHEDULE = os.environ.get('COMMUNITY_INDEX_SCHEDULE', {})
+# crontab kwargs for the nightly incremental reindex of the default and
+# published storage systems, e.g. '{"minute": 0, "hour": 2}'.
+INCREMENTAL_INDEX_SCHEDULE = json.loads(os.environ.get('INCREMENTAL_INDEX_SCHEDULE', '{}'))
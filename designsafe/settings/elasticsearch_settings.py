@@ -3,6 +3,21 @@ import os
 
 ES_INDEX_PREFIX = os.environ.get('ES_INDEX_PREFIX', 'designsafe-dev-{}')
 ES_AUTH = os.environ.get('ES_AUTH', 'username:password')
+# Number of documents sent per request when bulk indexing.
+ES_BULK_CHUNK_SIZE = int(os.environ.get('ES_BULK_CHUNK_SIZE', 500))
+# Seconds a resolved index alias is cached in-process, and how often other
+# processes' invalidations are picked up.
+ES_ALIAS_CACHE_TTL = int(os.environ.get('ES_ALIAS_CACHE_TTL', 300))
+ES_ALIAS_CHECK_INTERVAL = int(os.environ.get('ES_ALIAS_CHECK_INTERVAL', 5))
+# Worker processes and checkpoint directory of index maintenance jobs, see
+# designsafe.libs.elasticsearch.maintenance.
+ES_MAINTENANCE_WORKERS = int(os.environ.get('ES_MAINTENANCE_WORKERS', 4))
+ES_MAINTENANCE_DIR = os.environ.get('ES_MAINTENANCE_DIR', '/tmp/es-maintenance')
+# Documents per second copied by an online reindex, -1 for no throttle.
+ES_REINDEX_REQUESTS_PER_SECOND = int(os.environ.get('ES_REINDEX_REQUESTS_PER_SECOND', 2000))
+# Look file documents up by system and path when they are not under their
+# deterministic id yet. Set to False once `./manage.py rekey_files` has run.
+ES_FILES_LEGACY_LOOKUP = os.environ.get('ES_FILES_LEGACY_LOOKUP', 'True') == 'True'
 
 ES_CONNECTIONS = {
     'default': {
@@ -69,6 +84,11 @@ ES_INDICES = {
         'kwargs': {}
 
     },
+    'users': {
+        'alias': ES_INDEX_PREFIX.format('users'),
+        'document': 'designsafe.apps.data.models.elasticsearch.IndexedUser',
+        'kwargs': {}
+    },
     #'apps': {
     #    'name': 'des-apps_a',
     #    'alias': ['des-apps'],
@@ -127,8 +127,20 @@ CACHES = {
   },
 }
 
+# Seconds anonymous sitewide search results are cached for. 0 disables.
+SEARCH_CACHE_TIMEOUT = 0
+
+# Seconds the entities of a project are cached for. 0 disables.
+PROJECT_ENTITIES_CACHE_TIMEOUT = 0
+
+# Seconds TAS user profiles are cached for, see designsafe.apps.accounts.tas.
+# 0 disables.
+TAS_PROFILE_CACHE_TIMEOUT = 0
+# Seconds users without a TAS profile are remembered as missing.
+TAS_PROFILE_NEGATIVE_CACHE_TIMEOUT = 0
+
 MIDDLEWARE_CLASSES = (
-    'designsafe.middleware.RequestProfilingMiddleware',
+    'designsafe.middleware.InstrumentationMiddleware',
     'djng.middleware.AngularUrlMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -493,6 +505,15 @@ WS4REDIS_CONNECTION = {
     'db': os.environ.get('WS_BACKEND_DB'),
 }
 WS4REDIS_EXPIRE = 0
+# Seconds a user's notifications are coalesced into one websocket
+# message for, see designsafe.apps.api.notifications.pipeline. 0 disables.
+NOTIFICATIONS_WS_WINDOW = 0
+# Keep per-user unread notification counts in Redis, see
+# designsafe.apps.api.notifications.unread.
+NOTIFICATIONS_UNREAD_CACHE = False
+# Keep the users index in sync with user saves, see
+# designsafe.apps.accounts.receivers.
+USERS_INDEX_SYNC = False
 
 # Analytics
 #
@@ -551,6 +572,14 @@ PROJECT_STORAGE_SYSTEM_TEMPLATE = {
 
 PUBLISHED_SYSTEM = 'designsafe.storage.published'
 
+# Copy journals and checksum manifests of published files.
+PUBLICATION_MANIFEST_DIR = os.environ.get('PUBLICATION_MANIFEST_DIR',
+                                          '/corral-repl/tacc/NHERI/publication-manifests')
+
+FEDORA_BASE_URL = os.environ.get(
+    'FEDORA_BASE_URL',
+    'http://fedoraweb01.tacc.utexas.edu:8080/fcrepo/rest/publications_01')
+
 # RECAPTCHA SETTINGS FOR LESS SPAMMO
 DJANGOCMS_FORMS_RECAPTCHA_PUBLIC_KEY = os.environ.get('DJANGOCMS_FORMS_RECAPTCHA_PUBLIC_KEY')
 DJANGOCMS_FORMS_RECAPTCHA_SECRET_KEY = os.environ.get('DJANGOCMS_FORMS_RECAPTCHA_SECRET_KEY')
@@ -572,6 +601,11 @@ if os.environ.get('PORTAL_PROFILE') == 'True':
 else:
     PORTAL_PROFILE = False
 
+INSTRUMENTATION_ENABLED = False
+INSTRUMENTATION_FLUSH_INTERVAL = None
+PROFILE_SAMPLE_RATE = 1 if PORTAL_PROFILE else 0
+PROFILE_STATS_DIR = os.path.join(BASE_DIR, 'stats')
+
 from .elasticsearch_settings import *
 from .rt_settings import *
 from .external_resource_secrets import *
@@ -685,3 +719,4 @@ PORTAL_DATA_DEPOT_SEARCH_MANAGERS = {
 }
 
 COMMUNITY_INDEX_SCHEDULE = {}
+INCREMENTAL_INDEX_SCHEDULE = {}
@@ -36,6 +36,10 @@ function WSBusService($rootScope, logger, configURL) {
      * @param {Object} msg
      */
     function processWSMessage(msg) {
+        if (msg.event_type === 'batch') {
+            msg.events.forEach(processWSMessage);
+            return;
+        }
         $rootScope.$broadcast('ds.wsBus:notify', msg);
     }
 
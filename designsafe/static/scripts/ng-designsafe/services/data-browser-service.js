@@ -243,6 +243,7 @@ export function DataBrowserService($rootScope, $http, $q, $uibModal,
    * @param options.system
    * @param options.path
    * @param options.page
+   * @param options.cursor Cursor of the previous page, used instead of page when set
    */
   function browsePage (options) {
     currentState.busy = true;
@@ -254,11 +255,15 @@ export function DataBrowserService($rootScope, $http, $q, $uibModal,
       offset += limit * options.page;
     }
     var params = {limit: limit, offset: offset, query_string: options.queryString, typeFilters: options.typeFilters};
+    if (options.cursor) {
+      params.cursor = options.cursor;
+    }
     return FileListing.get(options, apiParams, params).then(function (listing) {
       select([], true);
       currentState.busy = false;
       currentState.busyListingPage = false;
       currentState.listing.children = currentState.listing.children.concat(listing.children);
+      currentState.listing.cursor = listing.cursor;
       return listing;
     }, function (err) {
       currentState.busy = false;
@@ -2015,12 +2020,13 @@ export function DataBrowserService($rootScope, $http, $q, $uibModal,
     return browsePage({system: currentState.listing.system,
                 path: currentState.listing.path,
                 page: currentState.page,
+                cursor: currentState.listing.cursor,
                 queryString: (params || {}).queryString,
                 typeFilters: (params || {}).typeFilters
                 })
     .then(function(listing){
         currentState.loadingMore = false;
-        if (listing.children.length < 95) {
+        if (listing.children.length < 95 || listing.cursor === null) {
           currentState.reachedEnd = true;
         }
       }, function (err){